@@ -9,7 +9,9 @@ from nilmtk import *
 from nilmtk.version import version as __version__
 from nilmtk.timeframe import TimeFrame
 from nilmtk.elecmeter import ElecMeter
-from nilmtk.datastore import DataStore, HDFDataStore, CSVDataStore, Key
+from nilmtk.datastore import (DataStore, HDFDataStore, CSVDataStore,
+                              MemmapDataStore, ParquetDataStore,
+                              PartitionedDataStore, ReaderPoolDataStore, Key)
 from nilmtk.metergroup import MeterGroup
 from nilmtk.appliance import Appliance
 from nilmtk.building import Building
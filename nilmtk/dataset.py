@@ -1,6 +1,10 @@
 from __future__ import print_function, division
 import os
 from collections import OrderedDict
+try:
+    from collections.abc import MutableMapping
+except ImportError:
+    from collections import MutableMapping
 import pandas as pd
 import numpy as np
 import matplotlib.pyplot as plt
@@ -8,6 +12,7 @@ from matplotlib.dates import DateFormatter
 from six import iteritems
 from .building import Building
 from .datastore.datastore import join_key
+from .datastore.key import Key
 from .utils import get_datastore
 from .timeframe import TimeFrame
 
@@ -16,9 +21,12 @@ class DataSet(object):
     """
     Attributes
     ----------
-    buildings : OrderedDict
+    buildings : OrderedDict or LazyBuildings
         Each key is an integer, starting from 1.
-        Each value is a nilmtk.Building object.
+        Each value is a nilmtk.Building object.  After `import_metadata`
+        this is a LazyBuildings mapping, which only loads each
+        Building's metadata (and creates its meters and appliances)
+        the first time that Building is accessed.
 
     store : nilmtk.DataStore
 
@@ -37,7 +45,9 @@ class DataSet(object):
             path to data set
 
         format : str
-            format of output. Either 'HDF' or 'CSV'. Defaults to 'HDF'
+            format of output. Either 'HDF', 'CSV', 'MEMMAP', 'PARQUET' or
+            'PARTITIONED'.
+            Defaults to 'HDF'
         """
         self.store = None
         self.buildings = OrderedDict()
@@ -61,14 +71,7 @@ class DataSet(object):
             building.save(destination, '/building' + str(b_id))
 
     def _init_buildings(self, store):
-        buildings = store.elements_below_key('/')
-        buildings.sort()
-
-        for b_key in buildings:
-            building = Building()
-            building.import_metadata(
-                store, '/'+b_key, self.metadata.get('name'))
-            self.buildings[building.identifier.instance] = building
+        self.buildings = LazyBuildings(store, self.metadata.get('name'))
 
     def set_window(self, start=None, end=None):
         """Set the timeframe window on self.store. Used for setting the
@@ -205,3 +208,81 @@ class DataSet(object):
                 del starts, ends
 
         store.close()
+
+
+class LazyBuildings(MutableMapping):
+    """Maps building instances to Buildings, loading each
+    Building from the store on first access.
+
+    Only the names of the nodes directly below the root of `store` are
+    read up front, so opening a dataset costs time proportional to
+    the number of buildings and accessing one building costs time
+    proportional to the size of that building alone.
+    """
+
+    def __init__(self, store, dataset_name):
+        """
+        Parameters
+        ----------
+        store : nilmtk.DataStore
+        dataset_name : str
+        """
+        self.store = store
+        self.dataset_name = dataset_name
+        self._keys = OrderedDict()
+        self._buildings = {}
+        unindexed_keys = []
+        for b_key in sorted(store.elements_below_key('/')):
+            try:
+                instance = Key(b_key).building
+            except (AssertionError, ValueError):
+                unindexed_keys.append(b_key)
+            else:
+                self._keys[instance] = '/' + b_key
+        self._keys = OrderedDict(sorted(self._keys.items()))
+
+        # Keys which don't follow the '/building<I>' convention
+        # have to be loaded now to find their instance.
+        for b_key in unindexed_keys:
+            building = self._load('/' + b_key)
+            self[building.identifier.instance] = building
+
+    def __getitem__(self, instance):
+        try:
+            return self._buildings[instance]
+        except KeyError:
+            pass
+        building = self._load(self._keys[instance])
+        self._buildings[instance] = building
+        return building
+
+    def __setitem__(self, instance, building):
+        self._keys.setdefault(instance, None)
+        self._buildings[instance] = building
+
+    def __delitem__(self, instance):
+        del self._keys[instance]
+        self._buildings.pop(instance, None)
+
+    def __iter__(self):
+        return iter(self._keys)
+
+    def __len__(self):
+        return len(self._keys)
+
+    def __contains__(self, instance):
+        return instance in self._keys
+
+    def __repr__(self):
+        return '{}({} buildings, {} loaded)'.format(
+            self.__class__.__name__, len(self), len(self._buildings))
+
+    def loaded(self):
+        """Returns a list of the instances which have been loaded."""
+        return [instance for instance in self._keys
+                if instance in self._buildings]
+
+    def _load(self, key):
+        building = Building()
+        building.import_metadata(self.store, key, self.dataset_name)
+        return building
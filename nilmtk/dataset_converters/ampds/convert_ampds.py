@@ -72,22 +72,23 @@ def convert_ampds(input_path, output_filename, format='HDF'):
     files.insert(0, "WHE.csv")
     assert isdir(input_path)
     store = get_datastore(output_filename, format, mode='w')
-    for i, csv_file in enumerate(files):
-        key = Key(building=1, meter=(i + 1))
-        print('Loading file #', (i + 1), ' : ', csv_file, '. Please wait...')
-        df = pd.read_csv(join(input_path, csv_file))
-        # Due to fixed width, column names have spaces :(
-        df.columns = [x.replace(" ", "") for x in df.columns]
-        df.index = pd.to_datetime(df[TIMESTAMP_COLUMN_NAME], unit='s', utc=True)
-        df = df.drop(TIMESTAMP_COLUMN_NAME, 1)
-        df = df.tz_localize('GMT').tz_convert(TIMEZONE)
-        df.rename(columns=lambda x: columnNameMapping[x], inplace=True)
-        df.columns.set_names(LEVEL_NAMES, inplace=True)
-        df = df.apply(pd.to_numeric, errors='ignore')
-        df = df.dropna()
-        df = df.astype(np.float32)
-        store.put(str(key), df)
-        print("Done with file #", (i + 1))
+    with store.write_session():
+        for i, csv_file in enumerate(files):
+            key = Key(building=1, meter=(i + 1))
+            print('Loading file #', (i + 1), ' : ', csv_file, '. Please wait...')
+            df = pd.read_csv(join(input_path, csv_file))
+            # Due to fixed width, column names have spaces :(
+            df.columns = [x.replace(" ", "") for x in df.columns]
+            df.index = pd.to_datetime(df[TIMESTAMP_COLUMN_NAME], unit='s', utc=True)
+            df = df.drop(TIMESTAMP_COLUMN_NAME, 1)
+            df = df.tz_localize('GMT').tz_convert(TIMEZONE)
+            df.rename(columns=lambda x: columnNameMapping[x], inplace=True)
+            df.columns.set_names(LEVEL_NAMES, inplace=True)
+            df = df.apply(pd.to_numeric, errors='ignore')
+            df = df.dropna()
+            df = df.astype(np.float32)
+            store.put(str(key), df)
+            print("Done with file #", (i + 1))
     store.close()
     metadata_path = join(_get_module_directory(), 'metadata')
     print('Processing metadata...')
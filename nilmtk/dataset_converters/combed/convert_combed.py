@@ -54,30 +54,31 @@ def convert_combed(combed_path, output_filename, format='HDF'):
     # Open store
     store = get_datastore(output_filename, format, mode='w')
 
-    for building_name, building_mapping in iteritems(overall_dataset_mapping):
-        for load_name, load_mapping in iteritems(building_mapping):
-            for load_mapping_path, meter_number in iteritems(load_mapping):
-                building_number = building_number_mapping[building_name]
-                key = Key(building=building_number, meter=meter_number)
-                dfs = []
-                for attribute in column_mapping.keys():
-                    filename_attribute = join(combed_path, building_name, load_name, load_mapping_path, "%s.csv" %attribute)
-                    if os.path.isfile(filename_attribute):
-                        exists = True
-                        print(filename_attribute)
-                        df = pd.read_csv(filename_attribute, header=True, names=["timestamp", attribute])
-                        df.index = pd.to_datetime(df["timestamp"], unit='ms')
-                        df = df.drop("timestamp", 1)
-                        dfs.append(df)
-                    else:
-                        exists = False
-                if exists:
-                    total = pd.concat(dfs, axis=1)
-                    total = total.tz_localize('UTC').tz_convert('Asia/Kolkata')
-                    total.rename(columns=lambda x: column_mapping[x], inplace=True)
-                    total.columns.set_names(LEVEL_NAMES, inplace=True)
-                    assert total.index.is_unique
-                    store.put(str(key), total)
+    with store.write_session():
+        for building_name, building_mapping in iteritems(overall_dataset_mapping):
+            for load_name, load_mapping in iteritems(building_mapping):
+                for load_mapping_path, meter_number in iteritems(load_mapping):
+                    building_number = building_number_mapping[building_name]
+                    key = Key(building=building_number, meter=meter_number)
+                    dfs = []
+                    for attribute in column_mapping.keys():
+                        filename_attribute = join(combed_path, building_name, load_name, load_mapping_path, "%s.csv" %attribute)
+                        if os.path.isfile(filename_attribute):
+                            exists = True
+                            print(filename_attribute)
+                            df = pd.read_csv(filename_attribute, header=True, names=["timestamp", attribute])
+                            df.index = pd.to_datetime(df["timestamp"], unit='ms')
+                            df = df.drop("timestamp", 1)
+                            dfs.append(df)
+                        else:
+                            exists = False
+                    if exists:
+                        total = pd.concat(dfs, axis=1)
+                        total = total.tz_localize('UTC').tz_convert('Asia/Kolkata')
+                        total.rename(columns=lambda x: column_mapping[x], inplace=True)
+                        total.columns.set_names(LEVEL_NAMES, inplace=True)
+                        assert total.index.is_unique
+                        store.put(str(key), total)
     convert_yaml_to_hdf5(join(_get_module_directory(), 'metadata'),
                          output_filename)
 
@@ -140,52 +140,53 @@ def convert_hes(data_dir, output_filename, format='HDF', max_chunks=None):
     house_appliance_codes = dict()
 
     # Iterate over files
-    for filename in FILENAMES:
-        # Load appliance energy data chunk-by-chunk
-        full_filename = join(data_dir, filename)
-        print('loading', full_filename)
-        try:
-            reader = pd.read_csv(full_filename, names=COL_NAMES, 
-                                 index_col=False, chunksize=CHUNKSIZE)
-        except IOError as e:
-            print(e, file=stderr)
-            continue
+    with store.write_session():
+        for filename in FILENAMES:
+            # Load appliance energy data chunk-by-chunk
+            full_filename = join(data_dir, filename)
+            print('loading', full_filename)
+            try:
+                reader = pd.read_csv(full_filename, names=COL_NAMES, 
+                                     index_col=False, chunksize=CHUNKSIZE)
+            except IOError as e:
+                print(e, file=stderr)
+                continue
 
-        # Iterate over chunks in file
-        chunk_i = 0
-        for chunk in reader:
-            if max_chunks is not None and chunk_i >= max_chunks:
-                break
+            # Iterate over chunks in file
+            chunk_i = 0
+            for chunk in reader:
+                if max_chunks is not None and chunk_i >= max_chunks:
+                    break
 
-            print(' processing chunk', chunk_i, 'of', filename)
-            # Convert date and time columns to np.datetime64 objects
-            dt = chunk['date'] + ' ' + chunk['time']
-            del chunk['date']
-            del chunk['time']
-            chunk['datetime'] = dt.apply(datetime_converter)
+                print(' processing chunk', chunk_i, 'of', filename)
+                # Convert date and time columns to np.datetime64 objects
+                dt = chunk['date'] + ' ' + chunk['time']
+                del chunk['date']
+                del chunk['time']
+                chunk['datetime'] = dt.apply(datetime_converter)
 
-            # Data is either tenths of a Wh or tenths of a degree
-            chunk['data'] *= 10
-            chunk['data'] = chunk['data'].astype(np.float32)
+                # Data is either tenths of a Wh or tenths of a degree
+                chunk['data'] *= 10
+                chunk['data'] = chunk['data'].astype(np.float32)
 
-            # Iterate over houses in chunk
-            for hes_house_id, hes_house_id_df in chunk.groupby('house id'):
-                if hes_house_id not in house_codes:
-                    house_codes.append(hes_house_id)
+                # Iterate over houses in chunk
+                for hes_house_id, hes_house_id_df in chunk.groupby('house id'):
+                    if hes_house_id not in house_codes:
+                        house_codes.append(hes_house_id)
                     
-                if hes_house_id not in house_appliance_codes.keys():
-                    house_appliance_codes[hes_house_id] = []
+                    if hes_house_id not in house_appliance_codes.keys():
+                        house_appliance_codes[hes_house_id] = []
                 
-                nilmtk_house_id = house_codes.index(hes_house_id)+1
+                    nilmtk_house_id = house_codes.index(hes_house_id)+1
                 
-                # Iterate over appliances in house
-                for appliance_code, appliance_df in chunk.groupby('appliance code'):
-                    if appliance_code not in house_appliance_codes[hes_house_id]:
-                        house_appliance_codes[hes_house_id].append(appliance_code)
-                    nilmtk_meter_id = house_appliance_codes[hes_house_id].index(appliance_code)+1
-                    _process_meter_in_chunk(nilmtk_house_id, nilmtk_meter_id, hes_house_id_df, store, appliance_code)
+                    # Iterate over appliances in house
+                    for appliance_code, appliance_df in chunk.groupby('appliance code'):
+                        if appliance_code not in house_appliance_codes[hes_house_id]:
+                            house_appliance_codes[hes_house_id].append(appliance_code)
+                        nilmtk_meter_id = house_appliance_codes[hes_house_id].index(appliance_code)+1
+                        _process_meter_in_chunk(nilmtk_house_id, nilmtk_meter_id, hes_house_id_df, store, appliance_code)
                     
-            chunk_i += 1
+                chunk_i += 1
     print('houses with some data loaded:', house_appliance_codes.keys())
     
     store.close()
@@ -71,25 +71,26 @@ def convert_iawe(iawe_path, output_filename, format="HDF"):
     electricity_path = join(iawe_path, "electricity")
 
     # Mains data
-    for chan in range(1, 12):
-        key = Key(building=1, meter=chan)
-        filename = join(electricity_path, "%d.csv" % chan)
-        print('Loading ', chan)
-        df = pd.read_csv(filename)
-        df.drop_duplicates(subset=["timestamp"], inplace=True)
-        df.index = pd.to_datetime(df.timestamp.values, unit='s', utc=True)
-        df = df.tz_convert(TIMEZONE)
-        df = df.drop(TIMESTAMP_COLUMN_NAME, 1)
-        df.rename(columns=lambda x: column_mapping[x], inplace=True)
-        df.columns.set_names(LEVEL_NAMES, inplace=True)
-        df = df.apply(pd.to_numeric, errors='ignore')
-        df = df.dropna()
-        df = df.astype(np.float32)
-        df = df.sort_index()
-        df = df.resample("1T").mean()
-        df = reindex_fill_na(df, idx)
-        assert df.isnull().sum().sum() == 0
-        store.put(str(key), df)
+    with store.write_session():
+        for chan in range(1, 12):
+            key = Key(building=1, meter=chan)
+            filename = join(electricity_path, "%d.csv" % chan)
+            print('Loading ', chan)
+            df = pd.read_csv(filename)
+            df.drop_duplicates(subset=["timestamp"], inplace=True)
+            df.index = pd.to_datetime(df.timestamp.values, unit='s', utc=True)
+            df = df.tz_convert(TIMEZONE)
+            df = df.drop(TIMESTAMP_COLUMN_NAME, 1)
+            df.rename(columns=lambda x: column_mapping[x], inplace=True)
+            df.columns.set_names(LEVEL_NAMES, inplace=True)
+            df = df.apply(pd.to_numeric, errors='ignore')
+            df = df.dropna()
+            df = df.astype(np.float32)
+            df = df.sort_index()
+            df = df.resample("1T").mean()
+            df = reindex_fill_na(df, idx)
+            assert df.isnull().sum().sum() == 0
+            store.put(str(key), df)
     store.close()
     convert_yaml_to_hdf5(join(_get_module_directory(), 'metadata'),
                          output_filename)
@@ -81,22 +81,23 @@ def _convert(input_path, store, measurement_mapping_func, tz, sort_index=True):
 
     # Iterate though all houses and channels
     houses = _find_all_houses(input_path)
-    for house_id in houses:
-        print("Loading house", house_id, end="... ")
-        stdout.flush()
-        chans = _find_all_chans(input_path, house_id)
-        for chan_id in chans:
-            print(chan_id, end=" ")
+    with store.write_session():
+        for house_id in houses:
+            print("Loading house", house_id, end="... ")
             stdout.flush()
-            key = Key(building=house_id, meter=chan_id)
-            measurements = measurement_mapping_func(house_id, chan_id)
-            csv_filename = _get_csv_filename(input_path, key)
-            df = _load_csv(csv_filename, measurements, tz)
-
-            if sort_index:
-                df = df.sort_index() # raw REDD data isn't always sorted
-            store.put(str(key), df)
-        print()
+            chans = _find_all_chans(input_path, house_id)
+            for chan_id in chans:
+                print(chan_id, end=" ")
+                stdout.flush()
+                key = Key(building=house_id, meter=chan_id)
+                measurements = measurement_mapping_func(house_id, chan_id)
+                csv_filename = _get_csv_filename(input_path, key)
+                df = _load_csv(csv_filename, measurements, tz)
+
+                if sort_index:
+                    df = df.sort_index() # raw REDD data isn't always sorted
+                store.put(str(key), df)
+            print()
 
 
 def _find_all_houses(input_path):
@@ -67,30 +67,31 @@ def _convert(input_path, store, tz, sort_index=True):
     # house 14 is missing!
     houses = [1,2,3,4,5,6,7,8,9,10,11,12,13,15,16,17,18,19,20,21]
     nilmtk_house_id = 0
-    for house_id in houses:
-        nilmtk_house_id += 1
-        print("Loading house", house_id, end="... ")
-        stdout.flush()
-        csv_filename = input_path + 'House' + str(house_id) + '.csv'
-        columns = ['Timestamp','Aggregate','Appliance1','Appliance2','Appliance3','Appliance4','Appliance5','Appliance6','Appliance7','Appliance8','Appliance9']
-        df = _load_csv(csv_filename, columns, tz)
-        if sort_index:
-            df = df.sort_index() # might not be sorted...
-        chan_id = 0
-        for col in df.columns:
-            chan_id += 1
-            print(chan_id, end=" ")
+    with store.write_session():
+        for house_id in houses:
+            nilmtk_house_id += 1
+            print("Loading house", house_id, end="... ")
             stdout.flush()
-            key = Key(building=nilmtk_house_id, meter=chan_id)
+            csv_filename = input_path + 'House' + str(house_id) + '.csv'
+            columns = ['Timestamp','Aggregate','Appliance1','Appliance2','Appliance3','Appliance4','Appliance5','Appliance6','Appliance7','Appliance8','Appliance9']
+            df = _load_csv(csv_filename, columns, tz)
+            if sort_index:
+                df = df.sort_index() # might not be sorted...
+            chan_id = 0
+            for col in df.columns:
+                chan_id += 1
+                print(chan_id, end=" ")
+                stdout.flush()
+                key = Key(building=nilmtk_house_id, meter=chan_id)
             
-            chan_df = pd.DataFrame(df[col])
-            chan_df.columns = pd.MultiIndex.from_tuples([('power', 'active')])
+                chan_df = pd.DataFrame(df[col])
+                chan_df.columns = pd.MultiIndex.from_tuples([('power', 'active')])
             
-            # Modify the column labels to reflect the power measurements recorded.
-            chan_df.columns.set_names(LEVEL_NAMES, inplace=True)
+                # Modify the column labels to reflect the power measurements recorded.
+                chan_df.columns.set_names(LEVEL_NAMES, inplace=True)
             
-            store.put(str(key), chan_df)
-        print('')
+                store.put(str(key), chan_df)
+            print('')
 
 def _load_csv(filename, columns, tz):
     """
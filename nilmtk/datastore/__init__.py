@@ -1,4 +1,15 @@
 from .datastore import DataStore, MAX_MEM_ALLOWANCE_IN_BYTES
+from .chunkplanner import set_memory_ceiling, get_memory_ceiling
+from .chunkcache import (ChunkCache, enable_chunk_cache, disable_chunk_cache,
+                         get_chunk_cache)
+from .statscache import (StatsCache, enable_stats_cache, disable_stats_cache,
+                         get_stats_cache)
+from .compression import (Codec, CompressionPolicy, benchmark_codecs,
+                          DEFAULT_POLICY, FAST_READ_POLICY, ARCHIVE_POLICY)
 from .hdfdatastore import HDFDataStore
 from .csvdatastore import CSVDataStore
+from .memmapdatastore import MemmapDataStore
+from .parquetdatastore import ParquetDataStore
+from .partitioneddatastore import PartitionedDataStore
+from .readerpool import ReaderPoolDataStore
 from .key import Key
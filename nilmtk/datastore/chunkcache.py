@@ -0,0 +1,448 @@
+"""A process-wide, size-bounded cache of loaded chunks.
+
+A typical session asks the same meter for `good_sections()`, then
+`total_energy(sections=...)`, then `dropout_rate()`, and each of those
+reads the same rows from disk again.  When the chunk cache is enabled,
+`ElecMeter.get_source_node` loads through it.  Tables are cached in
+blocks of consecutive rows (of every column), keyed by the store's
+file, the table key and the block's row range, and blocks are evicted
+least-recently-used first once the cache exceeds its byte budget.  Each
+chunk requested is sliced out of the cached blocks, so loads of
+different sections, columns or chunk sizes share the same blocks.
+
+Blocks are as long as the chunks which `DataStore.load` would plan for
+the whole table.  Stores which can't read rows by position (i.e. which
+don't plan their chunks with `_plan_chunks`, as HDFDataStore does) are
+cached per section instead, keyed by the columns and the section too.
+
+Cached chunks are shared between callers, so their arrays are read-only.
+Each call gets its own DataFrame objects (so setting a column on one
+doesn't affect the cache), but code which writes into a chunk in place
+must call `writeable_chunk()` first.
+
+Each load checks the number of rows of the table, so blocks cached
+before rows were appended to a table are dropped.  Otherwise the cache
+assumes that data does not change while it is cached: call
+`ChunkCache.invalidate()` after rewriting a key that may be cached.
+
+Examples
+--------
+::
+
+    from nilmtk.datastore import enable_chunk_cache, get_chunk_cache
+    enable_chunk_cache(max_bytes=2**30)
+    meter.good_sections()
+    meter.total_energy()   # served from memory
+    get_chunk_cache().stats()
+"""
+from __future__ import print_function, division
+import threading
+from collections import OrderedDict
+from os.path import abspath
+import numpy as np
+import pandas as pd
+from nilmtk.timeframe import TimeFrame
+from nilmtk.timeframegroup import TimeFrameGroup
+from .chunkplanner import bytes_per_row, get_memory_ceiling
+from .datastore import split_look_ahead, without_window, prefetch_chunks
+
+_chunk_cache = None
+
+
+def enable_chunk_cache(max_bytes=None):
+    """Create (or resize) the process-wide chunk cache.
+
+    Parameters
+    ----------
+    max_bytes : int, optional
+        Maximum number of bytes held by the cache.  Defaults to four
+        times the process-wide memory ceiling (see `chunkplanner`).
+
+    Returns
+    -------
+    ChunkCache
+    """
+    global _chunk_cache
+    if max_bytes is None:
+        max_bytes = 4 * get_memory_ceiling()
+    if _chunk_cache is None:
+        _chunk_cache = ChunkCache(max_bytes)
+    else:
+        _chunk_cache.resize(max_bytes)
+    return _chunk_cache
+
+
+def disable_chunk_cache():
+    """Drop the process-wide chunk cache and everything in it."""
+    global _chunk_cache
+    if _chunk_cache is not None:
+        _chunk_cache.clear()
+    _chunk_cache = None
+
+
+def get_chunk_cache():
+    """Returns the process-wide ChunkCache or None if disabled."""
+    return _chunk_cache
+
+
+def is_read_only(chunk):
+    """Returns True if `chunk` came from a ChunkCache."""
+    return bool(getattr(chunk, 'read_only', False))
+
+
+def writeable_chunk(chunk):
+    """Returns `chunk` if it can be modified in place, otherwise
+    a copy which keeps the `timeframe` and `look_ahead` attributes."""
+    if not is_read_only(chunk):
+        return chunk
+    copy = chunk.copy()
+    for attr in ('timeframe', 'look_ahead'):
+        if hasattr(chunk, attr):
+            setattr(copy, attr, getattr(chunk, attr))
+    return copy
+
+
+class ChunkCache(object):
+    """LRU cache of blocks of rows of tables.
+
+    Attributes
+    ----------
+    max_bytes : int
+    n_bytes : int, number of bytes currently held.
+    block_rows : int or None
+        Rows per block.  If None then the chunksize which the store
+        plans for each table.
+    hits, misses, evictions : int
+        Counted per block (or per section, for stores which are cached
+        per section).  A block which is too big to cache is never read
+        as a whole and counts as a miss every time it is needed.
+    """
+
+    def __init__(self, max_bytes, block_rows=None):
+        self._entries = OrderedDict()
+        self._lock = threading.RLock()
+        self.block_rows = block_rows
+        # Maps (store identity, key) to the rows per block and the
+        # number of rows of that table.
+        self._tables = {}
+        self.n_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.resize(max_bytes)
+
+    def resize(self, max_bytes):
+        max_bytes = int(max_bytes)
+        if max_bytes <= 0:
+            raise ValueError("Cache size must be positive, not {}"
+                             .format(max_bytes))
+        with self._lock:
+            self.max_bytes = max_bytes
+            self._evict()
+
+    def load(self, store, key, cols=None, sections=None, n_look_ahead_rows=0,
+             chunksize=None, **kwargs):
+        """Same as `store.load()`, but serves sections from the cache
+        when possible.
+
+        Parameters
+        ----------
+        store : nilmtk.DataStore
+        key, cols, sections, n_look_ahead_rows, chunksize, **kwargs :
+            See `DataStore.load`.  Only `prefetch` and `verbose` are
+            accepted as `**kwargs` by stores which are cached in blocks.
+
+        Returns
+        -------
+        generator of read-only DataFrames.
+        """
+        key = _normalise_key(key)
+        sections = [TimeFrame()] if sections is None else sections
+        if not hasattr(store, '_plan_chunks'):
+            return self._load_sections(
+                store, key, cols=cols, sections=sections,
+                n_look_ahead_rows=n_look_ahead_rows, chunksize=chunksize,
+                **kwargs)
+        prefetch = kwargs.pop('prefetch', 0)
+        table = (_store_identity(store), key)
+        layout = self._table_layout(store, table)
+        chunks = self._load_rows(store, table, layout, cols, sections,
+                                 n_look_ahead_rows, chunksize, **kwargs)
+        if prefetch:
+            chunks = prefetch_chunks(chunks, prefetch)
+        return chunks
+
+    def _load_rows(self, store, table, layout, cols, sections,
+                   n_look_ahead_rows, chunksize, verbose=False):
+        """Yields the chunks which `store.load` would, sliced out of
+        cached blocks."""
+        key = table[1]
+        if cols is not None:
+            cols = [('' if pq is None else pq, '' if ac is None else ac)
+                    for pq, ac in cols]
+        if chunksize is None:
+            chunksize = store._plan_chunksize(key, cols)
+        for start_i, stop_i, timeframe in store._plan_chunks(
+                key, TimeFrameGroup(sections), np.int64(chunksize), verbose):
+            if start_i is None:
+                data = pd.DataFrame()
+                data.timeframe = timeframe
+                yield data
+                continue
+            data = self._rows(store, table, layout, start_i,
+                              stop_i + max(n_look_ahead_rows, 0), cols)
+            if n_look_ahead_rows > 0:
+                data = split_look_ahead(data, stop_i - start_i)
+                data.look_ahead.read_only = True
+            data.read_only = True
+            data.timeframe = timeframe(data.index)
+            yield data
+
+    def _rows(self, store, table, layout, start_i, stop_i, cols):
+        """Returns a read-only DataFrame of rows [start_i, stop_i) of
+        `table` (fewer if the table ends first)."""
+        block_rows, n_rows = layout
+        stop_i = min(stop_i, n_rows)
+        if stop_i <= start_i:
+            return _read_only_frame(store._read_rows(
+                table[1], start_i, start_i, cols))
+        pieces = []
+        for block_i in range(start_i // block_rows,
+                             (stop_i - 1) // block_rows + 1):
+            block_start_i = block_i * block_rows
+            block_key = table + ((block_start_i, block_rows),)
+            block = self._get(block_key)
+            if block is None:
+                block = self._read_block(
+                    store, block_key, block_start_i,
+                    min(block_start_i + block_rows, n_rows))
+                if block is None:
+                    # Too big to cache: read just the rows needed.
+                    return _read_only_frame(store._read_rows(
+                        table[1], start_i, stop_i, cols))
+            pieces.append(block.to_frame(max(start_i - block_start_i, 0),
+                                         stop_i - block_start_i, cols))
+        if len(pieces) == 1:
+            return pieces[0]
+        return _read_only_frame(pd.concat(pieces))
+
+    def _table_layout(self, store, table):
+        """Returns the rows per block and the number of rows of `table`.
+        Forgets the cached blocks of `table` if its number of rows has
+        changed since they were cached."""
+        with without_window(store):
+            n_rows = store._nrows(table[1])
+        with self._lock:
+            layout = self._tables.get(table)
+            if layout is not None and layout[1] != n_rows:
+                self.invalidate(store, table[1])
+                layout = None
+            if layout is None:
+                block_rows = self.block_rows
+                if block_rows is None:
+                    block_rows = store._plan_chunksize(table[1])
+                layout = self._tables[table] = (max(int(block_rows), 1),
+                                                n_rows)
+            return layout
+
+    def _read_block(self, store, block_key, start_i, stop_i):
+        """Reads rows [start_i, stop_i) into the cache as one block.
+        Returns None, without reading them, if they would be too big
+        to cache."""
+        key = block_key[1]
+        n_bytes = (stop_i - start_i) * bytes_per_row(store._column_dtypes(key))
+        if n_bytes > self.max_bytes:
+            return None
+        block = _CachedChunk(store._read_rows(key, start_i, stop_i))
+        self._put(block_key, block, block.n_bytes)
+        return block
+
+    def _load_sections(self, store, key, cols=None, sections=None,
+                       n_look_ahead_rows=0, chunksize=None, **kwargs):
+        base_key = (_store_identity(store), key,
+                    None if cols is None else tuple(cols),
+                    n_look_ahead_rows, chunksize, _timeframe_key(store.window))
+        for section in TimeFrameGroup(sections):
+            cache_key = base_key + (_timeframe_key(section),)
+            cached = self._get(cache_key)
+            if cached is None:
+                chunks = store.load(
+                    key=key, cols=cols, sections=[section],
+                    n_look_ahead_rows=n_look_ahead_rows, chunksize=chunksize,
+                    **kwargs)
+                for chunk in self._load_and_insert(cache_key, chunks):
+                    yield chunk
+            else:
+                for cached_chunk in cached:
+                    yield cached_chunk.to_frame()
+
+    def _load_and_insert(self, cache_key, chunks):
+        """Yields read-only frames of `chunks` and inserts them into the
+        cache if all chunks were consumed and they fit."""
+        cached = []
+        n_bytes = 0
+        for chunk in chunks:
+            cached_chunk = _CachedChunk(chunk)
+            if cached is not None:
+                n_bytes += cached_chunk.n_bytes
+                if n_bytes > self.max_bytes:
+                    cached = None
+                else:
+                    cached.append(cached_chunk)
+            yield cached_chunk.to_frame()
+        if cached is not None:
+            self._put(cache_key, cached, n_bytes)
+
+    def _get(self, cache_key):
+        with self._lock:
+            try:
+                entry = self._entries.pop(cache_key)
+            except KeyError:
+                self.misses += 1
+                return None
+            self._entries[cache_key] = entry
+            self.hits += 1
+            return entry[0]
+
+    def _put(self, cache_key, cached, n_bytes):
+        with self._lock:
+            old = self._entries.pop(cache_key, None)
+            if old is not None:
+                self.n_bytes -= old[1]
+            self._entries[cache_key] = (cached, n_bytes)
+            self.n_bytes += n_bytes
+            self._evict()
+
+    def _evict(self):
+        while self.n_bytes > self.max_bytes and self._entries:
+            _, (_, n_bytes) = self._entries.popitem(last=False)
+            self.n_bytes -= n_bytes
+            self.evictions += 1
+
+    def invalidate(self, store, key=None):
+        """Forget every cached section of `key` in `store`, or every
+        key in `store` if `key` is None."""
+        identity = _store_identity(store)
+        if key is not None:
+            key = _normalise_key(key)
+        with self._lock:
+            for cache_key in list(self._entries):
+                if cache_key[0] == identity and key in (None, cache_key[1]):
+                    _, n_bytes = self._entries.pop(cache_key)
+                    self.n_bytes -= n_bytes
+            for table in list(self._tables):
+                if table[0] == identity and key in (None, table[1]):
+                    del self._tables[table]
+
+    def clear(self):
+        """Empty the cache.  The counters are kept."""
+        with self._lock:
+            self._entries.clear()
+            self._tables.clear()
+            self.n_bytes = 0
+
+    def stats(self):
+        """
+        Returns
+        -------
+        dict with keys 'hits', 'misses', 'evictions', 'entries',
+        'n_bytes' and 'max_bytes'.
+        """
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses,
+                    'evictions': self.evictions,
+                    'entries': len(self._entries),
+                    'n_bytes': self.n_bytes, 'max_bytes': self.max_bytes}
+
+    def reset_stats(self):
+        with self._lock:
+            self.hits = self.misses = self.evictions = 0
+
+
+class _CachedChunk(object):
+    """The read-only arrays, index and attributes of one chunk."""
+
+    def __init__(self, chunk):
+        self.index = chunk.index
+        self.columns = chunk.columns
+        self.values = _read_only_values(chunk)
+        self.timeframe = getattr(chunk, 'timeframe', None)
+        look_ahead = getattr(chunk, 'look_ahead', None)
+        self.look_ahead = (None if look_ahead is None
+                           else _CachedChunk(look_ahead))
+        self.n_bytes = self.index.nbytes + sum(
+            values.nbytes for values in self.values)
+        if self.look_ahead is not None:
+            self.n_bytes += self.look_ahead.n_bytes
+
+    def to_frame(self, start_i=None, stop_i=None, cols=None):
+        """Returns a read-only DataFrame of rows [start_i, stop_i) of
+        columns `cols` (all columns if None) without copying."""
+        rows = slice(start_i, stop_i)
+        index = self.index[rows]
+        columns = self.columns
+        positions = None
+        if cols is not None:
+            positions = [columns.get_loc(col) for col in cols
+                         if col in columns]
+            columns = columns[positions]
+        if len(self.values) == 1:
+            values = self.values[0][rows]
+            if positions is not None and positions != list(
+                    range(values.shape[1])):
+                values = values[:, positions]
+                values.flags.writeable = False
+            frame = pd.DataFrame(values, index=index, columns=columns,
+                                 copy=False)
+        else:
+            values = [array[rows] for array in self.values]
+            if positions is not None:
+                values = [values[position] for position in positions]
+            frame = pd.DataFrame(
+                OrderedDict(zip(range(len(values)), values)),
+                index=index, copy=False)
+            frame.columns = columns
+        frame.read_only = True
+        if self.timeframe is not None:
+            frame.timeframe = TimeFrame(self.timeframe)
+        if self.look_ahead is not None:
+            frame.look_ahead = self.look_ahead.to_frame()
+        return frame
+
+
+def _read_only_values(chunk):
+    """Returns a list holding one read-only 2D array if every column
+    of `chunk` has the same dtype, otherwise one 1D array per column."""
+    if chunk.shape[1] == 0 or len(set(chunk.dtypes)) == 1:
+        values = [np.array(chunk.values)]
+    else:
+        values = [np.array(chunk.iloc[:, i].values)
+                  for i in range(chunk.shape[1])]
+    for array in values:
+        array.flags.writeable = False
+    return values
+
+
+def _read_only_frame(chunk):
+    """Returns a read-only DataFrame with the same data as `chunk`."""
+    return _CachedChunk(chunk).to_frame()
+
+
+def _store_identity(store):
+    filename = getattr(store, 'filename', None)
+    if filename is None:
+        filename = getattr(getattr(store, 'store', None), 'filename', None)
+    if filename is None:
+        return ('id', id(store))
+    return abspath(filename)
+
+
+def _normalise_key(key):
+    return '/' + key.strip('/')
+
+
+def _timeframe_key(timeframe):
+    if timeframe.empty:
+        return 'empty'
+    return (timeframe.start, timeframe.end,
+            getattr(timeframe, 'include_end', False))
@@ -0,0 +1,94 @@
+"""Convert memory budgets (in bytes) into chunk sizes (in rows).
+
+All DataStores and `MeterGroup.load` ask this module how many rows
+to load per chunk.  The number of rows is derived from the dtypes of
+the columns being loaded, so a table with 10 float64 columns gets
+chunks a fifth of the length of a table with one float32 column.
+
+Every chunk is limited by a process-wide memory ceiling which defaults
+to `MAX_MEM_ALLOWANCE_IN_BYTES`.  Lower it with `set_memory_ceiling()`
+when running many workers on the same machine; raise it to use bigger
+chunks when memory allows.
+"""
+from __future__ import print_function, division
+import numpy as np
+
+MAX_MEM_ALLOWANCE_IN_BYTES = 2**28
+BYTES_PER_TIMESTAMP = 8
+
+# Used for columns whose dtype is not known before loading
+# (e.g. CSV files, which pandas parses as float64).
+DEFAULT_DTYPE = np.float64
+
+_memory_ceiling = MAX_MEM_ALLOWANCE_IN_BYTES
+
+
+def set_memory_ceiling(n_bytes=None):
+    """Set the maximum number of bytes any single chunk may use.
+
+    Parameters
+    ----------
+    n_bytes : int, optional
+        If None then reset to `MAX_MEM_ALLOWANCE_IN_BYTES`.
+    """
+    global _memory_ceiling
+    if n_bytes is None:
+        n_bytes = MAX_MEM_ALLOWANCE_IN_BYTES
+    n_bytes = int(n_bytes)
+    if n_bytes <= 0:
+        raise ValueError("Memory ceiling must be positive, not {}"
+                         .format(n_bytes))
+    _memory_ceiling = n_bytes
+
+
+def get_memory_ceiling():
+    """Returns the process-wide memory ceiling in bytes."""
+    return _memory_ceiling
+
+
+def bytes_per_row(dtypes, n_meters=1, index=True):
+    """
+    Parameters
+    ----------
+    dtypes : list of numpy dtypes (or anything `np.dtype` understands)
+        One entry per column.
+    n_meters : int, optional
+        Number of meters whose chunks are held in memory at the same time.
+    index : bool, optional
+        If True then include the 8-byte timestamp index.
+
+    Returns
+    -------
+    int : number of bytes used by one row.
+    """
+    n_bytes = sum(np.dtype(dtype).itemsize for dtype in dtypes)
+    if index:
+        n_bytes += BYTES_PER_TIMESTAMP
+    return n_bytes * max(int(n_meters), 1)
+
+
+def plan_chunksize(dtypes, n_meters=1, max_bytes=None):
+    """Returns the maximum number of rows per chunk.
+
+    Parameters
+    ----------
+    dtypes : list of numpy dtypes
+        One entry per column to be loaded.
+    n_meters : int, optional
+        Number of meters whose chunks are held in memory at the same time.
+    max_bytes : int, optional
+        Memory budget for each chunk.  Never exceeds the process-wide
+        ceiling.  If None then use the ceiling.
+
+    Returns
+    -------
+    int : always >= 1.
+
+    Examples
+    --------
+    >>> plan_chunksize(['float32'] * 3, max_bytes=2000)
+    100
+    """
+    ceiling = get_memory_ceiling()
+    budget = ceiling if max_bytes is None else min(int(max_bytes), ceiling)
+    return max(budget // bytes_per_row(dtypes, n_meters), 1)
@@ -0,0 +1,254 @@
+"""Compression settings for HDFDataStore.
+
+A `CompressionPolicy` chooses a `Codec` for each class of key:
+
+* 'meter' : raw meter data, e.g. '/building1/elec/meter1'
+* 'cache' : cached statistics and indexes, e.g.
+  '/building1/elec/cache/meter1/total_energy'
+* 'output' : every non-cache key in a store opened with
+  `purpose='output'` (e.g. the output of a disaggregator)
+
+Use `benchmark_codecs()` to measure candidate codecs on a sample of
+your own meter data before choosing a policy.
+"""
+from __future__ import print_function, division
+import os
+from collections import namedtuple
+from os.path import join, getsize
+from shutil import rmtree
+from tempfile import mkdtemp
+from time import time
+import pandas as pd
+
+KEY_CLASSES = ('meter', 'cache', 'output')
+PURPOSES = ('dataset', 'output')
+
+
+class Codec(namedtuple('Codec', ['complib', 'complevel', 'shuffle'])):
+    """
+    Attributes
+    ----------
+    complib : string
+        Any compression library supported by PyTables,
+        e.g. 'zlib', 'blosc', 'blosc:lz4', 'blosc:zstd'.
+    complevel : int, 0-9
+        0 disables compression.
+    shuffle : bool or 'bit'
+        True for byte shuffling, 'bit' for bit shuffling.
+    """
+
+    def __new__(cls, complib='blosc', complevel=9, shuffle=True):
+        if not 0 <= complevel <= 9:
+            raise ValueError("complevel must be between 0 and 9, not {}"
+                             .format(complevel))
+        if shuffle not in (True, False, 'bit'):
+            raise ValueError("shuffle must be True, False or 'bit', not {}"
+                             .format(shuffle))
+        return super(Codec, cls).__new__(cls, complib, int(complevel), shuffle)
+
+    def filters(self):
+        """Returns a tables.Filters object for this codec."""
+        import tables
+        return tables.Filters(complevel=self.complevel, complib=self.complib,
+                              shuffle=self.shuffle is True,
+                              bitshuffle=self.shuffle == 'bit')
+
+    def __str__(self):
+        shuffle = {True: 'shuffle', False: 'noshuffle', 'bit': 'bitshuffle'}
+        return '{}-{}-{}'.format(self.complib, self.complevel,
+                                 shuffle[self.shuffle])
+
+
+class CompressionPolicy(object):
+    """Chooses a Codec for every key in an HDFDataStore.
+
+    Parameters
+    ----------
+    meter, cache, output : Codec, optional
+        Default to `Codec()` (blosc, level 9, byte shuffling).
+
+    Examples
+    --------
+    >>> policy = CompressionPolicy(meter=Codec('blosc:lz4', 5))
+    >>> policy.codec('/building1/elec/meter1')
+    Codec(complib='blosc:lz4', complevel=5, shuffle=True)
+    >>> policy.codec('/building1/elec/cache/meter1/total_energy')
+    Codec(complib='blosc', complevel=9, shuffle=True)
+    """
+
+    def __init__(self, meter=None, cache=None, output=None):
+        self.codecs = {
+            'meter': Codec() if meter is None else meter,
+            'cache': Codec() if cache is None else cache,
+            'output': Codec() if output is None else output}
+
+    def codec(self, key, purpose='dataset'):
+        """Returns the Codec for `key` in a store opened for `purpose`."""
+        return self.codecs[key_class(key, purpose)]
+
+    def __repr__(self):
+        return ('CompressionPolicy(meter={meter!r}, cache={cache!r},'
+                ' output={output!r})'.format(**self.codecs))
+
+
+# Reproduces NILMTK's original behaviour.
+DEFAULT_POLICY = CompressionPolicy()
+
+# For fast local storage, where decompression dominates read time.
+FAST_READ_POLICY = CompressionPolicy(
+    meter=Codec('blosc:lz4', 5),
+    cache=Codec('blosc:lz4', 1),
+    output=Codec('blosc:lz4', 1))
+
+# For slow (e.g. network) storage, where file size dominates read time.
+ARCHIVE_POLICY = CompressionPolicy(
+    meter=Codec('blosc:zstd', 9, shuffle='bit'),
+    cache=Codec('blosc:lz4', 5),
+    output=Codec('blosc:zstd', 5))
+
+
+def key_class(key, purpose='dataset'):
+    """
+    Returns
+    -------
+    'meter', 'cache' or 'output'
+
+    Examples
+    --------
+    >>> key_class('/building1/elec/meter1')
+    'meter'
+    >>> key_class('/building1/elec/cache/meter1/good_sections')
+    'cache'
+    >>> key_class('/building1/elec/meter1', purpose='output')
+    'output'
+    """
+    if purpose not in PURPOSES:
+        raise ValueError("purpose must be one of {}, not '{}'"
+                         .format(PURPOSES, purpose))
+    # Imported here to avoid a circular import.
+    from .hdfdatastore import ROW_INDEX_GROUP
+    parts = key.strip('/').split('/')
+    if 'cache' in parts or parts[0] == ROW_INDEX_GROUP:
+        return 'cache'
+    return 'output' if purpose == 'output' else 'meter'
+
+
+def to_compression_policy(compression):
+    """Converts None, a Codec or a CompressionPolicy to a CompressionPolicy."""
+    if compression is None:
+        return DEFAULT_POLICY
+    if isinstance(compression, Codec):
+        return CompressionPolicy(compression, compression, compression)
+    if isinstance(compression, CompressionPolicy):
+        return compression
+    raise TypeError("compression must be a Codec or a CompressionPolicy,"
+                    " not {}".format(type(compression)))
+
+
+CANDIDATE_CODECS = [
+    Codec('blosc', 9),
+    Codec('blosc', 5),
+    Codec('blosc:lz4', 5),
+    Codec('blosc:lz4', 1),
+    Codec('blosc:lz4hc', 9),
+    Codec('blosc:zstd', 5),
+    Codec('blosc:zstd', 9),
+    Codec('blosc:zstd', 9, shuffle='bit'),
+    Codec('zlib', 5),
+    Codec('zlib', 0, shuffle=False)
+]
+
+
+def benchmark_codecs(datastore, keys=None, codecs=None, n_rows=100000,
+                     n_repeats=3):
+    """Measures how well each codec compresses a sample of real meter
+    data, and how fast that sample decompresses.
+
+    Parameters
+    ----------
+    datastore : nilmtk.DataStore
+        The data to sample.  Can be any DataStore subclass.
+    keys : list of strings, optional
+        Keys of the tables to sample.  Defaults to every meter
+        in `datastore`.
+    codecs : list of Codecs, optional
+        Defaults to CANDIDATE_CODECS.
+    n_rows : int, optional
+        Number of rows to sample from the start of each table.
+    n_repeats : int, optional
+        Each read is repeated `n_repeats` times and the fastest is used.
+
+    Returns
+    -------
+    pd.DataFrame with one row per codec, sorted by read time, with columns:
+        complib, complevel, shuffle
+        file_size : bytes on disk
+        compression_ratio : uncompressed bytes / file_size
+        write_time, read_time : seconds
+        read_throughput : uncompressed MBytes per second
+    """
+    codecs = CANDIDATE_CODECS if codecs is None else codecs
+    keys = _meter_keys(datastore) if keys is None else keys
+    samples = {}
+    for key in keys:
+        sample = next(datastore.load(key, chunksize=n_rows))
+        samples[key] = sample.iloc[:n_rows]
+    n_bytes = sum(sample.memory_usage(index=True).sum()
+                  for sample in samples.values())
+
+    results = []
+    tmp_dir = mkdtemp()
+    try:
+        for codec in codecs:
+            filename = join(tmp_dir, str(codec) + '.h5')
+            start = time()
+            with pd.HDFStore(filename, 'w', complevel=codec.complevel,
+                             complib=codec.complib) as store:
+                store._filters = codec.filters()
+                for key, sample in samples.items():
+                    store.put(key, sample, format='table')
+            write_time = time() - start
+
+            read_times = []
+            for _ in range(n_repeats):
+                start = time()
+                with pd.HDFStore(filename, 'r') as store:
+                    for key in samples:
+                        store.select(key)
+                read_times.append(time() - start)
+            read_time = min(read_times)
+
+            file_size = getsize(filename)
+            os.remove(filename)
+            results.append({
+                'complib': codec.complib,
+                'complevel': codec.complevel,
+                'shuffle': codec.shuffle,
+                'file_size': file_size,
+                'compression_ratio': n_bytes / file_size,
+                'write_time': write_time,
+                'read_time': read_time,
+                'read_throughput': (n_bytes / 1E6) / read_time})
+    finally:
+        rmtree(tmp_dir)
+
+    columns = ['complib', 'complevel', 'shuffle', 'file_size',
+               'compression_ratio', 'write_time', 'read_time',
+               'read_throughput']
+    report = pd.DataFrame(results, columns=columns,
+                          index=[str(codec) for codec in codecs])
+    return report.sort_values('read_time')
+
+
+def _meter_keys(datastore):
+    keys = []
+    for building in datastore.elements_below_key():
+        elec_key = '/' + building + '/elec'
+        try:
+            elements = datastore.elements_below_key(elec_key)
+        except (KeyError, AttributeError):
+            continue
+        for element in elements:
+            if element.startswith('meter'):
+                keys.append(elec_key + '/' + element)
+    return keys
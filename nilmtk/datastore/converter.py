@@ -0,0 +1,248 @@
+"""Copy a whole dataset from one DataStore to another.
+
+Each meter table is streamed in chunks, so no table has to fit in
+memory.  When the output DataStore writes each key to its own files
+(`DataStore.writes_keys_independently`, e.g. CSVDataStore) and both
+DataStores can be reopened in another process, the keys are copied by
+a pool of worker processes.  Each worker gets an equal share of the
+process-wide memory ceiling for its chunks.  An HDF5 output is a single
+file which only one process may write, so its keys are copied one at
+a time.
+
+Progress is recorded in a small YAML journal next to the output after
+every key.  Pass `resume=True` to continue an interrupted conversion:
+finished keys are skipped and any partially written key is removed
+and copied again.
+"""
+from __future__ import print_function, division
+import multiprocessing
+from io import open
+from os.path import isfile
+import yaml
+import pandas as pd
+from .datastore import write_yaml_to_file
+from .chunkplanner import get_memory_ceiling, set_memory_ceiling
+
+JOURNAL_SUFFIX = '.convert.yaml'
+
+
+def convert_datastore(input_store, output_store, n_workers=1, chunksize=None,
+                      resume=False, verify=True, journal_filename=None,
+                      verbose=False):
+    """
+    Parameters
+    ----------
+    input_store : nilmtk.DataStore
+    output_store : nilmtk.DataStore
+    n_workers : int, optional
+        Number of worker processes.  Only used if `output_store`
+        can be written by several processes at once; otherwise keys
+        are copied in this process.
+    chunksize : int, optional
+        Rows per chunk.  If None then planned by each DataStore.
+    resume : bool, optional
+        If True then skip the keys which the journal records as
+        finished.  If False then start again from scratch.
+    verify : bool, optional
+        If True then check that every key in `output_store` has the
+        same number of rows as in `input_store` and the same timeframe
+        as was read from `input_store`.
+    journal_filename : str, optional
+        Defaults to the output's filename plus '.convert.yaml'.
+    verbose : bool, optional
+
+    Returns
+    -------
+    dict mapping each meter key to a dict with 'nrows', 'start' and 'end'.
+
+    Raises
+    ------
+    RuntimeError if verification fails.
+    """
+    if journal_filename is None:
+        journal_filename = _default_journal_filename(output_store)
+    journal = _Journal(journal_filename, resume)
+
+    if not journal.metadata_copied:
+        _copy_metadata(input_store, output_store)
+        journal.metadata_copied = True
+        journal.save()
+
+    keys = [key for key in _meter_keys(input_store) if key not in journal.keys]
+    input_spec = input_store._reopen_spec(read_only=True)
+    output_spec = output_store._reopen_spec()
+    parallel = (n_workers > 1 and len(keys) > 1 and
+                output_store.writes_keys_independently and
+                input_spec is not None and output_spec is not None)
+
+    if parallel:
+        context = (multiprocessing.get_context('spawn')
+                   if hasattr(multiprocessing, 'get_context')
+                   else multiprocessing)
+        n_workers = min(n_workers, len(keys))
+        pool = context.Pool(n_workers, initializer=set_memory_ceiling,
+                            initargs=(get_memory_ceiling() // n_workers,))
+        tasks = [(input_spec, output_spec, key, chunksize, resume)
+                 for key in keys]
+        try:
+            for key, summary in pool.imap_unordered(_copy_key_in_worker,
+                                                    tasks):
+                journal.finished(key, summary, verbose)
+        finally:
+            pool.terminate()
+            pool.join()
+    else:
+        for key in keys:
+            summary = _copy_key(input_store, output_store, key, chunksize,
+                                remove_existing=resume)
+            journal.finished(key, summary, verbose)
+
+    if verify:
+        _verify(input_store, output_store, journal.keys)
+    return journal.keys
+
+
+def _default_journal_filename(output_store):
+    spec = output_store._reopen_spec()
+    if spec is None:
+        raise ValueError("Please specify `journal_filename` for {}"
+                         .format(type(output_store).__name__))
+    filename = spec[1][0]
+    return filename.rstrip('/\\') + JOURNAL_SUFFIX
+
+
+def _meter_keys(input_store):
+    keys = []
+    for building in input_store.elements_below_key():
+        building_key = '/' + building
+        for utility in input_store.elements_below_key(building):
+            utility_key = building_key + '/' + utility
+            for meter in input_store.elements_below_key(utility_key):
+                # ignore cache (should this appear as an element below key?)
+                if meter == 'cache':
+                    continue
+                keys.append(utility_key + '/' + meter)
+    return keys
+
+
+def _copy_metadata(input_store, output_store):
+    # dataset metadata
+    metadata = input_store.load_metadata()
+    output_store.save_metadata('/', metadata)
+    for building in input_store.elements_below_key():
+        building_key = '/' + building
+        metadata = input_store.load_metadata(building_key)
+        output_store.save_metadata(building_key, metadata)
+
+
+def _copy_key_in_worker(task):
+    input_spec, output_spec, key, chunksize, remove_existing = task
+    input_store = _open(input_spec)
+    output_store = _open(output_spec)
+    try:
+        summary = _copy_key(input_store, output_store, key, chunksize,
+                            remove_existing)
+    finally:
+        input_store.close()
+        output_store.close()
+    return key, summary
+
+
+def _open(spec):
+    cls, args, kwargs = spec
+    return cls(*args, **kwargs)
+
+
+def _copy_key(input_store, output_store, key, chunksize, remove_existing):
+    """Streams `key` from `input_store` to `output_store`.
+
+    Returns
+    -------
+    dict with the number of rows copied and the first and last timestamps.
+    """
+    if remove_existing:
+        try:
+            output_store.remove(key)
+        except (KeyError, IOError, OSError):
+            pass
+    nrows = 0
+    start = end = None
+    with output_store.write_session():
+        for chunk in _load_rows(input_store, key, chunksize):
+            output_store.append(key, chunk)
+            nrows += len(chunk)
+            if start is None:
+                start = chunk.index[0]
+            end = chunk.index[-1]
+    return {'nrows': nrows,
+            'start': None if start is None else start.isoformat(),
+            'end': None if end is None else end.isoformat()}
+
+
+def _load_rows(store, key, chunksize=None):
+    """Yields the non-empty chunks of `key`, without the rows which
+    each chunk shares with the next (see `DataStore.chunk_overlap`)."""
+    overlap = 0
+    for chunk in store.load(key, chunksize=chunksize):
+        chunk = chunk.iloc[overlap:]
+        if len(chunk) == 0:
+            continue
+        yield chunk
+        overlap = store.chunk_overlap
+
+
+def _verify(input_store, output_store, summaries):
+    errors = []
+    for key, summary in sorted(summaries.items()):
+        source_nrows = _count_rows(input_store, key)
+        nrows = _count_rows(output_store, key)
+        if not (nrows == summary['nrows'] == source_nrows):
+            errors.append("{}: {} rows in the input, copied {} but found {}"
+                          .format(key, source_nrows, summary['nrows'], nrows))
+            continue
+        if nrows == 0:
+            continue
+        timeframe = output_store.get_timeframe(key)
+        if not (_same_time(timeframe.start, summary['start']) and
+                _same_time(timeframe.end, summary['end'])):
+            errors.append("{}: copied {} to {} but found {}"
+                          .format(key, summary['start'], summary['end'],
+                                  timeframe))
+    if errors:
+        raise RuntimeError("Conversion failed verification:\n" +
+                           "\n".join(errors))
+
+
+def _count_rows(store, key):
+    try:
+        return store._nrows(key)
+    except AttributeError:
+        return sum(len(chunk) for chunk in _load_rows(store, key))
+
+
+def _same_time(timestamp, isoformat):
+    return pd.Timestamp(timestamp).value == pd.Timestamp(isoformat).value
+
+
+class _Journal(object):
+    """Records which keys have been copied, in a YAML file."""
+
+    def __init__(self, filename, resume):
+        self.filename = filename
+        self.metadata_copied = False
+        self.keys = {}
+        if resume and isfile(filename):
+            with open(filename, 'r') as fh:
+                journal = yaml.safe_load(fh) or {}
+            self.metadata_copied = journal.get('metadata_copied', False)
+            self.keys = journal.get('keys', {})
+
+    def finished(self, key, summary, verbose=False):
+        self.keys[key] = summary
+        self.save()
+        if verbose:
+            print("Copied", key, "({} rows)".format(summary['nrows']))
+
+    def save(self):
+        write_yaml_to_file(self.filename, {
+            'metadata_copied': self.metadata_copied, 'keys': self.keys})
@@ -3,28 +3,43 @@ import pandas as pd
 from itertools import repeat, tee
 from time import time
 from copy import deepcopy
-from collections import OrderedDict
+from collections import OrderedDict, deque
 import numpy as np
 import yaml
 from os.path import isdir, isfile, join, exists, dirname
-from os import listdir, makedirs, remove
+from os import listdir, makedirs, remove, stat
 from shutil import rmtree
 import re
 from nilm_metadata.convert_yaml_to_hdf5 import _load_file
 from nilmtk.timeframe import TimeFrame
 from nilmtk.timeframegroup import TimeFrameGroup
 from nilmtk.node import Node
-from nilmtk.datastore import DataStore, MAX_MEM_ALLOWANCE_IN_BYTES
+from nilmtk.datastore import DataStore
+from nilmtk.datastore.chunkplanner import DEFAULT_DTYPE
 from nilmtk.datastore.key import Key
-from nilmtk.datastore.datastore import write_yaml_to_file, join_key
+from nilmtk.datastore.datastore import (write_yaml_to_file, join_key,
+                                       prefetchable)
 from nilmtk.docinherit import doc_inherit
 
 # do not edit! added by PythonBreakpoints
 from pdb import set_trace as _breakpoint
 
 
+# Each CSV file has one header line per column level, sometimes
+# followed by a line holding the name of the index.
+HEADER_ROWS = [0, 1]
+
+# Row indexes record the byte offset and timestamp of every
+# ROW_INDEX_BLOCK_SIZE-th row.  They are stored in the metadata directory
+# below ROW_INDEX_DIRNAME, e.g. 'metadata/row_index/building1/elec/meter1.npz'
+ROW_INDEX_BLOCK_SIZE = 4096
+ROW_INDEX_DIRNAME = 'row_index'
+
+
 class CSVDataStore(DataStore):
 
+    writes_keys_independently = True
+
     @doc_inherit
     def __init__(self, filename):
 
@@ -37,6 +52,7 @@ class CSVDataStore(DataStore):
         path = self._get_metadata_path()
         if not exists(path):
             makedirs(path)
+        self._row_indexes = {}
         super(CSVDataStore, self).__init__()
 
     @doc_inherit
@@ -49,65 +65,122 @@ class CSVDataStore(DataStore):
             raise KeyError('{} not found'.format(key))
 
     @doc_inherit
+    @prefetchable
     def load(self, key, cols=None, sections=None, n_look_ahead_rows=0,
-             chunksize=MAX_MEM_ALLOWANCE_IN_BYTES):
+             chunksize=None):
              
         file_path = self._key_to_abs_path(key)
+
+        # Every column is parsed before `cols` are selected
+        # so plan the chunksize for all columns.
+        if chunksize is None:
+            chunksize = self._plan_chunksize(key)
         
         # Set `sections` variable
         sections = [TimeFrame()] if sections is None else sections
         sections = TimeFrameGroup(sections)
 
         self.all_sections_smaller_than_chunksize = True
+        columns = self._columns(key)
         
-        # iterate through parameter sections
-        # requires 1 pass through file for each section
+        # iterate through parameter sections.  Use the row index to
+        # seek to the first row of each section and to stop parsing
+        # soon after the end of each section.
         for section in sections:
             window_intersect = self.window.intersection(section)
-            header_rows = [0,1]
-            text_file_reader = pd.read_csv(file_path, 
-                                            index_col=0, 
-                                            header=header_rows, 
-                                            parse_dates=True,
-                                            chunksize=chunksize)
-                                            
-            # iterate through all chunks in file
-            for chunk_idx, chunk in enumerate(text_file_reader):
-                
-                # filter dataframe by specified columns
+            if window_intersect.empty:
+                continue
+            offset, nrows = self._row_index(key).seek_range(
+                window_intersect, n_look_ahead_rows)
+            if nrows <= 0:
+                continue
+            csv_file = open(file_path, 'rb')
+            try:
+                csv_file.seek(offset)
+                text_file_reader = pd.read_csv(csv_file, 
+                                               index_col=0, 
+                                               header=None, 
+                                               parse_dates=True,
+                                               nrows=nrows,
+                                               chunksize=chunksize)
+                for subchunk in self._load_section(
+                        text_file_reader, columns, cols, window_intersect,
+                        n_look_ahead_rows):
+                    yield subchunk
+            finally:
+                csv_file.close()
+
+    def _load_section(self, text_file_reader, columns, cols, window_intersect,
+                      n_look_ahead_rows):
+        # Chunks read from the file but not yet processed.  The look
+        # ahead is taken from these so the file is only read once.
+        upcoming_chunks = deque()
+
+        def read_chunk():
+            chunk = next(text_file_reader, None)
+            if chunk is not None:
+                chunk.columns = columns
                 if cols:
+                    # filter dataframe by specified columns
                     chunk = chunk[cols]
+            return chunk
+
+        def next_chunk():
+            if upcoming_chunks:
+                return upcoming_chunks.popleft()
+            return read_chunk()
+
+        def peek_chunk(i):
+            while len(upcoming_chunks) <= i:
+                chunk = read_chunk()
+                if chunk is None:
+                    return None
+                upcoming_chunks.append(chunk)
+            return upcoming_chunks[i]
+
+        # iterate through all chunks in section
+        chunk = next_chunk()
+        while chunk is not None:
+            # mask chunk by window and section intersect
+            subchunk_idx = [True]*len(chunk)
+            if window_intersect.start:
+                subchunk_idx = np.logical_and(subchunk_idx, (chunk.index>=window_intersect.start))
+            if window_intersect.end:
+                subchunk_idx = np.logical_and(subchunk_idx, (chunk.index<window_intersect.end))
+            subchunk = chunk[subchunk_idx]
+            
+            if len(subchunk)>0:
+                subchunk_end = np.max(np.nonzero(subchunk_idx))
+                subchunk.timeframe = TimeFrame(subchunk.index[0], subchunk.index[-1])
+                # Take the look ahead from the rows after the subchunk,
+                # continuing into the following chunks if necessary.
+                if n_look_ahead_rows > 0:
+                    look_ahead_start = subchunk_end + 1
+                    look_ahead = [chunk.iloc[look_ahead_start:
+                                             look_ahead_start +
+                                             n_look_ahead_rows]]
+                    n_rows_needed = n_look_ahead_rows - len(look_ahead[0])
+                    i = 0
+                    while n_rows_needed > 0:
+                        following_chunk = peek_chunk(i)
+                        if following_chunk is None:
+                            break
+                        look_ahead.append(
+                            following_chunk.iloc[:n_rows_needed])
+                        n_rows_needed -= len(look_ahead[-1])
+                        i += 1
+                    if len(look_ahead) == 1:
+                        subchunk.look_ahead = look_ahead[0]
+                    else:
+                        subchunk.look_ahead = pd.concat(look_ahead)
                 
-                # mask chunk by window and section intersect
-                subchunk_idx = [True]*len(chunk)
-                if window_intersect.start:
-                    subchunk_idx = np.logical_and(subchunk_idx, (chunk.index>=window_intersect.start))
-                if window_intersect.end:
-                    subchunk_idx = np.logical_and(subchunk_idx, (chunk.index<window_intersect.end))
-                if window_intersect.empty:
-                    subchunk_idx = [False]*len(chunk)
-                subchunk = chunk[subchunk_idx]
-                
-                if len(subchunk)>0:
-                    subchunk_end = np.max(np.nonzero(subchunk_idx))
-                    subchunk.timeframe = TimeFrame(subchunk.index[0], subchunk.index[-1])
-                    # Load look ahead if necessary
-                    if n_look_ahead_rows > 0:
-                        if len(subchunk.index) > 0:
-                            rows_to_skip = (len(header_rows)+1)+(chunk_idx*chunksize)+subchunk_end+1
-                            try:
-                                subchunk.look_ahead = pd.read_csv(file_path, 
-                                                index_col=0, 
-                                                header=None, 
-                                                parse_dates=True,
-                                                skiprows=rows_to_skip,
-                                                nrows=n_look_ahead_rows)
-                            except ValueError:
-                                subchunk.look_ahead = pd.DataFrame()
-                        else:
-                            subchunk.look_ahead = pd.DataFrame()
-                    
-                    yield subchunk
+                yield subchunk
+
+            # The file is sorted so stop once we're past the section.
+            if (window_intersect.end is not None and len(chunk) > 0 and
+                    chunk.index[-1] >= window_intersect.end):
+                break
+            chunk = next_chunk()
 
     @doc_inherit
     def append(self, key, value):
@@ -116,9 +189,11 @@ class CSVDataStore(DataStore):
         path = dirname(file_path)
         if not exists(path):
             makedirs(path)
+        # Only write the header if we're creating the file.
         value.to_csv(file_path,
                      mode='a',
-                     header=True)
+                     header=not isfile(file_path))
+        self._remove_row_index(key)
 
     @doc_inherit
     def put(self, key, value):
@@ -130,9 +205,11 @@ class CSVDataStore(DataStore):
         value.to_csv(file_path,
                      mode='w',
                      header=True)
+        self._remove_row_index(key)
 
     @doc_inherit
     def remove(self, key):
+        self._remove_row_index(key)
         file_path = self._key_to_abs_path(key)
         if isfile(file_path):
             remove(file_path)
@@ -220,21 +297,65 @@ class CSVDataStore(DataStore):
     @doc_inherit
     def get_timeframe(self, key):
     
-        file_path = self._key_to_abs_path(key)
-        text_file_reader = pd.read_csv(file_path, 
-                                        index_col=0, 
-                                        header=[0,1], 
-                                        parse_dates=True,
-                                        chunksize=MAX_MEM_ALLOWANCE_IN_BYTES)
-        start = None
-        end = None
-        for df in text_file_reader:
-            if start is None:
-                start = df.index[0]
-            end = df.index[-1]
+        row_index = self._row_index(key)
+        start, end = pd.to_datetime([row_index.first, row_index.last])
         timeframe = TimeFrame(start, end)
         return self.window.intersection(timeframe)
+
+    def _columns(self, key):
+        file_path = self._key_to_abs_path(key)
+        header = pd.read_csv(file_path, index_col=0, header=HEADER_ROWS,
+                             nrows=0)
+        return header.columns
         
+    def _column_names(self, key):
+        return list(self._columns(key))
+
+    def _row_index(self, key):
+        """Returns the _CSVRowIndex for `key`, loading it from the
+        metadata directory or (re)building it if the CSV file has
+        changed since the index was built."""
+        file_path = self._key_to_abs_path(key)
+        if not isfile(file_path):
+            raise KeyError('{} not found'.format(key))
+        file_stat = stat(file_path)
+        row_index = self._row_indexes.get(key)
+        if row_index is None or not row_index.is_valid_for(file_stat):
+            index_path = self._row_index_path(key)
+            row_index = _CSVRowIndex.load(index_path)
+            if row_index is None or not row_index.is_valid_for(file_stat):
+                row_index = _CSVRowIndex.build(file_path)
+                try:
+                    row_index.save(index_path)
+                except (IOError, OSError):
+                    pass # e.g. read-only dataset
+            self._row_indexes[key] = row_index
+        return row_index
+
+    def _row_index_path(self, key):
+        relative_path = key.strip('/')
+        return join(self._get_metadata_path(), ROW_INDEX_DIRNAME,
+                    relative_path + '.npz')
+
+    def _remove_row_index(self, key):
+        for indexed_key in list(self._row_indexes):
+            if (join_key(indexed_key) + '/').startswith(join_key(key) + '/'):
+                del self._row_indexes[indexed_key]
+        index_path = self._row_index_path(key)
+        if isfile(index_path):
+            remove(index_path)
+        elif isdir(index_path[:-len('.npz')]):
+            rmtree(index_path[:-len('.npz')])
+
+    def _reopen_spec(self, read_only=False):
+        return CSVDataStore, (self.filename,), {}
+
+    def _column_dtypes(self, key, cols=None):
+        # Numbers in CSV files are parsed as float64.
+        if cols is None:
+            cols = self._column_names(key)
+        return [np.dtype(DEFAULT_DTYPE)] * len(cols)
+
     def _get_metadata_path(self):
         return join(self.filename, 'metadata')
         
@@ -249,3 +370,142 @@ class CSVDataStore(DataStore):
             if key_object.building and key_object.meter:
                 abs_path += '.csv'
         return abs_path
+
+
+class _CSVRowIndex(object):
+    """A sparse index of a CSV file: the byte offset and timestamp
+    of every `block_size`-th data row.
+
+    Attributes
+    ----------
+    block_size : int
+    timestamps : np.ndarray of int64
+        `timestamps[i]` is the timestamp (nanoseconds since the epoch,
+        UTC if the file's timestamps have a UTC offset) of row
+        `i * block_size`.
+    offsets : np.ndarray of int64
+        `offsets[i]` is the byte offset of row `i * block_size`.
+    nrows : int
+    first, last : strings
+        The first and last timestamps in the file, as written.
+    file_size, file_mtime : used to detect changes to the CSV file.
+    """
+
+    def __init__(self, block_size, timestamps, offsets, nrows, first, last,
+                 file_size, file_mtime):
+        self.block_size = int(block_size)
+        self.timestamps = timestamps
+        self.offsets = offsets
+        self.nrows = int(nrows)
+        self.first = first
+        self.last = last
+        self.file_size = int(file_size)
+        self.file_mtime = float(file_mtime)
+
+    @classmethod
+    def build(cls, file_path, block_size=ROW_INDEX_BLOCK_SIZE):
+        file_stat = stat(file_path)
+        sampled_timestamps = []
+        offsets = []
+        last = None
+        nrows = 0
+        with open(file_path, 'rb') as csv_file:
+            offset = _skip_header(csv_file)
+            for line in csv_file:
+                if not line.strip():
+                    offset += len(line)
+                    continue
+                last = line.split(b',', 1)[0]
+                if nrows % block_size == 0:
+                    sampled_timestamps.append(last)
+                    offsets.append(offset)
+                offset += len(line)
+                nrows += 1
+        sampled_timestamps = [timestamp.decode('utf-8')
+                              for timestamp in sampled_timestamps]
+        timestamps = pd.to_datetime(sampled_timestamps, utc=True).asi8
+        first = sampled_timestamps[0] if sampled_timestamps else None
+        last = None if last is None else last.decode('utf-8')
+        return cls(block_size, np.asarray(timestamps, dtype=np.int64),
+                   np.asarray(offsets, dtype=np.int64), nrows, first, last,
+                   file_stat.st_size, file_stat.st_mtime)
+
+    @classmethod
+    def load(cls, index_path):
+        """Returns None if `index_path` does not exist or can't be read."""
+        if not isfile(index_path):
+            return None
+        try:
+            with np.load(index_path) as arrays:
+                return cls(block_size=arrays['block_size'],
+                           timestamps=arrays['timestamps'],
+                           offsets=arrays['offsets'],
+                           nrows=arrays['nrows'],
+                           first=arrays['first'].item() or None,
+                           last=arrays['last'].item() or None,
+                           file_size=arrays['file_size'],
+                           file_mtime=arrays['file_mtime'])
+        except (IOError, OSError, KeyError, ValueError):
+            return None
+
+    def save(self, index_path):
+        path = dirname(index_path)
+        if not exists(path):
+            makedirs(path)
+        with open(index_path, 'wb') as index_file:
+            np.savez(index_file, block_size=self.block_size,
+                     timestamps=self.timestamps, offsets=self.offsets,
+                     nrows=self.nrows, first=np.array(self.first or u''),
+                     last=np.array(self.last or u''),
+                     file_size=self.file_size, file_mtime=self.file_mtime)
+
+    def is_valid_for(self, file_stat):
+        return (self.file_size == file_stat.st_size and
+                self.file_mtime == file_stat.st_mtime)
+
+    def seek_range(self, timeframe, n_look_ahead_rows=0):
+        """
+        Returns
+        -------
+        offset, nrows : ints
+            Parsing `nrows` rows from byte `offset` reads every row
+            in `timeframe` plus `n_look_ahead_rows` rows after it.
+        """
+        start_block = 0
+        if timeframe.start is not None:
+            start_block = np.searchsorted(
+                self.timestamps, _to_i8(timeframe.start), side='left') - 1
+            start_block = max(start_block, 0)
+        end_row = self.nrows
+        if timeframe.end is not None:
+            end_block = np.searchsorted(
+                self.timestamps, _to_i8(timeframe.end),
+                side='right' if timeframe.include_end else 'left')
+            if end_block < len(self.timestamps):
+                end_row = end_block * self.block_size
+        if start_block >= len(self.offsets):
+            return 0, 0
+        start_row = start_block * self.block_size
+        nrows = min(end_row + n_look_ahead_rows, self.nrows) - start_row
+        return int(self.offsets[start_block]), int(nrows)
+
+
+def _skip_header(csv_file):
+    """Reads past the header of `csv_file` (opened in binary mode)
+    and returns the byte offset of the first data row."""
+    for _ in HEADER_ROWS:
+        csv_file.readline()
+    offset = csv_file.tell()
+    line = csv_file.readline()
+    fields = line.rstrip(b'\r\n').split(b',')
+    if len(fields) > 1 and not any(fields[1:]):
+        # Index names line, e.g. ',,,'
+        offset = csv_file.tell()
+    else:
+        csv_file.seek(offset)
+    return offset
+
+
+def _to_i8(timestamp):
+    # Nanoseconds since the epoch, comparable with _CSVRowIndex.timestamps
+    return pd.Timestamp(timestamp).value
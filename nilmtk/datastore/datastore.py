@@ -1,15 +1,18 @@
 from __future__ import print_function, division
 import yaml
+import threading
+from contextlib import contextmanager
+from functools import wraps
+from six.moves import queue
 from nilmtk.timeframe import TimeFrame
+from nilmtk.profiling import get_profiler
 from io import open
+from .chunkplanner import MAX_MEM_ALLOWANCE_IN_BYTES, plan_chunksize
 
 # do not edit! added by PythonBreakpoints
 from pdb import set_trace as _breakpoint
 
 
-MAX_MEM_ALLOWANCE_IN_BYTES = 2**28
-
-
 class DataStore(object):
     """
     Provides a common interface to all physical data stores.
@@ -35,6 +38,16 @@ class DataStore(object):
     window : nilmtk.TimeFrame
         Defines the timeframe we are interested in.
     """
+
+    # True if `append` and `put` only touch files which belong to the
+    # key being written, so that several processes can write different
+    # keys of the same store at once.
+    writes_keys_independently = False
+
+    # Number of rows at the end of each chunk yielded by `load` which
+    # are also the first rows of the next chunk of the same section.
+    chunk_overlap = 0
+
     def __init__(self):
         """
         Parameters
@@ -70,7 +83,7 @@ class DataStore(object):
         self._window = window
         
     def load(self, key, cols=None, sections=None, n_look_ahead_rows=0,
-             chunksize=MAX_MEM_ALLOWANCE_IN_BYTES):
+             chunksize=None):
         """
         Parameters
         ----------
@@ -87,6 +100,13 @@ class DataStore(object):
             property which will be a DataFrame of length `n_look_ahead_rows`
             of the data immediately in front of the data in the main DataFrame.
         chunksize : int, optional
+            Maximum number of rows per chunk.  If None then the number
+            of rows is planned from the dtypes of `cols` so that each
+            chunk fits within the process-wide memory ceiling
+            (see `nilmtk.datastore.chunkplanner`).
+        prefetch : int, optional, defaults to 0
+            If >0 then load up to `prefetch` chunks ahead on a background
+            thread while the caller processes the current chunk.
 
         Returns
         ------- 
@@ -142,6 +162,36 @@ class DataStore(object):
         """
         raise NotImplementedError("NotImplementedError")
         
+    @contextmanager
+    def write_session(self, max_bytes=None, index_in_background=False):
+        """Context manager for writing lots of data efficiently.
+
+        Within the session, backends may buffer calls to `append`,
+        defer flushing to disk and defer building table indexes until
+        the session closes.  Data is only guaranteed to be on disk once
+        the session has closed.  Sessions may be nested; only the
+        outermost session has any effect.  The default implementation
+        does nothing.
+
+        Parameters
+        ----------
+        max_bytes : int, optional
+            Maximum number of bytes of appended data to buffer in memory.
+            Defaults to the process-wide memory ceiling.
+        index_in_background : bool, optional
+            If True then build table indexes on a background thread
+            after the session closes.
+
+        Examples
+        --------
+        ::
+
+            with output_datastore.write_session():
+                for chunk in chunks:
+                    output_datastore.append(key, chunk)
+        """
+        yield self
+
     def load_metadata(self, key='/'):
         """
         Parameters
@@ -185,6 +235,149 @@ class DataStore(object):
         """
         raise NotImplementedError("NotImplementedError")
 
+    def _column_dtypes(self, key, cols=None):
+        """
+        Parameters
+        ----------
+        key : str
+        cols : list of column names, optional
+            If None then return dtypes of all columns.
+
+        Returns
+        -------
+        list of numpy dtypes, one per column.
+        """
+        raise NotImplementedError("NotImplementedError")
+
+    def _reopen_spec(self, read_only=False):
+        """Returns (cls, args, kwargs) such that `cls(*args, **kwargs)`
+        opens this DataStore again (e.g. in a worker process), or None
+        if this DataStore cannot be reopened.
+        """
+        return None
+
+    def _plan_chunksize(self, key, cols=None, n_meters=1, max_bytes=None):
+        """Returns the number of rows per chunk which fits in memory.
+
+        See `nilmtk.datastore.chunkplanner.plan_chunksize` for details.
+        """
+        dtypes = self._column_dtypes(key, cols)
+        return plan_chunksize(dtypes, n_meters=n_meters, max_bytes=max_bytes)
+
+
+@contextmanager
+def without_window(store):
+    """Clears `store.window` until the end of the `with` block, e.g.
+    so that indexes derived from a table cover the whole table."""
+    window = store.window
+    store.window = TimeFrame()
+    try:
+        yield store
+    finally:
+        store.window = window
+
+
+def split_look_ahead(data, n_chunk_rows):
+    """Splits a DataFrame read with extra look ahead rows.
+
+    Parameters
+    ----------
+    data : pd.DataFrame
+        The chunk followed immediately by its look ahead rows.
+    n_chunk_rows : int
+        Number of rows in the chunk itself.
+
+    Returns
+    -------
+    pd.DataFrame of the first `n_chunk_rows` rows of `data`, with
+    a `look_ahead` attribute holding the remaining rows.  Both are
+    slices of `data` so no data is copied.
+    """
+    chunk = data.iloc[:n_chunk_rows]
+    chunk.look_ahead = data.iloc[n_chunk_rows:]
+    return chunk
+
+
+def prefetchable(load):
+    """Decorator for `DataStore.load` implementations which adds
+    the `prefetch` parameter and profiles the loaded chunks (see
+    `nilmtk.profiling`).  Apply it beneath `@doc_inherit`."""
+    @wraps(load)
+    def wrapper(self, *args, **kwargs):
+        prefetch = kwargs.pop('prefetch', 0)
+        generator = load(self, *args, **kwargs)
+        if prefetch:
+            generator = prefetch_chunks(generator, prefetch)
+        profiler = get_profiler()
+        if profiler is not None:
+            generator = profiler.profile(type(self).__name__ + '.load',
+                                         generator)
+        return generator
+    return wrapper
+
+
+_END_OF_CHUNKS = object()
+
+
+def prefetch_chunks(generator, depth=1):
+    """Runs `generator` on a background thread, at most `depth`
+    items ahead of the consumer.
+
+    Exceptions raised by `generator` are re-raised in the consumer.
+    If the consumer stops early then the background thread stops too.
+
+    Parameters
+    ----------
+    generator : iterator, e.g. the output of `DataStore.load`
+    depth : int, maximum number of items buffered ahead of the consumer
+
+    Returns
+    -------
+    generator which yields the same items as `generator`.
+    """
+    chunks = queue.Queue(maxsize=max(int(depth), 1))
+    stop = threading.Event()
+
+    def put(item):
+        while not stop.is_set():
+            try:
+                chunks.put(item, timeout=0.1)
+            except queue.Full:
+                continue
+            else:
+                return True
+        return False
+
+    def produce():
+        try:
+            for chunk in generator:
+                if not put((chunk, None)):
+                    break
+        except Exception as exception:
+            put((_END_OF_CHUNKS, exception))
+        else:
+            put((_END_OF_CHUNKS, None))
+        finally:
+            close = getattr(generator, 'close', None)
+            if close is not None:
+                close()
+
+    thread = threading.Thread(target=produce, name='nilmtk-prefetch')
+    thread.daemon = True
+    thread.start()
+
+    try:
+        while True:
+            chunk, exception = chunks.get()
+            if chunk is _END_OF_CHUNKS:
+                if exception is not None:
+                    raise exception
+                return
+            yield chunk
+    finally:
+        stop.set()
+        thread.join()
+
 
 def write_yaml_to_file(metadata_filename, metadata):
     metadata_file = open(metadata_filename, 'w')
@@ -214,30 +407,12 @@ def join_key(*args):
         key = key[:-1] # remove last trailing slash
     return key
         
-def convert_datastore(input_store, output_store):
-    """
-    Parameters
-    ----------
-    input_store : nilmtk.DataStore
-    output_store : nilmtk.DataStore
-    """
-    # dataset metadata
-    metadata = input_store.load_metadata()
-    output_store.save_metadata('/', metadata)
-    for building in input_store.elements_below_key():
-        building_key = '/'+building
-        # building metadata
-        metadata = input_store.load_metadata(building_key)
-        output_store.save_metadata(building_key, metadata)
-        for utility in input_store.elements_below_key(building):
-            utility_key = building_key+'/'+utility
-            for meter in input_store.elements_below_key(utility_key):
-                # ignore cache (should this appear as an element below key?)
-                if meter == 'cache':
-                    continue
-                meter_key = utility_key+'/'+meter
-                # store meter data
-                for df in input_store.load(meter_key):
-                    output_store.append(meter_key, df)
-
+def convert_datastore(input_store, output_store, **kwargs):
+    """Copies every meter table and all metadata from `input_store`
+    to `output_store`.
 
+    See `nilmtk.datastore.converter.convert_datastore` for the
+    key word arguments.
+    """
+    from .converter import convert_datastore as convert
+    return convert(input_store, output_store, **kwargs)
@@ -1,11 +1,17 @@
 from __future__ import print_function, division
 import pandas as pd
-from copy import deepcopy
+from six.moves import cPickle as pickle
 import numpy as np
+import threading
+from functools import wraps, partial
+from collections import OrderedDict
+from contextlib import contextmanager
 from os.path import isfile
 from nilmtk.timeframe import TimeFrame
 from nilmtk.timeframegroup import TimeFrameGroup
-from .datastore import DataStore, MAX_MEM_ALLOWANCE_IN_BYTES
+from .datastore import DataStore, join_key, prefetchable, split_look_ahead
+from .chunkplanner import bytes_per_row, get_memory_ceiling
+from .compression import to_compression_policy, PURPOSES
 from nilmtk.docinherit import doc_inherit
 from builtins import range
 
@@ -13,34 +19,92 @@ from builtins import range
 from pdb import set_trace as _breakpoint
 
 
+# Tables are indexed by taking the timestamp of every
+# ROW_INDEX_BLOCK_SIZE-th row.  Row indexes are stored below
+# ROW_INDEX_GROUP, e.g. '/nilmtk_row_index/building1/elec/meter1'.
+ROW_INDEX_BLOCK_SIZE = 4096
+ROW_INDEX_BLOCKS_PER_READ = 256
+ROW_INDEX_GROUP = 'nilmtk_row_index'
+
+# A summary of every table (first and last timestamps, number of rows,
+# columns and dtypes) is kept in the `summaries` attribute of
+# SUMMARY_GROUP so that get_timeframe() etc. don't have to open each table.
+SUMMARY_GROUP = 'nilmtk_summary'
+
+# PyTables (and HDF5 itself, unless built thread-safe) must only be
+# called from one thread at a time.  `load(prefetch=...)` reads on a
+# background thread so every call into PyTables holds this lock.
+_HDF5_LOCK = threading.RLock()
+
+
+def _synchronized(method):
+    @wraps(method)
+    def wrapper(*args, **kwargs):
+        with _HDF5_LOCK:
+            return method(*args, **kwargs)
+    return wrapper
+
+
 class HDFDataStore(DataStore):
 
-    @doc_inherit
-    def __init__(self, filename, mode='a'):
+    # Each chunk ends with the first row of the next chunk.
+    chunk_overlap = 1
+
+    def __init__(self, filename, mode='a', compression=None,
+                 purpose='dataset'):
+        """
+        Parameters
+        ----------
+        filename : string
+        mode : 'a' (append), 'w' (write) or 'r' (read), optional
+        compression : CompressionPolicy or Codec, optional
+            Compression used when writing each key.  A Codec is used for
+            every key.  Defaults to blosc, level 9.
+            See `nilmtk.datastore.compression`.
+        purpose : 'dataset' or 'output', optional
+            Set to 'output' for stores written by disaggregators so
+            that the policy's `output` codec is used.
+        """
         if mode == 'a' and not isfile(filename):
             raise IOError("No such file as " + filename)
-        self.store = pd.HDFStore(filename, mode, complevel=9, complib='blosc')
+        if purpose not in PURPOSES:
+            raise ValueError("purpose must be one of {}, not '{}'"
+                             .format(PURPOSES, purpose))
+        self.compression = to_compression_policy(compression)
+        self.purpose = purpose
+        default_codec = self.compression.codec('/', purpose)
+        self.store = pd.HDFStore(filename, mode,
+                                 complevel=default_codec.complevel,
+                                 complib=default_codec.complib)
+        self.store._filters = default_codec.filters()
+        self._row_indexes = {}
+        # Keys whose row index or summary was built by a read and so
+        # only lives in memory: reading must not modify the file.
+        self._unsaved_row_indexes = set()
+        self._metadata_cache = {}
+        self._summaries = None
+        self._unsaved_summaries = set()
+        self._summaries_modified = False
+        self._write_session = None
+        self._index_thread = None
         super(HDFDataStore, self).__init__()
 
     @doc_inherit
+    @_synchronized
     def __getitem__(self, key):
+        self._write_pending_appends(key)
         return self.store[key]
 
     @doc_inherit
+    @prefetchable
     def load(self, key, cols=None, sections=None, n_look_ahead_rows=0,
-             chunksize=MAX_MEM_ALLOWANCE_IN_BYTES, verbose=False):
-        # TODO: calculate chunksize default based on physical
-        # memory installed and number of columns
-
+             chunksize=None, verbose=False):
         # Make sure key has a slash at the front but not at the end.
         if key[0] != '/':
             key = '/' + key
         if len(key) > 1 and key[-1] == '/':
             key = key[:-1]
 
-        # Make sure chunksize is an int otherwise `range` complains later.
-        chunksize = np.int64(chunksize)
-
         # Set `sections` variable
         sections = [TimeFrame()] if sections is None else sections
         sections = TimeFrameGroup(sections)
@@ -50,11 +114,44 @@ class HDFDataStore(DataStore):
             cols = [('' if pq is None else pq, '' if ac is None else ac)
                     for pq, ac in cols]
 
+        if chunksize is None:
+            chunksize = self._plan_chunksize(key, cols)
+
+        # Make sure chunksize is an int otherwise `range` complains later.
+        chunksize = np.int64(chunksize)
+
         if verbose:
             print("HDFDataStore.load(key='{}', cols='{}', sections='{}',"
                   " n_look_ahead_rows='{}', chunksize='{}')"
                   .format(key, cols, sections, n_look_ahead_rows, chunksize))
 
+        for start_i, stop_i, timeframe in self._plan_chunks(
+                key, sections, chunksize, verbose):
+            if start_i is None:
+                data = pd.DataFrame()
+                data.timeframe = timeframe
+                yield data
+                continue
+
+            # Read the look ahead in the same read as the chunk.
+            data = self._read_rows(key, start_i,
+                                   stop_i + max(n_look_ahead_rows, 0), cols)
+            if n_look_ahead_rows > 0:
+                data = split_look_ahead(data, stop_i - start_i)
+            data.timeframe = timeframe(data.index)
+            yield data
+            del data
+
+    def _plan_chunks(self, key, sections, chunksize, verbose=False):
+        """Plans the chunks which `load` yields for `sections`.
+
+        Yields
+        ------
+        (start_i, stop_i, timeframe) for each chunk.  Rows [start_i,
+        stop_i) of the table are the chunk and `timeframe(index)`
+        returns its TimeFrame given its index.  For empty sections,
+        start_i and stop_i are None and `timeframe` is a TimeFrame.
+        """
         self.all_sections_smaller_than_chunksize = True
 
         for section in sections:
@@ -63,41 +160,31 @@ class HDFDataStore(DataStore):
             window_intersect = self.window.intersection(section)
 
             if window_intersect.empty:
-                data = pd.DataFrame()
-                data.timeframe = section
-                yield data
+                yield None, None, section
                 continue
 
             terms = window_intersect.query_terms('window_intersect')
             if terms is None:
                 section_start_i = 0
-                section_end_i = self.store.get_storer(key).nrows
-                if section_end_i <= 1:
-                    data = pd.DataFrame()
-                    data.timeframe = section
-                    yield data
+                with _HDF5_LOCK:
+                    section_end_i = self._get_storer(key).nrows
+                if section_end_i == 0:
+                    yield None, None, section
                     continue
             else:
-                try:
-                    coords = self.store.select_as_coordinates(key=key, where=terms)
-                except AttributeError as e:
-                    if str(e) == ("'NoneType' object has no attribute "
-                                  "'read_coordinates'"):
-                        raise KeyError("key '{}' not found".format(key))
-                    else:
-                        raise
-                n_coords = len(coords)
-                if n_coords == 0:
-                    data = pd.DataFrame()
-                    data.timeframe = window_intersect
-                    yield data
+                section_start_i, section_end_i = self._row_range(
+                    key, window_intersect)
+                if section_end_i <= section_start_i:
+                    yield None, None, window_intersect
                     continue
 
-                section_start_i = coords[0]
-                section_end_i   = coords[-1]
-                del coords
-            slice_starts = range(section_start_i, section_end_i, chunksize)
-            n_chunks = int(np.ceil((section_end_i - section_start_i) / chunksize))
+                # `section_end_i` is the last row *in* the section
+                section_end_i -= 1
+            # A section of a single row is still one chunk
+            slice_starts = range(section_start_i,
+                                 max(section_end_i, section_start_i + 1),
+                                 chunksize)
+            n_chunks = len(slice_starts)
 
             if n_chunks > 1:
                 self.all_sections_smaller_than_chunksize = False
@@ -110,34 +197,18 @@ class HDFDataStore(DataStore):
                     chunk_end_i = section_end_i
                 chunk_end_i += 1
 
-                data = self.store.select(key=key, columns=cols,
-                                         start=chunk_start_i, stop=chunk_end_i)
-
-                # if len(data) <= 2:
-                #     yield pd.DataFrame()
-
-                # Load look ahead if necessary
-                if n_look_ahead_rows > 0:
-                    if len(data.index) > 0:
-                        look_ahead_start_i = chunk_end_i
-                        look_ahead_end_i = look_ahead_start_i + n_look_ahead_rows
-                        try:
-                            data.look_ahead = self.store.select(
-                                key=key, columns=cols,
-                                start=look_ahead_start_i,
-                                stop=look_ahead_end_i)
-                        except ValueError:
-                            data.look_ahead = pd.DataFrame()
-                    else:
-                        data.look_ahead = pd.DataFrame()
-
-                data.timeframe = _timeframe_for_chunk(there_are_more_subchunks, 
-                                                      chunk_i, window_intersect,
-                                                      data.index)
-                yield data
-                del data
+                yield chunk_start_i, chunk_end_i, partial(
+                    _timeframe_for_chunk, there_are_more_subchunks, chunk_i,
+                    window_intersect)
+
+    @_synchronized
+    def _read_rows(self, key, start_i, stop_i, cols=None):
+        """Returns rows [start_i, stop_i) of table `key`."""
+        return self.store.select(key=key, columns=cols, start=start_i,
+                                 stop=stop_i)
 
     @doc_inherit
+    @_synchronized
     def append(self, key, value):
         """
         Parameters
@@ -151,69 +222,215 @@ class HDFDataStore(DataStore):
         Append does *not* check if data being appended overlaps with existing
         data in the table, so be careful.
         """
-        self.store.append(key=key, value=value)
-        self.store.flush()
+        session = self._write_session
+        if session is None:
+            with self._compression_for(key):
+                self.store.append(key=key, value=value)
+            self._update_summary(key, value)
+            self._save_summaries()
+            self._update_row_index(key)
+            self.store.flush()
+        else:
+            session.buffer(key, value)
+            if session.n_bytes > session.max_bytes:
+                self._write_pending_appends()
 
     @doc_inherit
+    @_synchronized
     def put(self, key, value):
-        self.store.put(key, value, format='table', 
-                       expectedrows=len(value), index=False)
-        self.store.create_table_index(key, columns=['index'], 
-                                      kind='full', optlevel=9)
-        self.store.flush()
+        self._remove_row_index(key)
+        self._forget_metadata(key)
+        session = self._write_session
+        if session is not None:
+            session.discard(key)
+        with self._compression_for(key):
+            self.store.put(key, value, format='table', 
+                           expectedrows=len(value), index=False)
+        self._update_summary(key, value, replace=True)
+        self._save_summaries()
+        if session is None:
+            self.store.create_table_index(key, columns=['index'], 
+                                          kind='full', optlevel=9)
+            self._row_index(join_key(key), save=True)
+            self.store.flush()
+        else:
+            session.keys_to_index.add(join_key(key))
 
     @doc_inherit
+    @_synchronized
     def remove(self, key):
+        self._remove_row_index(key)
+        if self._write_session is not None:
+            self._write_session.discard(key)
         self.store.remove(key)
+        self._forget_metadata(key)
+        self._forget_summaries(key)
+        self._save_summaries()
 
     @doc_inherit
+    @_synchronized
     def load_metadata(self, key='/'):
-        if key == '/':
-            node = self.store.root
-        else:
-            node = self.store.get_node(key)
-
-        metadata = deepcopy(node._v_attrs.metadata)
-        return metadata
+        self._write_pending_appends(key)
+        # Metadata is cached as a pickle: unpickling is a much cheaper
+        # way to hand out a private copy than deepcopy.
+        try:
+            pickled = self._metadata_cache[join_key(key)]
+        except KeyError:
+            if key == '/':
+                node = self.store.root
+            else:
+                node = self.store.get_node(key)
+            pickled = pickle.dumps(node._v_attrs.metadata,
+                                   pickle.HIGHEST_PROTOCOL)
+            self._metadata_cache[join_key(key)] = pickled
+        return pickle.loads(pickled)
 
     @doc_inherit
+    @_synchronized
     def save_metadata(self, key, metadata):
+        self._write_pending_appends(key)
         if key == '/':
             node = self.store.root
         else:
             node = self.store.get_node(key)
+            if node is None:
+                # e.g. building metadata saved before any of its tables
+                parent, name = join_key(key).rsplit('/', 1)
+                node = self.store._handle.create_group(
+                    parent or '/', name, createparents=True)
 
         node._v_attrs.metadata = metadata
-        self.store.flush()
+        self._metadata_cache.pop(join_key(key), None)
+        self._flush()
 
     @doc_inherit
+    @_synchronized
     def elements_below_key(self, key='/'):
+        self._write_pending_appends(key)
         if key == '/' or not key:
             node = self.store.root
         else:
             node = self.store.get_node(key)
-        return list(node._v_children.keys())
+        return [element for element in node._v_children.keys()
+                if element not in (ROW_INDEX_GROUP, SUMMARY_GROUP)]
 
     @doc_inherit
+    @_synchronized
     def close(self):
+        self.wait_for_indexes()
         self.store.close()
+        self._metadata_cache = {}
+        self._summaries = None
 
     @doc_inherit
+    @_synchronized
     def open(self, mode='a'):
         self.store.open(mode=mode)
+        self._metadata_cache = {}
+        self._summaries = None
+        self.store._filters = self.compression.codec(
+            '/', self.purpose).filters()
         
     @doc_inherit
+    @_synchronized
     def get_timeframe(self, key):
         """
         Returns
         -------
         nilmtk.TimeFrame of entire table after intersecting with self.window.
         """
-        data_start_date = self.store.select(key, [0]).index[0]
-        data_end_date = self.store.select(key, start=-1).index[0]
-        timeframe = TimeFrame(data_start_date, data_end_date)
+        summary = self._get_summary(key, timestamps=True)
+        if summary['nrows'] == 0:
+            timeframe = TimeFrame()
+            timeframe._empty = True
+            return timeframe
+        timeframe = TimeFrame(_from_i8(summary['start'], summary['tz']),
+                              _from_i8(summary['end'], summary['tz']))
         return self.window.intersection(timeframe)
     
+    @doc_inherit
+    @contextmanager
+    def write_session(self, max_bytes=None, index_in_background=False):
+        """
+        Appends are buffered in memory and written in large batches
+        without an index.  Nothing is flushed until the session closes,
+        when a full index is built for every table written in the session.
+        DataFrames passed to `append` must not be modified until they
+        have been written.
+        """
+        if self._write_session is not None:
+            # Nested session: the outermost session does all the work.
+            yield self
+            return
+
+        self.wait_for_indexes()
+        session = _WriteSession(
+            get_memory_ceiling() if max_bytes is None else max_bytes)
+        with _HDF5_LOCK:
+            self._write_session = session
+        try:
+            yield self
+        finally:
+            with _HDF5_LOCK:
+                try:
+                    self._write_pending_appends()
+                finally:
+                    self._write_session = None
+                self._save_summaries()
+            if index_in_background:
+                self._index_thread = threading.Thread(
+                    target=self._build_indexes, args=(session.keys_to_index,),
+                    name='nilmtk-hdf-index')
+                self._index_thread.start()
+            else:
+                self._build_indexes(session.keys_to_index)
+
+    def wait_for_indexes(self):
+        """Blocks until indexes being built in the background (see
+        `write_session`) are complete."""
+        if self._index_thread is not None:
+            self._index_thread.join()
+            self._index_thread = None
+
+    def _write_pending_appends(self, key='/'):
+        """Writes appends buffered by the write session for tables
+        at or below `key`."""
+        session = self._write_session
+        if session is None:
+            return
+        with _HDF5_LOCK:
+            for pending_key, value in session.pop(key):
+                with self._compression_for(pending_key):
+                    self.store.append(key=pending_key, value=value,
+                                      index=False)
+                self._update_summary(pending_key, value)
+                session.keys_to_index.add(join_key(pending_key))
+
+    @_synchronized
+    def _build_indexes(self, keys):
+        for key in sorted(keys):
+            self.store.create_table_index(key, columns=['index'],
+                                          kind='full', optlevel=9)
+            self._row_index(key, save=True)
+        self.store.flush()
+
+    @contextmanager
+    def _compression_for(self, key):
+        """Sets the compression filters used by the next writes
+        to the codec chosen by `self.compression` for `key`."""
+        codec = self.compression.codec(key, self.purpose)
+        filters = self.store._filters
+        self.store._filters = codec.filters()
+        try:
+            yield
+        finally:
+            self.store._filters = filters
+
+    def _flush(self):
+        # Flushing is deferred until the write session closes.
+        if self._write_session is None:
+            self.store.flush()
+
     def _check_columns(self, key, columns):
         if columns is None:
             return
@@ -239,38 +456,62 @@ class HDFDataStore(DataStore):
         table_cols = set(self._column_names(key) + ['index'])
         return query_cols.issubset(table_cols)
 
+    @_synchronized
     def _column_names(self, key):
-        self._check_key(key)
+        return list(self._get_summary(key)['columns'])
+
+    def _reopen_spec(self, read_only=False):
+        # HDF5 locks a file which is open for writing, so other
+        # processes can only read it if this handle is read-only too.
+        if read_only and self.store._mode != 'r':
+            return None
+        mode = 'r' if read_only else 'a'
+        return (HDFDataStore, (self.store.filename, mode),
+                {'compression': self.compression, 'purpose': self.purpose})
+
+    def _column_dtypes(self, key, cols=None):
+        summary = self._get_summary(key)
+        dtypes = {_hashable(col): np.dtype(dtype) for col, dtype
+                  in zip(summary['columns'], summary['dtypes'])}
+        if cols is None:
+            cols = summary['columns']
+        # Like `select`, ignore requested columns which aren't in the table.
+        return [dtypes[_hashable(col)] for col in cols
+                if _hashable(col) in dtypes]
+
+    @_synchronized
+    def _table_column_dtypes(self, key, cols):
         storer = self._get_storer(key)
-        col_names = storer.non_index_axes[0][1:][0]
-        return col_names
+        storer.infer_axes()
+        coldtypes = storer.table.coldtypes
+        dtypes = {}
+        for values_axis in storer.values_axes:
+            dtype = coldtypes[values_axis.cname].base
+            for col_name in values_axis.values:
+                dtypes[_hashable(col_name)] = dtype
+        return [dtypes[_hashable(col)] for col in cols]
 
     def _check_data_will_fit_in_memory(self, key, nrows, cols=None):
         # Check we won't use too much memory
         mem_requirement = self._estimate_memory_requirement(key, nrows, cols)
-        if mem_requirement > MAX_MEM_ALLOWANCE_IN_BYTES:
+        if mem_requirement > get_memory_ceiling():
             raise MemoryError('Requested data would use {:.3f}MBytes:'
                               ' too much memory.'
                               .format(mem_requirement / 1E6))
 
     def _estimate_memory_requirement(self, key, nrows, cols=None, paranoid=False):
         """Returns estimated mem requirement in bytes."""
-        BYTES_PER_ELEMENT = 4
-        BYTES_PER_TIMESTAMP = 8
         if paranoid:
             self._check_key(key)
-        if cols is None:
-            cols = self._column_names(key)
-        elif paranoid:
-            self._check_columns(key, cols)
-        ncols = len(cols)
-        est_mem_usage_for_data = nrows * ncols * BYTES_PER_ELEMENT
-        est_mem_usage_for_index = nrows * BYTES_PER_TIMESTAMP
+            if cols is not None:
+                self._check_columns(key, cols)
         if cols == ['index']:
-            return est_mem_usage_for_index
+            dtypes = []
         else:
-            return est_mem_usage_for_data + est_mem_usage_for_index
-       
+            dtypes = self._column_dtypes(key, cols)
+        return nrows * bytes_per_row(dtypes)
+
+    @_synchronized
     def _nrows(self, key, timeframe=None):
         """
         Returns
@@ -281,23 +522,248 @@ class HDFDataStore(DataStore):
         if timeframe_intersect.empty:
             nrows = 0
         elif timeframe_intersect:
-            terms = timeframe_intersect.query_terms('timeframe_intersect')
-            coords = self.store.select_as_coordinates(key, terms)
-            nrows = len(coords)
+            start_i, end_i = self._row_range(key, timeframe_intersect)
+            nrows = max(end_i - start_i, 0)
         else:
-            storer = self._get_storer(key)
-            nrows = storer.nrows
+            nrows = self._get_summary(key)['nrows']
         return nrows
     
+    @_synchronized
     def _keys(self):
         return self.store.keys()
 
     def _get_storer(self, key):
-        self._check_key(key)
-        storer = self.store.get_storer(key)
-        assert storer is not None, "cannot get storer for key = " + key
+        self._write_pending_appends(key)
+        try:
+            storer = self.store.get_storer(key)
+        except (KeyError, TypeError):
+            storer = None
+        if storer is None:
+            raise KeyError(key + ' not in store')
         return storer
+
+    @_synchronized
+    def _row_range(self, key, timeframe):
+        """Finds the rows of table `key` which lie within `timeframe`.
+
+        Uses the row index (see `_row_index`) so we only need to read
+        at most two small blocks of the table's index from disk,
+        rather than materialising the coordinates of every row in
+        `timeframe`.  Assumes the table is sorted by its index.
+
+        Returns
+        -------
+        start_i, end_i : ints
+            Rows [start_i, end_i) lie within `timeframe`.
+        """
+        row_index = self._row_index(key)
+        start_i = 0
+        end_i = row_index.nrows
+        if timeframe.start is not None:
+            start_i = row_index.searchsorted(
+                timeframe.start, side='left',
+                read_block=self._index_reader(key))
+        if timeframe.end is not None:
+            end_i = row_index.searchsorted(
+                timeframe.end, side='right' if timeframe.include_end else 'left',
+                read_block=self._index_reader(key))
+        return start_i, end_i
+
+    def _row_index(self, key, save=False):
+        """Returns the _RowIndex for table `key`, building or extending it
+        if necessary.  The row index is only written to the store if
+        `save` is True, which only the write paths do."""
+        nrows = self._get_storer(key).nrows
+        row_index = self._row_indexes.get(key)
+        if row_index is None:
+            row_index = self._load_row_index(key)
+        if row_index is None or row_index.nrows > nrows:
+            row_index = _RowIndex()
+            self._unsaved_row_indexes.add(key)
+        if row_index.nrows < nrows:
+            row_index.extend(nrows, self._index_reader(key))
+            self._unsaved_row_indexes.add(key)
+        self._row_indexes[key] = row_index
+        if save and key in self._unsaved_row_indexes:
+            self._save_row_index(key, row_index)
+        return row_index
+
+    def _update_row_index(self, key):
+        """Extends and saves the row index of `key` after an append,
+        if one has already been built."""
+        key = join_key(key)
+        if key in self._row_indexes or self._load_row_index(key) is not None:
+            self._row_index(key, save=True)
+
+    def _index_reader(self, key):
+        # Read the raw int64 'index' field straight from the PyTables table
+        # to avoid constructing a DatetimeIndex for every block.
+        table = self._get_storer(key).table
+        def read_block(start, stop):
+            return table.read(start=start, stop=stop, field='index')
+        return read_block
+
+    def _load_row_index(self, key):
+        row_index_key = join_key(ROW_INDEX_GROUP, key)
+        try:
+            storer = self.store.get_storer(row_index_key)
+        except (KeyError, TypeError):
+            return None
+        if storer is None:
+            return None
+        samples = self.store[row_index_key].values.astype(np.int64)
+        return _RowIndex(block_size=storer.attrs.block_size,
+                         samples=samples, nrows=storer.attrs.nrows)
+
+    def _save_row_index(self, key, row_index):
+        if self.store._mode == 'r':
+            return
+        row_index_key = join_key(ROW_INDEX_GROUP, key)
+        with self._compression_for(row_index_key):
+            self.store.put(row_index_key, pd.Series(row_index.samples),
+                           format='fixed')
+        attrs = self.store.get_storer(row_index_key).attrs
+        attrs.block_size = row_index.block_size
+        attrs.nrows = row_index.nrows
+        self._unsaved_row_indexes.discard(key)
+        self._flush()
+
+    def _remove_row_index(self, key):
+        key = join_key(key)
+        for indexed_key in list(self._row_indexes):
+            if indexed_key == key or indexed_key.startswith(key + '/'):
+                del self._row_indexes[indexed_key]
+                self._unsaved_row_indexes.discard(indexed_key)
+        if self.store._mode == 'r':
+            return
+        try:
+            self.store.remove(join_key(ROW_INDEX_GROUP, key))
+        except KeyError:
+            pass
     
+    @_synchronized
+    def _get_summary(self, key, timestamps=False):
+        """Returns a dict with keys 'start', 'end' (int64 nanoseconds),
+        'tz', 'nrows', 'columns' and 'dtypes'.
+
+        Tables written before summaries existed, or whose summary no longer
+        matches their number of rows, are summarised the first time they
+        are used.  Their 'start', 'end' and 'tz' are None
+        unless `timestamps` is True, which reads the first and last rows.
+        """
+        self._write_pending_appends(key)
+        key = join_key(key)
+        summaries = self._load_summaries()
+        summary = summaries.get(key)
+        if (summary is not None and
+                summary['nrows'] != self._get_storer(key).nrows):
+            # The table was written to without updating its summary,
+            # e.g. by pandas.HDFStore.
+            summary = None
+        if summary is None:
+            self._check_key(key)
+            storer = self._get_storer(key)
+            columns = list(storer.non_index_axes[0][1:][0])
+            summary = {'nrows': storer.nrows, 'start': None, 'end': None,
+                       'tz': None, 'columns': columns,
+                       'dtypes': [str(dtype) for dtype
+                                  in self._table_column_dtypes(key, columns)]}
+            summaries[key] = summary
+            self._unsaved_summaries.add(key)
+        nrows = summary['nrows']
+        if timestamps and nrows > 0 and summary['start'] is None:
+            index = self.store.select(key, start=0, stop=1).index
+            summary['tz'] = _tz_name(index)
+            summary['start'] = index[0].value
+            summary['end'] = self.store.select(
+                key, start=nrows-1, stop=nrows).index[0].value
+        return summary
+
+    def _update_summary(self, key, value, replace=False):
+        """Records that `value` has been written to `key`."""
+        key = join_key(key)
+        summaries = self._load_summaries()
+        summary = summaries.get(key)
+        if (not replace and summary is not None and summary['nrows'] > 0
+                and summary['start'] is None):
+            # The table's timestamps have not been read yet.
+            del summaries[key]
+            self._unsaved_summaries.discard(key)
+            self._summaries_modified = True
+            return
+        self._unsaved_summaries.discard(key)
+        if replace or summary is None or summary['nrows'] == 0:
+            if not replace and self.store.get_storer(key).nrows != len(value):
+                # Appending to a table we have no summary for.
+                summaries.pop(key, None)
+                self._summaries_modified = True
+                return
+            summary = {'nrows': 0, 'start': None, 'end': None,
+                       'tz': _tz_name(value.index),
+                       'columns': list(value.columns),
+                       'dtypes': [str(dtype) for dtype in value.dtypes]}
+            summaries[key] = summary
+        if len(value) == 0:
+            return
+        start = value.index[0].value
+        end = value.index[-1].value
+        summary['nrows'] += len(value)
+        summary['start'] = (start if summary['start'] is None
+                            else min(summary['start'], start))
+        summary['end'] = (end if summary['end'] is None
+                          else max(summary['end'], end))
+        self._summaries_modified = True
+
+    def _forget_summaries(self, key):
+        key = join_key(key)
+        summaries = self._load_summaries()
+        for summary_key in list(summaries):
+            if (key == '/' or summary_key == key or
+                    summary_key.startswith(key + '/')):
+                del summaries[summary_key]
+                self._unsaved_summaries.discard(summary_key)
+                self._summaries_modified = True
+
+    def _load_summaries(self):
+        if self._summaries is None:
+            try:
+                node = self.store.get_node(SUMMARY_GROUP)
+            except (KeyError, AttributeError):
+                node = None
+            if node is None:
+                self._summaries = {}
+            else:
+                self._summaries = dict(getattr(node._v_attrs, 'summaries', {}))
+            self._unsaved_summaries = set()
+            self._summaries_modified = False
+        return self._summaries
+
+    def _save_summaries(self):
+        """Writes summaries to SUMMARY_GROUP.  Deferred until the write
+        session closes.  Does nothing if the file is read-only.  Summaries
+        built by reads are not written."""
+        if (self._summaries is None or not self._summaries_modified or
+                self._write_session is not None or self.store._mode == 'r'):
+            return
+        summaries = {key: summary for key, summary in self._summaries.items()
+                     if key not in self._unsaved_summaries}
+        node = self.store.get_node(SUMMARY_GROUP)
+        if not summaries:
+            if node is not None:
+                node._f_remove()
+        else:
+            if node is None:
+                node = self.store._handle.create_group('/', SUMMARY_GROUP)
+            node._v_attrs.summaries = summaries
+        self._summaries_modified = False
+
+    def _forget_metadata(self, key):
+        key = join_key(key)
+        for cached_key in list(self._metadata_cache):
+            if (key == '/' or cached_key == key or
+                    cached_key.startswith(key + '/')):
+                del self._metadata_cache[cached_key]
+
     def _check_key(self, key):
         """
         Parameters
@@ -308,6 +774,120 @@ class HDFDataStore(DataStore):
             raise KeyError(key + ' not in store')
         
 
+class _WriteSession(object):
+    """Appends buffered by `HDFDataStore.write_session`.
+
+    Attributes
+    ----------
+    max_bytes : int
+    n_bytes : int
+        Number of bytes currently buffered.
+    keys_to_index : set of keys written during the session.
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.n_bytes = 0
+        self.keys_to_index = set()
+        self._pending = OrderedDict()
+
+    def buffer(self, key, value):
+        self._pending.setdefault(join_key(key), []).append(value)
+        self.n_bytes += value.memory_usage(index=True).sum()
+
+    def discard(self, key):
+        self.pop(key)
+        self.keys_to_index.discard(join_key(key))
+
+    def pop(self, key='/'):
+        """Removes and returns (key, DataFrame) pairs for all tables at
+        or below `key`.  Each table's appends are concatenated."""
+        key = join_key(key)
+        popped = []
+        for pending_key in list(self._pending):
+            if (key == '/' or pending_key == key or
+                    pending_key.startswith(key + '/')):
+                values = self._pending.pop(pending_key)
+                for value in values:
+                    self.n_bytes -= value.memory_usage(index=True).sum()
+                if len(values) > 1:
+                    value = pd.concat(values)
+                else:
+                    value = values[0]
+                popped.append((pending_key, value))
+        return popped
+
+
+class _RowIndex(object):
+    """A sparse index of an HDF5 table: the timestamp (as int64 nanoseconds)
+    of every `block_size`-th row.  Resolving a timestamp to a row number
+    is a binary search of `samples` followed by a binary search of a single
+    block of the table's index.
+
+    Attributes
+    ----------
+    block_size : int
+    samples : np.ndarray of int64
+        `samples[i]` is the timestamp of row `i * block_size`.
+    nrows : int
+        The number of rows in the table when the index was last extended.
+    """
+
+    def __init__(self, block_size=ROW_INDEX_BLOCK_SIZE, samples=None, nrows=0):
+        self.block_size = int(block_size)
+        self.samples = (np.array([], dtype=np.int64) if samples is None
+                        else samples)
+        self.nrows = int(nrows)
+
+    def extend(self, nrows, read_block):
+        """Add samples for rows [self.nrows, nrows).
+
+        Parameters
+        ----------
+        nrows : int
+            The new number of rows in the table.
+        read_block : function(start, stop) returning int64 np.ndarray
+            Reads the index of the table for rows [start, stop).
+        """
+        block_size = self.block_size
+        next_sample_i = int(np.ceil(self.nrows / block_size)) * block_size
+        read_size = block_size * ROW_INDEX_BLOCKS_PER_READ
+        new_samples = [self.samples]
+        for start in range(next_sample_i, nrows, read_size):
+            stop = min(start + read_size, nrows)
+            new_samples.append(read_block(start, stop)[::block_size])
+        self.samples = np.concatenate(new_samples).astype(np.int64)
+        self.nrows = nrows
+
+    def searchsorted(self, timestamp, side, read_block):
+        """Returns the row at which `timestamp` would be inserted to
+        maintain order (see np.searchsorted)."""
+        timestamp = pd.Timestamp(timestamp).value
+        j = int(np.searchsorted(self.samples, timestamp, side=side))
+        if j == 0:
+            return 0
+        block_start = (j - 1) * self.block_size
+        block_end = min(j * self.block_size, self.nrows)
+        block = read_block(block_start, block_end)
+        return block_start + int(np.searchsorted(block, timestamp, side=side))
+
+
+def _tz_name(index):
+    return None if index.tz is None else str(index.tz)
+
+
+def _from_i8(value, tz):
+    timestamp = pd.Timestamp(value)
+    if tz is not None:
+        timestamp = timestamp.tz_localize('UTC').tz_convert(tz)
+    return timestamp
+
+
+def _hashable(col_name):
+    # PyTables metadata may give MultiIndex column names as lists.
+    return tuple(col_name) if isinstance(col_name, list) else col_name
+
+
 def _timeframe_for_chunk(there_are_more_subchunks, chunk_i, window_intersect, index):
     start = None
     end = None
@@ -326,7 +906,8 @@ def _timeframe_for_chunk(there_are_more_subchunks, chunk_i, window_intersect, in
 
     if start is None:
         start = index[0]
-    if end is None:
+    if end is None and index[-1] > start:
+        # (a chunk of a single row in an open-ended section stays open)
         end = index[-1]
 
     return TimeFrame(start, end)
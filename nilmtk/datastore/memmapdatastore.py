@@ -0,0 +1,411 @@
+from __future__ import print_function, division
+import pandas as pd
+import numpy as np
+import yaml
+from collections import OrderedDict
+from os.path import isdir, isfile, join, exists
+from os import listdir, makedirs, remove
+from shutil import rmtree
+from io import open
+from nilmtk.timeframe import TimeFrame
+from nilmtk.timeframegroup import TimeFrameGroup
+from .datastore import (DataStore, write_yaml_to_file, prefetchable,
+                        split_look_ahead)
+from .hdfdatastore import _timeframe_for_chunk
+from nilmtk.docinherit import doc_inherit
+from builtins import range
+
+
+SCHEMA_FILENAME = 'schema.yaml'
+METADATA_FILENAME = 'metadata.yaml'
+INDEX_FILENAME = 'index.bin'
+INDEX_DTYPE = np.int64
+
+
+class MemmapDataStore(DataStore):
+    """Stores each table as contiguous binary arrays on disk.
+
+    Every key is a directory.  Table directories contain `index.bin`
+    (int64 nanoseconds since the epoch, UTC if the table is timezone-aware),
+    one `col<N>.bin` file per column and a `schema.yaml` describing the
+    number of rows, the column names and the dtypes.  Metadata for any key
+    lives in `metadata.yaml` inside that key's directory.
+
+    `load()` memory-maps the arrays and uses a binary search of the
+    index to find the rows for each section, so only the pages which
+    are actually needed are read from disk.  Each column is a separate
+    file, so those pages are copied into each chunk's DataFrame.
+
+    `append()` only accepts rows which come after the last row on disk.
+    """
+
+    writes_keys_independently = True
+
+    @doc_inherit
+    def __init__(self, filename):
+        self.filename = filename
+        if not exists(filename):
+            makedirs(filename)
+        self._tables = {}
+        super(MemmapDataStore, self).__init__()
+
+    @doc_inherit
+    def __getitem__(self, key):
+        table = self._get_table(key)
+        return self._frame(table, None, 0, table.nrows)
+
+    @doc_inherit
+    @prefetchable
+    def load(self, key, cols=None, sections=None, n_look_ahead_rows=0,
+             chunksize=None, verbose=False):
+        table = self._get_table(key)
+
+        # Set `sections` variable
+        sections = [TimeFrame()] if sections is None else sections
+        sections = TimeFrameGroup(sections)
+
+        # Replace any Nones with '' in cols:
+        if cols is not None:
+            cols = [('' if pq is None else pq, '' if ac is None else ac)
+                    for pq, ac in cols]
+
+        if chunksize is None:
+            chunksize = self._plan_chunksize(key, cols)
+        chunksize = int(chunksize)
+
+        if verbose:
+            print("MemmapDataStore.load(key='{}', cols='{}', sections='{}',"
+                  " n_look_ahead_rows='{}', chunksize='{}')"
+                  .format(key, cols, sections, n_look_ahead_rows, chunksize))
+
+        self.all_sections_smaller_than_chunksize = True
+
+        for section in sections:
+            window_intersect = self.window.intersection(section)
+
+            if window_intersect.empty:
+                data = pd.DataFrame()
+                data.timeframe = section
+                yield data
+                continue
+
+            section_start_i, section_end_i = table.row_range(window_intersect)
+            if section_end_i <= section_start_i:
+                data = pd.DataFrame()
+                data.timeframe = window_intersect
+                yield data
+                continue
+
+            slice_starts = range(section_start_i, section_end_i, chunksize)
+            n_chunks = len(slice_starts)
+
+            if n_chunks > 1:
+                self.all_sections_smaller_than_chunksize = False
+
+            for chunk_i, chunk_start_i in enumerate(slice_starts):
+                chunk_end_i = min(chunk_start_i + chunksize, section_end_i)
+                there_are_more_subchunks = (chunk_i < n_chunks-1)
+
+                # Read the look ahead in the same read as the chunk.
+                if n_look_ahead_rows > 0:
+                    look_ahead_end_i = min(chunk_end_i + n_look_ahead_rows,
+                                           table.nrows)
+                    data = self._frame(table, cols, chunk_start_i,
+                                       look_ahead_end_i)
+                    data = split_look_ahead(data, chunk_end_i - chunk_start_i)
+                else:
+                    data = self._frame(table, cols, chunk_start_i, chunk_end_i)
+
+                data.timeframe = _timeframe_for_chunk(there_are_more_subchunks,
+                                                      chunk_i, window_intersect,
+                                                      data.index)
+                yield data
+                del data
+
+    @doc_inherit
+    def append(self, key, value):
+        if not isfile(join(self._key_to_abs_path(key), SCHEMA_FILENAME)):
+            self.put(key, value)
+            return
+
+        table = self._get_table(key)
+        columns = _columns_to_list(value.columns)
+        if columns != table.schema['columns']:
+            raise ValueError("Cannot append to '{}': columns {} do not match"
+                             " the columns on disk {}."
+                             .format(key, columns, table.schema['columns']))
+        if len(value) == 0:
+            return
+        if not value.index.is_monotonic_increasing:
+            raise ValueError("The index must be sorted.")
+        if (table.nrows > 0 and
+                table._to_i8(value.index[0]) <= table.index[-1]):
+            raise ValueError("Cannot append to '{}': data must start after"
+                             " the last row on disk ({})."
+                             .format(key, self._index(table, table.nrows - 1,
+                                                      table.nrows)[0]))
+
+        path = self._key_to_abs_path(key)
+        self._write_arrays(path, value, table.schema, mode='ab')
+        table.schema['nrows'] += len(value)
+        write_yaml_to_file(join(path, SCHEMA_FILENAME), table.schema)
+        self._tables.pop(_normalise_key(key), None)
+
+    @doc_inherit
+    def put(self, key, value):
+        path = self._key_to_abs_path(key)
+        if exists(path):
+            self._remove_table_files(path)
+        else:
+            makedirs(path)
+
+        index = value.index
+        if not isinstance(index, pd.DatetimeIndex):
+            raise TypeError("MemmapDataStore can only store DataFrames with"
+                            " a DatetimeIndex, not '{}'.".format(type(index)))
+        tz = None if index.tz is None else str(index.tz)
+        dtypes = []
+        for dtype in value.dtypes:
+            if dtype == np.object_:
+                raise ValueError("Cannot store columns of dtype 'object'.")
+            dtypes.append(str(dtype))
+
+        schema = {
+            'nrows': len(value),
+            'tz': tz,
+            'columns': _columns_to_list(value.columns),
+            'column_names': list(value.columns.names),
+            'dtypes': dtypes}
+        self._write_arrays(path, value, schema, mode='wb')
+        write_yaml_to_file(join(path, SCHEMA_FILENAME), schema)
+        self._tables.pop(_normalise_key(key), None)
+
+    @doc_inherit
+    def remove(self, key):
+        path = self._key_to_abs_path(key)
+        if not exists(path):
+            raise KeyError('{} not found'.format(key))
+        self._forget_tables_below(key)
+        rmtree(path)
+
+    @doc_inherit
+    def load_metadata(self, key='/'):
+        filename = join(self._key_to_abs_path(key), METADATA_FILENAME)
+        if not isfile(filename):
+            return {}
+        with open(filename, 'r') as metadata_file:
+            metadata = yaml.load(metadata_file, Loader=_YAML_LOADER)
+        return {} if metadata is None else metadata
+
+    @doc_inherit
+    def save_metadata(self, key, metadata):
+        path = self._key_to_abs_path(key)
+        if not exists(path):
+            makedirs(path)
+        write_yaml_to_file(join(path, METADATA_FILENAME), metadata)
+
+    @doc_inherit
+    def elements_below_key(self, key='/'):
+        path = self._key_to_abs_path(key)
+        if not isdir(path):
+            return []
+        return sorted([element for element in listdir(path)
+                       if isdir(join(path, element))])
+
+    @doc_inherit
+    def close(self):
+        self._tables = {}
+
+    @doc_inherit
+    def open(self):
+        # memmaps are opened lazily
+        pass
+
+    @doc_inherit
+    def get_timeframe(self, key):
+        table = self._get_table(key)
+        if table.nrows == 0:
+            timeframe = TimeFrame()
+            timeframe._empty = True
+            return timeframe
+        start = self._index(table, 0, 1)[0]
+        end = self._index(table, table.nrows - 1, table.nrows)[0]
+        timeframe = TimeFrame(start, end)
+        return self.window.intersection(timeframe)
+
+    def _nrows(self, key, timeframe=None):
+        """
+        Returns
+        -------
+        nrows : int
+        """
+        table = self._get_table(key)
+        timeframe_intersect = self.window.intersection(timeframe)
+        if timeframe_intersect.empty:
+            return 0
+        start_i, end_i = table.row_range(timeframe_intersect)
+        return max(end_i - start_i, 0)
+
+    def _column_names(self, key):
+        table = self._get_table(key)
+        return list(table.columns)
+
+    def _reopen_spec(self, read_only=False):
+        return MemmapDataStore, (self.filename,), {}
+
+    def _column_dtypes(self, key, cols=None):
+        table = self._get_table(key)
+        dtypes = [np.dtype(dtype) for dtype in table.schema['dtypes']]
+        if cols is None:
+            return dtypes
+        try:
+            return [dtypes[table.columns.index(col)] for col in cols]
+        except ValueError:
+            raise KeyError('at least one of ' + str(cols) +
+                           ' is not a valid column')
+
+    def _get_table(self, key):
+        key = _normalise_key(key)
+        try:
+            return self._tables[key]
+        except KeyError:
+            pass
+        path = self._key_to_abs_path(key)
+        schema_filename = join(path, SCHEMA_FILENAME)
+        if not isfile(schema_filename):
+            raise KeyError('{} not found'.format(key))
+        with open(schema_filename, 'r') as schema_file:
+            schema = yaml.load(schema_file, Loader=_YAML_LOADER)
+        table = _MemmapTable(path, schema)
+        self._tables[key] = table
+        return table
+
+    def _frame(self, table, cols, start, stop):
+        if cols is None:
+            col_indices = range(len(table.columns))
+        else:
+            try:
+                col_indices = [table.columns.index(col) for col in cols]
+            except ValueError:
+                raise KeyError('at least one of ' + str(cols) +
+                               ' is not a valid column')
+        data = OrderedDict()
+        for i in col_indices:
+            data[i] = table.column(i)[start:stop]
+        frame = pd.DataFrame(data, index=self._index(table, start, stop),
+                             columns=list(col_indices), copy=False)
+        frame.columns = _list_to_columns(
+            [table.columns[i] for i in col_indices],
+            table.schema.get('column_names'))
+        return frame
+
+    def _index(self, table, start, stop):
+        index = pd.DatetimeIndex(table.index[start:stop].view('M8[ns]'))
+        tz = table.schema.get('tz')
+        if tz is not None:
+            index = index.tz_localize('UTC').tz_convert(tz)
+        return index
+
+    def _write_arrays(self, path, value, schema, mode):
+        index = value.index
+        if index.tz is not None:
+            index = index.tz_convert('UTC')
+        index_values = np.ascontiguousarray(index.asi8, dtype=INDEX_DTYPE)
+        with open(join(path, INDEX_FILENAME), mode) as fh:
+            fh.write(index_values.tobytes())
+        for i, dtype in enumerate(schema['dtypes']):
+            values = np.ascontiguousarray(value.iloc[:, i].values, dtype=dtype)
+            with open(join(path, _column_filename(i)), mode) as fh:
+                fh.write(values.tobytes())
+
+    def _remove_table_files(self, path):
+        for filename in listdir(path):
+            if filename.endswith('.bin') or filename == SCHEMA_FILENAME:
+                remove(join(path, filename))
+
+    def _forget_tables_below(self, key):
+        key = _normalise_key(key)
+        for table_key in list(self._tables):
+            if table_key == key or table_key.startswith(key + '/'):
+                del self._tables[table_key]
+
+    def _key_to_abs_path(self, key):
+        relative_path = _normalise_key(key).strip('/')
+        if relative_path:
+            return join(self.filename, *relative_path.split('/'))
+        else:
+            return self.filename
+
+
+class _MemmapTable(object):
+    """Lazily memory-mapped arrays for a single key."""
+
+    def __init__(self, path, schema):
+        self.path = path
+        self.schema = schema
+        self.nrows = schema['nrows']
+        self.columns = [tuple(col) if isinstance(col, list) else col
+                        for col in schema['columns']]
+        self.index = self._memmap(INDEX_FILENAME, INDEX_DTYPE)
+        self._columns = {}
+
+    def column(self, i):
+        try:
+            return self._columns[i]
+        except KeyError:
+            arr = self._memmap(_column_filename(i), self.schema['dtypes'][i])
+            self._columns[i] = arr
+            return arr
+
+    def row_range(self, timeframe):
+        """Returns (start_i, end_i) such that rows [start_i, end_i) lie
+        within `timeframe`.  Uses a binary search of the index."""
+        start_i = 0
+        end_i = self.nrows
+        if timeframe.start is not None:
+            start_i = int(np.searchsorted(
+                self.index, self._to_i8(timeframe.start), side='left'))
+        if timeframe.end is not None:
+            side = 'right' if timeframe.include_end else 'left'
+            end_i = int(np.searchsorted(
+                self.index, self._to_i8(timeframe.end), side=side))
+        return start_i, end_i
+
+    def _to_i8(self, timestamp):
+        timestamp = pd.Timestamp(timestamp)
+        tz = self.schema.get('tz')
+        if tz is not None and timestamp.tz is None:
+            timestamp = timestamp.tz_localize(tz)
+        return timestamp.value
+
+    def _memmap(self, filename, dtype):
+        if self.nrows == 0:
+            return np.empty(0, dtype=dtype)
+        # mode 'c' is copy-on-write so downstream nodes can safely
+        # modify chunks in-place without touching the file on disk.
+        return np.memmap(join(self.path, filename), dtype=dtype, mode='c',
+                         shape=(self.nrows,))
+
+
+_YAML_LOADER = getattr(yaml, 'FullLoader', yaml.Loader)
+
+
+def _column_filename(i):
+    return 'col{:d}.bin'.format(i)
+
+
+def _normalise_key(key):
+    """Make sure key has a slash at the front but not at the end."""
+    key = '/' + key.strip('/')
+    return key
+
+
+def _columns_to_list(columns):
+    return [list(col) if isinstance(col, tuple) else col for col in columns]
+
+
+def _list_to_columns(columns, names=None):
+    if columns and isinstance(columns[0], tuple):
+        return pd.MultiIndex.from_tuples(columns, names=names)
+    else:
+        return pd.Index(columns, name=names[0] if names else None)
@@ -0,0 +1,538 @@
+from __future__ import print_function, division
+import pandas as pd
+import numpy as np
+import yaml
+from collections import OrderedDict
+from os.path import isdir, isfile, join, exists
+from os import listdir, makedirs, remove
+from shutil import rmtree
+from io import open
+from nilmtk.timeframe import TimeFrame
+from nilmtk.timeframegroup import TimeFrameGroup
+from .datastore import (DataStore, write_yaml_to_file, prefetchable,
+                        split_look_ahead)
+from .hdfdatastore import _timeframe_for_chunk
+from .memmapdatastore import (SCHEMA_FILENAME, METADATA_FILENAME,
+                              _YAML_LOADER, _normalise_key, _columns_to_list,
+                              _list_to_columns)
+from nilmtk.docinherit import doc_inherit
+from builtins import range
+
+# pyarrow is an optional dependency.  It is only needed
+# if you want to use ParquetDataStore.
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = pq = None
+
+
+INDEX_FIELD = 'timestamp'
+PART_PREFIX = 'part-'
+PART_SUFFIX = '.parquet'
+
+# 2**16 rows is about 18 hours of 1 Hz data.  Smaller row groups
+# let `load()` skip more data but make the file footers bigger.
+ROW_GROUP_SIZE = 2**16
+
+# Earlier Parquet format versions can't store nanosecond timestamps, so
+# pyarrow would silently write the index in microseconds.  pyarrow < 6
+# calls the first version with nanoseconds '2.0'.
+if pa is None:
+    PARQUET_VERSION = None
+elif int(pa.__version__.split('.')[0]) >= 6:
+    PARQUET_VERSION = '2.6'
+else:
+    PARQUET_VERSION = '2.0'
+
+
+class ParquetDataStore(DataStore):
+    """Stores each table as a Parquet dataset.
+
+    Every key is a directory.  Table directories contain one or more
+    `part-<N>.parquet` files (one per call to `append()`) and a
+    `schema.yaml` which maps the Parquet field names back to NILMTK's
+    (physical_quantity, type) column tuples.  The index is stored in the
+    'timestamp' field.  Metadata for any key lives in `metadata.yaml`
+    inside that key's directory.
+
+    `load()` uses the min and max timestamps which Parquet records for
+    every row group to find the row groups which overlap each section
+    and only reads those row groups, and only the requested columns.
+
+    Requires pyarrow.
+    """
+
+    writes_keys_independently = True
+
+    def __init__(self, filename, compression='snappy',
+                 row_group_size=ROW_GROUP_SIZE):
+        """
+        Parameters
+        ----------
+        filename : string
+            The root directory of the dataset.
+        compression : string, optional
+            Any codec supported by `pyarrow.parquet.write_table`,
+            e.g. 'snappy', 'zstd', 'gzip' or 'none'.
+        row_group_size : int, optional
+            Maximum number of rows in each row group written by
+            `put()` and `append()`.
+        """
+        if pq is None:
+            raise ImportError("ParquetDataStore requires pyarrow.  Please"
+                              " install it, e.g. `pip install pyarrow`.")
+        self.filename = filename
+        self.compression = compression
+        self.row_group_size = int(row_group_size)
+        if not exists(filename):
+            makedirs(filename)
+        self._tables = {}
+        super(ParquetDataStore, self).__init__()
+
+    @doc_inherit
+    def __getitem__(self, key):
+        table = self._get_table(key)
+        return self._frame(table, None, 0, table.nrows)
+
+    @doc_inherit
+    @prefetchable
+    def load(self, key, cols=None, sections=None, n_look_ahead_rows=0,
+             chunksize=None, verbose=False):
+        table = self._get_table(key)
+
+        # Set `sections` variable
+        sections = [TimeFrame()] if sections is None else sections
+        sections = TimeFrameGroup(sections)
+
+        # Replace any Nones with '' in cols:
+        if cols is not None:
+            cols = [tuple('' if level is None else level for level in col)
+                    for col in cols]
+
+        if chunksize is None:
+            chunksize = self._plan_chunksize(key, cols)
+        chunksize = int(chunksize)
+
+        if verbose:
+            print("ParquetDataStore.load(key='{}', cols='{}', sections='{}',"
+                  " n_look_ahead_rows='{}', chunksize='{}')"
+                  .format(key, cols, sections, n_look_ahead_rows, chunksize))
+
+        self.all_sections_smaller_than_chunksize = True
+
+        for section in sections:
+            window_intersect = self.window.intersection(section)
+
+            if window_intersect.empty:
+                data = pd.DataFrame()
+                data.timeframe = section
+                yield data
+                continue
+
+            section_start_i, section_end_i = table.row_range(window_intersect)
+            if section_end_i <= section_start_i:
+                data = pd.DataFrame()
+                data.timeframe = window_intersect
+                yield data
+                continue
+
+            slice_starts = range(section_start_i, section_end_i, chunksize)
+            n_chunks = len(slice_starts)
+
+            if n_chunks > 1:
+                self.all_sections_smaller_than_chunksize = False
+
+            for chunk_i, chunk_start_i in enumerate(slice_starts):
+                chunk_end_i = min(chunk_start_i + chunksize, section_end_i)
+                there_are_more_subchunks = (chunk_i < n_chunks-1)
+
+                # Read the look ahead in the same read as the chunk.
+                if n_look_ahead_rows > 0:
+                    look_ahead_end_i = min(chunk_end_i + n_look_ahead_rows,
+                                           table.nrows)
+                    data = self._frame(table, cols, chunk_start_i,
+                                       look_ahead_end_i)
+                    data = split_look_ahead(data, chunk_end_i - chunk_start_i)
+                else:
+                    data = self._frame(table, cols, chunk_start_i, chunk_end_i)
+
+                data.timeframe = _timeframe_for_chunk(there_are_more_subchunks,
+                                                      chunk_i, window_intersect,
+                                                      data.index)
+                yield data
+                del data
+
+    @doc_inherit
+    def append(self, key, value):
+        path = self._key_to_abs_path(key)
+        if not isfile(join(path, SCHEMA_FILENAME)):
+            self.put(key, value)
+            return
+
+        table = self._get_table(key)
+        columns = _columns_to_list(value.columns)
+        if columns != table.schema['columns']:
+            raise ValueError("Cannot append to '{}': columns {} do not match"
+                             " the columns on disk {}."
+                             .format(key, columns, table.schema['columns']))
+        if len(value) == 0:
+            return
+        if not value.index.is_monotonic_increasing:
+            raise ValueError("The index must be sorted.")
+        if table.nrows > 0:
+            last = table.index_bounds()[1]
+            if table._to_i8(value.index[0]) <= last:
+                raise ValueError("Cannot append to '{}': data must start"
+                                 " after the last row on disk ({})."
+                                 .format(key, table.to_timestamp(last)))
+
+        self._write_part(path, len(table.parts), value, table.schema)
+        self._tables.pop(_normalise_key(key), None)
+
+    @doc_inherit
+    def put(self, key, value):
+        path = self._key_to_abs_path(key)
+        if exists(path):
+            self._remove_table_files(path)
+        else:
+            makedirs(path)
+
+        index = value.index
+        if not isinstance(index, pd.DatetimeIndex):
+            raise TypeError("ParquetDataStore can only store DataFrames with"
+                            " a DatetimeIndex, not '{}'.".format(type(index)))
+        tz = None if index.tz is None else str(index.tz)
+        dtypes = []
+        for dtype in value.dtypes:
+            if dtype == np.object_:
+                raise ValueError("Cannot store columns of dtype 'object'.")
+            dtypes.append(str(dtype))
+
+        columns = _columns_to_list(value.columns)
+        schema = {
+            'tz': tz,
+            'columns': columns,
+            'column_names': list(value.columns.names),
+            'dtypes': dtypes,
+            'fields': _field_names(columns)}
+        write_yaml_to_file(join(path, SCHEMA_FILENAME), schema)
+        self._write_part(path, 0, value, schema)
+        self._tables.pop(_normalise_key(key), None)
+
+    @doc_inherit
+    def remove(self, key):
+        path = self._key_to_abs_path(key)
+        if not exists(path):
+            raise KeyError('{} not found'.format(key))
+        self._forget_tables_below(key)
+        rmtree(path)
+
+    @doc_inherit
+    def load_metadata(self, key='/'):
+        filename = join(self._key_to_abs_path(key), METADATA_FILENAME)
+        if not isfile(filename):
+            return {}
+        with open(filename, 'r') as metadata_file:
+            metadata = yaml.load(metadata_file, Loader=_YAML_LOADER)
+        return {} if metadata is None else metadata
+
+    @doc_inherit
+    def save_metadata(self, key, metadata):
+        path = self._key_to_abs_path(key)
+        if not exists(path):
+            makedirs(path)
+        write_yaml_to_file(join(path, METADATA_FILENAME), metadata)
+
+    @doc_inherit
+    def elements_below_key(self, key='/'):
+        path = self._key_to_abs_path(key)
+        if not isdir(path):
+            return []
+        return sorted([element for element in listdir(path)
+                       if isdir(join(path, element))])
+
+    @doc_inherit
+    def close(self):
+        self._tables = {}
+
+    @doc_inherit
+    def open(self):
+        # Parquet files are opened lazily
+        pass
+
+    @doc_inherit
+    def get_timeframe(self, key):
+        table = self._get_table(key)
+        if table.nrows == 0:
+            timeframe = TimeFrame()
+            timeframe._empty = True
+            return timeframe
+        start, end = table.index_bounds()
+        timeframe = TimeFrame(table.to_timestamp(start),
+                              table.to_timestamp(end))
+        return self.window.intersection(timeframe)
+
+    def _nrows(self, key, timeframe=None):
+        """
+        Returns
+        -------
+        nrows : int
+        """
+        table = self._get_table(key)
+        timeframe_intersect = self.window.intersection(timeframe)
+        if timeframe_intersect.empty:
+            return 0
+        start_i, end_i = table.row_range(timeframe_intersect)
+        return max(end_i - start_i, 0)
+
+    def _column_names(self, key):
+        table = self._get_table(key)
+        return list(table.columns)
+
+    def _reopen_spec(self, read_only=False):
+        return (ParquetDataStore, (self.filename,),
+                {'compression': self.compression,
+                 'row_group_size': self.row_group_size})
+
+    def _column_dtypes(self, key, cols=None):
+        table = self._get_table(key)
+        dtypes = [np.dtype(dtype) for dtype in table.schema['dtypes']]
+        if cols is None:
+            return dtypes
+        return [dtypes[i] for i in table.column_indices(cols)]
+
+    def _get_table(self, key):
+        key = _normalise_key(key)
+        try:
+            return self._tables[key]
+        except KeyError:
+            pass
+        path = self._key_to_abs_path(key)
+        schema_filename = join(path, SCHEMA_FILENAME)
+        if not isfile(schema_filename):
+            raise KeyError('{} not found'.format(key))
+        with open(schema_filename, 'r') as schema_file:
+            schema = yaml.load(schema_file, Loader=_YAML_LOADER)
+        table = _ParquetTable(path, schema)
+        self._tables[key] = table
+        return table
+
+    def _frame(self, table, cols, start, stop):
+        if cols is None:
+            col_indices = list(range(len(table.columns)))
+        else:
+            col_indices = table.column_indices(cols)
+        fields = [table.schema['fields'][i] for i in col_indices]
+        arrow_table = table.read_rows(start, stop, fields)
+        data = OrderedDict()
+        for i, field in zip(col_indices, fields):
+            data[i] = arrow_table.column(field).to_numpy()
+        index_values = arrow_table.column(INDEX_FIELD).cast(pa.int64())
+        frame = pd.DataFrame(data, index=table.to_index(index_values.to_numpy()),
+                             columns=col_indices, copy=False)
+        frame.columns = _list_to_columns(
+            [table.columns[i] for i in col_indices],
+            table.schema.get('column_names'))
+        return frame
+
+    def _write_part(self, path, part_i, value, schema):
+        index = value.index
+        if index.tz is not None:
+            index = index.tz_convert(schema['tz'])
+        arrays = [pa.array(index.asi8,
+                           type=pa.timestamp('ns', tz=schema['tz']))]
+        for i, dtype in enumerate(schema['dtypes']):
+            values = np.ascontiguousarray(value.iloc[:, i].values, dtype=dtype)
+            arrays.append(pa.array(values))
+        arrow_table = pa.Table.from_arrays(
+            arrays, names=[INDEX_FIELD] + schema['fields'])
+        pq.write_table(arrow_table, join(path, _part_filename(part_i)),
+                       row_group_size=self.row_group_size,
+                       compression=self.compression,
+                       version=PARQUET_VERSION)
+
+    def _remove_table_files(self, path):
+        for filename in listdir(path):
+            if _is_part_filename(filename) or filename == SCHEMA_FILENAME:
+                remove(join(path, filename))
+
+    def _forget_tables_below(self, key):
+        key = _normalise_key(key)
+        for table_key in list(self._tables):
+            if table_key == key or table_key.startswith(key + '/'):
+                del self._tables[table_key]
+
+    def _key_to_abs_path(self, key):
+        relative_path = _normalise_key(key).strip('/')
+        if relative_path:
+            return join(self.filename, *relative_path.split('/'))
+        else:
+            return self.filename
+
+
+class _ParquetTable(object):
+    """The row groups of every part file for a single key.
+
+    Only the Parquet footers are read when this object is created.
+    Each row group's row offset and min and max timestamps (int64
+    nanoseconds, as stored by Parquet) are kept in numpy arrays so
+    that `row_range()` can find the row groups for a section without
+    touching any column data.
+    """
+
+    def __init__(self, path, schema):
+        self.path = path
+        self.schema = schema
+        self.columns = [tuple(col) if isinstance(col, list) else col
+                        for col in schema['columns']]
+        self.parts = sorted(filename for filename in listdir(path)
+                            if _is_part_filename(filename))
+        self._files = [pq.ParquetFile(join(path, part)) for part in self.parts]
+        self._init_row_groups()
+        # The most recently decoded row group.  Consecutive chunks
+        # often share a row group so this saves decoding it twice.
+        self._cached_row_group = (None, None, None)
+
+    def _init_row_groups(self):
+        row_groups = []
+        n_rows = []
+        mins = []
+        maxs = []
+        for file_i, parquet_file in enumerate(self._files):
+            metadata = parquet_file.metadata
+            index_col = parquet_file.schema_arrow.get_field_index(INDEX_FIELD)
+            for rg_i in range(metadata.num_row_groups):
+                row_group = metadata.row_group(rg_i)
+                statistics = row_group.column(index_col).statistics
+                if statistics is not None and statistics.has_min_max:
+                    mins.append(statistics.min_raw)
+                    maxs.append(statistics.max_raw)
+                else:
+                    # Without statistics we have to assume that
+                    # this row group overlaps every section.
+                    mins.append(np.iinfo(np.int64).min)
+                    maxs.append(np.iinfo(np.int64).max)
+                row_groups.append((file_i, rg_i))
+                n_rows.append(row_group.num_rows)
+        self.row_groups = row_groups
+        self.offsets = np.concatenate([[0], np.cumsum(n_rows, dtype=np.int64)])
+        self.mins = np.array(mins, dtype=np.int64)
+        self.maxs = np.array(maxs, dtype=np.int64)
+        self.nrows = int(self.offsets[-1])
+
+    def column_indices(self, cols):
+        try:
+            return [self.columns.index(col) for col in cols]
+        except ValueError:
+            raise KeyError('at least one of ' + str(cols) +
+                           ' is not a valid column')
+
+    def row_range(self, timeframe):
+        """Returns (start_i, end_i) such that rows [start_i, end_i) lie
+        within `timeframe`.  Only the index of the first and last row
+        groups which overlap `timeframe` is read."""
+        overlapping = np.ones(len(self.row_groups), dtype=bool)
+        if timeframe.start is not None:
+            start = self._to_i8(timeframe.start)
+            overlapping &= self.maxs >= start
+        if timeframe.end is not None:
+            end = self._to_i8(timeframe.end)
+            overlapping &= self.mins <= end
+        overlapping = np.flatnonzero(overlapping)
+        if len(overlapping) == 0:
+            return 0, 0
+
+        first_rg, last_rg = overlapping[0], overlapping[-1]
+        start_i = int(self.offsets[first_rg])
+        end_i = int(self.offsets[last_rg + 1])
+        if timeframe.start is not None:
+            index = self._read_index(first_rg)
+            start_i += int(np.searchsorted(index, start, side='left'))
+        if timeframe.end is not None:
+            index = self._read_index(last_rg)
+            side = 'right' if timeframe.include_end else 'left'
+            end_i = int(self.offsets[last_rg] +
+                        np.searchsorted(index, end, side=side))
+        return start_i, end_i
+
+    def index_bounds(self):
+        """Returns the first and last timestamps as int64 nanoseconds."""
+        start = self.mins.min()
+        end = self.maxs.max()
+        if start == np.iinfo(np.int64).min or end == np.iinfo(np.int64).max:
+            start = self._read_index(0)[0]
+            end = self._read_index(len(self.row_groups) - 1)[-1]
+        return start, end
+
+    def read_rows(self, start, stop, fields):
+        """Returns a pyarrow.Table of rows [start, stop) with the
+        index and `fields`."""
+        fields = [INDEX_FIELD] + list(fields)
+        first_rg = int(np.searchsorted(self.offsets, start, side='right')) - 1
+        last_rg = int(np.searchsorted(self.offsets, stop, side='left')) - 1
+        first_rg = max(first_rg, 0)
+        last_rg = max(last_rg, first_rg)
+        arrow_table = pa.concat_tables(
+            [self._read_row_group(rg, fields)
+             for rg in range(first_rg, last_rg + 1)])
+        return arrow_table.slice(start - int(self.offsets[first_rg]),
+                                 stop - start)
+
+    def to_index(self, values):
+        index = pd.DatetimeIndex(values.view('M8[ns]'))
+        tz = self.schema.get('tz')
+        if tz is not None:
+            index = index.tz_localize('UTC').tz_convert(tz)
+        return index
+
+    def to_timestamp(self, value):
+        return self.to_index(np.array([value], dtype=np.int64))[0]
+
+    def _read_index(self, rg):
+        arrow_table = self._read_row_group(rg, [INDEX_FIELD])
+        return arrow_table.column(INDEX_FIELD).cast(pa.int64()).to_numpy()
+
+    def _read_row_group(self, rg, fields):
+        cached_rg, cached_fields, cached_table = self._cached_row_group
+        if cached_rg == rg and set(fields).issubset(cached_fields):
+            return cached_table.select(fields)
+        file_i, rg_i = self.row_groups[rg]
+        arrow_table = self._files[file_i].read_row_group(rg_i, columns=fields)
+        self._cached_row_group = (rg, fields, arrow_table)
+        return arrow_table
+
+    def _to_i8(self, timestamp):
+        timestamp = pd.Timestamp(timestamp)
+        tz = self.schema.get('tz')
+        if tz is not None and timestamp.tz is None:
+            timestamp = timestamp.tz_localize(tz)
+        return timestamp.value
+
+
+def _part_filename(i):
+    return '{}{:05d}{}'.format(PART_PREFIX, i, PART_SUFFIX)
+
+
+def _is_part_filename(filename):
+    return filename.startswith(PART_PREFIX) and filename.endswith(PART_SUFFIX)
+
+
+def _field_names(columns):
+    """Returns a unique, flat Parquet field name for each column, e.g.
+    ('power', 'active') -> 'power_active' and ('voltage', '') -> 'voltage'.
+    """
+    fields = []
+    for col in columns:
+        if isinstance(col, (list, tuple)):
+            name = '_'.join(str(level) for level in col if level not in ('', None))
+        else:
+            name = str(col)
+        name = name or 'column'
+        unique_name = name
+        i = 1
+        while unique_name in fields or unique_name == INDEX_FIELD:
+            unique_name = '{}_{:d}'.format(name, i)
+            i += 1
+        fields.append(unique_name)
+    return fields
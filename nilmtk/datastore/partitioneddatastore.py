@@ -0,0 +1,543 @@
+from __future__ import print_function, division
+import pandas as pd
+import numpy as np
+import yaml
+import multiprocessing
+from collections import deque, OrderedDict
+from os.path import isdir, isfile, join, exists
+from os import listdir, makedirs, remove
+from shutil import rmtree
+from io import open
+from nilmtk.timeframe import TimeFrame
+from nilmtk.timeframegroup import TimeFrameGroup
+from .datastore import (DataStore, write_yaml_to_file, prefetchable,
+                        split_look_ahead)
+from .hdfdatastore import _timeframe_for_chunk
+from .memmapdatastore import (METADATA_FILENAME, _YAML_LOADER,
+                              _normalise_key, _columns_to_list,
+                              _list_to_columns)
+from nilmtk.docinherit import doc_inherit
+from builtins import range
+
+
+MANIFEST_FILENAME = 'manifest.yaml'
+PARTITION_KEY = 'data'
+PARTITION_SUFFIX = '.h5'
+DEFAULT_FREQ = 'M'
+
+# Most row positions (see `_row_position`) cached per DataStore.
+ROW_POSITION_CACHE_SIZE = 4096
+
+
+class PartitionedDataStore(DataStore):
+    """Shards each table into time partitions, one HDF5 file per partition.
+
+    Every key is a directory.  Table directories contain one HDF5 file
+    per partition (e.g. one per calendar month) and a `manifest.yaml`
+    which records the partition frequency, the columns and, for every
+    partition, its filename, number of rows and first and last
+    timestamps.  Metadata for any key lives in `metadata.yaml` inside
+    that key's directory.
+
+    `load()` uses the manifest to open only the partitions which overlap
+    each section.  If `n_workers > 1` then chunks are read by a pool of
+    worker processes, so independent partitions are read in parallel
+    while chunks are still yielded in chronological order.
+
+    `append()` only ever writes to the newest partition (or creates a new
+    one).  All older partitions are immutable, so the row positions
+    found in them are cached (the most recently used
+    `ROW_POSITION_CACHE_SIZE` of them) until the DataStore is closed.
+    """
+
+    writes_keys_independently = True
+
+    def __init__(self, filename, freq=DEFAULT_FREQ, n_workers=1):
+        """
+        Parameters
+        ----------
+        filename : string
+            The root directory of the dataset.
+        freq : string, optional
+            Any Pandas period frequency, e.g. 'M' for one partition per
+            calendar month or 'D' for one partition per day.  Only used
+            for keys which do not exist yet.
+        n_workers : int, optional
+            Number of worker processes used by `load()`.  Defaults to
+            1, i.e. all reads happen in this process.  The worker
+            processes are spawned, so scripts which set this above 1
+            must guard their entry point with
+            `if __name__ == '__main__':`.
+        """
+        self.filename = filename
+        self.freq = freq
+        self.n_workers = max(int(n_workers), 1)
+        if not exists(filename):
+            makedirs(filename)
+        self._manifests = {}
+        self._row_position_cache = OrderedDict()
+        self._pool = None
+        super(PartitionedDataStore, self).__init__()
+
+    @doc_inherit
+    def __getitem__(self, key):
+        manifest = self._get_manifest(key)
+        return _read_pieces(manifest.pieces(0, manifest.nrows), None,
+                            manifest.columns)
+
+    @doc_inherit
+    @prefetchable
+    def load(self, key, cols=None, sections=None, n_look_ahead_rows=0,
+             chunksize=None, verbose=False):
+        manifest = self._get_manifest(key)
+
+        # Set `sections` variable
+        sections = [TimeFrame()] if sections is None else sections
+        sections = TimeFrameGroup(sections)
+
+        # Replace any Nones with '' in cols:
+        if cols is not None:
+            cols = [tuple('' if level is None else level for level in col)
+                    for col in cols]
+            manifest.column_indices(cols)
+
+        if chunksize is None:
+            chunksize = self._plan_chunksize(key, cols)
+        chunksize = int(chunksize)
+
+        if verbose:
+            print("PartitionedDataStore.load(key='{}', cols='{}',"
+                  " sections='{}', n_look_ahead_rows='{}', chunksize='{}')"
+                  .format(key, cols, sections, n_look_ahead_rows, chunksize))
+
+        self.all_sections_smaller_than_chunksize = True
+
+        for section in sections:
+            window_intersect = self.window.intersection(section)
+
+            if window_intersect.empty:
+                data = pd.DataFrame()
+                data.timeframe = section
+                yield data
+                continue
+
+            section_start_i, section_end_i = self._row_range(
+                manifest, window_intersect)
+            if section_end_i <= section_start_i:
+                data = pd.DataFrame()
+                data.timeframe = window_intersect
+                yield data
+                continue
+
+            slice_starts = range(section_start_i, section_end_i, chunksize)
+            n_chunks = len(slice_starts)
+
+            if n_chunks > 1:
+                self.all_sections_smaller_than_chunksize = False
+
+            # Each read covers the chunk and its look ahead.
+            reads = []
+            for chunk_start_i in slice_starts:
+                chunk_end_i = min(chunk_start_i + chunksize, section_end_i)
+                read_end_i = min(chunk_end_i + max(n_look_ahead_rows, 0),
+                                 manifest.nrows)
+                reads.append((manifest.pieces(chunk_start_i, read_end_i),
+                              chunk_end_i - chunk_start_i))
+
+            for chunk_i, (data, n_chunk_rows) in enumerate(
+                    self._read_in_order(key, cols, reads)):
+                there_are_more_subchunks = (chunk_i < n_chunks-1)
+                if n_look_ahead_rows > 0:
+                    data = split_look_ahead(data, n_chunk_rows)
+                data.timeframe = _timeframe_for_chunk(there_are_more_subchunks,
+                                                      chunk_i, window_intersect,
+                                                      data.index)
+                yield data
+                del data
+
+    @doc_inherit
+    def append(self, key, value):
+        path = self._key_to_abs_path(key)
+        if not isfile(join(path, MANIFEST_FILENAME)):
+            self.put(key, value)
+            return
+
+        manifest = self._get_manifest(key)
+        columns = _columns_to_list(value.columns)
+        if columns != manifest.schema['columns']:
+            raise ValueError("Cannot append to '{}': columns {} do not match"
+                             " the columns on disk {}."
+                             .format(key, columns, manifest.schema['columns']))
+        if len(value) == 0:
+            return
+        if (manifest.nrows > 0 and
+                manifest.to_i8(value.index[0]) <= manifest.ends[-1]):
+            raise ValueError("Cannot append to '{}': data must start after the"
+                             " end of the newest partition ({}).  Older"
+                             " partitions are immutable."
+                             .format(key, manifest.partitions[-1]['end']))
+        self._write_partitions(path, manifest.schema, value)
+        self._manifests.pop(_normalise_key(key), None)
+
+    @doc_inherit
+    def put(self, key, value):
+        index = value.index
+        if not isinstance(index, pd.DatetimeIndex):
+            raise TypeError("PartitionedDataStore can only store DataFrames"
+                            " with a DatetimeIndex, not '{}'."
+                            .format(type(index)))
+        if not index.is_monotonic_increasing:
+            raise ValueError("The index must be sorted.")
+
+        path = self._key_to_abs_path(key)
+        if exists(path):
+            self._remove_partition_files(path)
+        else:
+            makedirs(path)
+        self._forget_key(key)
+
+        schema = {
+            'freq': self.freq,
+            'tz': None if index.tz is None else str(index.tz),
+            'columns': _columns_to_list(value.columns),
+            'column_names': list(value.columns.names),
+            'dtypes': [str(dtype) for dtype in value.dtypes],
+            'partitions': []}
+        self._write_partitions(path, schema, value)
+
+    @doc_inherit
+    def remove(self, key):
+        path = self._key_to_abs_path(key)
+        if not exists(path):
+            raise KeyError('{} not found'.format(key))
+        self._forget_key(key)
+        rmtree(path)
+
+    @doc_inherit
+    def load_metadata(self, key='/'):
+        filename = join(self._key_to_abs_path(key), METADATA_FILENAME)
+        if not isfile(filename):
+            return {}
+        with open(filename, 'r') as metadata_file:
+            metadata = yaml.load(metadata_file, Loader=_YAML_LOADER)
+        return {} if metadata is None else metadata
+
+    @doc_inherit
+    def save_metadata(self, key, metadata):
+        path = self._key_to_abs_path(key)
+        if not exists(path):
+            makedirs(path)
+        write_yaml_to_file(join(path, METADATA_FILENAME), metadata)
+
+    @doc_inherit
+    def elements_below_key(self, key='/'):
+        path = self._key_to_abs_path(key)
+        if not isdir(path):
+            return []
+        return sorted([element for element in listdir(path)
+                       if isdir(join(path, element))])
+
+    @doc_inherit
+    def close(self):
+        self._manifests = {}
+        self._row_position_cache = OrderedDict()
+        if self._pool is not None:
+            self._pool.terminate()
+            self._pool.join()
+            self._pool = None
+
+    @doc_inherit
+    def open(self):
+        # Partitions are opened when they are read.
+        pass
+
+    @doc_inherit
+    def get_timeframe(self, key):
+        manifest = self._get_manifest(key)
+        if manifest.nrows == 0:
+            timeframe = TimeFrame()
+            timeframe._empty = True
+            return timeframe
+        timeframe = TimeFrame(manifest.to_timestamp(manifest.starts[0]),
+                              manifest.to_timestamp(manifest.ends[-1]))
+        return self.window.intersection(timeframe)
+
+    def _nrows(self, key, timeframe=None):
+        """
+        Returns
+        -------
+        nrows : int
+        """
+        manifest = self._get_manifest(key)
+        timeframe_intersect = self.window.intersection(timeframe)
+        if timeframe_intersect.empty:
+            return 0
+        start_i, end_i = self._row_range(manifest, timeframe_intersect)
+        return max(end_i - start_i, 0)
+
+    def _column_names(self, key):
+        manifest = self._get_manifest(key)
+        return list(manifest.columns)
+
+    def _reopen_spec(self, read_only=False):
+        # The worker reads its own partitions.
+        return (PartitionedDataStore, (self.filename,),
+                {'freq': self.freq, 'n_workers': 1})
+
+    def _column_dtypes(self, key, cols=None):
+        manifest = self._get_manifest(key)
+        dtypes = [np.dtype(dtype) for dtype in manifest.schema['dtypes']]
+        if cols is None:
+            return dtypes
+        return [dtypes[i] for i in manifest.column_indices(cols)]
+
+    def _get_manifest(self, key):
+        key = _normalise_key(key)
+        try:
+            return self._manifests[key]
+        except KeyError:
+            pass
+        path = self._key_to_abs_path(key)
+        manifest_filename = join(path, MANIFEST_FILENAME)
+        if not isfile(manifest_filename):
+            raise KeyError('{} not found'.format(key))
+        with open(manifest_filename, 'r') as manifest_file:
+            schema = yaml.load(manifest_file, Loader=_YAML_LOADER)
+        manifest = _Manifest(path, schema)
+        self._manifests[key] = manifest
+        return manifest
+
+    def _row_range(self, manifest, timeframe):
+        """Returns (start_i, end_i) such that rows [start_i, end_i) lie
+        within `timeframe`.  Row numbers count from the first row of the
+        first partition.  Only the first and last partitions which overlap
+        `timeframe` are opened."""
+        overlapping = manifest.overlapping_partitions(timeframe)
+        if len(overlapping) == 0:
+            return 0, 0
+        first, last = overlapping[0], overlapping[-1]
+        start_i = int(manifest.offsets[first])
+        end_i = int(manifest.offsets[last + 1])
+        if timeframe.start is not None:
+            start_i += self._row_position(
+                manifest, first, manifest.to_i8(timeframe.start), 'left')
+        if timeframe.end is not None:
+            side = 'right' if timeframe.include_end else 'left'
+            end_i = int(manifest.offsets[last]) + self._row_position(
+                manifest, last, manifest.to_i8(timeframe.end), side)
+        return start_i, end_i
+
+    def _row_position(self, manifest, partition_i, value, side):
+        partition = manifest.partitions[partition_i]
+        filename = join(manifest.path, partition['filename'])
+        immutable = partition_i < len(manifest.partitions) - 1
+        cache_key = (filename, value, side)
+        cache = self._row_position_cache
+        if immutable:
+            try:
+                position = cache.pop(cache_key)
+            except KeyError:
+                pass
+            else:
+                cache[cache_key] = position
+                return position
+        with pd.HDFStore(filename, 'r') as store:
+            table = store.get_storer(PARTITION_KEY).table
+            position = _search_sorted(table, value, side)
+        if immutable:
+            cache[cache_key] = position
+            while len(cache) > ROW_POSITION_CACHE_SIZE:
+                cache.popitem(last=False)
+        return position
+
+    def _read_in_order(self, key, cols, reads):
+        """Yields (data, n_chunk_rows) for each read, in order.  Keeps at
+        most `n_workers` reads in flight.  A single read happens in this
+        process."""
+        columns = self._get_manifest(key).columns
+        if self.n_workers <= 1 or len(reads) <= 1:
+            for pieces, n_chunk_rows in reads:
+                yield _read_pieces(pieces, cols, columns), n_chunk_rows
+            return
+
+        pool = self._get_pool()
+        in_flight = deque()
+        for pieces, n_chunk_rows in reads:
+            in_flight.append((pool.apply_async(
+                _read_pieces, (pieces, cols, columns)), n_chunk_rows))
+            if len(in_flight) > self.n_workers:
+                result, n_chunk_rows = in_flight.popleft()
+                yield result.get(), n_chunk_rows
+        while in_flight:
+            result, n_chunk_rows = in_flight.popleft()
+            yield result.get(), n_chunk_rows
+
+    def _get_pool(self):
+        if self._pool is None:
+            context = (multiprocessing.get_context('spawn')
+                       if hasattr(multiprocessing, 'get_context')
+                       else multiprocessing)
+            self._pool = context.Pool(self.n_workers)
+        return self._pool
+
+    def _write_partitions(self, path, schema, value):
+        """Appends `value` to the newest partition and creates new
+        partitions as necessary.  Updates and saves the manifest."""
+        partitions = schema['partitions']
+        periods = _periods(value.index, schema['freq'])
+        ordinals = np.asarray(periods.asi8)
+        boundaries = np.flatnonzero(ordinals[1:] != ordinals[:-1]) + 1
+        starts = np.concatenate([[0], boundaries])
+        ends = np.concatenate([boundaries, [len(value)]])
+        for start, end in zip(starts, ends):
+            filename = _partition_filename(periods[start])
+            chunk = value.iloc[start:end]
+            if partitions and partitions[-1]['filename'] == filename:
+                partition = partitions[-1]
+            else:
+                partition = {'filename': filename, 'nrows': 0,
+                             'start': chunk.index[0].isoformat()}
+                partitions.append(partition)
+            with pd.HDFStore(join(path, filename), 'a', complevel=9,
+                             complib='blosc') as store:
+                store.append(PARTITION_KEY, chunk, format='table',
+                             index=False)
+            partition['nrows'] += len(chunk)
+            partition['end'] = chunk.index[-1].isoformat()
+        write_yaml_to_file(join(path, MANIFEST_FILENAME), schema)
+
+    def _remove_partition_files(self, path):
+        for filename in listdir(path):
+            if (filename.endswith(PARTITION_SUFFIX) or
+                    filename == MANIFEST_FILENAME):
+                remove(join(path, filename))
+
+    def _forget_key(self, key):
+        key = _normalise_key(key)
+        for manifest_key in list(self._manifests):
+            if manifest_key == key or manifest_key.startswith(key + '/'):
+                del self._manifests[manifest_key]
+        path = self._key_to_abs_path(key)
+        for cache_key in list(self._row_position_cache):
+            if cache_key[0].startswith(path):
+                del self._row_position_cache[cache_key]
+
+    def _key_to_abs_path(self, key):
+        relative_path = _normalise_key(key).strip('/')
+        if relative_path:
+            return join(self.filename, *relative_path.split('/'))
+        else:
+            return self.filename
+
+
+class _Manifest(object):
+    """The partitions of a single key."""
+
+    def __init__(self, path, schema):
+        self.path = path
+        self.schema = schema
+        self.partitions = schema['partitions']
+        self.columns = [tuple(col) if isinstance(col, list) else col
+                        for col in schema['columns']]
+        n_rows = [partition['nrows'] for partition in self.partitions]
+        self.offsets = np.concatenate([[0], np.cumsum(n_rows, dtype=np.int64)])
+        self.nrows = int(self.offsets[-1])
+        self.starts = np.array([self.to_i8(partition['start'])
+                                for partition in self.partitions],
+                               dtype=np.int64)
+        self.ends = np.array([self.to_i8(partition['end'])
+                              for partition in self.partitions],
+                             dtype=np.int64)
+
+    def column_indices(self, cols):
+        try:
+            return [self.columns.index(col) for col in cols]
+        except ValueError:
+            raise KeyError('at least one of ' + str(cols) +
+                           ' is not a valid column')
+
+    def overlapping_partitions(self, timeframe):
+        overlapping = np.ones(len(self.partitions), dtype=bool)
+        if timeframe.start is not None:
+            overlapping &= self.ends >= self.to_i8(timeframe.start)
+        if timeframe.end is not None:
+            overlapping &= self.starts <= self.to_i8(timeframe.end)
+        return np.flatnonzero(overlapping)
+
+    def pieces(self, start, stop):
+        """Returns a list of (filename, start, stop) tuples, one per
+        partition, which together cover rows [start, stop)."""
+        pieces = []
+        first = max(int(np.searchsorted(self.offsets, start, 'right')) - 1, 0)
+        for partition_i in range(first, len(self.partitions)):
+            offset = int(self.offsets[partition_i])
+            if offset >= stop:
+                break
+            piece_start = max(start - offset, 0)
+            piece_stop = min(stop, int(self.offsets[partition_i + 1])) - offset
+            if piece_stop > piece_start:
+                filename = join(self.path,
+                                self.partitions[partition_i]['filename'])
+                pieces.append((filename, piece_start, piece_stop))
+        return pieces
+
+    def to_i8(self, timestamp):
+        timestamp = pd.Timestamp(timestamp)
+        tz = self.schema.get('tz')
+        if tz is not None and timestamp.tz is None:
+            timestamp = timestamp.tz_localize(tz)
+        return timestamp.value
+
+    def to_timestamp(self, value):
+        timestamp = pd.Timestamp(int(value))
+        tz = self.schema.get('tz')
+        if tz is not None:
+            timestamp = timestamp.tz_localize('UTC').tz_convert(tz)
+        return timestamp
+
+
+def _read_pieces(pieces, cols, columns):
+    """Reads and concatenates rows from one or more partitions.
+
+    This is a module-level function so it can run in a worker process.
+    """
+    frames = []
+    for filename, start, stop in pieces:
+        with pd.HDFStore(filename, 'r') as store:
+            frames.append(store.select(PARTITION_KEY, start=start, stop=stop,
+                                       columns=cols))
+    if len(frames) == 1:
+        return frames[0]
+    elif frames:
+        return pd.concat(frames)
+    else:
+        return pd.DataFrame(columns=_list_to_columns(
+            columns if cols is None else cols))
+
+
+def _search_sorted(table, value, side):
+    """Binary search of the 'index' column of a PyTables table.
+
+    Only reads O(log(nrows)) rows, rather than the whole index.
+    """
+    lo, hi = 0, table.nrows
+    while lo < hi:
+        mid = (lo + hi) // 2
+        mid_value = table.read(start=mid, stop=mid+1, field='index')[0]
+        if mid_value < value or (side == 'right' and mid_value == value):
+            lo = mid + 1
+        else:
+            hi = mid
+    return lo
+
+
+def _periods(index, freq):
+    """Returns the partition period of each timestamp, in local time."""
+    if index.tz is not None:
+        index = index.tz_localize(None)
+    return index.to_period(freq)
+
+
+def _partition_filename(period):
+    """e.g. '20130401T000000.h5' for April 2013."""
+    return period.start_time.strftime('%Y%m%dT%H%M%S') + PARTITION_SUFFIX
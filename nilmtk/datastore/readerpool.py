@@ -0,0 +1,382 @@
+"""Concurrent read-only access to an HDF5 dataset from worker processes.
+
+PyTables file handles cannot be shared between threads or processes,
+so every `HDFDataStore.load` is serialised through a single handle.
+`ReaderPoolDataStore` instead starts a pool of worker processes, each
+with its own read-only `HDFDataStore`.  Each call to `load()` is served
+by one worker, which reads up to `queue_depth` chunks ahead of the
+consumer, so reading and decompressing overlaps with whatever the
+caller does with each chunk, and concurrent generators (e.g. one per
+meter) read in parallel.
+
+Chunks are passed back through shared memory: the worker copies the
+index and each column into a shared memory block and only sends the
+block's name and layout through the pipe.  Python 2 does not have
+`multiprocessing.shared_memory`, so chunks are pickled instead.
+"""
+from __future__ import print_function, division
+import multiprocessing
+import pickle
+import threading
+import traceback
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+from six.moves import queue
+from nilmtk.docinherit import doc_inherit
+from .datastore import DataStore, prefetchable
+from .hdfdatastore import HDFDataStore
+
+try:
+    from multiprocessing import shared_memory
+except ImportError:
+    shared_memory = None
+
+# Seconds to wait for a worker before checking that it is still alive.
+POLL_INTERVAL = 1.0
+
+_ALIGNMENT = 8
+
+
+class ReaderPoolDataStore(DataStore):
+    """Read-only DataStore which serves `load()` from worker processes.
+
+    All other methods are served by a read-only HDFDataStore in this
+    process.  If every worker is busy (because more than `n_workers`
+    generators are open at once) then `load()` reads in this process.
+
+    Examples
+    --------
+    >>> store = ReaderPoolDataStore('redd.h5', n_workers=4)
+    >>> dataset = DataSet().import_metadata(store)
+    """
+
+    chunk_overlap = HDFDataStore.chunk_overlap
+
+    def __init__(self, filename, n_workers=None, queue_depth=2):
+        """
+        Parameters
+        ----------
+        filename : string
+            An HDF5 file written by HDFDataStore.
+        n_workers : int, optional
+            Number of worker processes.  Defaults to the number of CPUs.
+        queue_depth : int, optional
+            Maximum number of chunks each worker reads ahead of the consumer.
+        """
+        self.filename = filename
+        self.n_workers = (multiprocessing.cpu_count() if n_workers is None
+                          else max(int(n_workers), 1))
+        self.queue_depth = max(int(queue_depth), 1)
+        self._store = HDFDataStore(filename, 'r')
+        self._workers = None
+        self._idle_workers = []
+        self._lock = threading.Lock()
+        super(ReaderPoolDataStore, self).__init__()
+
+    @property
+    def window(self):
+        return self._store.window
+
+    @window.setter
+    def window(self, window):
+        self._store.window = window
+
+    @doc_inherit
+    def __getitem__(self, key):
+        return self._store[key]
+
+    @doc_inherit
+    @prefetchable
+    def load(self, key, cols=None, sections=None, n_look_ahead_rows=0,
+             chunksize=None, verbose=False):
+        kwargs = dict(cols=cols, sections=sections,
+                      n_look_ahead_rows=n_look_ahead_rows,
+                      chunksize=chunksize, verbose=verbose)
+        worker = self._acquire_worker()
+        if worker is None:
+            for chunk in self._store.load(key, **kwargs):
+                yield chunk
+            return
+
+        finished = False
+        try:
+            worker.requests.put((key, kwargs, self.window))
+            while True:
+                kind, payload = worker.get()
+                if kind == 'chunk':
+                    yield _decode_chunk(payload)
+                else:
+                    finished = True
+                    if kind == 'error':
+                        raise payload
+                    break
+        finally:
+            if not finished:
+                finished = worker.cancel()
+            if finished:
+                self._release_worker(worker)
+
+    @doc_inherit
+    def append(self, key, value):
+        raise NotImplementedError("ReaderPoolDataStore is read-only.")
+
+    @doc_inherit
+    def put(self, key, value):
+        raise NotImplementedError("ReaderPoolDataStore is read-only.")
+
+    @doc_inherit
+    def remove(self, key):
+        raise NotImplementedError("ReaderPoolDataStore is read-only.")
+
+    @doc_inherit
+    def load_metadata(self, key='/'):
+        return self._store.load_metadata(key)
+
+    @doc_inherit
+    def save_metadata(self, key, metadata):
+        raise NotImplementedError("ReaderPoolDataStore is read-only.")
+
+    @doc_inherit
+    def elements_below_key(self, key='/'):
+        return self._store.elements_below_key(key)
+
+    @doc_inherit
+    def close(self):
+        with self._lock:
+            workers = self._workers or []
+            self._workers = None
+            self._idle_workers = []
+        for worker in workers:
+            worker.stop()
+        self._store.close()
+
+    @doc_inherit
+    def open(self):
+        self._store.open()
+
+    @doc_inherit
+    def get_timeframe(self, key):
+        return self._store.get_timeframe(key)
+
+    def _nrows(self, key, timeframe=None):
+        return self._store._nrows(key, timeframe)
+
+    def _column_names(self, key):
+        return self._store._column_names(key)
+
+    def _reopen_spec(self, read_only=False):
+        return self._store._reopen_spec(read_only=True)
+
+    def _column_dtypes(self, key, cols=None):
+        return self._store._column_dtypes(key, cols)
+
+    def _acquire_worker(self):
+        """Returns an idle _ReaderProcess, or None if all are busy."""
+        with self._lock:
+            if self._workers is None:
+                self._workers = [
+                    _ReaderProcess(self.filename, self.queue_depth)
+                    for _ in range(self.n_workers)]
+                self._idle_workers = list(self._workers)
+            if self._idle_workers:
+                return self._idle_workers.pop()
+            return None
+
+    def _release_worker(self, worker):
+        with self._lock:
+            if self._workers is not None and worker in self._workers:
+                self._idle_workers.append(worker)
+
+
+class _ReaderProcess(object):
+    """A worker process and the queues used to talk to it."""
+
+    def __init__(self, filename, queue_depth):
+        # 'spawn' rather than 'fork' so that the worker does not
+        # inherit this process's open PyTables handles.
+        context = (multiprocessing.get_context('spawn')
+                   if hasattr(multiprocessing, 'get_context')
+                   else multiprocessing)
+        self.requests = context.Queue()
+        self.responses = context.Queue(maxsize=queue_depth)
+        self.cancelled = context.Event()
+        self.process = context.Process(
+            target=_reader_main, name='nilmtk-reader',
+            args=(filename, self.requests, self.responses, self.cancelled))
+        self.process.daemon = True
+        self.process.start()
+
+    def get(self):
+        """Returns the next (kind, payload) response."""
+        while True:
+            try:
+                return self.responses.get(timeout=POLL_INTERVAL)
+            except queue.Empty:
+                if not self.process.is_alive():
+                    raise RuntimeError("nilmtk reader process exited with"
+                                       " code {}"
+                                       .format(self.process.exitcode))
+
+    def cancel(self):
+        """Stops the current load and discards its remaining chunks.
+
+        Returns
+        -------
+        bool : True if the worker is ready for another request.
+        """
+        if not self.process.is_alive():
+            return False
+        self.cancelled.set()
+        try:
+            while True:
+                kind, payload = self.get()
+                if kind == 'chunk':
+                    _discard_chunk(payload)
+                else:
+                    break
+        except RuntimeError:
+            return False
+        self.cancelled.clear()
+        return True
+
+    def stop(self):
+        """Stops the process, freeing any chunks it has already sent."""
+        self.cancelled.set()
+        self.requests.put(None)
+        while True:
+            alive = self.process.is_alive()
+            try:
+                kind, payload = self.responses.get(timeout=0.1)
+            except queue.Empty:
+                if alive:
+                    continue
+                break
+            if kind == 'chunk':
+                _discard_chunk(payload)
+        self.process.join()
+
+
+def _reader_main(filename, requests, responses, cancelled):
+    """Entry point of each worker process."""
+    store = HDFDataStore(filename, 'r')
+    try:
+        while True:
+            request = requests.get()
+            if request is None:
+                break
+            key, kwargs, window = request
+            store.window = window
+            try:
+                for chunk in store.load(key, **kwargs):
+                    if cancelled.is_set():
+                        break
+                    responses.put(('chunk', _encode_chunk(chunk)))
+            except Exception as exception:
+                responses.put(('error', _picklable(exception)))
+            else:
+                responses.put(('end', None))
+    finally:
+        store.close()
+
+
+def _picklable(exception):
+    try:
+        pickle.dumps(exception)
+    except Exception:
+        return RuntimeError(traceback.format_exc())
+    return exception
+
+
+def _encode_chunk(chunk):
+    look_ahead = getattr(chunk, 'look_ahead', None)
+    return {'timeframe': getattr(chunk, 'timeframe', None),
+            'data': _encode_frame(chunk),
+            'look_ahead': (None if look_ahead is None
+                           else _encode_frame(look_ahead))}
+
+
+def _decode_chunk(message):
+    chunk = _decode_frame(message['data'])
+    if message['look_ahead'] is not None:
+        chunk.look_ahead = _decode_frame(message['look_ahead'])
+    if message['timeframe'] is not None:
+        chunk.timeframe = message['timeframe']
+    return chunk
+
+
+def _discard_chunk(message):
+    for frame in (message['data'], message['look_ahead']):
+        if frame is not None and frame[0] == 'shared_memory':
+            _attach(frame[1]).unlink()
+
+
+def _encode_frame(data):
+    """Returns ('shared_memory', name, layout) or ('pickle', data)."""
+    index = data.index
+    if (shared_memory is None or len(data) == 0 or
+            not isinstance(index, pd.DatetimeIndex) or
+            any(dtype.kind not in 'biuf' for dtype in data.dtypes)):
+        return ('pickle', data)
+
+    index_values = (index.tz_convert('UTC') if index.tz is not None
+                    else index).asi8
+    arrays = [index_values] + [data.iloc[:, i].values
+                               for i in range(data.shape[1])]
+    dtypes = []
+    offsets = []
+    n_bytes = 0
+    for array in arrays:
+        dtypes.append(array.dtype.str)
+        offsets.append(n_bytes)
+        n_bytes += -(-array.nbytes // _ALIGNMENT) * _ALIGNMENT
+
+    block = shared_memory.SharedMemory(create=True, size=n_bytes)
+    try:
+        for array, offset in zip(arrays, offsets):
+            np.ndarray(array.shape, dtype=array.dtype, buffer=block.buf,
+                       offset=offset)[:] = array
+    except Exception:
+        block.close()
+        block.unlink()
+        raise
+    block.close()
+    layout = {'nrows': len(data), 'dtypes': dtypes, 'offsets': offsets,
+              'tz': None if index.tz is None else str(index.tz),
+              'columns': list(data.columns),
+              'column_names': list(data.columns.names)}
+    return ('shared_memory', block.name, layout)
+
+
+def _decode_frame(message):
+    if message[0] == 'pickle':
+        return message[1]
+
+    _, name, layout = message
+    block = _attach(name)
+    try:
+        nrows = layout['nrows']
+        arrays = [np.ndarray((nrows,), dtype=dtype, buffer=block.buf,
+                             offset=offset).copy()
+                  for dtype, offset in zip(layout['dtypes'],
+                                           layout['offsets'])]
+    finally:
+        block.close()
+        block.unlink()
+
+    index = pd.DatetimeIndex(arrays[0].view('M8[ns]'))
+    if layout['tz'] is not None:
+        index = index.tz_localize('UTC').tz_convert(layout['tz'])
+    columns = layout['columns']
+    data = OrderedDict(zip(range(len(columns)), arrays[1:]))
+    frame = pd.DataFrame(data, index=index, columns=list(data), copy=False)
+    if columns and isinstance(columns[0], tuple):
+        frame.columns = pd.MultiIndex.from_tuples(
+            columns, names=layout['column_names'])
+    else:
+        frame.columns = pd.Index(columns, name=layout['column_names'][0])
+    return frame
+
+
+def _attach(name):
+    return shared_memory.SharedMemory(name=name)
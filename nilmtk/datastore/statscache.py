@@ -0,0 +1,277 @@
+"""A stats cache kept outside the dataset.
+
+By default `ElecMeter` caches statistics such as `good_sections` in the
+dataset's own file, under 'building<I>/elec/cache/meter<K>/<stat>'.
+That fails if the dataset is read-only, grows files which may be shared,
+and makes every user of a dataset write to the same file.  When the
+stats cache is enabled, cached statistics are kept in a separate
+directory instead, and the dataset is never written to.
+
+Each statistic is stored in its own HDF5 file.  The file name is a
+digest of the dataset's identity (path, size and modification time),
+the meter's key, the statistic's name and the load parameters which
+change the result (e.g. `cols`), so a modified dataset or different
+parameters never see stale results.
+
+Several processes (and users) may share one cache directory.  Every
+file is written to a temporary file and then renamed over the old one,
+so readers only ever see complete files.  If two processes append to
+the same statistic at once then one append may be lost, which only
+means that it will be computed again.  Once the directory holds more
+than `max_bytes`, the least recently used files are deleted.
+
+Examples
+--------
+::
+
+    from nilmtk.datastore import enable_stats_cache
+    enable_stats_cache('/scratch/nilmtk_stats', max_bytes=2**30)
+    meter.good_sections()   # computed and cached in /scratch/nilmtk_stats
+    meter.good_sections()   # served from /scratch/nilmtk_stats
+"""
+from __future__ import print_function, division
+import hashlib
+import os
+import tempfile
+import threading
+import time
+from os.path import abspath, realpath, isdir, join, getsize, getmtime
+import pandas as pd
+
+DEFAULT_MAX_BYTES = 2**30
+SUFFIX = '.h5'
+TMP_SUFFIX = '.tmp'
+
+# Temporary files older than this (in seconds) were left behind by a
+# process which died while writing, so they can be deleted.
+STALE_TMP_AGE = 3600
+
+# Load parameters which don't change the result of a statistic.
+# `sections` are stored row by row inside each cached statistic and
+# the fingerprint of any `preprocessing` is part of the stat's name.
+PARAMS_NOT_IN_KEY = ('sections', 'verbose', 'full_results', 'chunksize',
+                     'n_look_ahead_rows', 'preprocessing')
+
+_replace = getattr(os, 'replace', os.rename)
+_stats_cache = None
+
+
+def enable_stats_cache(directory, max_bytes=DEFAULT_MAX_BYTES):
+    """Keep cached statistics in `directory` instead of in each dataset.
+
+    Parameters
+    ----------
+    directory : str
+        Created if it does not exist.
+    max_bytes : int, optional
+
+    Returns
+    -------
+    StatsCache
+    """
+    global _stats_cache
+    _stats_cache = StatsCache(directory, max_bytes)
+    return _stats_cache
+
+
+def disable_stats_cache():
+    """Go back to caching statistics in each dataset.
+    The files in the cache directory are kept."""
+    global _stats_cache
+    _stats_cache = None
+
+
+def get_stats_cache():
+    """Returns the process-wide StatsCache or None if disabled."""
+    return _stats_cache
+
+
+class StatsCache(object):
+    """A directory of cached statistics.
+
+    Supports the subset of the `DataStore` interface which `ElecMeter`
+    uses for its cache: `__getitem__`, `append`, `put` and `remove`.
+
+    Attributes
+    ----------
+    directory : str
+    max_bytes : int
+    """
+
+    def __init__(self, directory, max_bytes=DEFAULT_MAX_BYTES):
+        if max_bytes <= 0:
+            raise ValueError("Cache size must be positive, not {}"
+                             .format(max_bytes))
+        self.directory = abspath(directory)
+        self.max_bytes = int(max_bytes)
+        # HDF5 is not thread safe
+        self._lock = threading.Lock()
+        if not isdir(self.directory):
+            try:
+                os.makedirs(self.directory)
+            except OSError:
+                # another process may have just created it
+                if not isdir(self.directory):
+                    raise
+
+    def key(self, store, meter_key, stat_name, loader_kwargs=None):
+        """Returns the key of a statistic of a meter.
+
+        Parameters
+        ----------
+        store : nilmtk.DataStore
+        meter_key : str, e.g. '/building1/elec/meter1'
+        stat_name : str, e.g. 'good_sections'
+        loader_kwargs : dict, optional
+
+        Returns
+        -------
+        str, or None if `store` is not backed by a file.
+        """
+        dataset = _dataset_identity(store)
+        if dataset is None:
+            return None
+        params = sorted((name, value)
+                        for name, value in (loader_kwargs or {}).items()
+                        if name not in PARAMS_NOT_IN_KEY and value is not None)
+        return (_digest(dataset, meter_key) + '-' +
+                _digest(stat_name, params))
+
+    def meter_prefix(self, store, meter_key):
+        """Returns the start of every key of the meter's statistics,
+        or None if `store` is not backed by a file."""
+        dataset = _dataset_identity(store)
+        if dataset is None:
+            return None
+        return _digest(dataset, meter_key) + '-'
+
+    def __getitem__(self, key):
+        filename = self._filename(key)
+        with self._lock:
+            try:
+                stat = pd.read_hdf(filename, 'stat')
+            except (IOError, OSError):
+                raise KeyError(key)
+        try:
+            # Record the use for least-recently-used eviction
+            os.utime(filename, None)
+        except OSError:
+            pass
+        return stat
+
+    def append(self, key, value):
+        """Appends the rows of `value` to the statistic.
+
+        Raises
+        ------
+        ValueError if `value` has different columns to the cached rows.
+        """
+        try:
+            existing = self[key]
+        except KeyError:
+            self.put(key, value)
+            return
+        if set(existing.columns) != set(value.columns):
+            raise ValueError("Cannot append columns {} to a cached statistic"
+                             " with columns {}".format(list(value.columns),
+                                                       list(existing.columns)))
+        self.put(key, pd.concat([existing, value[existing.columns]]))
+
+    def put(self, key, value):
+        handle, tmp_filename = tempfile.mkstemp(
+            dir=self.directory, suffix=TMP_SUFFIX)
+        os.close(handle)
+        try:
+            with self._lock:
+                value.to_hdf(tmp_filename, 'stat', mode='w', format='table')
+            _replace(tmp_filename, self._filename(key))
+        except:
+            _remove(tmp_filename)
+            raise
+        self.evict()
+
+    def remove(self, key):
+        """Removes a statistic, or every statistic whose key
+        starts with `key` if `key` ends with '-'.
+
+        Raises
+        ------
+        KeyError if nothing was removed.
+        """
+        if key.endswith('-'):
+            filenames = [join(self.directory, name)
+                         for name in os.listdir(self.directory)
+                         if name.startswith(key) and name.endswith(SUFFIX)]
+        else:
+            filenames = [self._filename(key)]
+        n_removed = sum(_remove(filename) for filename in filenames)
+        if not n_removed:
+            raise KeyError(key)
+
+    def clear(self):
+        """Removes every cached statistic."""
+        for name in os.listdir(self.directory):
+            if name.endswith(SUFFIX):
+                _remove(join(self.directory, name))
+
+    def n_bytes(self):
+        return sum(size for _, _, size in self._files())
+
+    def evict(self):
+        """Removes the least recently used statistics until the
+        directory holds no more than `max_bytes`."""
+        files = sorted(self._files())
+        n_bytes = sum(size for _, _, size in files)
+        for _, filename, size in files:
+            if n_bytes <= self.max_bytes:
+                break
+            if _remove(filename):
+                n_bytes -= size
+
+    def _files(self):
+        """Returns a list of (last used time, filename, size) for
+        each cached statistic.  Also removes stale temporary files."""
+        files = []
+        now = time.time()
+        for name in os.listdir(self.directory):
+            filename = join(self.directory, name)
+            try:
+                mtime = getmtime(filename)
+                size = getsize(filename)
+            except OSError:
+                # removed by another process
+                continue
+            if name.endswith(SUFFIX):
+                files.append((mtime, filename, size))
+            elif name.endswith(TMP_SUFFIX) and now - mtime > STALE_TMP_AGE:
+                _remove(filename)
+        return files
+
+    def _filename(self, key):
+        return join(self.directory, key + SUFFIX)
+
+
+def _dataset_identity(store):
+    filename = getattr(store, 'filename', None)
+    if filename is None:
+        filename = getattr(getattr(store, 'store', None), 'filename', None)
+    if filename is None:
+        return None
+    filename = realpath(filename)
+    try:
+        return (filename, getsize(filename), getmtime(filename))
+    except OSError:
+        return None
+
+
+def _digest(*parts):
+    return hashlib.sha1(repr(parts).encode('utf-8')).hexdigest()
+
+
+def _remove(filename):
+    """Returns True if `filename` was removed."""
+    try:
+        os.remove(filename)
+    except OSError:
+        return False
+    return True
@@ -146,43 +146,44 @@ class CombinatorialOptimisation(Disaggregator):
         mains_data_location = building_path + '/elec/meter1'
         data_is_available = False
 
-        for chunk in mains.power_series(**load_kwargs):
-            # Check that chunk is sensible size
-            if len(chunk) < self.MIN_CHUNK_LENGTH:
-                continue
-
-            # Record metadata
-            timeframes.append(chunk.timeframe)
-            measurement = chunk.name
-
-            appliance_powers = self.disaggregate_chunk(chunk)
-
-            for i, model in enumerate(self.model):
-                appliance_power = appliance_powers[i]
-                if len(appliance_power) == 0:
+        with output_datastore.write_session():
+            for chunk in mains.power_series(**load_kwargs):
+                # Check that chunk is sensible size
+                if len(chunk) < self.MIN_CHUNK_LENGTH:
                     continue
-                data_is_available = True
-                cols = pd.MultiIndex.from_tuples([chunk.name])
-                meter_instance = model['training_metadata'].instance()
-                df = pd.DataFrame(
-                    appliance_power.values, index=appliance_power.index,
-                    columns=cols)
-                key = '{}/elec/meter{}'.format(building_path, meter_instance)
-                output_datastore.append(key, df)
-
-            # Copy mains data to disag output
-            mains_df = pd.DataFrame(chunk, columns=cols)
-            output_datastore.append(key=mains_data_location, value=mains_df)
-
-        if data_is_available:
-            self._save_metadata_for_disaggregation(
-                output_datastore=output_datastore,
-                sample_period=load_kwargs['sample_period'],
-                measurement=measurement,
-                timeframes=timeframes,
-                building=mains.building(),
-                meters=[d['training_metadata'] for d in self.model]
-            )
+
+                # Record metadata
+                timeframes.append(chunk.timeframe)
+                measurement = chunk.name
+
+                appliance_powers = self.disaggregate_chunk(chunk)
+
+                for i, model in enumerate(self.model):
+                    appliance_power = appliance_powers[i]
+                    if len(appliance_power) == 0:
+                        continue
+                    data_is_available = True
+                    cols = pd.MultiIndex.from_tuples([chunk.name])
+                    meter_instance = model['training_metadata'].instance()
+                    df = pd.DataFrame(
+                        appliance_power.values, index=appliance_power.index,
+                        columns=cols)
+                    key = '{}/elec/meter{}'.format(building_path, meter_instance)
+                    output_datastore.append(key, df)
+
+                # Copy mains data to disag output
+                mains_df = pd.DataFrame(chunk, columns=cols)
+                output_datastore.append(key=mains_data_location, value=mains_df)
+
+            if data_is_available:
+                self._save_metadata_for_disaggregation(
+                    output_datastore=output_datastore,
+                    sample_period=load_kwargs['sample_period'],
+                    measurement=measurement,
+                    timeframes=timeframes,
+                    building=mains.building(),
+                    meters=[d['training_metadata'] for d in self.model]
+                )
 
     def disaggregate_chunk(self, mains):
         """In-memory disaggregation.
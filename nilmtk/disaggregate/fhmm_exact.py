@@ -384,44 +384,45 @@ class FHMM(Disaggregator):
         import warnings
         warnings.filterwarnings("ignore", category=Warning)
 
-        for chunk in mains.power_series(**load_kwargs):
+        with output_datastore.write_session():
+            for chunk in mains.power_series(**load_kwargs):
 
-            # Check that chunk is sensible size before resampling
-            if len(chunk) < self.MIN_CHUNK_LENGTH:
-                continue
+                # Check that chunk is sensible size before resampling
+                if len(chunk) < self.MIN_CHUNK_LENGTH:
+                    continue
 
-            # Record metadata
-            timeframes.append(chunk.timeframe)
-            measurement = chunk.name
+                # Record metadata
+                timeframes.append(chunk.timeframe)
+                measurement = chunk.name
 
-            # Start disaggregation
-            predictions = self.disaggregate_chunk(chunk)
-            for meter in predictions.columns:
+                # Start disaggregation
+                predictions = self.disaggregate_chunk(chunk)
+                for meter in predictions.columns:
 
-                meter_instance = meter.instance()
-                cols = pd.MultiIndex.from_tuples([chunk.name])
-                predicted_power = predictions[[meter]]
-                if len(predicted_power) == 0:
-                    continue
-                data_is_available = True
-                output_df = pd.DataFrame(predicted_power)
-                output_df.columns = pd.MultiIndex.from_tuples([chunk.name])
-                key = '{}/elec/meter{}'.format(building_path, meter_instance)
-                output_datastore.append(key, output_df)
-
-            # Copy mains data to disag output
-            output_datastore.append(key=mains_data_location,
-                                    value=pd.DataFrame(chunk, columns=cols))
-
-        if data_is_available:
-            self._save_metadata_for_disaggregation(
-                output_datastore=output_datastore,
-                sample_period=load_kwargs['sample_period'],
-                measurement=measurement,
-                timeframes=timeframes,
-                building=mains.building(),
-                meters=self.meters
-            )
+                    meter_instance = meter.instance()
+                    cols = pd.MultiIndex.from_tuples([chunk.name])
+                    predicted_power = predictions[[meter]]
+                    if len(predicted_power) == 0:
+                        continue
+                    data_is_available = True
+                    output_df = pd.DataFrame(predicted_power)
+                    output_df.columns = pd.MultiIndex.from_tuples([chunk.name])
+                    key = '{}/elec/meter{}'.format(building_path, meter_instance)
+                    output_datastore.append(key, output_df)
+
+                # Copy mains data to disag output
+                output_datastore.append(key=mains_data_location,
+                                        value=pd.DataFrame(chunk, columns=cols))
+
+            if data_is_available:
+                self._save_metadata_for_disaggregation(
+                    output_datastore=output_datastore,
+                    sample_period=load_kwargs['sample_period'],
+                    measurement=measurement,
+                    timeframes=timeframes,
+                    building=mains.building(),
+                    meters=self.meters
+                )
 
     def disaggregate_across_buildings(self, ds, output_datastore, list_of_buildings, **load_kwargs):
         """
@@ -463,49 +464,50 @@ class FHMM(Disaggregator):
                 else:
                     pass
 
-            for chunk in mains.power_series(**load_kwargs):
-                # Check that chunk is sensible size before resampling
-                if len(chunk) < self.MIN_CHUNK_LENGTH:
-                    continue
-
-                # Record metadata
-                timeframes.append(chunk.timeframe)
-                measurement = chunk.name
-
-                # Start disaggregation
-                predictions = self.disaggregate_chunk(chunk)
-                for meter in predictions.columns:
-
-                    if type(meter) is str:
-                        # training done across homes
-                        meter_instance = get_meter_instance(ds, building, meter)
-                        if meter_instance == -1:
-                            continue
-                    else:
-                        meter_instance = meter.instance()
-                    cols = pd.MultiIndex.from_tuples([chunk.name])
-                    predicted_power = predictions[[meter]]
-                    if len(predicted_power) == 0:
+            with output_datastore.write_session():
+                for chunk in mains.power_series(**load_kwargs):
+                    # Check that chunk is sensible size before resampling
+                    if len(chunk) < self.MIN_CHUNK_LENGTH:
                         continue
-                    data_is_available = True
-                    output_df = pd.DataFrame(predicted_power)
-                    output_df.columns = pd.MultiIndex.from_tuples([chunk.name])
-                    key = '{}/elec/meter{}'.format(building_path, meter_instance)
-                    output_datastore.append(key, output_df)
 
-                # Copy mains data to disag output
-                output_datastore.append(key=mains_data_location,
-                                        value=pd.DataFrame(chunk, columns=cols, dtype='float32'))
-
-            if data_is_available:
-                self._save_metadata_for_disaggregation(
-                    output_datastore=output_datastore,
-                    sample_period=load_kwargs['sample_period'],
-                    measurement=measurement,
-                    timeframes=timeframes,
-                    building=mains.building(),
-                    meters=self.meters
-                )
+                    # Record metadata
+                    timeframes.append(chunk.timeframe)
+                    measurement = chunk.name
+
+                    # Start disaggregation
+                    predictions = self.disaggregate_chunk(chunk)
+                    for meter in predictions.columns:
+
+                        if type(meter) is str:
+                            # training done across homes
+                            meter_instance = get_meter_instance(ds, building, meter)
+                            if meter_instance == -1:
+                                continue
+                        else:
+                            meter_instance = meter.instance()
+                        cols = pd.MultiIndex.from_tuples([chunk.name])
+                        predicted_power = predictions[[meter]]
+                        if len(predicted_power) == 0:
+                            continue
+                        data_is_available = True
+                        output_df = pd.DataFrame(predicted_power)
+                        output_df.columns = pd.MultiIndex.from_tuples([chunk.name])
+                        key = '{}/elec/meter{}'.format(building_path, meter_instance)
+                        output_datastore.append(key, output_df)
+
+                    # Copy mains data to disag output
+                    output_datastore.append(key=mains_data_location,
+                                            value=pd.DataFrame(chunk, columns=cols, dtype='float32'))
+
+                if data_is_available:
+                    self._save_metadata_for_disaggregation(
+                        output_datastore=output_datastore,
+                        sample_period=load_kwargs['sample_period'],
+                        measurement=measurement,
+                        timeframes=timeframes,
+                        building=mains.building(),
+                        meters=self.meters
+                    )
 
     ###################### Methods Below by Yuchen ############################
 
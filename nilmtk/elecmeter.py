@@ -2,23 +2,39 @@ from __future__ import print_function, division
 from warnings import warn
 from collections import namedtuple
 from copy import deepcopy
+from itertools import chain
 import numpy as np
 import pandas as pd
 from six import iteritems
 from .preprocessing import Clip
-from .stats import TotalEnergy, GoodSections, DropoutRate
+from .stats import (TotalEnergy, GoodSections, DropoutRate,
+                    GoodSectionsDropoutRate)
 from .hashable import Hashable
 from .measurement import (select_best_ac_type, PHYSICAL_QUANTITIES,
                           check_ac_type, check_physical_quantity)
-from .node import Node
+from .node import Node, Inlet, run_branches, pipeline_fingerprint
 from .electric import Electric
 from nilmtk.exceptions import MeasurementError
 from .utils import flatten_2d_list, capitalise_first_letter
+from nilmtk.timeframe import TimeFrame
 from nilmtk.timeframegroup import TimeFrameGroup
+from nilmtk.datastore.chunkcache import get_chunk_cache
+from nilmtk.datastore.statscache import get_stats_cache
+from nilmtk.stats.totalenergy import select_energy_columns
+from nilmtk.stats.parallel import get_parallel_stats
+from nilmtk.stats.energyindex import (energy_index_key, last_indexed_sample,
+                                      update_energy_index, energy_from_index)
+from nilmtk.preprocessing.clip import _find_limits
+from nilmtk.pyramid import (DEFAULT_LEVELS, AGGREGATES, pyramid_key,
+                            available_levels, choose_level,
+                            pyramid_watermark, update_pyramid)
 import nilmtk
 
 ElecMeterID = namedtuple('ElecMeterID', ['instance', 'building', 'dataset'])
 
+# Statistics which `ElecMeter.compute_stats` can compute in one pass.
+SINGLE_PASS_STATS = ('good_sections', 'total_energy', 'dropout_rate')
+
 
 class ElecMeter(Hashable, Electric):
 
@@ -396,6 +412,12 @@ class ElecMeter(Hashable, Electric):
         preprocessing : list of Node subclass instances
             e.g. [Clip()].
 
+        use_pyramid : bool, default=True
+            If True and data is resampled then read the mean of each bin
+            of the coarsest level of the meter's pyramid which is no
+            coarser than `sample_period` (see `build_pyramid`) instead
+            of the raw data.
+
         **kwargs : any other key word arguments to pass to `self.store.load()`
 
         Returns
@@ -431,6 +453,11 @@ class ElecMeter(Hashable, Electric):
             print("kwargs after setting resample setting:")
             print(kwargs)
 
+        level = None
+        if kwargs.pop('use_pyramid', True) and kwargs.get('resample'):
+            sample_period = kwargs.get('sample_period', self.sample_period())
+            level = choose_level(self.pyramid_levels(), sample_period)
+
         kwargs = self._prep_kwargs_for_sample_period_and_resample(**kwargs)
 
         if verbose:
@@ -439,7 +466,12 @@ class ElecMeter(Hashable, Electric):
 
         # Get source node
         preprocessing = kwargs.pop('preprocessing', [])
-        last_node = self.get_source_node(**kwargs)
+        if level is None:
+            last_node = self.get_source_node(**kwargs)
+        else:
+            if verbose:
+                print("Loading from pyramid level", level)
+            last_node = self._get_pyramid_source_node(level, **kwargs)
         generator = last_node.generator
 
         # Connect together all preprocessing nodes
@@ -565,10 +597,76 @@ class ElecMeter(Hashable, Electric):
                 "Cannot get source node if meter.store is None!")
 
         loader_kwargs = self._convert_physical_quantity_and_ac_type_to_cols(**loader_kwargs)
-        generator = self.store.load(key=self.key, **loader_kwargs)
+        generator = self._load_key(self.key, **loader_kwargs)
         self.metadata['device'] = self.device
         return Node(self, generator=generator)
 
+    def _get_pyramid_source_node(self, level, **loader_kwargs):
+        """Returns a source node which yields the mean of each bin of
+        a level of the pyramid, followed by the raw data after the
+        last bin of the level."""
+        loader_kwargs = self._convert_physical_quantity_and_ac_type_to_cols(**loader_kwargs)
+        sections = loader_kwargs.pop('sections', None)
+        sections = TimeFrameGroup([TimeFrame()] if sections is None else sections)
+        watermark = pyramid_watermark(self.store, self.key, level)
+        if watermark is None:
+            level_sections, raw_sections = [], sections
+        else:
+            level_sections = sections.intersection([TimeFrame(end=watermark)])
+            raw_sections = sections.intersection([TimeFrame(start=watermark)])
+        generators = []
+        if level_sections:
+            generators.append(self._load_key(
+                pyramid_key(self.key, level, 'mean'), sections=level_sections,
+                **loader_kwargs))
+        if raw_sections:
+            generators.append(self._load_key(
+                self.key, sections=raw_sections, **loader_kwargs))
+        self.metadata['device'] = self.device
+        return Node(self, generator=chain(*generators))
+
+    def _load_key(self, key, **loader_kwargs):
+        chunk_cache = get_chunk_cache()
+        if chunk_cache is None:
+            return self.store.load(key=key, **loader_kwargs)
+        else:
+            return chunk_cache.load(self.store, key, **loader_kwargs)
+
+    def build_pyramid(self, levels=DEFAULT_LEVELS, chunksize=None):
+        """Builds the levels of this meter's pyramid of aggregates, or
+        extends them with data appended since they were last built.
+        See `nilmtk.pyramid`.
+
+        Parameters
+        ----------
+        levels : list of ints, optional
+            Seconds per bin of each level.  Each must divide a day.
+        chunksize : int, optional
+
+        Returns
+        -------
+        dict mapping each level to the number of bins added.
+        """
+        if self.store is None:
+            raise RuntimeError("Cannot build pyramid if meter.store is None!")
+        n_bins = update_pyramid(self.store, self.key,
+                                self.device['max_sample_period'], levels,
+                                chunksize)
+        chunk_cache = get_chunk_cache()
+        if chunk_cache is not None:
+            for level in levels:
+                for aggregate in AGGREGATES:
+                    chunk_cache.invalidate(
+                        self.store, pyramid_key(self.key, level, aggregate))
+        return n_bins
+
+    def pyramid_levels(self):
+        """Returns a sorted list of the seconds per bin of each level
+        of this meter's pyramid."""
+        if self.store is None:
+            return []
+        return available_levels(self.store, self.key)
+
     def total_energy(self, **loader_kwargs):
         """
         Parameters
@@ -580,11 +678,78 @@ class ElecMeter(Hashable, Electric):
         -------
         if `full_results` is True then return TotalEnergyResults object
         else returns a pd.Series with a row for each AC type.
+
+        Notes
+        -----
+        If the meter has an up-to-date energy index (see
+        `build_energy_index`) for every AC type then the energy is found
+        from the index without reading any data.
         """
+        energy = self._total_energy_from_index(dict(loader_kwargs))
+        if energy is not None:
+            return energy
         nodes = [Clip, TotalEnergy]
         return self._get_stat_from_cache_or_compute(
             nodes, TotalEnergy.results_class(), loader_kwargs)
 
+    def build_energy_index(self, chunksize=None):
+        """Builds the energy index of each power column of this meter,
+        or extends it with data appended since it was last built.
+        See `nilmtk.stats.energyindex`.
+
+        Returns
+        -------
+        dict mapping each AC type to the number of samples indexed.
+        """
+        if self.store is None:
+            raise RuntimeError(
+                "Cannot build energy index if meter.store is None!")
+        measurements = self.device['measurements']
+        limits = dict((column, _find_limits(column, measurements))
+                      for column in self.available_columns()
+                      if column[0] == 'power')
+        n_samples = update_energy_index(
+            self.store, self.key, limits, self.device['max_sample_period'],
+            chunksize)
+        chunk_cache = get_chunk_cache()
+        if chunk_cache is not None:
+            for column in limits:
+                chunk_cache.invalidate(
+                    self.store, energy_index_key(self.key, column[1]))
+        return n_samples
+
+    def _total_energy_from_index(self, loader_kwargs):
+        """Returns the same as `total_energy` or None if the energy
+        can't be found from the energy index."""
+        if self.store is None or loader_kwargs.get('preprocessing'):
+            return None
+        full_results = loader_kwargs.pop('full_results', False)
+        if 'ac_type' in loader_kwargs or 'physical_quantity' in loader_kwargs:
+            loader_kwargs = self._convert_physical_quantity_and_ac_type_to_cols(
+                **loader_kwargs)
+        columns = select_energy_columns(
+            loader_kwargs.get('cols') or self.available_columns())
+        if not columns or any(column[0] != 'power' for column in columns):
+            return None
+        ac_types = [column[1] for column in columns]
+
+        # The index is stale if data has been appended since it was built
+        last_samples = [last_indexed_sample(self.store, self.key, ac_type)
+                        for ac_type in ac_types]
+        if None in last_samples or min(last_samples) < self.get_timeframe().end:
+            return None
+
+        sections = self._sections_for_stats(loader_kwargs)
+        energy = energy_from_index(self.store, self.key, ac_types, sections)
+        data = pd.DataFrame(energy, columns=ac_types,
+                            index=[section.start for section in sections])
+        data.insert(0, 'end', [section.end for section in sections])
+        results_obj = TotalEnergy.results_class()
+        results_obj._data = data
+        results_obj.check_for_overlap()
+        return self._stat_to_return(results_obj, full_results,
+                                    self._ac_types_of_cols(loader_kwargs))
+
     def dropout_rate(self, ignore_gaps=True, **loader_kwargs):
         """
         Parameters
@@ -635,7 +800,9 @@ class ElecMeter(Hashable, Electric):
         DataFrame. Some times we need to do some conversion to store
         `Results._data` on disk.  The logic for doing this conversion lives
         in the `Results` class or subclass.  The cache can be cleared by calling
-        `ElecMeter.clear_cache()`.
+        `ElecMeter.clear_cache()`.  If `enable_stats_cache()` has been
+        called then statistics are cached in that directory instead
+        (see `nilmtk.datastore.statscache`).
 
         Parameters
         ----------
@@ -659,41 +826,14 @@ class ElecMeter(Hashable, Electric):
         verbose = loader_kwargs.get('verbose')
         if 'ac_type' in loader_kwargs or 'physical_quantity' in loader_kwargs:
             loader_kwargs = self._convert_physical_quantity_and_ac_type_to_cols(**loader_kwargs)
-        cols = loader_kwargs.get('cols', [])
-        ac_types = set([m[1] for m in cols if m[1]])
-        results_obj_copy = deepcopy(results_obj)
-
-        # Prepare `sections` list
-        sections = loader_kwargs.get('sections')
-        if sections is None:
-            tf = self.get_timeframe()
-            tf.include_end = True
-            sections = [tf]
-        sections = TimeFrameGroup(sections)
-        sections = [s for s in sections if not s.empty]
+        ac_types = self._ac_types_of_cols(loader_kwargs)
+        sections = self._sections_for_stats(loader_kwargs)
 
         # Retrieve usable stats from cache
-        key_for_cached_stat = self.key_for_cached_stat(results_obj.name)
-        if loader_kwargs.get('preprocessing') is None:
-            cached_stat = self.get_cached_stat(key_for_cached_stat)
-            results_obj.import_from_cache(cached_stat, sections)
-
-            def find_sections_to_compute():
-                # Get sections_to_compute
-                results_obj_timeframes = results_obj.timeframes()
-                sections_to_compute = set(sections) - set(results_obj_timeframes)
-                sections_to_compute = sorted(sections_to_compute)
-                return sections_to_compute
-            try:
-                ac_type_keys = results_obj.simple().keys()
-            except:
-                sections_to_compute = find_sections_to_compute()
-            else:
-                if ac_types.issubset(ac_type_keys):
-                    sections_to_compute = find_sections_to_compute()
-                else:
-                    sections_to_compute = sections
-                    results_obj = results_obj_copy
+        use_cache = _can_cache(loader_kwargs)
+        if use_cache:
+            results_obj, sections_to_compute = self._import_stat_from_cache(
+                results_obj, sections, ac_types, loader_kwargs)
         else:
             sections_to_compute = sections
 
@@ -703,20 +843,92 @@ class ElecMeter(Hashable, Electric):
         # If we get to here then we have to compute some stats
         if sections_to_compute:
             loader_kwargs['sections'] = sections_to_compute
-            computed_result = self._compute_stat(nodes, loader_kwargs)
+            computed_results = self._compute_stat(nodes, loader_kwargs)
 
             # Merge cached results with newly computed
-            results_obj.update(computed_result.results)
+            results_obj.update(computed_results)
 
             # Save to disk newly computed stats
-            stat_for_store = computed_result.results.export_to_cache()
-            try:
-                self.store.append(key_for_cached_stat, stat_for_store)
-            except ValueError:
-                # the old table probably had different columns
-                self.store.remove(key_for_cached_stat)
-                self.store.put(key_for_cached_stat, results_obj.export_to_cache())
+            if use_cache:
+                self._cache_stat(
+                    self.key_for_cached_stat(results_obj.name, loader_kwargs),
+                    computed_results, results_obj)
+
+        return self._stat_to_return(results_obj, full_results, ac_types)
+
+    def _ac_types_of_cols(self, loader_kwargs):
+        cols = loader_kwargs.get('cols', [])
+        return set([m[1] for m in cols if m[1]])
+
+    def _sections_for_stats(self, loader_kwargs):
+        """Returns the list of non-empty sections to compute stats for."""
+        sections = loader_kwargs.get('sections')
+        if sections is None:
+            tf = self.get_timeframe()
+            tf.include_end = True
+            sections = [tf]
+        sections = TimeFrameGroup(sections)
+        return [s for s in sections if not s.empty]
+
+    def _import_stat_from_cache(self, results_obj, sections, ac_types,
+                                loader_kwargs):
+        """Loads the cached results for `sections` into `results_obj`.
 
+        Returns
+        -------
+        results_obj, sections_to_compute
+        """
+        results_obj_copy = deepcopy(results_obj)
+        key_for_cached_stat = self.key_for_cached_stat(results_obj.name,
+                                                       loader_kwargs)
+        cached_stat = self.get_cached_stat(key_for_cached_stat)
+        results_obj.import_from_cache(cached_stat, sections)
+
+        def find_sections_to_compute():
+            # Get sections_to_compute
+            results_obj_timeframes = results_obj.timeframes()
+            sections_to_compute = set(sections) - set(results_obj_timeframes)
+            sections_to_compute = sorted(sections_to_compute)
+            return sections_to_compute
+        try:
+            ac_type_keys = results_obj.simple().keys()
+        except:
+            sections_to_compute = find_sections_to_compute()
+        else:
+            if ac_types.issubset(ac_type_keys):
+                sections_to_compute = find_sections_to_compute()
+            else:
+                sections_to_compute = sections
+                results_obj = results_obj_copy
+        return results_obj, sections_to_compute
+
+    def _cache_stat(self, key_for_cached_stat, computed_results, results_obj):
+        """Appends `computed_results` to the cache.  If that fails then
+        replaces the cache with `results_obj`."""
+        store = self._store_for_cache()
+        if store is None:
+            return
+        stat_for_store = computed_results.export_to_cache()
+        try:
+            store.append(key_for_cached_stat, stat_for_store)
+        except ValueError:
+            # the old table probably had different columns
+            store.remove(key_for_cached_stat)
+            store.put(key_for_cached_stat, results_obj.export_to_cache())
+
+    def _store_for_cache(self):
+        """Returns the process-wide StatsCache if enabled, otherwise
+        the meter's DataStore.  Returns None if there is nowhere to
+        cache statistics."""
+        stats_cache = get_stats_cache()
+        if stats_cache is None:
+            return self.store
+        if self.store is None or stats_cache.meter_prefix(
+                self.store, self.key) is None:
+            return None
+        return stats_cache
+
+    def _stat_to_return(self, results_obj, full_results, ac_types):
         if full_results:
             return results_obj
         else:
@@ -731,6 +943,164 @@ class ElecMeter(Hashable, Electric):
             else:
                 return res
 
+    def compute_stats(self, stats, ignore_gaps=True, **loader_kwargs):
+        """Computes several statistics in a single pass over the data.
+
+        Cached results are used where available (exactly as the methods
+        for each statistic do) and newly computed results are written
+        to the same cache.  The data is read once for all the
+        statistics which could not be served from the cache.
+
+        Parameters
+        ----------
+        stats : list of strings
+            Any of 'good_sections', 'total_energy' and 'dropout_rate'.
+        ignore_gaps : bool, default=True
+            See `dropout_rate`.
+        full_results : bool, default=False
+        **loader_kwargs : key word arguments for DataStore.load()
+
+        Returns
+        -------
+        dict mapping each name in `stats` to the value returned by the
+        method of the same name.
+
+        Examples
+        --------
+        >>> meter.compute_stats(['good_sections', 'total_energy', 'dropout_rate'])
+        """
+        unknown = set(stats) - set(SINGLE_PASS_STATS)
+        if unknown:
+            raise ValueError("Cannot compute {}.  `stats` must be a subset of"
+                             " {}.".format(sorted(unknown), SINGLE_PASS_STATS))
+        full_results = loader_kwargs.pop('full_results', False)
+        if 'ac_type' in loader_kwargs or 'physical_quantity' in loader_kwargs:
+            loader_kwargs = self._convert_physical_quantity_and_ac_type_to_cols(**loader_kwargs)
+        ac_types = self._ac_types_of_cols(loader_kwargs)
+        sections = self._sections_for_stats(loader_kwargs)
+        use_cache = _can_cache(loader_kwargs)
+        per_section_stats = [stat for stat in stats
+                             if not (stat == 'dropout_rate' and ignore_gaps)]
+        dropout_in_good_sections = len(per_section_stats) < len(stats)
+
+        # Find which sections each statistic needs
+        results = {}
+        sections_to_compute = {}
+        stats_to_compute = set(per_section_stats)
+        if dropout_in_good_sections:
+            stats_to_compute.add('good_sections')
+        for stat in stats_to_compute:
+            results_obj = self._new_results_obj(stat)
+            if use_cache:
+                results[stat], sections_to_compute[stat] = (
+                    self._import_stat_from_cache(results_obj, sections,
+                                                 ac_types, loader_kwargs))
+            else:
+                results[stat], sections_to_compute[stat] = results_obj, sections
+        if dropout_in_good_sections:
+            if use_cache and not sections_to_compute['good_sections']:
+                good_sections = deepcopy(results['good_sections']).combined()
+                results['dropout_rate'], missing = (
+                    self._import_stat_from_cache(
+                        DropoutRate.results_class(), list(good_sections),
+                        ac_types, loader_kwargs))
+            else:
+                missing = True
+            # The dropout rate is found for each good section, so
+            # we either compute it for all `sections` or for none.
+            sections_to_compute['dropout_rate'] = sections if missing else []
+
+        # Read the data once for every section which any stat needs
+        sections_for_pass = sorted(set(
+            section for stat_sections in sections_to_compute.values()
+            for section in stat_sections))
+        if sections_for_pass:
+            computed = self._compute_stats_in_one_pass(
+                sections_to_compute, sections_for_pass, dropout_in_good_sections,
+                loader_kwargs)
+            for stat, computed_results in iteritems(computed):
+                if not use_cache:
+                    if stat == 'dropout_rate' and dropout_in_good_sections:
+                        results[stat] = computed_results
+                    else:
+                        results[stat].update(_results_within_sections(
+                            computed_results, sections_to_compute[stat]))
+                    continue
+                key_for_cached_stat = self.key_for_cached_stat(
+                    computed_results.name, loader_kwargs)
+                if stat == 'dropout_rate' and dropout_in_good_sections:
+                    results[stat] = computed_results
+                    computed_results = _results_not_in_cache(
+                        computed_results,
+                        self.get_cached_stat(key_for_cached_stat))
+                else:
+                    computed_results = _results_within_sections(
+                        computed_results, sections_to_compute[stat])
+                    results[stat].update(computed_results)
+                self._cache_stat(key_for_cached_stat, computed_results,
+                                 results[stat])
+
+        return {stat: self._stat_to_return(results[stat], full_results,
+                                           ac_types)
+                for stat in stats}
+
+    def _new_results_obj(self, stat):
+        if stat == 'good_sections':
+            return GoodSections.results_class(self.device['max_sample_period'])
+        elif stat == 'total_energy':
+            return TotalEnergy.results_class()
+        else:
+            return DropoutRate.results_class()
+
+    def _compute_stats_in_one_pass(self, sections_to_compute, sections_for_pass,
+                                   dropout_in_good_sections, loader_kwargs):
+        """
+        Parameters
+        ----------
+        sections_to_compute : dict mapping stat name to list of sections
+            Only stats with at least one section are computed.
+        sections_for_pass : list of TimeFrames
+        dropout_in_good_sections : bool
+            If True then compute the dropout rate of each good section.
+        loader_kwargs : dict
+
+        Returns
+        -------
+        dict mapping stat name to Results object.
+        """
+        stats = [stat for stat in SINGLE_PASS_STATS
+                 if sections_to_compute.get(stat)]
+        loader_kwargs = dict(loader_kwargs)
+        loader_kwargs['sections'] = sections_for_pass
+        if 'good_sections' in stats or dropout_in_good_sections:
+            loader_kwargs.setdefault('n_look_ahead_rows', 10)
+        preprocessing = loader_kwargs.pop('preprocessing', None) or []
+        source = self.get_source_node(**loader_kwargs)
+        for node in preprocessing:
+            node.upstream = source
+            source = node
+
+        # Clip modifies chunks in place so TotalEnergy must be last.
+        nodes = {}
+        branches = []
+        if 'dropout_rate' in stats:
+            if dropout_in_good_sections:
+                nodes['good_sections'] = GoodSections(Inlet(source))
+                nodes['dropout_rate'] = GoodSectionsDropoutRate(
+                    nodes['good_sections'])
+            else:
+                nodes['dropout_rate'] = DropoutRate(Inlet(source))
+            branches.append(nodes['dropout_rate'])
+        if 'good_sections' in stats and 'good_sections' not in nodes:
+            nodes['good_sections'] = GoodSections(Inlet(source))
+            branches.append(nodes['good_sections'])
+        if 'total_energy' in stats:
+            nodes['total_energy'] = TotalEnergy(Clip(Inlet(source)))
+            branches.append(nodes['total_energy'])
+
+        run_branches(source, branches)
+        return {stat: nodes[stat].results for stat in stats}
+
     def _compute_stat(self, nodes, loader_kwargs):
         """
         Parameters
@@ -740,7 +1110,9 @@ class ElecMeter(Hashable, Electric):
 
         Returns
         -------
-        Node subclass object
+        Results subclass object of the last node.  If parallel stats
+        are enabled (see `nilmtk.stats.parallel`) then the sections
+        may be computed by several processes.
 
         See Also
         --------
@@ -749,17 +1121,33 @@ class ElecMeter(Hashable, Electric):
         key_for_cached_stat
         get_cached_stat
         """
-        results = self.get_source_node(**loader_kwargs)
-        for node in nodes:
-            results = node(results)
-        results.run()
-        return results
-
-    def key_for_cached_stat(self, stat_name):
+        parallel_stats = get_parallel_stats()
+        if parallel_stats is not None:
+            results = parallel_stats.compute(self, nodes, loader_kwargs)
+            if results is not None:
+                return results
+
+        loader_kwargs = dict(loader_kwargs)
+        preprocessing = loader_kwargs.pop('preprocessing', None) or []
+        node = self.get_source_node(**loader_kwargs)
+        for preprocessing_node in preprocessing:
+            preprocessing_node.upstream = node
+            node = preprocessing_node
+        for node_class in nodes:
+            node = node_class(node)
+        node.run()
+        return node.results
+
+    def key_for_cached_stat(self, stat_name, loader_kwargs=None):
         """
         Parameters
         ----------
         stat_name : str
+        loader_kwargs : dict, optional
+            If this contains `preprocessing` then the fingerprint of the
+            preprocessing nodes is appended to `stat_name`.  If the stats
+            cache is enabled then the other load parameters are part of
+            the key too.
 
         Returns
         -------
@@ -772,6 +1160,20 @@ class ElecMeter(Hashable, Electric):
         _get_stat_from_cache_or_compute
         get_cached_stat
         """
+        preprocessing = (loader_kwargs or {}).get('preprocessing')
+        if preprocessing and stat_name:
+            fingerprint = pipeline_fingerprint(preprocessing)
+            if fingerprint is None:
+                raise ValueError("Cannot cache statistics computed with"
+                                 " preprocessing nodes which have no"
+                                 " fingerprint.")
+            stat_name += '_' + fingerprint
+
+        stats_cache = get_stats_cache()
+        if stats_cache is not None:
+            return stats_cache.key(self.store, self.key, stat_name,
+                                   loader_kwargs)
+
         if isinstance(self.instance(), tuple):
             meter_str = "_".join([str(i) for i in (self.instance())])
         else:
@@ -789,10 +1191,15 @@ class ElecMeter(Hashable, Electric):
         key_for_cached_stat
         get_cached_stat
         """
-        if self.store is not None:
-            key_for_cache = self.key_for_cached_stat('')
+        store = self._store_for_cache()
+        if store is not None:
+            stats_cache = get_stats_cache()
+            if stats_cache is None:
+                key_for_cache = self.key_for_cached_stat('')
+            else:
+                key_for_cache = stats_cache.meter_prefix(self.store, self.key)
             try:
-                self.store.remove(key_for_cache)
+                store.remove(key_for_cache)
             except KeyError:
                 if verbose:
                     print("No existing cache for", key_for_cache)
@@ -816,10 +1223,11 @@ class ElecMeter(Hashable, Electric):
         key_for_cached_stat
         clear_cache
         """
-        if self.store is None:
+        store = self._store_for_cache()
+        if store is None:
             return pd.DataFrame()
         try:
-            stat_from_cache = self.store[key_for_stat]
+            stat_from_cache = store[key_for_stat]
         except KeyError:
             return pd.DataFrame()
         else:
@@ -856,3 +1264,42 @@ class ElecMeter(Hashable, Electric):
     #     cleaning steps have been executed and some summary results (e.g. the number of
     #     implausible values removed)"""
     #     raise NotImplementedError
+
+
+def _can_cache(loader_kwargs):
+    """Returns True unless `loader_kwargs` contains preprocessing
+    nodes which cannot be fingerprinted."""
+    preprocessing = loader_kwargs.get('preprocessing')
+    return not preprocessing or pipeline_fingerprint(preprocessing) is not None
+
+
+def _results_within_sections(results, sections):
+    """Returns a copy of `results` with only the rows which start
+    within one of `sections`."""
+    selected = deepcopy(results)
+    starts = selected._data.index
+    if len(starts) == 0:
+        return selected
+    mask = np.zeros(len(starts), dtype=bool)
+    for section in sections:
+        in_section = np.ones(len(starts), dtype=bool)
+        if section.start is not None:
+            in_section &= starts >= section.start
+        if section.end is not None:
+            if section.include_end:
+                in_section &= starts <= section.end
+            else:
+                in_section &= starts < section.end
+        mask |= in_section
+    selected._data = selected._data[mask]
+    return selected
+
+
+def _results_not_in_cache(results, cached_stat):
+    """Returns a copy of `results` without the rows whose start is
+    already in `cached_stat`."""
+    selected = deepcopy(results)
+    if not cached_stat.empty:
+        selected._data = selected._data[
+            ~selected._data.index.isin(cached_stat.index)]
+    return selected
@@ -13,11 +13,11 @@ import numpy.random as nr
 import matplotlib.pyplot as plt
 import numpy as np
 from datetime import timedelta
-import gc
 import pytz
 
 from .timeframe import TimeFrame
 from .measurement import select_best_ac_type
+from .scratch import get_scratch_pool
 from .utils import (offset_alias_to_seconds, convert_to_timestamp,
                     flatten_2d_list, append_or_extend_list,
                     timedelta64_to_secs, safe_resample)
@@ -144,8 +144,11 @@ class Electric(object):
                 resample_kwargs['rule'] = '{:d}S'.format(sample_period)
                 return safe_resample(df, **resample_kwargs)
 
+            func_key = ('resample', sample_period,
+                        sorted((key, value) for key, value
+                               in resample_kwargs.items() if key != 'rule'))
             kwargs.setdefault('preprocessing', []).append(
-                Apply(func=resample_func))
+                Apply(func=resample_func, func_key=func_key))
 
         return kwargs
 
@@ -352,7 +355,7 @@ class Electric(object):
         def stdev(electric, mean, n):
             s_square_sum = 0.0
             for power in electric.power_series(**load_kwargs):
-                s_square_sum += ((power - mean) * (power - mean)).sum()
+                s_square_sum += _sum_of_products(power, mean, power, mean)
             s_square = s_square_sum / (n - 1)
             return np.sqrt(s_square)
 
@@ -362,16 +365,7 @@ class Electric(object):
         numerator = 0.0
         for (x_power, y_power) in zip(self.power_series(**load_kwargs), 
                                        other.power_series(**load_kwargs)):
-            xi_minus_xbar = x_power - x_bar
-            del x_power
-            gc.collect()
-            yi_minus_ybar = y_power - y_bar
-            del y_power
-            gc.collect()
-            numerator += (xi_minus_xbar * yi_minus_ybar).sum()
-            del xi_minus_xbar
-            del yi_minus_ybar
-            gc.collect()
+            numerator += _sum_of_products(x_power, x_bar, y_power, y_bar)
         denominator = (x_n - 1) * x_s * y_s
         corr = numerator / denominator
         return corr
@@ -973,3 +967,35 @@ def get_vampire_power(power_series):
     # power_series.min() in case we get round to building
     # a better vampire power function!
     return power_series.min()
+
+
+def _sum_of_products(x, x_mean, y, y_mean):
+    """Returns ``((x - x_mean) * (y - y_mean)).sum()``, skipping NaNs,
+    computed in scratch arrays.
+
+    Parameters
+    ----------
+    x, y : pd.Series
+    x_mean, y_mean : float
+    """
+    if not x.index.equals(y.index):
+        # pandas aligns the indices of x and y
+        return ((x - x_mean) * (y - y_mean)).sum()
+
+    pool = get_scratch_pool()
+    x_minus_mean = pool.array('x_minus_mean', len(x),
+                              np.result_type(x.values, x_mean))
+    np.subtract(x.values, x_mean, out=x_minus_mean)
+    if y is x and y_mean == x_mean:
+        y_minus_mean = x_minus_mean
+    else:
+        y_minus_mean = pool.array('y_minus_mean', len(y),
+                                  np.result_type(y.values, y_mean))
+        np.subtract(y.values, y_mean, out=y_minus_mean)
+    products = pool.array('products', len(x),
+                          np.result_type(x_minus_mean, y_minus_mean))
+    np.multiply(x_minus_mean, y_minus_mean, out=products)
+    is_nan = pool.array('is_nan', len(x), np.bool_)
+    np.isnan(products, out=is_nan)
+    np.copyto(products, 0, where=is_nan)
+    return products.sum()
@@ -9,12 +9,11 @@ from warnings import warn
 from sys import stdout
 from collections import Counter
 from copy import copy, deepcopy
-import gc
 from collections import namedtuple
 from six import iteritems, integer_types
 
 # NILMTK imports
-from .elecmeter import ElecMeter, ElecMeterID
+from .elecmeter import ElecMeter, ElecMeterID, SINGLE_PASS_STATS
 from .appliance import Appliance
 from .datastore.datastore import join_key
 from .utils import (tree_root, nodes_adjacent_to_root, simplest_type_for,
@@ -28,7 +27,9 @@ from nilmtk.exceptions import MeasurementError
 from .electric import Electric
 from .timeframe import TimeFrame, split_timeframes
 from .preprocessing import Apply
-from .datastore import MAX_MEM_ALLOWANCE_IN_BYTES
+from .datastore.chunkplanner import plan_chunksize
+from .datastore.datastore import prefetch_chunks
+from .scratch import get_scratch_pool
 from nilmtk.timeframegroup import TimeFrameGroup
 
 # MeterGroupID.meters is a tuple of ElecMeterIDs.  Order doesn't matter.
@@ -36,6 +37,9 @@ from nilmtk.timeframegroup import TimeFrameGroup
 # a set as a dict key or a DataFrame column name.)
 MeterGroupID = namedtuple('MeterGroupID', ['meters'])
 
+# dtype of the DataFrame which `combine_chunks_from_generators` sums into.
+CUMULATOR_DTYPE = np.float32
+
 class MeterGroup(Electric):
 
     """A group of ElecMeter objects. Can contain nested MeterGroup objects.
@@ -87,12 +91,22 @@ class MeterGroup(Electric):
         ElecMeter.load_meter_devices(store)
 
         # Load each meter
+        meters_by_id = {}
         for meter_i, meter_metadata_dict in iteritems(elec_meters):
             meter_id = ElecMeterID(instance=meter_i,
                                    building=building_id.instance,
                                    dataset=building_id.dataset)
             meter = ElecMeter(store, meter_metadata_dict, meter_id)
             self.meters.append(meter)
+            meters_by_id[meter_id] = meter
+
+        def get_meter(meter_id):
+            # Use the index rather than a linear scan through self.meters
+            # where we can.  Instance 0 means 'mains' so needs self[].
+            try:
+                return meters_by_id[meter_id]
+            except (KeyError, TypeError):
+                return self[meter_id]
 
         # Load each appliance
         for appliance_md in appliances:
@@ -106,7 +120,7 @@ class MeterGroup(Electric):
 
             if appliance.n_meters == 1:
                 # Attach this appliance to just a single meter
-                meter = self[meter_ids[0]]
+                meter = get_meter(meter_ids[0])
                 if isinstance(meter, MeterGroup):  # MeterGroup of site_meters
                     metergroup = meter
                     for meter in metergroup.meters:
@@ -116,12 +130,14 @@ class MeterGroup(Electric):
             else:
                 # DualSupply or 3-phase appliance so need a meter group
                 metergroup = MeterGroup()
-                metergroup.meters = [self[meter_id] for meter_id in meter_ids]
+                metergroup.meters = [get_meter(meter_id)
+                                     for meter_id in meter_ids]
                 for meter in metergroup.meters:
                     # We assume that any meters used for measuring
                     # dual-supply or 3-phase appliances are not also used
                     # for measuring single-supply appliances.
                     self.meters.remove(meter)
+                    meters_by_id.pop(meter.identifier, None)
                     meter.appliances.append(appliance)
                 self.meters.append(metergroup)
 
@@ -646,6 +662,13 @@ class MeterGroup(Electric):
             the maximum number of rows per chunk. Note that each chunk is 
             guaranteed to be of length <= chunksize.  Each chunk is *not*
             guaranteed to be exactly of length == chunksize.
+            If not specified then the chunksize is planned so that the
+            combined chunk and each meter's raw chunk fit within the
+            process-wide memory ceiling
+            (see `nilmtk.datastore.chunkplanner`).
+        prefetch : int, optional
+            If >0 then combine up to `prefetch` chunks ahead on a
+            background thread.
         **kwargs : 
             any other key word arguments to pass to `self.store.load()` including:
         physical_quantity : string or list of strings
@@ -676,14 +699,27 @@ class MeterGroup(Electric):
 
         .. note:: Different AC types will be treated separately.
         """
+        # Combine meters on a background thread if asked to prefetch.
+        # Don't pass `prefetch` on to the meters: we only take a
+        # single chunk from each meter per section.
+        prefetch = kwargs.pop('prefetch', 0)
+        if prefetch:
+            for chunk in prefetch_chunks(self.load(**kwargs), prefetch):
+                yield chunk
+            return
+
         # Handle kwargs
         sample_period = kwargs.setdefault('sample_period', self.sample_period())
         sections = kwargs.pop('sections', [self.get_timeframe()])
-        chunksize = kwargs.pop('chunksize', MAX_MEM_ALLOWANCE_IN_BYTES)
-        duration_threshold = sample_period * chunksize
+        chunksize = kwargs.pop('chunksize', None)
         columns = pd.MultiIndex.from_tuples(
             self._convert_physical_quantity_and_ac_type_to_cols(**kwargs)['cols'],
             names=LEVEL_NAMES)
+        if chunksize is None:
+            duration_threshold = self._plan_duration_threshold(
+                sample_period, columns)
+        else:
+            duration_threshold = sample_period * chunksize
         freq = '{:d}S'.format(int(sample_period))
         verbose = kwargs.get('verbose')
 
@@ -706,6 +742,25 @@ class MeterGroup(Electric):
                 index, columns, self.meters, kwargs)
             yield chunk
 
+    def _plan_duration_threshold(self, sample_period, columns):
+        """Returns the maximum duration (in seconds) of each chunk
+        such that no chunk loaded by `load()` exceeds the memory ceiling.
+
+        `combine_chunks_from_generators` holds the float32 cumulator
+        and one meter's resampled chunk in memory at the same time.
+        Each meter must also deliver its section as a single raw chunk.
+        """
+        n_rows = plan_chunksize([CUMULATOR_DTYPE] * len(columns), n_meters=2)
+        duration_threshold = sample_period * n_rows
+        for meter in self.meters:
+            try:
+                meter_n_rows = meter.store._plan_chunksize(meter.key)
+            except (AttributeError, KeyError, NotImplementedError):
+                continue
+            meter_duration = meter.sample_period() * meter_n_rows
+            duration_threshold = min(duration_threshold, meter_duration)
+        return duration_threshold
+
     def _convert_physical_quantity_and_ac_type_to_cols(self, **kwargs):
         all_columns = set()
         kwargs = deepcopy(kwargs)
@@ -1357,12 +1412,13 @@ class MeterGroup(Electric):
         """
         timeframe = None
         for meter in self.meters:
+            meter_timeframe = meter.get_timeframe()
             if timeframe is None:
-                timeframe = meter.get_timeframe()
-            elif meter.get_timeframe().empty:
+                timeframe = meter_timeframe
+            elif meter_timeframe.empty:
                 pass
             else:
-                timeframe = timeframe.union(meter.get_timeframe())
+                timeframe = timeframe.union(meter_timeframe)
         return timeframe
 
     def plot(self, kind='separate lines', **kwargs):
@@ -1644,6 +1700,12 @@ class MeterGroup(Electric):
         """Clear cache on all meters in this MeterGroup."""
         for meter in self.meters:
             meter.clear_cache()
+
+    def build_pyramid(self, **kwargs):
+        """Build (or extend) the pyramid of aggregates of every meter in
+        this MeterGroup.  See `ElecMeter.build_pyramid`."""
+        for meter in self.meters:
+            meter.build_pyramid(**kwargs)
         
     def correlation_of_sum_of_submeters_with_mains(self, **load_kwargs):
         print("Running MeterGroup.correlation_of_sum_of_submeters_with_mains...")
@@ -1663,6 +1725,10 @@ class MeterGroup(Electric):
         site_meters = [m for m in all_meters if m.is_site_meter()]
         series['total_n_site_meters'] = len(site_meters)
         if compute_expensive_stats:
+            # Fill each meter's stats cache in a single pass over its data
+            # so that the statistics below are read from the cache.
+            for meter in all_meters:
+                meter.compute_stats(list(SINGLE_PASS_STATS), **deepcopy(kwargs))
             series['correlation_of_sum_of_submeters_with_mains'] = (
                 self.correlation_of_sum_of_submeters_with_mains(**kwargs))
             series['proportion_of_energy_submetered'] = (
@@ -1755,8 +1821,8 @@ def combine_chunks_from_generators(index, columns, meters, kwargs):
     # If we didn't do this then we'd get horrible memory fragmentation.
     # See http://stackoverflow.com/a/27526721/732596
 
-    DTYPE = np.float32
-    cumulator = pd.DataFrame(np.NaN, index=index, columns=columns, dtype=DTYPE)
+    cumulator = pd.DataFrame(np.NaN, index=index, columns=columns,
+                             dtype=CUMULATOR_DTYPE)
     cumulator_arr = cumulator.as_matrix()
     columns_to_average_counter = pd.DataFrame(dtype=np.uint16)
     timeframe = None
@@ -1773,7 +1839,6 @@ def combine_chunks_from_generators(index, columns, meters, kwargs):
 
         del generator
         del kwargs_copy
-        gc.collect()
 
         if chunk_from_next_meter.empty or not chunk_from_next_meter.timeframe:
             continue
@@ -1792,14 +1857,7 @@ def combine_chunks_from_generators(index, columns, meters, kwargs):
 
             aligned = column.reindex(index, copy=False).values
             del column
-            cumulator_col = cumulator_arr[:,i]
-            where_both_are_nan = np.isnan(cumulator_col) & np.isnan(aligned)
-            np.nansum([cumulator_col, aligned], axis=0, out=cumulator_col, 
-                      dtype=DTYPE)
-            cumulator_col[where_both_are_nan] = np.NaN
-            del aligned
-            del where_both_are_nan
-            gc.collect()
+            _nansum_into(cumulator_arr[:, i], aligned)
 
         # Update columns_to_average_counter - this is necessary so we do not
         # add up columns like 'voltage' which should be averaged.
@@ -1815,21 +1873,38 @@ def combine_chunks_from_generators(index, columns, meters, kwargs):
             del counter_increment
 
         del chunk_from_next_meter
-        gc.collect()
 
     del cumulator_arr
-    gc.collect()
 
     # Create mean values by dividing any columns which need dividing
     for column in columns_to_average_counter:
         cumulator[column] /= columns_to_average_counter[column]
 
     del columns_to_average_counter
-    gc.collect()
     print()
     print("Done loading data all meters for this chunk.")
     cumulator.timeframe = timeframe
     return cumulator
 
 
+def _nansum_into(cumulator_col, aligned):
+    """Adds `aligned` to `cumulator_col` in place, treating NaNs as zeros,
+    except where both are NaN.  Equivalent to
+    ``np.nansum([cumulator_col, aligned], axis=0, out=cumulator_col)``
+    but computed in scratch arrays."""
+    pool = get_scratch_pool()
+    n_rows = len(cumulator_col)
+    cumulator_is_nan = pool.array('cumulator_is_nan', n_rows, np.bool_)
+    np.isnan(cumulator_col, out=cumulator_is_nan)
+    aligned_is_nan = pool.array('aligned_is_nan', n_rows, np.bool_)
+    np.isnan(aligned, out=aligned_is_nan)
+    addend = pool.array('addend', n_rows, aligned.dtype)
+    np.copyto(addend, aligned)
+    np.copyto(addend, 0, where=aligned_is_nan)
+    np.copyto(cumulator_col, 0, where=cumulator_is_nan)
+    np.add(cumulator_col, addend, out=cumulator_col, dtype=CUMULATOR_DTYPE)
+    np.logical_and(cumulator_is_nan, aligned_is_nan, out=cumulator_is_nan)
+    np.copyto(cumulator_col, np.NaN, where=cumulator_is_nan)
+
+
 meter_sorting_key = lambda meter: meter.instance()
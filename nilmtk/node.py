@@ -1,6 +1,9 @@
+import hashlib
 from copy import deepcopy
-from six import iteritems
+from collections import deque
+from six import iteritems, get_unbound_function
 from nilm_metadata import recursively_update_dict
+from .profiling import get_profiler
 
 class Node(object):
     """Abstract class defining interface for all Node subclasses,
@@ -12,6 +15,11 @@ class Node(object):
     postconditions = {}
     results_class = None
 
+    # Names of the attributes which change what this node outputs.
+    # None means that the node cannot be fingerprinted (so statistics
+    # computed through it are never cached).
+    fingerprint_attrs = None
+
     def __init__(self, upstream=None, generator=None):
         """
         Parameters
@@ -29,6 +37,17 @@ class Node(object):
         self.generator = generator
         self.results = None
         self.reset()
+        profiler = get_profiler()
+        if (profiler is not None and not isinstance(self, Inlet) and
+                get_unbound_function(type(self).process) is not
+                get_unbound_function(Node.process)):
+            self.process = _profiled_process(profiler, self)
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        # Profiling only applies to the process which built this node.
+        state.pop('process', None)
+        return state
 
     def reset(self):
         if self.results_class is not None:
@@ -81,6 +100,16 @@ class Node(object):
             metadata = self.upstream.get_metadata()
         return metadata
 
+    def fingerprint(self):
+        """Returns a string which is the same for every node of this
+        type with the same `fingerprint_attrs`, or None if this node
+        cannot be fingerprinted."""
+        if self.fingerprint_attrs is None:
+            return None
+        params = [(attr, getattr(self, attr, None))
+                  for attr in self.fingerprint_attrs]
+        return _digest(type(self).__module__, type(self).__name__, params)
+
     def required_measurements(self, state):
         """
         Returns
@@ -90,6 +119,270 @@ class Node(object):
         return set()
 
 
+class Inlet(Node):
+    """Yields the chunks which a `Pipeline` pushes into it, so that
+    several nodes can share a single upstream generator.
+    """
+
+    fingerprint_attrs = ()
+
+    def reset(self):
+        self.chunks = deque()
+        self.finished = False
+        # Shared by every Inlet of the same upstream in a Pipeline,
+        # so that the upstream's dry run is only done once.
+        self.dry_run_cache = {}
+
+    def dry_run_metadata(self):
+        if 'metadata' not in self.dry_run_cache:
+            self.dry_run_cache['metadata'] = self.upstream.dry_run_metadata()
+        return self.dry_run_cache['metadata']
+
+    def process(self):
+        while True:
+            if self.chunks:
+                yield self.chunks.popleft()
+            elif self.finished:
+                return
+            else:
+                raise RuntimeError("Nodes run by a Pipeline must yield"
+                                   " one chunk for every chunk they receive.")
+
+
+class Pipeline(object):
+    """Runs a graph of nodes which all read from a single source.
+
+    The graph is given by the `upstream` of each node and any number
+    of nodes may share an upstream, e.g. a Clip node can feed both
+    TotalEnergy and a user's Apply node.  `run` pulls each chunk from
+    the source once and pushes it through every node in topological
+    order, so the output of each node is broadcast to all the nodes
+    downstream of it.
+
+    Chunks are not copied.  By default a chunk passed to more than one
+    node is marked read-only so that nodes which modify chunks in place
+    (after calling `nilmtk.datastore.chunkcache.writeable_chunk`, as
+    Clip does) modify a copy instead.
+
+    Until the source is exhausted, every node must yield exactly one
+    chunk for each chunk it receives (as all preprocessing and stats
+    nodes do).  After that, nodes may yield any remaining chunks.
+
+    Attributes
+    ----------
+    source : Node, e.g. from `ElecMeter.get_source_node()`
+    sinks : list of Nodes
+        The last nodes of the graph.
+    nodes : list of Nodes
+        Every node between the source and the sinks, in topological
+        order.  `Inlet` nodes are skipped over.
+
+    Examples
+    --------
+    ::
+
+        source = meter.get_source_node()
+        clip = Clip(source)
+        good_sections = GoodSections(source)
+        total_energy = TotalEnergy(clip)
+        clipped_power = Apply(clip, func=store_chunk)
+        Pipeline(source, [good_sections, total_energy, clipped_power]).run()
+    """
+
+    def __init__(self, source, sinks, copy_on_write=True):
+        """
+        Parameters
+        ----------
+        source : Node
+        sinks : list of Nodes
+        copy_on_write : bool, optional
+            If False then shared chunks are not marked read-only, so
+            a node may only modify chunks in place if every other
+            node which receives the same chunk runs before it.
+
+        Raises
+        ------
+        ValueError if a sink does not read from `source`.
+        """
+        self.source = source
+        self.sinks = list(sinks)
+        self.copy_on_write = copy_on_write
+        self.nodes = []
+        self._original_upstreams = []
+        self._parents = {}
+        self._children = {id(source): []}
+        for sink in self.sinks:
+            self._add(sink)
+
+    def _add(self, node):
+        if id(node) in self._children:
+            return
+        parent = _upstream_of(node)
+        if parent is None:
+            raise ValueError("{} does not read from the pipeline's source."
+                             .format(node))
+        self._add(parent)
+        self.nodes.append(node)
+        self._parents[id(node)] = parent
+        self._children[id(node)] = []
+        self._children[id(parent)].append(node)
+
+    def check_requirements(self):
+        """Checks the requirements of every node before any data is
+        loaded.  The dry run metadata of each node is only computed
+        once, however many nodes are downstream of it.
+
+        Raises
+        ------
+        UnsatisfiedRequirementsError listing every unsatisfied node.
+        """
+        self._connect()
+        try:
+            self._check_requirements()
+        finally:
+            self._disconnect()
+
+    def _check_requirements(self):
+        messages = []
+        for node in self.nodes:
+            if not node.requirements:
+                continue
+            try:
+                node.check_requirements()
+            except UnsatisfiedRequirementsError as error:
+                messages.append(str(error))
+        if messages:
+            raise UnsatisfiedRequirementsError("\n".join(messages))
+
+    def run(self):
+        """Checks the requirements of every node, then pulls every
+        chunk from the source through the graph."""
+        inlets = self._connect()
+        try:
+            self._check_requirements()
+            generators = [node.process() for node in self.nodes]
+            for chunk in self.source.process():
+                self._broadcast(self.source, chunk, inlets)
+                for node, generator in zip(self.nodes, generators):
+                    try:
+                        output = next(generator)
+                    except StopIteration:
+                        raise RuntimeError(
+                            "Nodes run by a Pipeline must yield one chunk"
+                            " for every chunk they receive.")
+                    self._broadcast(node, output, inlets)
+            for node, generator in zip(self.nodes, generators):
+                inlets[id(node)].finished = True
+                for output in generator:
+                    self._broadcast(node, output, inlets)
+        finally:
+            self._disconnect()
+
+    def _broadcast(self, node, chunk, inlets):
+        children = self._children[id(node)]
+        if self.copy_on_write and len(children) > 1:
+            _mark_read_only(chunk)
+        for child in children:
+            inlets[id(child)].chunks.append(chunk)
+
+    def _connect(self):
+        """Makes each node read from an Inlet which reads from its
+        parent.  Returns a dict mapping id(node) to its Inlet."""
+        self._original_upstreams = []
+        inlets = {}
+        dry_run_caches = {}
+        for node in self.nodes:
+            parent = self._parents[id(node)]
+            inlet = Inlet(parent)
+            inlet.dry_run_cache = dry_run_caches.setdefault(id(parent), {})
+            inlets[id(node)] = inlet
+            self._original_upstreams.append((node, node.upstream))
+            node.upstream = inlet
+        return inlets
+
+    def _disconnect(self):
+        for node, upstream in self._original_upstreams:
+            node.upstream = upstream
+        self._original_upstreams = []
+
+
+def _upstream_of(node):
+    """Returns the upstream of `node`, skipping over Inlets."""
+    upstream = getattr(node, 'upstream', None)
+    while isinstance(upstream, Inlet):
+        upstream = upstream.upstream
+    return upstream
+
+
+def _mark_read_only(chunk):
+    try:
+        chunk.read_only = True
+    except AttributeError:
+        # e.g. chunks which aren't DataFrames
+        pass
+
+
+def pipeline_fingerprint(nodes):
+    """Returns a string which identifies a list of nodes (e.g. the
+    `preprocessing` passed to `ElecMeter.load`) by the type and
+    parameters of each node, or None if any node cannot be
+    fingerprinted."""
+    fingerprints = [node.fingerprint() for node in nodes]
+    if None in fingerprints:
+        return None
+    return _digest(*fingerprints)
+
+
+def _digest(*parts):
+    return hashlib.sha1(repr(parts).encode('utf-8')).hexdigest()
+
+
+def _profiled_process(profiler, node):
+    process = type(node).process.__get__(node, type(node))
+    stage = type(node).__name__
+
+    def profiled_process():
+        return profiler.profile(stage, process())
+    return profiled_process
+
+
+def run_branches(source, branches):
+    """Pulls every chunk from `source` once and pushes it down every
+    branch, in order.
+
+    Chunks are not copied, so nodes must not modify chunks in place
+    unless they are in the last branch.  Every node must yield exactly
+    one chunk for each chunk it receives (as all stats nodes do).
+
+    Parameters
+    ----------
+    source : Node, e.g. from `ElecMeter.get_source_node()`
+    branches : list of Nodes
+        The last node of each branch.  The first node of each branch
+        must have an `Inlet(source)` as its upstream.
+
+    Examples
+    --------
+    ::
+
+        source = meter.get_source_node()
+        good_sections = GoodSections(Inlet(source))
+        total_energy = TotalEnergy(Clip(Inlet(source)))
+        run_branches(source, [good_sections, total_energy])
+    """
+    for branch in branches:
+        _find_inlet(branch)
+    Pipeline(source, branches, copy_on_write=False).run()
+
+
+def _find_inlet(node):
+    while not isinstance(node, Inlet):
+        node = node.upstream
+        if node is None:
+            raise ValueError("Every branch must start with an Inlet.")
+    return node
+
+
 class UnsatisfiedRequirementsError(Exception):
     pass
 
@@ -3,12 +3,27 @@ from ..node import Node
 
 class Apply(Node):
     
-    """Apply an arbitrary function to each pd.Series chunk."""
+    """Apply an arbitrary function to each pd.Series chunk.
 
-    def __init__(self, upstream=None, generator=None, func=None):
+    Statistics computed through an Apply node are only cached if
+    `func_key` is given.  `func_key` must be a string (or other
+    value with a stable repr) which is different for every function
+    which gives different results, e.g. 'resample 60S ffill'.
+    """
+
+    fingerprint_attrs = ('func_key',)
+
+    def __init__(self, upstream=None, generator=None, func=None,
+                 func_key=None):
         self.func = func
+        self.func_key = func_key
         super(Apply, self).__init__(upstream, generator)
 
+    def fingerprint(self):
+        if self.func_key is None:
+            return None
+        return super(Apply, self).fingerprint()
+
     def process(self):
         self.check_requirements()
         for chunk in self.upstream.process():
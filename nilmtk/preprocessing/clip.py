@@ -2,6 +2,7 @@ from __future__ import print_function, division
 from warnings import warn
 from ..node import Node
 from ..utils import index_of_column_name
+from ..datastore.chunkcache import writeable_chunk
 
 class Clip(Node):
 
@@ -15,6 +16,7 @@ class Clip(Node):
     # each measurement...
     requirements = {'device': {'measurements': 'ANY VALUE'}}
     postconditions =  {'preprocessing_applied': {'clip': {}}}
+    fingerprint_attrs = ('lower', 'upper')
 
     def reset(self):
         self.lower = None
@@ -25,6 +27,7 @@ class Clip(Node):
         metadata = self.upstream.get_metadata()
         measurements = metadata['device']['measurements']
         for chunk in self.upstream.process():
+            chunk = writeable_chunk(chunk)
             for measurement in chunk:
                 lower, upper = _find_limits(measurement, measurements)
                 lower = lower if self.lower is None else self.lower
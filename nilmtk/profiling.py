@@ -0,0 +1,226 @@
+"""Timing, throughput and memory of each stage of a pipeline.
+
+When profiling is enabled, every chunk yielded by a `DataStore.load`
+generator and by the `process()` generator of every `Node` subclass
+is measured:
+
+* 'wall_time', 'cpu_time' : seconds spent producing the chunks,
+  including the time spent waiting for upstream stages.
+* 'self_wall_time', 'self_cpu_time' : as above, but excluding the time
+  spent in upstream stages.  This is the column to sort by to find the
+  stage worth optimising.
+* 'chunks', 'rows', 'bytes' : chunks produced, their rows and the
+  memory used by their arrays (not including Python objects).
+* 'peak_rss_delta' : bytes by which this stage (excluding upstream
+  stages) raised the peak resident set size of the process.  Zero
+  where the `resource` module is not available (e.g. on Windows).
+* 'calls' : generators started, e.g. sections of a meter loaded.
+
+Stages are named after the class of each node (e.g. 'GoodSections')
+and each DataStore (e.g. 'HDFDataStore.load'), so the statistics of all
+meters are added up.  Nodes are only profiled if they are constructed
+while profiling is enabled.  Loads with `prefetch` are measured as the
+consumer sees them, i.e. the time spent waiting for the next chunk.
+Statistics computed by worker processes (see
+`nilmtk.stats.enable_parallel_stats`) are not profiled.
+
+CPU time is that of the whole process, so it includes other threads.
+
+Examples
+--------
+::
+
+    from nilmtk.profiling import enable_profiling, disable_profiling
+    profiler = enable_profiling()
+    elec.mains().good_sections()
+    print(profiler.report().sort_values('self_wall_time'))
+    disable_profiling()
+"""
+from __future__ import print_function, division
+import sys
+import threading
+import time
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+try:
+    import resource
+except ImportError:
+    resource = None
+
+# Wall clock with the best resolution available.
+_wall_clock = getattr(time, 'perf_counter', time.time)
+_cpu_clock = getattr(time, 'process_time', None) or time.clock
+
+# ru_maxrss is in bytes on macOS and in kilobytes elsewhere.
+_MAXRSS_UNITS = 1 if sys.platform == 'darwin' else 1024
+
+COLUMNS = ['calls', 'chunks', 'rows', 'bytes', 'wall_time', 'self_wall_time',
+           'cpu_time', 'self_cpu_time', 'peak_rss_delta']
+
+_profiler = None
+
+
+def enable_profiling(callbacks=None):
+    """Profile every pipeline from now on.
+
+    Parameters
+    ----------
+    callbacks : list of functions, optional
+        See `Profiler.add_callback`.
+
+    Returns
+    -------
+    Profiler
+    """
+    global _profiler
+    _profiler = Profiler(callbacks)
+    return _profiler
+
+
+def disable_profiling():
+    """Stop profiling.  Generators which are already being profiled
+    are still recorded by their Profiler."""
+    global _profiler
+    _profiler = None
+
+
+def get_profiler():
+    """Returns the process-wide Profiler or None if disabled."""
+    return _profiler
+
+
+class Profiler(object):
+    """Records the statistics of each stage of every profiled generator.
+
+    Attributes
+    ----------
+    callbacks : list of functions
+    """
+
+    def __init__(self, callbacks=None):
+        self.callbacks = list(callbacks or [])
+        self._stages = OrderedDict()
+        self._lock = threading.Lock()
+        # Per thread: a stack of [wall, cpu, rss] spent in the
+        # upstream stages of each stage which is producing a chunk.
+        self._local = threading.local()
+
+    def add_callback(self, callback):
+        """Calls `callback(stage, chunk_stats)` after each profiled chunk.
+
+        `chunk_stats` is a dict with the keys 'rows', 'bytes',
+        'wall_time', 'self_wall_time', 'cpu_time', 'self_cpu_time'
+        and 'peak_rss_delta' of that chunk.
+        """
+        self.callbacks.append(callback)
+
+    def profile(self, stage, generator):
+        """Returns a generator which yields the same chunks as
+        `generator` and records how long each took to produce.
+
+        Parameters
+        ----------
+        stage : str
+        generator : iterator
+
+        Returns
+        -------
+        generator
+        """
+        with self._lock:
+            stats = self._stages.get(stage)
+            if stats is None:
+                stats = self._stages[stage] = dict.fromkeys(COLUMNS, 0)
+            stats['calls'] += 1
+        return self._profiled(stage, stats, iter(generator))
+
+    def _profiled(self, stage, stats, iterator):
+        try:
+            while True:
+                start = self._enter()
+                chunk = None
+                try:
+                    chunk = next(iterator)
+                except StopIteration:
+                    return
+                finally:
+                    self._exit(stage, stats, start, chunk)
+                yield chunk
+        finally:
+            close = getattr(iterator, 'close', None)
+            if close is not None:
+                close()
+
+    def _enter(self):
+        stack = getattr(self._local, 'stack', None)
+        if stack is None:
+            stack = self._local.stack = []
+        stack.append([0., 0., 0])
+        return _wall_clock(), _cpu_clock(), _peak_rss()
+
+    def _exit(self, stage, stats, start, chunk=None):
+        wall, cpu, rss = (_wall_clock() - start[0], _cpu_clock() - start[1],
+                          _peak_rss() - start[2])
+        stack = self._local.stack
+        upstream = stack.pop()
+        if stack:
+            parent = stack[-1]
+            parent[0] += wall
+            parent[1] += cpu
+            parent[2] += rss
+        chunk_stats = {
+            'rows': 0 if chunk is None else _n_rows(chunk),
+            'bytes': 0 if chunk is None else _n_bytes(chunk),
+            'wall_time': wall,
+            'self_wall_time': wall - upstream[0],
+            'cpu_time': cpu,
+            'self_cpu_time': cpu - upstream[1],
+            'peak_rss_delta': rss - upstream[2]}
+        with self._lock:
+            if chunk is not None:
+                stats['chunks'] += 1
+            for key, value in chunk_stats.items():
+                stats[key] += value
+        if chunk is not None:
+            for callback in self.callbacks:
+                callback(stage, chunk_stats)
+
+    def report(self):
+        """Returns a DataFrame with one row per stage (in the order in
+        which they were first profiled) and the `COLUMNS` described in
+        the module docstring."""
+        stages = self.to_dict()
+        return pd.DataFrame(list(stages.values()),
+                            index=pd.Index(list(stages), name='stage'),
+                            columns=COLUMNS)
+
+    def to_dict(self):
+        """Returns a dict mapping each stage to a dict of its statistics."""
+        with self._lock:
+            return OrderedDict((stage, dict(stats))
+                               for stage, stats in self._stages.items())
+
+    def reset(self):
+        """Forgets every stage recorded so far."""
+        with self._lock:
+            self._stages = OrderedDict()
+
+
+def _peak_rss():
+    if resource is None:
+        return 0
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * _MAXRSS_UNITS
+
+
+def _n_rows(chunk):
+    try:
+        return len(chunk)
+    except TypeError:
+        return 0
+
+
+def _n_bytes(chunk):
+    if isinstance(chunk, (pd.DataFrame, pd.Series)):
+        return int(np.sum(chunk.memory_usage(index=True, deep=False)))
+    return getattr(chunk, 'nbytes', 0)
@@ -0,0 +1,244 @@
+"""Multi-resolution aggregates of each meter's data.
+
+Most queries don't need every raw sample: plots resample to one sample
+per pixel and disaggregation often runs at one sample per minute.  A
+pyramid stores the data of a meter pre-aggregated into bins of several
+periods (by default 1 minute, 15 minutes, 1 hour and 1 day), so that
+`ElecMeter.load(sample_period=...)` can read a few rows of the coarsest
+level which is no coarser than the requested sample period instead of
+reading and resampling every raw row.
+
+Each level has one table per aggregate, with the same columns as the
+meter's table:
+
+* 'mean', 'min', 'max' : of the samples in each bin.
+* 'energy' : kWh in each bin, for power columns only.  Computed the same
+  way as `TotalEnergy`: each sample lasts until the next sample or for
+  at most `max_sample_period` seconds.
+* 'count' : number of samples in each bin.
+
+The tables live in the meter's DataStore under
+'building<I>/elec/cache/pyramid/meter<K>/period_<seconds>/<aggregate>'.
+Each row is indexed by the start of its bin.  Bins are aligned to
+multiples of their period since the Unix epoch (UTC) and bins without
+any samples have no row.
+
+Only complete bins are stored: the last bin of the data is left out
+until a sample after it arrives.  `update_pyramid` only reads the raw
+data after the last stored bin, so it can be called again after
+appending data to extend every level.
+"""
+from __future__ import print_function, division
+import numpy as np
+import pandas as pd
+from .timeframe import TimeFrame
+from .consts import JOULES_PER_KWH, SECS_PER_DAY
+from .datastore.datastore import without_window
+
+DEFAULT_LEVELS = (60, 900, 3600, 86400)
+AGGREGATES = ('mean', 'min', 'max', 'energy', 'count')
+PYRAMID_GROUP = 'pyramid'
+LEVEL_PREFIX = 'period_'
+
+# Exceptions raised by different DataStores for keys which don't exist.
+_MISSING_KEY_ERRORS = (KeyError, AttributeError, IOError, OSError,
+                       ValueError)
+
+
+def pyramid_key(meter_key, period=None, aggregate=None):
+    """
+    Parameters
+    ----------
+    meter_key : str, e.g. '/building1/elec/meter1'
+    period : int, optional
+        Seconds per bin of the level.
+    aggregate : str, optional
+        One of `AGGREGATES`.
+
+    Returns
+    -------
+    str, e.g. '/building1/elec/cache/pyramid/meter1/period_60/mean'
+    """
+    utility_key, meter = meter_key.strip('/').rsplit('/', 1)
+    key = '/'.join(['', utility_key, 'cache', PYRAMID_GROUP, meter])
+    if period is not None:
+        key += '/' + LEVEL_PREFIX + '{:d}'.format(int(period))
+        if aggregate is not None:
+            key += '/' + aggregate
+    return key
+
+
+def available_levels(store, meter_key):
+    """Returns a sorted list of the periods (in seconds) of the levels
+    stored for the meter."""
+    try:
+        elements = store.elements_below_key(pyramid_key(meter_key))
+    except _MISSING_KEY_ERRORS:
+        return []
+    levels = []
+    for element in elements or []:
+        if element.startswith(LEVEL_PREFIX):
+            try:
+                levels.append(int(element[len(LEVEL_PREFIX):]))
+            except ValueError:
+                continue
+    return sorted(levels)
+
+
+def choose_level(levels, sample_period):
+    """Returns the coarsest level no coarser than `sample_period`,
+    or None if there is no such level."""
+    usable = [level for level in levels if level <= sample_period]
+    return max(usable) if usable else None
+
+
+def pyramid_watermark(store, meter_key, period):
+    """Returns the end of the last stored bin of a level (i.e. the time
+    from which the level must be built), or None if the level is empty."""
+    try:
+        timeframe = store.get_timeframe(pyramid_key(meter_key, period, 'mean'))
+    except _MISSING_KEY_ERRORS:
+        return None
+    if timeframe.end is None:
+        return None
+    return timeframe.end + pd.Timedelta(seconds=period)
+
+
+def update_pyramid(store, meter_key, max_sample_period, levels=DEFAULT_LEVELS,
+                   chunksize=None):
+    """Builds each level of the meter's pyramid, or extends it with the
+    data appended since it was last built.
+
+    Parameters
+    ----------
+    store : nilmtk.DataStore
+    meter_key : str, e.g. '/building1/elec/meter1'
+    max_sample_period : float
+        From the meter's device metadata.  Used to compute energy.
+    levels : list of ints, optional
+        Seconds per bin of each level.  Each must divide a day.
+    chunksize : int, optional
+        Raw rows per chunk.  If None then planned by `store`.
+
+    Returns
+    -------
+    dict mapping each level to the number of bins stored.
+    """
+    for period in levels:
+        if period <= 0 or SECS_PER_DAY % period:
+            raise ValueError("Pyramid levels must divide a day, not {}"
+                             .format(period))
+    with without_window(store), store.write_session():
+        builders = [_LevelBuilder(period,
+                                  pyramid_watermark(store, meter_key, period),
+                                  max_sample_period)
+                    for period in levels]
+        watermarks = [builder.watermark for builder in builders]
+        start = None if None in watermarks else min(watermarks)
+        n_bins = dict((period, 0) for period in levels)
+        for chunk in store.load(meter_key, sections=[TimeFrame(start=start)],
+                                chunksize=chunksize):
+            if chunk.empty:
+                continue
+            for builder in builders:
+                for aggregate, bins in builder.add(chunk):
+                    store.append(
+                        pyramid_key(meter_key, builder.period, aggregate), bins)
+                    if aggregate == 'mean':
+                        n_bins[builder.period] += len(bins)
+    return n_bins
+
+
+class _LevelBuilder(object):
+    """Aggregates consecutive chunks into the bins of one level.
+
+    The rows of the last bin seen so far are held back until a later
+    chunk shows that the bin is complete.  Rows which overlap the
+    previous chunk (see `DataStore.chunk_overlap`) are dropped.
+    """
+
+    def __init__(self, period, watermark, max_sample_period):
+        self.period = period
+        self.watermark = watermark
+        self.max_sample_period = max_sample_period
+        self._period_ns = int(period) * 10**9
+        self._held_back = None
+        self._last_timestamp = None
+
+    def add(self, chunk):
+        """Returns a list of (aggregate, DataFrame) for the bins which
+        `chunk` completes."""
+        if self.watermark is not None:
+            chunk = chunk[chunk.index >= self.watermark]
+        if self._last_timestamp is not None:
+            chunk = chunk[chunk.index > self._last_timestamp]
+        if not chunk.empty:
+            self._last_timestamp = chunk.index[-1]
+        if self._held_back is not None:
+            chunk = pd.concat([self._held_back, chunk])
+        if chunk.empty:
+            return []
+        bins = chunk.index.asi8 // self._period_ns
+        n_complete = np.searchsorted(bins, bins[-1])
+        self._held_back = chunk.iloc[n_complete:]
+        if n_complete == 0:
+            return []
+        return aggregate_bins(chunk, bins, n_complete, self._period_ns,
+                              self.max_sample_period)
+
+
+def aggregate_bins(data, bins, n_complete, period_ns, max_sample_period):
+    """Aggregates the first `n_complete` rows of `data`.
+
+    Parameters
+    ----------
+    data : pd.DataFrame
+    bins : np.ndarray of int64
+        The bin number of each row of `data`.
+    n_complete : int
+        The rows after `n_complete` are only used to find how long
+        the last complete rows lasted.
+    period_ns : int
+    max_sample_period : float
+
+    Returns
+    -------
+    list of (aggregate, DataFrame)
+    """
+    complete_bins = bins[:n_complete]
+    grouped = data.iloc[:n_complete].groupby(complete_bins, sort=True)
+    labels = np.unique(complete_bins)
+    index = pd.to_datetime(labels * period_ns, unit='ns', utc=True)
+    if data.index.tz is None:
+        index = index.tz_localize(None)
+    else:
+        index = index.tz_convert(data.index.tz)
+
+    aggregates = [('mean', grouped.mean()), ('min', grouped.min()),
+                  ('max', grouped.max()), ('count', grouped.count())]
+    power_columns = [col for col in data.columns if col[0] == 'power']
+    if power_columns:
+        energy = pd.DataFrame(
+            {col: _energy_per_bin(data[col], labels, bins[n_complete - 1],
+                                  period_ns, max_sample_period)
+             for col in power_columns},
+            index=labels, columns=power_columns)
+        energy.columns = pd.MultiIndex.from_tuples(power_columns,
+                                                   names=data.columns.names)
+        aggregates.append(('energy', energy))
+    for _, frame in aggregates:
+        frame.index = index
+    return [(aggregate, frame) for aggregate, frame in aggregates]
+
+
+def _energy_per_bin(series, labels, last_bin, period_ns, max_sample_period):
+    """Returns an array of kWh for each of `labels`."""
+    series = series.dropna()
+    timestamps = series.index.asi8
+    secs = np.diff(timestamps) / 1E9
+    joules = series.values[:-1] * secs.clip(max=max_sample_period)
+    sample_bins = timestamps[:-1] // period_ns
+    in_complete_bins = sample_bins <= last_bin
+    energy = pd.Series(joules[in_complete_bins]).groupby(
+        sample_bins[in_complete_bins]).sum()
+    return energy.reindex(labels, fill_value=0).values / JOULES_PER_KWH
@@ -1,8 +1,10 @@
 import abc
+from bisect import bisect_left
+import numpy as np
 import pandas as pd
 import copy
 from six import iteritems
-from .timeframe import TimeFrame
+from .timeframe import TimeFrame, timestamp_to_i8, OPEN_START, OPEN_END
 from nilmtk.utils import get_tz, tz_localize_naive
 
 class Results(object):
@@ -20,17 +22,41 @@ class Results(object):
     _data : DataFrame
         Index is period start.  
         Columns are: `end` and any columns for internal storage of stats.
+        Rows added by `append` are buffered and only concatenated
+        into `_data` when `_data` is next read.
+    _starts, _ends : lists of int64 nanoseconds, sorted by start
+        The start and end of every row, used to check for overlaps
+        with binary searches.  None if they need rebuilding from `_data`.
 
     Static Attributes
     -----------------
     name : str
         The string used to cache this results object.
+    collapsible : bool
+        True if `collapse` is implemented.
     """
     __metaclass__ = abc.ABCMeta
+    collapsible = False
 
     def __init__(self):
         self._data = pd.DataFrame(columns=['end'])
 
+    @property
+    def _data(self):
+        if self._pending_rows:
+            rows = [self._frame] + self._pending_rows
+            self._pending_rows = []
+            self._frame = pd.concat(rows, verify_integrity=True)
+            self._frame.sort_index(inplace=True)
+        return self._frame
+
+    @_data.setter
+    def _data(self, data):
+        self._frame = data
+        self._pending_rows = []
+        self._starts = None
+        self._ends = None
+
     def combined(self):
         """Return all results from each chunk combined.  Either return single
         float for all periods or a dict where necessary, e.g. if
@@ -66,29 +92,52 @@ class Results(object):
                             .format(type(new_results)))
         
         # check that there is no overlap
-        for index, series in self._data.iterrows():
-            tf = TimeFrame(index, series['end'])
-            tf.check_for_overlap(timeframe)
+        self._check_for_overlap_with(timeframe)
 
         row = pd.DataFrame(index=[timeframe.start],
                            columns=['end'] + list(new_results))
         row['end'] = timeframe.end
         for key, val in iteritems(new_results):
             row[key] = val
-        self._data = self._data.append(row, verify_integrity=True)
-        self._data.sort_index(inplace=True)
+        self._pending_rows.append(row)
+
+    def _check_for_overlap_with(self, timeframe):
+        """Raises ValueError if `timeframe` overlaps any existing row,
+        otherwise records `timeframe` in `_starts` and `_ends`."""
+        if self._starts is None:
+            self._starts, self._ends = _starts_and_ends(self._data)
+        if timeframe.empty:
+            return
+        start = timestamp_to_i8(timeframe.start, OPEN_START)
+        end = timestamp_to_i8(timeframe.end, OPEN_END)
+        i = bisect_left(self._starts, start)
+        # Rows are disjoint so only the neighbours can overlap.
+        for j in (i - 1, i):
+            if (0 <= j < len(self._starts) and
+                    max(start, self._starts[j]) < min(end, self._ends[j])):
+                raise ValueError("Periods overlap: " + str(timeframe) + " " +
+                                 str(TimeFrame(self._data.index[j],
+                                               self._data['end'].iloc[j])))
+        self._starts.insert(i, start)
+        self._ends.insert(i, end)
 
     def check_for_overlap(self):
-        # TODO this could be made much faster
-        n = len(self._data)
-        index = self._data.index
-        for i in range(n):
-            row1 = self._data.iloc[i]
-            tf1 = TimeFrame(index[i], row1['end'])
-            for j in range(i+1, n):
-                row2 = self._data.iloc[j]
-                tf2 = TimeFrame(index[j], row2['end'])
-                tf1.check_for_overlap(tf2)
+        """Raises ValueError if any two rows overlap."""
+        starts, ends = _starts_and_ends(self._data)
+        starts = np.array(starts, dtype=np.int64)
+        ends = np.array(ends, dtype=np.int64)
+        if len(starts) < 2:
+            return
+        # `_data` is sorted by start so a row overlaps an earlier
+        # row if and only if it starts before the latest earlier end.
+        latest_ends = np.maximum.accumulate(ends[:-1])
+        overlaps = np.flatnonzero((starts[1:] < latest_ends) &
+                                  (starts[1:] < ends[1:]))
+        if len(overlaps):
+            i = overlaps[0] + 1
+            index = self._data.index
+            raise ValueError("Periods overlap: " +
+                             str(TimeFrame(index[i], self._data['end'].iloc[i])))
 
     def update(self, new_result):
         """Add results from a new chunk.
@@ -106,10 +155,53 @@ class Results(object):
         if new_result._data.empty:
             return
 
-        self._data = self._data.append(new_result._data)
-        self._data.sort_index(inplace=True)
+        data = pd.concat([self._data, new_result._data])
+        data.sort_index(inplace=True, kind='mergesort')
+        self._data = data
         self.check_for_overlap()
 
+    def merge(self, other):
+        """Merges in the results of the partition of the data after
+        this one (see `nilmtk.stats.parallel`), as if both had been
+        computed by the same node.  Merging is associative, so
+        partitions can be merged in any grouping as long as they are
+        kept in order.
+
+        Parameters
+        ----------
+        other : Results subclass (same class as self).
+        """
+        self.update(other)
+
+    def collapse(self, timeframe):
+        """Replaces the rows within `timeframe` with a single row for
+        `timeframe`, as if `timeframe` had been processed as one chunk.
+        Used to put back together a section which was split between
+        processes (see `nilmtk.stats.parallel`).
+
+        Parameters
+        ----------
+        timeframe : nilmtk.TimeFrame
+        """
+        starts, ends = _starts_and_ends(self._data)
+        within = ((np.array(starts, dtype=np.int64) >=
+                   timestamp_to_i8(timeframe.start, OPEN_START)) &
+                  (np.array(ends, dtype=np.int64) <=
+                   timestamp_to_i8(timeframe.end, OPEN_END)))
+        if not within.any():
+            return
+        rows = self._data[within]
+        self._data = self._data[~within]
+        new_results = self._collapse_rows(rows)
+        if new_results is not None:
+            self.append(timeframe, new_results)
+
+    def _collapse_rows(self, rows):
+        """Returns the `new_results` dict (see `append`) of a single
+        row with the same results as consecutive `rows`, or None if
+        there should be no row."""
+        raise NotImplementedError()
+
     def unify(self, other):
         """Take results from another table of data (another physical meter)
         and merge those results into self.  For example, if we have a dual-split
@@ -141,34 +233,22 @@ class Results(object):
             return
 
         tz = get_tz(cached_stat)
-        usable_sections_from_cache = []
-
-        def append_row(row, section):
-            row = row.astype(object)
-            # We stripped off the timezone when exporting to cache
-            # so now we must put the timezone back.
-            row['end'] = tz_localize_naive(row['end'], tz)
-            if row['end'] == section.end:
-                usable_sections_from_cache.append(row)
-
-        for section in sections:
-            if not section:
-                continue
-
-            try:
-                rows_matching_start = cached_stat.loc[section.start]
-            except KeyError:
-                pass
-            else:
-                if isinstance(rows_matching_start, pd.Series):
-                    append_row(rows_matching_start, section)
-                else:
-                    for row_i in range(rows_matching_start.shape[0]):
-                        row = rows_matching_start.iloc[row_i]
-                        append_row(row, section)
-
-        self._data = pd.DataFrame(usable_sections_from_cache)
-        self._data.sort_index(inplace=True)
+
+        # Find the cached rows whose start and end match a section.
+        # Ends were stored without their timezone, so compare in UTC.
+        sections = [section for section in sections if section]
+        wanted = set((timestamp_to_i8(section.start, OPEN_START),
+                      timestamp_to_i8(section.end, OPEN_END))
+                     for section in sections)
+        ends = [tz_localize_naive(end, tz) for end in cached_stat['end']]
+        keys = zip(_timestamps_to_i8(cached_stat.index, OPEN_START),
+                   _timestamps_to_i8(ends, OPEN_END))
+        usable = np.array([key in wanted for key in keys], dtype=bool)
+
+        data = cached_stat[usable].astype(object)
+        data['end'] = [end for end, use in zip(ends, usable) if use]
+        data.sort_index(inplace=True)
+        self._data = data
 
     def export_to_cache(self):
         """
@@ -204,3 +284,18 @@ class Results(object):
 
     def __repr__(self):
         return str(self._data)
+
+
+def _timestamps_to_i8(timestamps, open_value):
+    return [timestamp_to_i8(None if pd.isnull(timestamp) else timestamp,
+                            open_value)
+            for timestamp in timestamps]
+
+
+def _starts_and_ends(data):
+    """Returns lists of the start and end of each row of `data`
+    in int64 nanoseconds."""
+    if data.empty:
+        return [], []
+    return (_timestamps_to_i8(data.index, OPEN_START),
+            _timestamps_to_i8(data['end'], OPEN_END))
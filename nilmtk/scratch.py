@@ -0,0 +1,93 @@
+"""Reusable scratch arrays for the kernels which compute statistics.
+
+Kernels such as `get_good_sections` need a few temporary arrays as
+long as the chunk they are given.  Allocating those for every chunk
+costs more than the arithmetic when chunks are short, so each thread
+keeps a `ScratchPool` of buffers which are reused from one chunk to
+the next.  Buffers grow to fit the longest chunk seen so far.  The
+pool never keeps more than the process-wide memory ceiling (see
+`nilmtk.datastore.set_memory_ceiling`), i.e. the budget of one chunk;
+requests beyond that get a freshly allocated array instead.
+
+An array returned by the pool is only valid until the pool is next
+asked for an array with the same name, so kernels must never return
+a scratch array or keep one between calls.
+
+Examples
+--------
+::
+
+    pool = get_scratch_pool()
+    gaps = pool.array('gaps', len(index) - 1, np.int64)
+    np.subtract(index[1:], index[:-1], out=gaps)
+"""
+from __future__ import print_function, division
+import threading
+import numpy as np
+from .datastore.chunkplanner import get_memory_ceiling
+
+_local = threading.local()
+
+
+def get_scratch_pool():
+    """Returns the calling thread's ScratchPool."""
+    pool = getattr(_local, 'pool', None)
+    if pool is None:
+        pool = _local.pool = ScratchPool()
+    return pool
+
+
+class ScratchPool(object):
+    """Named buffers which are reused by every call with the same name.
+
+    Attributes
+    ----------
+    max_bytes : int or None
+        Most bytes kept by the pool.  If None then the process-wide
+        memory ceiling.
+    """
+
+    def __init__(self, max_bytes=None):
+        self.max_bytes = max_bytes
+        self._buffers = {}
+
+    def array(self, name, length, dtype):
+        """Returns an uninitialised 1D array.
+
+        Parameters
+        ----------
+        name : str
+            Identifies the buffer.  Use a different name for each array
+            which is needed at the same time.
+        length : int
+        dtype : numpy dtype (or anything `np.dtype` understands)
+
+        Returns
+        -------
+        np.ndarray of `length` items of `dtype`
+        """
+        dtype = np.dtype(dtype)
+        n_bytes = int(length) * dtype.itemsize
+        buffer = self._buffers.get(name)
+        if buffer is None or len(buffer) < n_bytes:
+            old_capacity = 0 if buffer is None else len(buffer)
+            room = self._max_bytes() - (self.n_bytes - old_capacity)
+            if n_bytes > room:
+                return np.empty(length, dtype=dtype)
+            # Grow geometrically so that slowly growing chunks
+            # don't reallocate every time.
+            capacity = min(max(n_bytes, 2 * old_capacity), room)
+            buffer = self._buffers[name] = np.empty(capacity, dtype=np.uint8)
+        return buffer[:n_bytes].view(dtype)
+
+    @property
+    def n_bytes(self):
+        """Bytes currently kept by the pool."""
+        return sum(len(buffer) for buffer in self._buffers.values())
+
+    def clear(self):
+        """Frees every buffer."""
+        self._buffers = {}
+
+    def _max_bytes(self):
+        return get_memory_ceiling() if self.max_bytes is None else self.max_bytes
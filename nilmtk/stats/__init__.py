@@ -1,3 +1,5 @@
 from .totalenergy import TotalEnergy
 from .goodsections import GoodSections
-from .dropoutrate import DropoutRate
+from .dropoutrate import DropoutRate, GoodSectionsDropoutRate
+from .parallel import (enable_parallel_stats, disable_parallel_stats,
+                       get_parallel_stats)
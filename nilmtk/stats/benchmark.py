@@ -0,0 +1,91 @@
+"""Measures the per-chunk cost of the kernels which compute statistics.
+
+The fixed cost of each call dominates when data arrives in many short
+chunks (e.g. one chunk per good section), so the benchmark runs each
+kernel on `n_chunks` synthetic chunks of `n_rows` rows.  Run it before
+and after changing a kernel to see the speedup, e.g.::
+
+    from nilmtk.stats.benchmark import benchmark_kernels
+    benchmark_kernels(n_chunks=10000, n_rows=50)
+"""
+from __future__ import print_function, division
+from time import time
+import numpy as np
+import pandas as pd
+from .goodsections import get_good_sections
+from .totalenergy import _energy_for_power_series
+from ..electric import _sum_of_products
+from ..metergroup import _nansum_into, CUMULATOR_DTYPE
+
+SAMPLE_PERIOD = 6
+MAX_SAMPLE_PERIOD = 20
+
+
+def benchmark_kernels(n_chunks=1000, n_rows=100, n_repeats=3, seed=0):
+    """
+    Parameters
+    ----------
+    n_chunks : int, optional
+    n_rows : int, optional
+        Rows per chunk.
+    n_repeats : int, optional
+        Each kernel is run over every chunk `n_repeats` times and the
+        fastest is used.
+    seed : int, optional
+        Seeds the synthetic data, which has occasional gaps and NaNs.
+
+    Returns
+    -------
+    pd.DataFrame with one row per kernel and columns:
+        time_per_chunk : seconds
+        rows_per_second
+    """
+    chunks = _synthetic_chunks(n_chunks, n_rows, seed)
+    cumulator = np.empty((n_rows, 1), dtype=CUMULATOR_DTYPE)
+
+    def good_sections(chunk):
+        get_good_sections(chunk, MAX_SAMPLE_PERIOD)
+
+    def total_energy(chunk):
+        _energy_for_power_series(chunk['power'], MAX_SAMPLE_PERIOD)
+
+    def correlation(chunk):
+        power = chunk['power']
+        _sum_of_products(power, 100., power, 100.)
+
+    def combine_chunks(chunk):
+        cumulator[:] = np.NaN
+        _nansum_into(cumulator[:, 0], chunk['power'].values)
+
+    kernels = [('get_good_sections', good_sections),
+               ('_energy_for_power_series', total_energy),
+               ('Electric.correlation', correlation),
+               ('combine_chunks_from_generators', combine_chunks)]
+    results = []
+    for name, kernel in kernels:
+        durations = []
+        for _ in range(n_repeats):
+            start = time()
+            for chunk in chunks:
+                kernel(chunk)
+            durations.append(time() - start)
+        duration = min(durations)
+        results.append({'kernel': name,
+                        'time_per_chunk': duration / n_chunks,
+                        'rows_per_second': n_chunks * n_rows / duration})
+    return pd.DataFrame(results).set_index('kernel')
+
+
+def _synthetic_chunks(n_chunks, n_rows, seed):
+    rng = np.random.RandomState(seed)
+    start = pd.Timestamp('2014-01-01', tz='Europe/London')
+    chunks = []
+    for i in range(n_chunks):
+        periods = np.full(n_rows, SAMPLE_PERIOD)
+        periods[rng.rand(n_rows) < 0.05] = MAX_SAMPLE_PERIOD * 2
+        index = start + pd.to_timedelta(np.cumsum(periods), unit='s')
+        power = (rng.rand(n_rows) * 1000).astype(np.float32)
+        power[rng.rand(n_rows) < 0.01] = np.NaN
+        chunks.append(pd.DataFrame({'power': power}, index=index))
+        start = index[-1]
+    return chunks
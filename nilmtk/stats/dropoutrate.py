@@ -1,15 +1,21 @@
 from __future__ import print_function, division
+from copy import deepcopy
 import numpy as np
-from ..node import Node
+from ..node import Node, _upstream_of
+from ..timeframe import TimeFrame
 from ..exceptions import TooFewSamplesError
 from ..utils import get_index 
 from .dropoutrateresults import DropoutRateResults
 
+MIN_N_SAMPLES = 5
+
+
 class DropoutRate(Node):
 
     requirements = {'device': {'sample_period': 'ANY VALUE'}}
     postconditions =  {'statistics': {'dropout_rate': None}}
     results_class = DropoutRateResults
+    fingerprint_attrs = ()
 
     def process(self):
         self.check_requirements()
@@ -23,6 +29,97 @@ class DropoutRate(Node):
             yield chunk
 
 
+class GoodSectionsDropoutRate(Node):
+    """Dropout rate of each good section, found in the same pass over
+    the data as the good sections themselves.
+
+    Must be immediately downstream of a `GoodSections` node.  Gives
+    the same results as `DropoutRate` run over each good section
+    (as `ElecMeter.dropout_rate(ignore_gaps=True)` does), except that
+    there is always a single result per good section, even if that
+    section spans several chunks.
+    """
+
+    requirements = {'device': {'sample_period': 'ANY VALUE'}}
+    postconditions =  {'statistics': {'dropout_rate': None}}
+    results_class = DropoutRateResults
+    fingerprint_attrs = ()
+
+    def process(self):
+        self.check_requirements()
+        metadata = self.upstream.get_metadata()
+        sample_period = metadata['device']['sample_period']
+        # A Pipeline puts an Inlet between this node and GoodSections.
+        good_sections_node = _upstream_of(self)
+        pieces = []
+        for chunk in self.upstream.process():
+            pieces.extend(_good_section_pieces(
+                chunk.index, good_sections_node.chunk_good_sections))
+            yield chunk
+
+        # `combined()` modifies the results it combines.
+        good_sections = deepcopy(good_sections_node.results).combined()
+        self.results = DropoutRateResults()
+        for section, (n_samples, first, last) in _samples_per_section(
+                good_sections, pieces):
+            if n_samples == 0:
+                continue
+            self.results.append(
+                section, {'dropout_rate': _dropout_rate(
+                    n_samples, last - first, sample_period),
+                          'n_samples': n_samples})
+
+
+def _good_section_pieces(index, good_sections):
+    """Returns a list of (n_samples, first, last) tuples for the rows
+    of `index` within each good section.  Sections which are
+    open-ended extend to the edge of `index`."""
+    pieces = []
+    for section in good_sections:
+        start_i = (0 if section.start is None
+                   else index.searchsorted(section.start, side='left'))
+        end_i = (len(index) if section.end is None
+                 else index.searchsorted(section.end, side='left'))
+        if end_i > start_i:
+            pieces.append((end_i - start_i, index[start_i], index[end_i-1]))
+        # The sample at `section.end` is only loaded for the last
+        # good section (which has `include_end=True`).
+        if end_i < len(index) and index[end_i] == section.end:
+            pieces.append((1, section.end, section.end))
+    return pieces
+
+
+def _samples_per_section(sections, pieces):
+    """Yields (TimeFrame, (n_samples, first, last)) for each section
+    by summing the pieces which fall within that section."""
+    pieces = sorted(pieces, key=lambda piece: piece[1])
+    piece_i = 0
+    for section in sections:
+        n_samples, first, last = 0, None, None
+        while piece_i < len(pieces):
+            n, piece_first, piece_last = pieces[piece_i]
+            if section.start is not None and piece_first < section.start:
+                piece_i += 1
+                continue
+            if section.end is not None and (
+                    piece_last > section.end or
+                    (piece_last == section.end and not section.include_end)):
+                break
+            n_samples += n
+            first = piece_first if first is None else first
+            last = piece_last
+            piece_i += 1
+        yield TimeFrame(section.start, section.end), (n_samples, first, last)
+
+
+def _dropout_rate(n_samples, duration, sample_period):
+    """Same as `get_dropout_rate` for `n_samples` spanning `duration`."""
+    if n_samples < MIN_N_SAMPLES:
+        return np.NaN
+    n_expected_samples = round(duration.total_seconds() / sample_period) + 1
+    return max(1 - (n_samples / n_expected_samples), 0.0)
+
+
 def get_dropout_rate(data, sample_period):
     """
     Parameters
@@ -38,7 +135,6 @@ def get_dropout_rate(data, sample_period):
         0 means that no samples have been lost.
         NaN means too few samples.
     """
-    MIN_N_SAMPLES = 5
     if len(data) < MIN_N_SAMPLES:
         return np.NaN
 
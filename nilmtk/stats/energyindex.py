@@ -0,0 +1,221 @@
+"""Prefix sums of the energy of each power column of a meter.
+
+`TotalEnergy` integrates every sample of every section it is asked
+about.  An energy index stores, for every sample of a power column, the
+energy (in kWh) of all the earlier samples.  The energy of any section
+is then the difference between the index at the last and at the first
+sample in the section: two binary searches instead of a scan.
+
+The energy is computed as in `TotalEnergy` (after `Clip`): values are
+clipped to the limits in the meter's device metadata, NaNs are dropped,
+and each sample lasts until the next sample or for at most
+`max_sample_period` seconds.  Like `TotalEnergy`, the time between the
+start of a section and its first sample (and after its last sample) is
+not counted.
+
+The index of each AC type is a table with a single 'kwh' column, stored
+in the meter's DataStore under
+'building<I>/elec/cache/energy_index/meter<K>/<ac_type>'.
+`update_energy_index` only reads the samples after the last indexed
+sample, so it can be called again after appending data.
+"""
+from __future__ import print_function, division
+import numpy as np
+import pandas as pd
+from ..timeframe import TimeFrame
+from ..consts import JOULES_PER_KWH
+from ..datastore.datastore import without_window
+
+INDEX_GROUP = 'energy_index'
+
+# Exceptions raised by different DataStores for keys which don't exist.
+_MISSING_KEY_ERRORS = (KeyError, AttributeError, IOError, OSError,
+                       ValueError)
+
+
+def energy_index_key(meter_key, ac_type=None):
+    """
+    Parameters
+    ----------
+    meter_key : str, e.g. '/building1/elec/meter1'
+    ac_type : str, optional
+
+    Returns
+    -------
+    str, e.g. '/building1/elec/cache/energy_index/meter1/active'
+    """
+    utility_key, meter = meter_key.strip('/').rsplit('/', 1)
+    key = '/'.join(['', utility_key, 'cache', INDEX_GROUP, meter])
+    if ac_type is not None:
+        key += '/' + ac_type
+    return key
+
+
+def last_indexed_sample(store, meter_key, ac_type):
+    """Returns the timestamp of the last sample in the index of `ac_type`,
+    or None if there is no index."""
+    try:
+        return store.get_timeframe(energy_index_key(meter_key, ac_type)).end
+    except _MISSING_KEY_ERRORS:
+        return None
+
+
+def update_energy_index(store, meter_key, limits, max_sample_period,
+                        chunksize=None):
+    """Builds the index of each power column, or extends it with the
+    samples appended since it was last built.
+
+    Parameters
+    ----------
+    store : nilmtk.DataStore
+    meter_key : str, e.g. '/building1/elec/meter1'
+    limits : dict
+        Maps each power column to index, e.g. ('power', 'active'), to
+        its (lower_limit, upper_limit).  Values are only clipped if
+        both limits are not None.
+    max_sample_period : float
+    chunksize : int, optional
+
+    Returns
+    -------
+    dict mapping each AC type to the number of samples indexed.
+    """
+    with without_window(store), store.write_session():
+        builders = {}
+        for column, (lower, upper) in limits.items():
+            ac_type = column[1]
+            key = energy_index_key(meter_key, ac_type)
+            last_timestamp = last_indexed_sample(store, meter_key, ac_type)
+            last_kwh = None
+            if last_timestamp is not None:
+                last_kwh = _last_indexed_kwh(store, key, last_timestamp)
+            builders[column] = _IndexBuilder(
+                key, last_timestamp, last_kwh, lower, upper, max_sample_period)
+
+        last_timestamps = [builder.last_timestamp
+                           for builder in builders.values()]
+        start = None if None in last_timestamps else min(last_timestamps)
+        n_samples = dict((column[1], 0) for column in limits)
+        for chunk in store.load(meter_key, cols=list(limits),
+                                sections=[TimeFrame(start=start)],
+                                chunksize=chunksize):
+            if chunk.empty:
+                continue
+            for column, builder in builders.items():
+                rows = builder.add(chunk[column])
+                if len(rows):
+                    store.append(builder.key, rows)
+                    n_samples[column[1]] += len(rows)
+    return n_samples
+
+
+def _last_indexed_kwh(store, key, last_timestamp):
+    """Returns the energy index at `last_timestamp`, its last row."""
+    chunks = store.load(key, sections=[TimeFrame(start=last_timestamp)])
+    last_row = [chunk for chunk in chunks if len(chunk)][-1]
+    return last_row['kwh'].iloc[-1]
+
+
+class _IndexBuilder(object):
+    """Extends the index of one column, one chunk at a time."""
+
+    def __init__(self, key, last_timestamp, last_kwh, lower, upper,
+                 max_sample_period):
+        self.key = key
+        self.last_timestamp = last_timestamp
+        self.kwh = 0. if last_kwh is None else last_kwh
+        self.lower = lower
+        self.upper = upper
+        self.max_sample_period = max_sample_period
+        # The value of the sample at `last_timestamp`, which is
+        # only known once the raw data at that time has been read.
+        self._last_value = None
+
+    def add(self, series):
+        """Returns a DataFrame of the cumulative energy before each
+        new sample in `series`."""
+        series = series.dropna()
+        if self.lower is not None and self.upper is not None:
+            series = series.clip(self.lower, self.upper)
+        if self.last_timestamp is not None:
+            if self._last_value is None:
+                at_last = series.index == self.last_timestamp
+                if at_last.any():
+                    self._last_value = series.values[at_last][-1]
+            series = series[series.index > self.last_timestamp]
+        if series.empty:
+            return pd.DataFrame(columns=['kwh'])
+
+        timestamps = series.index.asi8
+        values = series.values.astype(np.float64)
+        if self._last_value is not None:
+            timestamps = np.concatenate([[self.last_timestamp.value],
+                                         timestamps])
+            values = np.concatenate([[self._last_value], values])
+        secs = np.diff(timestamps) / 1E9
+        joules = values[:-1] * secs.clip(max=self.max_sample_period)
+        kwh = self.kwh + np.cumsum(joules) / JOULES_PER_KWH
+        if self._last_value is None:
+            # The first sample ever indexed
+            kwh = np.concatenate([[self.kwh], kwh])
+
+        self.last_timestamp = series.index[-1]
+        self._last_value = values[-1]
+        self.kwh = kwh[-1]
+        return pd.DataFrame({'kwh': kwh}, index=series.index)
+
+
+def energy_from_index(store, meter_key, ac_types, sections):
+    """Returns the energy of each section, from the index.
+
+    Parameters
+    ----------
+    store : nilmtk.DataStore
+    meter_key : str
+    ac_types : list of str
+    sections : list of nilmtk.TimeFrames
+        Intersected with `store.window`, as when loading data.
+
+    Returns
+    -------
+    dict mapping each AC type to an array of kWh for each section
+    (NaN for sections without any samples).
+    """
+    sections = [store.window.intersection(section) for section in sections]
+    energy = {}
+    for ac_type in ac_types:
+        key = energy_index_key(meter_key, ac_type)
+        # Like TotalEnergy, sections without any samples have no energy
+        # (NaN) whereas a section with a single sample has zero energy.
+        section_kwh = np.full(len(sections), np.NaN)
+        for i, section in enumerate(sections):
+            if section.empty:
+                continue
+            first_and_last = _first_and_last_kwh(store, key, section)
+            if first_and_last is not None:
+                section_kwh[i] = first_and_last[1] - first_and_last[0]
+        energy[ac_type] = section_kwh
+    return energy
+
+
+def _first_and_last_kwh(store, key, section):
+    """Returns the index at the first and last sample in `section`, or
+    None if there are no samples in `section`.
+
+    Stores which can find the rows of a section (i.e. HDFDataStore)
+    only read those two rows.  Other stores read the section.
+    """
+    with without_window(store):
+        if hasattr(store, '_read_rows'):
+            start_i, end_i = store._row_range(key, section)
+            if end_i <= start_i:
+                return None
+            first = store._read_rows(key, start_i, start_i + 1)
+            last = store._read_rows(key, end_i - 1, end_i)
+        else:
+            chunks = [chunk for chunk in store.load(key, sections=[section])
+                      if len(chunk)]
+            if not chunks:
+                return None
+            first, last = chunks[0], chunks[-1]
+    return first['kwh'].iloc[0], last['kwh'].iloc[-1]
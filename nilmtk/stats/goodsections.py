@@ -1,10 +1,8 @@
 from __future__ import print_function, division
 import numpy as np
-from numpy import diff, concatenate
-import gc
 from .goodsectionsresults import GoodSectionsResults
 from ..timeframe import TimeFrame
-from ..utils import timedelta64_to_secs
+from ..scratch import get_scratch_pool
 from ..node import Node
 from ..timeframe import list_of_timeframes_from_list_of_dicts, timeframe_from_dict
 
@@ -15,14 +13,24 @@ class GoodSections(Node):
     Attributes
     ----------
     previous_chunk_ended_with_open_ended_good_section : bool
+    chunk_good_sections : list of TimeFrame objects
+        The good sections found in the most recent chunk.
+    partial : bool
+        True if the chunks are one partition of the data and the
+        partition before it is computed separately.  The results then
+        record what they need to be merged after the results of that
+        partition (see `GoodSectionsResults.merge`).
     """
 
     requirements = {'device': {'max_sample_period': 'ANY VALUE'}}
     postconditions =  {'statistics': {'good_sections': []}}
     results_class = GoodSectionsResults
+    fingerprint_attrs = ()
         
     def reset(self):
         self.previous_chunk_ended_with_open_ended_good_section = False
+        self.chunk_good_sections = []
+        self.partial = False
 
     def process(self):
         metadata = self.upstream.get_metadata()
@@ -62,10 +70,19 @@ class GoodSections(Node):
         look_ahead = getattr(df, 'look_ahead', None)
         timeframe = df.timeframe
 
+        if self.partial and self.results.continuation is None:
+            # The first chunk with enough samples is the only one whose
+            # good sections depend on the previous partition.
+            continued = get_good_sections(df, max_sample_period, look_ahead,
+                                          True)
+            if continued:
+                self.results.continuation = (timeframe, continued)
+
         # Process dataframe
         good_sections = get_good_sections(
             df, max_sample_period, look_ahead,
             self.previous_chunk_ended_with_open_ended_good_section)
+        self.chunk_good_sections = good_sections
 
         # Set self.previous_chunk_ended_with_open_ended_good_section
         if good_sections:
@@ -75,6 +92,10 @@ class GoodSections(Node):
             # Update self.results
             self.results.append(timeframe, {'sections': [good_sections]})
 
+        if self.results.continuation is not None:
+            self.results.ends_open = (
+                self.previous_chunk_ended_with_open_ended_good_section)
+
 
 def get_good_sections(df, max_sample_period, look_ahead=None,
                       previous_chunk_ended_with_open_ended_good_section=False):
@@ -94,42 +115,41 @@ def get_good_sections(df, max_sample_period, look_ahead=None,
         `end=None`.  If this df starts with an open-ended good section
         then the first TimeFrame will have `start=None`.
     """
-    index = df.dropna().sort_index().index
+    index = _index_of_complete_rows(df)
     del df
-
-    if len(index) < 2:
+    n_samples = len(index)
+    if n_samples < 2:
         return []
-
-    timedeltas_sec = timedelta64_to_secs(diff(index.values))
-    timedeltas_check = timedeltas_sec <= max_sample_period
-
-    # Memory management
-    del timedeltas_sec
-    gc.collect()
-
-    timedeltas_check = concatenate(
-        [[previous_chunk_ended_with_open_ended_good_section],
-         timedeltas_check])
-    transitions = diff(timedeltas_check.astype(np.int))
-
-    # Memory management
+    timestamps = index.asi8
+
+    # timedeltas_check[i] is True if the gap before sample i is short
+    # enough.  The gap before the first sample is that from the
+    # previous chunk.
+    pool = get_scratch_pool()
+    timedeltas_ns = pool.array('timedeltas_ns', n_samples - 1, np.int64)
+    np.subtract(timestamps[1:], timestamps[:-1], out=timedeltas_ns)
+    timedeltas_sec = pool.array('timedeltas_sec', n_samples - 1, np.float64)
+    np.divide(timedeltas_ns, 1E9, out=timedeltas_sec)
+    timedeltas_check = pool.array('timedeltas_check', n_samples, np.bool_)
+    timedeltas_check[0] = previous_chunk_ended_with_open_ended_good_section
+    np.less_equal(timedeltas_sec, max_sample_period,
+                  out=timedeltas_check[1:])
+
+    # Good sections start (and end) at the sample before each
+    # transition from a long gap to a short gap (and vice versa).
+    transitions = pool.array('transitions', n_samples - 1, np.bool_)
+    np.greater(timedeltas_check[1:], timedeltas_check[:-1], out=transitions)
+    good_sect_starts = np.flatnonzero(transitions)
+    np.less(timedeltas_check[1:], timedeltas_check[:-1], out=transitions)
+    good_sect_ends = np.flatnonzero(transitions)
     last_timedeltas_check = timedeltas_check[-1]
-    del timedeltas_check
-    gc.collect()
-
-    good_sect_starts = list(index[:-1][transitions ==  1])
-    good_sect_ends   = list(index[:-1][transitions == -1])
-
-    # Memory management
-    last_index = index[-1]
-    del index
-    gc.collect()
+    last_i = n_samples - 1
 
     # Use look_ahead to see if we need to append a 
     # good sect start or good sect end.
     look_ahead_valid = look_ahead is not None and not look_ahead.empty
     if look_ahead_valid:
-        look_ahead_timedelta = look_ahead.dropna().index[0] - last_index
+        look_ahead_timedelta = look_ahead.dropna().index[0] - index[last_i]
         look_ahead_gap = look_ahead_timedelta.total_seconds()
     if last_timedeltas_check: # current chunk ends with a good section
         if not look_ahead_valid or look_ahead_gap > max_sample_period:
@@ -137,11 +157,11 @@ def get_good_sections(df, max_sample_period, look_ahead=None,
             # be closed because next chunk either does not exist
             # or starts with a sample which is more than max_sample_period
             # away from df.index[-1]
-            good_sect_ends += [last_index]
+            good_sect_ends = np.append(good_sect_ends, last_i)
     elif look_ahead_valid and look_ahead_gap <= max_sample_period:
         # Current chunk appears to end with a bad section
         # but last sample is the start of a good section
-        good_sect_starts += [last_index]
+        good_sect_starts = np.append(good_sect_starts, last_i)
 
     # Work out if this chunk ends with an open ended good section
     if len(good_sect_ends) == 0:
@@ -151,7 +171,7 @@ def get_good_sections(df, max_sample_period, look_ahead=None,
     elif len(good_sect_starts) > 0:
         # We have good_sect_ends and good_sect_starts
         ends_with_open_ended_good_section = (
-            good_sect_ends[-1] < good_sect_starts[-1])
+            timestamps[good_sect_ends[-1]] < timestamps[good_sect_starts[-1]])
     else:
         # We have good_sect_ends but no good_sect_starts
         ends_with_open_ended_good_section = False
@@ -159,20 +179,31 @@ def get_good_sections(df, max_sample_period, look_ahead=None,
     # If this chunk starts or ends with an open-ended
     # good section then the relevant TimeFrame needs to have
     # a None as the start or end.
+    starts = list(index[good_sect_starts])
+    ends = list(index[good_sect_ends])
     if previous_chunk_ended_with_open_ended_good_section:
-        good_sect_starts = [None] + good_sect_starts
+        starts = [None] + starts
+        good_sect_starts = np.append(-1, good_sect_starts)
     if ends_with_open_ended_good_section:
-        good_sect_ends += [None]
-
-    assert len(good_sect_starts) == len(good_sect_ends)
-
-    sections = [TimeFrame(start, end)
-                for start, end in zip(good_sect_starts, good_sect_ends)
-                if not (start == end and start is not None)]
-
-    # Memory management
-    del good_sect_starts
-    del good_sect_ends
-    gc.collect()
-
-    return sections
+        ends += [None]
+        good_sect_ends = np.append(good_sect_ends, -1)
+
+    assert len(starts) == len(ends)
+
+    # Drop sections which start and end at the same time
+    keep = ((good_sect_starts == -1) | (good_sect_ends == -1) |
+            (timestamps[good_sect_starts] != timestamps[good_sect_ends]))
+    return [TimeFrame(start, end)
+            for start, end, keep_section in zip(starts, ends, keep)
+            if keep_section]
+
+
+def _index_of_complete_rows(df):
+    """Returns the sorted index of the rows of `df` without NaNs."""
+    complete = df.notnull().values
+    if complete.ndim > 1:
+        complete = complete.all(axis=1)
+    index = df.index if complete.all() else df.index[complete]
+    if not index.is_monotonic_increasing:
+        index = index.sort_values()
+    return index
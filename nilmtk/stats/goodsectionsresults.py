@@ -16,14 +16,82 @@ class GoodSectionsResults(Results):
         index is start date for the whole chunk
         `end` is end date for the whole chunk
         `sections` is a TimeFrameGroups object (a list of nilmtk.TimeFrame objects)
+    continuation : (TimeFrame, list of TimeFrames) or None
+        Only set if `GoodSections.partial` is True.  The timeframe of the
+        first chunk with at least two samples and its good sections if
+        the previous chunk ended with an open-ended good section.
+        None if there was no such chunk.
+    ends_open : bool
+        True if the last chunk ended with an open-ended good section.
+        Only meaningful if `continuation` is not None.
     """
     
     name = "good_sections"
+    collapsible = True
 
     def __init__(self, max_sample_period):
         self.max_sample_period_td = timedelta(seconds=max_sample_period)
+        self.continuation = None
+        self.ends_open = False
         super(GoodSectionsResults, self).__init__()
 
+    def merge(self, other):
+        """Merges in the results of the partition of the data after
+        this one, as if both had been computed by the same GoodSections
+        node.  If this partition ends with an open-ended good section
+        then the first good sections of `other` are replaced by its
+        `continuation`.  Modifies `other`.
+        """
+        if self.continuation is None:
+            # No chunk of this partition depends on the previous one
+            # or changes what the next partition depends on.
+            self.continuation = other.continuation
+            self.ends_open = other.ends_open
+        elif other.continuation is not None:
+            if self.ends_open:
+                timeframe, sections = other.continuation
+                other._replace_sections(timeframe, sections)
+            self.ends_open = other.ends_open
+        self.update(other)
+
+    def _collapse_rows(self, rows):
+        # Like `combined`, except that open-ended good sections at the
+        # start and end of `rows` are left open.
+        sections = TimeFrameGroup()
+        end_date_of_prev_row = None
+        for index, row in rows.iterrows():
+            row_sections = [TimeFrame(section) for section in row['sections']]
+            if end_date_of_prev_row is not None:
+                if sections and sections[-1].end is None:
+                    if row_sections and row_sections[0].start is None:
+                        sections[-1].end = row_sections.pop(0).end
+                    else:
+                        try:
+                            sections[-1].end = end_date_of_prev_row
+                        except ValueError:
+                            pass
+                elif row_sections and row_sections[0].start is None:
+                    try:
+                        row_sections[0].start = index
+                    except ValueError:
+                        pass
+            end_date_of_prev_row = row['end']
+            sections.extend(row_sections)
+        if not sections:
+            return None
+        return {'sections': [sections]}
+
+    def _replace_sections(self, timeframe, sections):
+        data = self._data
+        if timeframe.start in data.index:
+            row_sections = list(data['sections'])
+            row_sections[data.index.get_loc(timeframe.start)] = (
+                TimeFrameGroup(sections))
+            data['sections'] = pd.Series(row_sections, index=data.index,
+                                         dtype=object)
+        else:
+            self.append(timeframe, {'sections': [sections]})
+
     def append(self, timeframe, new_results):
         """Append a single result.
 
@@ -0,0 +1,338 @@
+"""Computing statistics over several partitions of the data in parallel.
+
+`ElecMeter` computes each statistic by pulling every chunk of the
+requested sections through a chain of nodes in a single process.  When
+parallel stats are enabled, the sections are split into consecutive
+partitions and each partition is computed by a pool of worker
+processes, each running the same chain of nodes on its own handle to
+the meter's DataStore.  The partial Results are then merged in order
+with `Results.merge`, which stitches together good sections which
+span the boundary between two partitions.
+
+Partitions are groups of consecutive sections.  If there are fewer
+sections than workers then sections are split in time, as long as the
+statistic's Results can be put back together (see
+`Results.collapse`).  Each split is moved to the first sample after it,
+which is in both pieces, just as consecutive chunks overlap by one row.
+The rows of the pieces of each section are then collapsed into a single
+row for that section, so the results match those computed in this
+process.
+
+Statistics are only computed in parallel if the DataStore can be
+reopened read-only in another process (see `DataStore._reopen_spec`;
+e.g. not an HDFDataStore which is open for writing) and any
+preprocessing nodes can be pickled.  Otherwise they are computed in
+this process as usual.
+
+Examples
+--------
+::
+
+    from nilmtk.stats import enable_parallel_stats
+    enable_parallel_stats(n_workers=8)
+    meter.good_sections()   # computed by 8 worker processes
+"""
+from __future__ import print_function, division
+import multiprocessing
+import pickle
+from copy import copy
+from functools import partial
+import numpy as np
+from ..node import Node
+from ..timeframe import split_timeframes
+from ..consts import SECS_PER_DAY
+from ..datastore.chunkplanner import get_memory_ceiling, set_memory_ceiling
+from .goodsections import GoodSections
+from .totalenergy import TotalEnergy
+
+# Partitions shorter than this aren't worth a worker's start-up cost.
+DEFAULT_MIN_PARTITION_SECONDS = SECS_PER_DAY
+
+_parallel_stats = None
+
+
+def enable_parallel_stats(n_workers=None,
+                          min_partition_seconds=DEFAULT_MIN_PARTITION_SECONDS):
+    """Compute statistics in parallel from now on.
+
+    Parameters
+    ----------
+    n_workers : int, optional
+        Number of worker processes.  Defaults to the number of CPUs.
+    min_partition_seconds : float, optional
+
+    Returns
+    -------
+    ParallelStats
+    """
+    global _parallel_stats
+    disable_parallel_stats()
+    _parallel_stats = ParallelStats(n_workers, min_partition_seconds)
+    return _parallel_stats
+
+
+def disable_parallel_stats():
+    """Go back to computing statistics in this process and stop
+    the worker processes."""
+    global _parallel_stats
+    if _parallel_stats is not None:
+        _parallel_stats.close()
+    _parallel_stats = None
+
+
+def get_parallel_stats():
+    """Returns the process-wide ParallelStats or None if disabled."""
+    return _parallel_stats
+
+
+class ParallelStats(object):
+    """A pool of worker processes which compute statistics.
+
+    The pool is started the first time it is needed.
+
+    Attributes
+    ----------
+    n_workers : int
+    min_partition_seconds : float
+    """
+
+    def __init__(self, n_workers=None,
+                 min_partition_seconds=DEFAULT_MIN_PARTITION_SECONDS):
+        self.n_workers = (multiprocessing.cpu_count() if n_workers is None
+                          else max(int(n_workers), 1))
+        self.min_partition_seconds = min_partition_seconds
+        self._pool = None
+
+    def compute(self, meter, nodes, loader_kwargs):
+        """Computes a statistic of `meter` in parallel.
+
+        Parameters
+        ----------
+        meter : nilmtk.ElecMeter
+        nodes : list of nilmtk.Node subclasses
+        loader_kwargs : dict
+            Must include `sections`.
+
+        Returns
+        -------
+        Results subclass instance, or None if the statistic should be
+        computed in this process instead.
+        """
+        spec = meter.store._reopen_spec(read_only=True)
+        if spec is None:
+            return None
+        loader_kwargs = dict(loader_kwargs)
+        preprocessing = []
+        for node in loader_kwargs.pop('preprocessing', None) or []:
+            node = copy(node)
+            node.upstream = None
+            node.generator = None
+            preprocessing.append(node)
+        try:
+            pickle.dumps(preprocessing, pickle.HIGHEST_PROTOCOL)
+        except (pickle.PicklingError, TypeError, AttributeError):
+            return None
+
+        loader_kwargs = meter._convert_physical_quantity_and_ac_type_to_cols(
+            **loader_kwargs)
+        sections = list(loader_kwargs.pop('sections'))
+        results_class = nodes[-1].results_class
+        partitions = self._partition(sections, results_class.collapsible)
+        partitions = _split_at_samples(
+            partitions, partial(_first_sample, meter.store, meter.key,
+                                loader_kwargs.get('cols')))
+        if len(partitions) < 2:
+            return None
+
+        metadata = dict(meter.metadata)
+        metadata['device'] = meter.device
+        tasks = []
+        previous_section_i = None
+        for partition in partitions:
+            section_i, first_piece = partition[0]
+            # The first sample of the partition is also the last
+            # sample of the partition before.
+            shared_sample = (first_piece.start
+                             if section_i == previous_section_i else None)
+            previous_section_i = partition[-1][0]
+            task_kwargs = dict(loader_kwargs)
+            task_kwargs['sections'] = [piece for _, piece in partition]
+            tasks.append((spec, meter.store.window, meter.key, metadata,
+                          nodes, preprocessing, shared_sample, task_kwargs))
+
+        partial_results = self._get_pool().map(_compute_partition, tasks)
+        results = partial_results[0]
+        for other in partial_results[1:]:
+            results.merge(other)
+        split = sorted(set(section_i for partition in partitions
+                           for section_i, piece in partition
+                           if piece is not sections[section_i]))
+        for section_i in split:
+            results.collapse(sections[section_i])
+        return results
+
+    def partition(self, sections, split_sections=True):
+        """Splits `sections` into at most `n_workers` lists of
+        consecutive sections of roughly equal duration.
+
+        Parameters
+        ----------
+        sections : list of nilmtk.TimeFrames
+        split_sections : bool, optional
+            If False then sections are only grouped, never split.
+
+        Returns
+        -------
+        list of lists of nilmtk.TimeFrames
+        """
+        return [[piece for _, piece in partition]
+                for partition in self._partition(sections, split_sections)]
+
+    def _partition(self, sections, split_sections):
+        """Same as `partition` except that each piece is a tuple of
+        the index of its section in `sections` and the piece."""
+        sections = list(sections)
+        bounded = [section for section in sections
+                   if section.start is not None and section.end is not None]
+        total_seconds = sum(section.timedelta.total_seconds()
+                            for section in bounded)
+        n_partitions = min(self.n_workers,
+                           int(total_seconds // self.min_partition_seconds))
+        if n_partitions < 2:
+            return [list(enumerate(sections))]
+        seconds_per_partition = total_seconds / n_partitions
+
+        pieces = []
+        for section_i, section in enumerate(sections):
+            if (not split_sections or section.start is None or
+                    section.end is None):
+                pieces.append((section_i, section))
+                continue
+            section_pieces = list(split_timeframes([section],
+                                                   seconds_per_partition))
+            section_pieces[-1].include_end = section.include_end
+            pieces.extend((section_i, piece) for piece in section_pieces)
+
+        seconds = np.array([piece.timedelta.total_seconds()
+                            if piece.start is not None and piece.end is not None
+                            else 0. for _, piece in pieces])
+        # Assign each piece to a partition by the time before its middle
+        middles = np.cumsum(seconds) - seconds / 2
+        partition_i = np.minimum(
+            (middles // seconds_per_partition).astype(int), n_partitions - 1)
+        partitions = []
+        for i, piece in zip(partition_i, pieces):
+            if not partitions or i != previous_i:
+                partitions.append([])
+            partitions[-1].append(piece)
+            previous_i = i
+        return partitions
+
+    def close(self):
+        """Stops the worker processes."""
+        if self._pool is not None:
+            self._pool.terminate()
+            self._pool.join()
+            self._pool = None
+
+    def _get_pool(self):
+        if self._pool is None:
+            context = (multiprocessing.get_context('spawn')
+                       if hasattr(multiprocessing, 'get_context')
+                       else multiprocessing)
+            self._pool = context.Pool(
+                self.n_workers, initializer=set_memory_ceiling,
+                initargs=(get_memory_ceiling() // self.n_workers,))
+        return self._pool
+
+
+def _split_at_samples(partitions, first_sample):
+    """Moves the start of each piece after the first of a section to
+    the first sample in it, and the end of the piece before to that
+    sample (inclusive), so the sample is in both pieces.  Pieces without
+    any samples, and pieces in the same partition as the piece before,
+    are merged into the piece before.
+
+    Parameters
+    ----------
+    partitions : list of lists of (section index, TimeFrame)
+        From `ParallelStats._partition`.  The TimeFrames are modified
+        in place.
+    first_sample : function
+        Returns the timestamp of the first sample in a TimeFrame,
+        or None.
+
+    Returns
+    -------
+    list of the partitions which still have pieces.
+    """
+    split_partitions = []
+    previous = None
+    for partition in partitions:
+        pieces = []
+        for section_i, piece in partition:
+            if previous is not None and previous[0] == section_i:
+                previous_piece = previous[1]
+                sample = None if pieces else first_sample(piece)
+                if sample is None or sample >= piece.end:
+                    previous_piece.end = piece.end
+                    previous_piece.include_end = piece.include_end
+                    continue
+                previous_piece.end = sample
+                previous_piece.include_end = True
+                piece.start = sample
+            pieces.append((section_i, piece))
+            previous = (section_i, piece)
+        if pieces:
+            split_partitions.append(pieces)
+    return split_partitions
+
+
+def _first_sample(store, key, cols, timeframe):
+    """Returns the timestamp of the first sample of `key` in
+    `timeframe`, or None."""
+    chunks = store.load(key, cols=cols, sections=[timeframe], chunksize=1)
+    try:
+        for chunk in chunks:
+            if len(chunk):
+                return chunk.index[0]
+    finally:
+        chunks.close()
+    return None
+
+
+class _MeterMetadata(object):
+    """Stands in for the ElecMeter upstream of a worker's source node."""
+
+    def __init__(self, metadata):
+        self.metadata = metadata
+
+    def dry_run_metadata(self):
+        return self.metadata
+
+    def get_metadata(self):
+        return self.metadata
+
+
+def _compute_partition(task):
+    (spec, window, key, metadata, nodes, preprocessing, shared_sample,
+     loader_kwargs) = task
+    cls, args, kwargs = spec
+    store = cls(*args, **kwargs)
+    try:
+        store.window = window
+        generator = store.load(key, **loader_kwargs)
+        results = Node(_MeterMetadata(metadata), generator=generator)
+        for node in preprocessing:
+            node.upstream = results
+            results = node
+        for node_class in nodes:
+            results = node_class(results)
+            if isinstance(results, GoodSections):
+                results.partial = True
+            elif isinstance(results, TotalEnergy):
+                results.previous_sample = shared_sample
+        results.run()
+        return results.results
+    finally:
+        store.close()
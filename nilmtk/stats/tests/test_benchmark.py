@@ -0,0 +1,20 @@
+#!/usr/bin/python
+from __future__ import print_function, division
+import unittest
+from ..benchmark import benchmark_kernels
+
+
+class TestBenchmark(unittest.TestCase):
+
+    def test_benchmark_kernels(self):
+        report = benchmark_kernels(n_chunks=10, n_rows=20, n_repeats=1)
+        self.assertEqual(list(report.index),
+                         ['get_good_sections', '_energy_for_power_series',
+                          'Electric.correlation',
+                          'combine_chunks_from_generators'])
+        self.assertTrue((report['time_per_chunk'] > 0).all())
+        self.assertTrue((report['rows_per_second'] > 0).all())
+
+
+if __name__ == '__main__':
+    unittest.main()
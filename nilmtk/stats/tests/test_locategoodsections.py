@@ -1,6 +1,8 @@
 #!/usr/bin/python
 from __future__ import print_function, division
 import unittest
+import shutil
+import tempfile
 from os.path import join
 import numpy as np
 import pandas as pd
@@ -32,8 +34,12 @@ class TestLocateGoodSections(unittest.TestCase):
         meter1 = ElecMeter(store=self.datastore, metadata=self.meter_meta,
                            meter_id=METER_ID)
 
-        # load co_test.h5
-        dataset = DataSet(join(data_dir(), 'co_test.h5'))
+        # load a copy of co_test.h5: clear_cache() removes the
+        # good sections cached in the shared file
+        directory = tempfile.mkdtemp()
+        filename = join(directory, 'co_test.h5')
+        shutil.copyfile(join(data_dir(), 'co_test.h5'), filename)
+        dataset = DataSet(filename)
         meter2 = dataset.buildings[1].elec.mains()
 
         for meter in [meter1, meter2]:
@@ -53,6 +59,7 @@ class TestLocateGoodSections(unittest.TestCase):
                 meter.clear_cache()
 
         dataset.store.close()
+        shutil.rmtree(directory)
 
     def test_process_chunk(self):
         MAX_SAMPLE_PERIOD = 10
@@ -110,6 +117,43 @@ class TestLocateGoodSections(unittest.TestCase):
             self.assertEqual(results[2].timedelta.total_seconds(), 50)
             self.assertEqual(results[3].timedelta.total_seconds(), 20)
 
+    def test_merge_partitions(self):
+        MAX_SAMPLE_PERIOD = 10
+        metadata = {'device': {'max_sample_period': MAX_SAMPLE_PERIOD}}
+        secs = [0, 10, 20, 30, 50, 60, 100, 200,
+                250, 260, 270, 280, 290, 300, 350, 360, 370]
+        index = pd.DatetimeIndex([pd.Timestamp('2011-01-01 00:00:00') +
+                                  timedelta(seconds=sec) for sec in secs])
+        df = pd.DataFrame(data=np.random.randn(len(index), 3), index=index,
+                          columns=['a', 'b', 'c'])
+
+        # Compute each chunk as a separate partition, then merge them
+        # in order.  The good section from 250 to 300 secs spans three.
+        split_points = [0, 4, 10, 12, 17]
+        boundaries = list(index[split_points[:-1]]) + [index[-1] +
+                                                       timedelta(seconds=1)]
+        partial_results = []
+        for j, (start_i, end_i) in enumerate(zip(split_points[:-1],
+                                                 split_points[1:])):
+            chunk = df.iloc[start_i:end_i]
+            chunk.timeframe = TimeFrame(boundaries[j], boundaries[j+1])
+            chunk.look_ahead = df.iloc[end_i:]
+            locate = GoodSections()
+            locate.partial = True
+            locate.results = GoodSectionsResults(MAX_SAMPLE_PERIOD)
+            locate._process_chunk(chunk, metadata)
+            partial_results.append(locate.results)
+
+        results = partial_results[0]
+        for other in partial_results[1:]:
+            results.merge(other)
+        results = results.combined()
+        self.assertEqual(len(results), 4)
+        self.assertAlmostEqual(results[0].timedelta.total_seconds(), 30)
+        self.assertEqual(results[1].timedelta.total_seconds(), 10)
+        self.assertEqual(results[2].timedelta.total_seconds(), 50)
+        self.assertEqual(results[3].timedelta.total_seconds(), 20)
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,132 @@
+#!/usr/bin/python
+from __future__ import print_function, division
+import unittest
+import shutil
+import tempfile
+from os.path import join
+from datetime import timedelta
+import pandas as pd
+from ..goodsections import GoodSections
+from ..parallel import (ParallelStats, enable_parallel_stats,
+                        disable_parallel_stats, get_parallel_stats)
+from ... import TimeFrame, ElecMeter, HDFDataStore
+from ...datastore import enable_stats_cache, disable_stats_cache
+from ...elecmeter import ElecMeterID
+from ...tests.testingtools import data_dir
+
+METER_ID = ElecMeterID(instance=1, building=1, dataset='REDD')
+
+
+class TestParallelStats(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        filename = join(data_dir(), 'energy.h5')
+        cls.datastore = HDFDataStore(filename, 'r')
+        ElecMeter.load_meter_devices(cls.datastore)
+        cls.meter_meta = cls.datastore.load_metadata('building1')['elec_meters'][METER_ID.instance]
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.datastore.close()
+
+    def setUp(self):
+        # The datastore is read-only, so cache statistics outside it.
+        self.directory = tempfile.mkdtemp()
+        enable_stats_cache(self.directory)
+
+    def tearDown(self):
+        disable_parallel_stats()
+        disable_stats_cache()
+        shutil.rmtree(self.directory)
+
+    def test_partition(self):
+        parallel_stats = ParallelStats(n_workers=4, min_partition_seconds=10)
+        start = pd.Timestamp('2014-01-01', tz='Europe/London')
+        section = TimeFrame(start, start + timedelta(seconds=100))
+        section.include_end = True
+
+        # One long section is split into adjacent pieces
+        partitions = parallel_stats.partition([section])
+        self.assertEqual(len(partitions), 4)
+        pieces = [piece for partition in partitions for piece in partition]
+        self.assertEqual(pieces[0].start, section.start)
+        self.assertEqual(pieces[-1].end, section.end)
+        self.assertTrue(pieces[-1].include_end)
+        for piece, next_piece in zip(pieces[:-1], pieces[1:]):
+            self.assertEqual(piece.end, next_piece.start)
+            self.assertFalse(piece.include_end)
+
+        # Too short to be worth splitting
+        parallel_stats = ParallelStats(n_workers=4, min_partition_seconds=60)
+        self.assertEqual(parallel_stats.partition([section]), [[section]])
+
+        # Short sections are grouped in order
+        parallel_stats = ParallelStats(n_workers=4, min_partition_seconds=10)
+        sections = [TimeFrame(start + timedelta(seconds=10*i),
+                              start + timedelta(seconds=10*i + 5))
+                    for i in range(8)]
+        partitions = parallel_stats.partition(sections)
+        self.assertEqual([len(partition) for partition in partitions],
+                         [2, 2, 2, 2])
+        self.assertEqual(
+            [section for partition in partitions for section in partition],
+            sections)
+
+    def test_compute(self):
+        meter = ElecMeter(store=self.datastore, metadata=self.meter_meta,
+                          meter_id=METER_ID)
+        meter.clear_cache()
+        good_sections = meter.good_sections()
+        timeframe = meter.get_timeframe()
+        timeframe.include_end = True
+
+        parallel_stats = enable_parallel_stats(n_workers=2,
+                                               min_partition_seconds=30)
+        self.assertIs(get_parallel_stats(), parallel_stats)
+        pieces = [piece for partition in parallel_stats.partition([timeframe])
+                  for piece in partition]
+        self.assertEqual(len(pieces), 2)
+        meter.clear_cache()
+        self.assertEqual(meter.good_sections(), good_sections)
+        self.assertEqual(
+            len(meter.good_sections(full_results=True)._data), 1)
+        energy = meter.total_energy(full_results=True)
+
+        # The pieces are put back together, so the result is cached
+        # for the section asked for and isn't computed again.
+        self.assertEqual(len(energy._data), 1)
+        meter.total_energy()
+        self.assertEqual(len(meter.get_cached_stat(
+            meter.key_for_cached_stat('total_energy'))), 1)
+
+        # No energy is lost at the split
+        disable_parallel_stats()
+        meter.clear_cache()
+        expected = meter.total_energy()
+        for ac_type in expected.keys():
+            self.assertAlmostEqual(energy.simple()[ac_type], expected[ac_type])
+        meter.clear_cache()
+
+    def test_writable_store(self):
+        # Workers can't open a file which is open for writing, so
+        # statistics are computed in this process.
+        filename = join(self.directory, 'energy.h5')
+        shutil.copyfile(join(data_dir(), 'energy.h5'), filename)
+        datastore = HDFDataStore(filename, 'a')
+        try:
+            meter = ElecMeter(store=datastore, metadata=self.meter_meta,
+                              meter_id=METER_ID)
+            timeframe = meter.get_timeframe()
+            parallel_stats = enable_parallel_stats(n_workers=2,
+                                                   min_partition_seconds=30)
+            self.assertIsNone(parallel_stats.compute(
+                meter, [GoodSections], {'sections': [timeframe]}))
+            meter.clear_cache()
+            self.assertEqual(len(meter.good_sections()), 1)
+        finally:
+            datastore.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,20 +1,33 @@
 from __future__ import print_function, division
 import numpy as np
-import gc
+import pandas as pd
 from .totalenergyresults import TotalEnergyResults
 from ..node import Node
-from ..utils import timedelta64_to_secs
+from ..scratch import get_scratch_pool
 from ..consts import JOULES_PER_KWH
 from ..measurement import AC_TYPES
 from ..timeframe import TimeFrame
 
 
 class TotalEnergy(Node):
+    """
+    Attributes
+    ----------
+    previous_sample : pd.Timestamp or None
+        The last sample counted by another TotalEnergy node, if the
+        data was split between processes and the first chunk starts
+        with that sample.  Its 'energy' is then not counted again.
+    """
 
     requirements = {'device': {'max_sample_period': 'ANY VALUE'},
                     'preprocessing_applied': {'clip': 'ANY VALUE'}}
     postconditions =  {'statistics': {'energy': {}}}
     results_class = TotalEnergyResults
+    fingerprint_attrs = ()
+
+    def reset(self):
+        super(TotalEnergy, self).reset()
+        self.previous_sample = None
 
     def process(self):
         """
@@ -23,8 +36,13 @@ class TotalEnergy(Node):
         self.check_requirements()
         metadata = self.upstream.get_metadata()
         max_sample_period = metadata['device']['max_sample_period']
+        previous_sample = self.previous_sample
         for chunk in self.upstream.process():
             energy = get_total_energy(chunk, max_sample_period)
+            if previous_sample is not None and len(chunk):
+                if chunk.index[0] == previous_sample:
+                    _uncount_first_row(energy, chunk)
+                previous_sample = None
             self.results.append(chunk.timeframe, energy)
             yield chunk
 
@@ -52,20 +70,8 @@ def get_total_energy(df, max_sample_period):
         Values are energy in kWh (or equivalent for reactive and apparent power).
     """
 
-    # Select a column based on ordered preferences
-    PHYSICAL_QUANTITY_PREFS = ["cumulative energy", "energy", "power"]
-    selected_columns = []
-    for ac_type in AC_TYPES:
-        physical_quantities = [physical_quantity 
-                               for (physical_quantity, col_ac_type) in df.keys()
-                               if col_ac_type == ac_type]
-        for pq in PHYSICAL_QUANTITY_PREFS:
-            if pq in physical_quantities:
-                selected_columns.append((pq, ac_type))
-                break
-
     energy = {}
-    for col in selected_columns:
+    for col in select_energy_columns(df.keys()):
         (physical_quantity, ac_type) = col
         series = df[col]
         if physical_quantity == 'power':
@@ -78,6 +84,41 @@ def get_total_energy(df, max_sample_period):
     return energy
 
 
+def _uncount_first_row(energy, df):
+    """Subtracts the 'energy' of the first row of `df` from `energy`,
+    as returned by `get_total_energy(df)`."""
+    for col in select_energy_columns(df.keys()):
+        physical_quantity, ac_type = col
+        value = df[col].iloc[0]
+        if physical_quantity == 'energy' and not pd.isnull(value):
+            energy[ac_type] -= value
+
+
+def select_energy_columns(columns):
+    """Returns the column to compute the energy of each AC type from.
+
+    Parameters
+    ----------
+    columns : list of (physical_quantity, ac_type) tuples
+
+    Returns
+    -------
+    list of (physical_quantity, ac_type) tuples, at most one per AC type.
+    """
+    # Select a column based on ordered preferences
+    PHYSICAL_QUANTITY_PREFS = ["cumulative energy", "energy", "power"]
+    selected_columns = []
+    for ac_type in AC_TYPES:
+        physical_quantities = [physical_quantity 
+                               for (physical_quantity, col_ac_type) in columns
+                               if col_ac_type == ac_type]
+        for pq in PHYSICAL_QUANTITY_PREFS:
+            if pq in physical_quantities:
+                selected_columns.append((pq, ac_type))
+                break
+    return selected_columns
+
+
 def _energy_for_power_series(series, max_sample_period):
     """
     Parameters
@@ -91,11 +132,16 @@ def _energy_for_power_series(series, max_sample_period):
         kWh
     """
     series = series.dropna()
-    timedelta = np.diff(series.index.values)
-    timedelta_secs = timedelta64_to_secs(timedelta)
-    del timedelta
-    gc.collect()
-    timedelta_secs = timedelta_secs.clip(max=max_sample_period)
-    joules = (timedelta_secs * series.values[:-1]).sum()
-    kwh = joules / JOULES_PER_KWH
+    n_samples = len(series)
+    if n_samples < 2:
+        return 0.0
+    timestamps = series.index.asi8
+    pool = get_scratch_pool()
+    timedeltas_ns = pool.array('timedeltas_ns', n_samples - 1, np.int64)
+    np.subtract(timestamps[1:], timestamps[:-1], out=timedeltas_ns)
+    joules = pool.array('joules', n_samples - 1, np.float64)
+    np.divide(timedeltas_ns, 1E9, out=joules)
+    np.minimum(joules, max_sample_period, out=joules)
+    np.multiply(joules, series.values[:-1], out=joules)
+    kwh = joules.sum() / JOULES_PER_KWH
     return kwh
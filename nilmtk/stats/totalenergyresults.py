@@ -15,6 +15,7 @@ class TotalEnergyResults(Results):
     """
     
     name = "total_energy"
+    collapsible = True
 
     def append(self, timeframe, new_results):
         """Append a single result.
@@ -25,6 +26,10 @@ class TotalEnergyResults(Results):
                            str(AC_TYPES))
         super(TotalEnergyResults, self).append(timeframe, new_results)
 
+    def _collapse_rows(self, rows):
+        return dict((ac_type, rows[ac_type].sum())
+                    for ac_type in rows.columns if ac_type != 'end')
+
     def unify(self, other):
         super(TotalEnergyResults, self).unify(other)
         ac_types = set(self._data.columns) - set(['end'])
@@ -0,0 +1,167 @@
+#!/usr/bin/python
+from __future__ import print_function, division
+import unittest
+import shutil
+import tempfile
+from os.path import join
+import pandas as pd
+from .testingtools import data_dir
+from .generate_data import create_random_df
+from nilmtk.datastore import (HDFDataStore, ChunkCache, enable_chunk_cache,
+                              disable_chunk_cache, get_chunk_cache)
+from nilmtk.datastore.chunkcache import writeable_chunk
+from nilmtk.elecmeter import ElecMeter, ElecMeterID
+from nilmtk import TimeFrame
+
+KEY = '/building1/elec/meter1'
+METER_ID = ElecMeterID(instance=1, building=1, dataset='REDD')
+SECTIONS = [TimeFrame('2012-01-01 00:00:00', '2012-01-01 00:00:05'),
+            TimeFrame('2012-01-01 00:10:00', '2012-01-01 00:10:05')]
+
+
+class TestChunkCache(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        filename = join(data_dir(), 'random.h5')
+        cls.datastore = HDFDataStore(filename, 'r')
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.datastore.close()
+        disable_chunk_cache()
+
+    def test_hits_and_misses(self):
+        cache = ChunkCache(max_bytes=2**20)
+        expected = list(self.datastore.load(KEY, sections=SECTIONS))
+        for i in range(2):
+            chunks = list(cache.load(self.datastore, KEY, sections=SECTIONS))
+            self.assertEqual(len(chunks), len(expected))
+            for chunk, expected_chunk in zip(chunks, expected):
+                self.assertTrue(chunk.equals(expected_chunk))
+                self.assertEqual(chunk.timeframe, expected_chunk.timeframe)
+        # Both sections are in the first block
+        stats = cache.stats()
+        self.assertEqual(stats['misses'], 1)
+        self.assertEqual(stats['hits'], 3)
+        self.assertEqual(stats['entries'], 1)
+
+        # Other columns and chunk sizes are sliced out of the same block
+        cols = [('energy', 'reactive'), ('power', 'active')]
+        expected = list(self.datastore.load(KEY, cols=cols, chunksize=3000,
+                                            n_look_ahead_rows=5))
+        chunks = list(cache.load(self.datastore, KEY, cols=cols,
+                                 chunksize=3000, n_look_ahead_rows=5))
+        self.assertEqual(len(chunks), len(expected))
+        for chunk, expected_chunk in zip(chunks, expected):
+            self.assertTrue(chunk.equals(expected_chunk))
+            self.assertTrue(chunk.look_ahead.equals(expected_chunk.look_ahead))
+            self.assertEqual(chunk.timeframe, expected_chunk.timeframe)
+        self.assertEqual(cache.stats()['misses'], 1)
+
+        cache.invalidate(self.datastore, KEY)
+        self.assertEqual(cache.stats()['entries'], 0)
+        self.assertEqual(cache.n_bytes, 0)
+
+    def test_read_only(self):
+        cache = ChunkCache(max_bytes=2**20)
+        chunk = next(cache.load(self.datastore, KEY, sections=SECTIONS,
+                                n_look_ahead_rows=3))
+        with self.assertRaises(ValueError):
+            chunk.values[0, 0] = 0
+        self.assertEqual(len(chunk.look_ahead), 3)
+        chunk = writeable_chunk(chunk)
+        chunk.iloc[0, 0] = 0
+        self.assertEqual(len(chunk.look_ahead), 3)
+
+    def test_eviction(self):
+        # Each section is in a different block
+        cache = ChunkCache(max_bytes=2**20, block_rows=100)
+        list(cache.load(self.datastore, KEY, sections=SECTIONS))
+        self.assertEqual(cache.stats()['entries'], 2)
+        cache.resize(cache.n_bytes - 1)
+        self.assertEqual(cache.stats()['evictions'], 1)
+        self.assertEqual(cache.stats()['entries'], 1)
+
+        # The least recently used block is evicted first
+        list(cache.load(self.datastore, KEY, sections=SECTIONS[1:]))
+        self.assertEqual(cache.stats()['hits'], 1)
+
+        # Blocks bigger than the cache are never stored
+        cache.resize(1)
+        chunks = list(cache.load(self.datastore, KEY, sections=SECTIONS))
+        self.assertEqual(cache.stats()['entries'], 0)
+        self.assertEqual([len(chunk) for chunk in chunks], [5, 5])
+
+    def test_append(self):
+        directory = tempfile.mkdtemp()
+        datastore = HDFDataStore(join(directory, 'append.h5'), 'w')
+        df = create_random_df()
+        try:
+            datastore.put(KEY, df.iloc[:10])
+            cache = ChunkCache(max_bytes=2**20)
+            self.assertEqual(len(pd.concat(cache.load(datastore, KEY))), 10)
+            datastore.append(KEY, df.iloc[10:20])
+            chunks = list(cache.load(datastore, KEY))
+            self.assertTrue(pd.concat(chunks).equals(df.iloc[:20]))
+            section = TimeFrame(df.index[15], df.index[18])
+            chunk, = cache.load(datastore, KEY, sections=[section],
+                                prefetch=1, verbose=False)
+            self.assertTrue(chunk.equals(df.iloc[15:18]))
+            with self.assertRaises(TypeError):
+                cache.load(datastore, KEY, spam=True)
+        finally:
+            datastore.close()
+            shutil.rmtree(directory)
+
+    def test_meter_session(self):
+        # Each statistic reads the same rows, so only the first read
+        # of the table misses.
+        directory = tempfile.mkdtemp()
+        filename = join(directory, 'energy.h5')
+        shutil.copyfile(join(data_dir(), 'energy.h5'), filename)
+        datastore = HDFDataStore(filename)
+        try:
+            ElecMeter.load_meter_devices(datastore)
+            meter_meta = datastore.load_metadata(
+                'building1')['elec_meters'][METER_ID.instance]
+            meter = ElecMeter(store=datastore, metadata=meter_meta,
+                              meter_id=METER_ID)
+
+            def session():
+                good_sections = meter.good_sections()
+                energy = meter.total_energy(sections=good_sections)
+                dropout_rate = meter.dropout_rate()
+                power = list(meter.power_series(sections=good_sections))
+                meter.clear_cache()
+                return good_sections, energy, dropout_rate, power
+
+            expected = session()
+            cache = enable_chunk_cache(max_bytes=2**20)
+            good_sections, energy, dropout_rate, power = session()
+            stats = cache.stats()
+            self.assertEqual(stats['misses'], 1)
+            self.assertEqual(stats['hits'], 3)
+            self.assertEqual(good_sections, expected[0])
+            self.assertTrue(energy.equals(expected[1]))
+            self.assertEqual(dropout_rate, expected[2])
+            self.assertEqual(len(power), len(expected[3]))
+            for chunk, expected_chunk in zip(power, expected[3]):
+                self.assertTrue(chunk.equals(expected_chunk))
+        finally:
+            disable_chunk_cache()
+            datastore.close()
+            shutil.rmtree(directory)
+
+    def test_process_wide_cache(self):
+        self.assertIsNone(get_chunk_cache())
+        cache = enable_chunk_cache(max_bytes=2**20)
+        self.assertIs(get_chunk_cache(), cache)
+        self.assertIs(enable_chunk_cache(max_bytes=2**21), cache)
+        self.assertEqual(cache.max_bytes, 2**21)
+        disable_chunk_cache()
+        self.assertIsNone(get_chunk_cache())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,45 @@
+#!/usr/bin/python
+from __future__ import print_function, division
+import unittest
+import numpy as np
+from nilmtk.datastore.chunkplanner import (
+    MAX_MEM_ALLOWANCE_IN_BYTES, bytes_per_row, plan_chunksize,
+    set_memory_ceiling, get_memory_ceiling)
+
+
+class TestChunkPlanner(unittest.TestCase):
+
+    def tearDown(self):
+        set_memory_ceiling()
+
+    def test_bytes_per_row(self):
+        self.assertEqual(bytes_per_row([np.float32] * 3), 20)
+        self.assertEqual(bytes_per_row(['float64', 'int16']), 18)
+        self.assertEqual(bytes_per_row([np.float32], index=False), 4)
+        self.assertEqual(bytes_per_row([np.float32] * 3, n_meters=4), 80)
+
+    def test_plan_chunksize(self):
+        self.assertEqual(plan_chunksize([np.float32] * 3),
+                         MAX_MEM_ALLOWANCE_IN_BYTES // 20)
+        self.assertEqual(plan_chunksize([np.float32] * 3, max_bytes=2000), 100)
+        self.assertEqual(plan_chunksize([np.float64] * 3, max_bytes=2000), 62)
+        self.assertEqual(plan_chunksize([np.float32] * 3, n_meters=2,
+                                        max_bytes=2000), 50)
+        # Always load at least one row
+        self.assertEqual(plan_chunksize([np.float64] * 3, max_bytes=1), 1)
+
+    def test_memory_ceiling(self):
+        self.assertEqual(get_memory_ceiling(), MAX_MEM_ALLOWANCE_IN_BYTES)
+        set_memory_ceiling(2000)
+        self.assertEqual(get_memory_ceiling(), 2000)
+        self.assertEqual(plan_chunksize([np.float32] * 3), 100)
+        # `max_bytes` cannot exceed the ceiling
+        self.assertEqual(plan_chunksize([np.float32] * 3, max_bytes=4000), 100)
+        with self.assertRaises(ValueError):
+            set_memory_ceiling(0)
+        set_memory_ceiling()
+        self.assertEqual(get_memory_ceiling(), MAX_MEM_ALLOWANCE_IN_BYTES)
+
+
+if __name__ == '__main__':
+    unittest.main()
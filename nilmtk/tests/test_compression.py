@@ -0,0 +1,93 @@
+#!/usr/bin/python
+from __future__ import print_function, division
+import unittest
+from os.path import join
+from shutil import rmtree
+from tempfile import mkdtemp
+import tables
+from .generate_data import create_random_df
+from nilmtk.datastore import HDFDataStore
+from nilmtk.datastore.compression import (
+    Codec, CompressionPolicy, DEFAULT_POLICY, key_class,
+    to_compression_policy, benchmark_codecs)
+
+
+class TestCompression(unittest.TestCase):
+
+    def setUp(self):
+        self.dirname = mkdtemp()
+
+    def tearDown(self):
+        rmtree(self.dirname)
+
+    def test_key_class(self):
+        self.assertEqual(key_class('/building1/elec/meter1'), 'meter')
+        self.assertEqual(key_class('building1/elec/cache/meter1/total_energy'),
+                         'cache')
+        self.assertEqual(key_class('/building1/elec/meter1', 'output'),
+                         'output')
+        self.assertEqual(key_class('/nilmtk_row_index/building1/elec/meter1',
+                                   'output'), 'cache')
+        with self.assertRaises(ValueError):
+            key_class('/building1/elec/meter1', 'archive')
+
+    def test_codec(self):
+        with self.assertRaises(ValueError):
+            Codec('blosc', 10)
+        with self.assertRaises(ValueError):
+            Codec('blosc', 5, shuffle='byte')
+        filters = Codec('blosc:zstd', 9, shuffle='bit').filters()
+        self.assertEqual(filters.complib, 'blosc:zstd')
+        self.assertTrue(filters.bitshuffle)
+        self.assertFalse(filters.shuffle)
+
+    def test_to_compression_policy(self):
+        self.assertIs(to_compression_policy(None), DEFAULT_POLICY)
+        codec = Codec('zlib', 1)
+        policy = to_compression_policy(codec)
+        for key_cls in ['meter', 'cache', 'output']:
+            self.assertEqual(policy.codecs[key_cls], codec)
+        with self.assertRaises(TypeError):
+            to_compression_policy('blosc')
+
+    def test_hdf_store_uses_policy(self):
+        policy = CompressionPolicy(meter=Codec('zlib', 1),
+                                   cache=Codec('blosc:lz4', 5),
+                                   output=Codec('blosc:zstd', 3))
+        df = create_random_df()
+        for purpose, expected in [('dataset', ('zlib', 1)),
+                                  ('output', ('blosc:zstd', 3))]:
+            filename = join(self.dirname, purpose + '.h5')
+            datastore = HDFDataStore(filename, 'w', compression=policy,
+                                     purpose=purpose)
+            datastore.append('/building1/elec/meter1', df)
+            datastore.append('/building1/elec/cache/meter1/stat', df)
+            datastore.close()
+            with tables.open_file(filename) as h5file:
+                filters = h5file.get_node('/building1/elec/meter1/table').filters
+                self.assertEqual((filters.complib, filters.complevel), expected)
+                filters = h5file.get_node(
+                    '/building1/elec/cache/meter1/stat/table').filters
+                self.assertEqual((filters.complib, filters.complevel),
+                                 ('blosc:lz4', 5))
+
+    def test_benchmark_codecs(self):
+        filename = join(self.dirname, 'data.h5')
+        datastore = HDFDataStore(filename, 'w')
+        for meter in [1, 2]:
+            datastore.append('/building1/elec/meter{:d}'.format(meter),
+                             create_random_df())
+        codecs = [Codec('zlib', 0, shuffle=False), Codec('blosc', 9)]
+        report = benchmark_codecs(datastore, codecs=codecs, n_rows=1000,
+                                  n_repeats=1)
+        datastore.close()
+        self.assertEqual(sorted(report.index),
+                         sorted(str(codec) for codec in codecs))
+        self.assertTrue((report['file_size'] > 0).all())
+        self.assertTrue((report['read_throughput'] > 0).all())
+        self.assertGreater(report.loc['blosc-9-shuffle', 'compression_ratio'],
+                           report.loc['zlib-0-noshuffle', 'compression_ratio'])
+
+
+if __name__ == '__main__':
+    unittest.main()
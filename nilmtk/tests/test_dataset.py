@@ -0,0 +1,37 @@
+#!/usr/bin/python
+from __future__ import print_function, division
+import unittest
+from os.path import join
+from nilmtk.tests.testingtools import data_dir
+from nilmtk import DataSet, Building
+from nilmtk.dataset import LazyBuildings
+
+
+class TestDataSet(unittest.TestCase):
+
+    def setUp(self):
+        self.dataset = DataSet(join(data_dir(), 'co_test.h5'))
+
+    def tearDown(self):
+        self.dataset.store.close()
+
+    def test_buildings_are_loaded_lazily(self):
+        buildings = self.dataset.buildings
+        self.assertIsInstance(buildings, LazyBuildings)
+        self.assertEqual(list(buildings), [1])
+        self.assertEqual(buildings.loaded(), [])
+
+        building = buildings[1]
+        self.assertIsInstance(building, Building)
+        self.assertEqual(building.identifier.instance, 1)
+        self.assertEqual(buildings.loaded(), [1])
+        self.assertIs(buildings[1], building)
+
+    def test_metadata_is_not_shared(self):
+        store = self.dataset.store
+        metadata = store.load_metadata('/building1')
+        metadata['instance'] = 42
+        self.assertEqual(store.load_metadata('/building1')['instance'], 1)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -2,10 +2,17 @@
 from __future__ import print_function, division
 import unittest
 from os.path import join
+from shutil import rmtree
+from tempfile import mkdtemp
 import pandas as pd
 from datetime import timedelta
 from .testingtools import data_dir
-from nilmtk.datastore import HDFDataStore, CSVDataStore
+from .generate_data import create_random_df
+from nilmtk.datastore import (HDFDataStore, CSVDataStore, MemmapDataStore,
+                              ParquetDataStore, PartitionedDataStore,
+                              ReaderPoolDataStore, set_memory_ceiling)
+from nilmtk.datastore import parquetdatastore, partitioneddatastore
+from nilmtk.datastore.csvdatastore import _CSVRowIndex
 from nilmtk import TimeFrame
 
 
@@ -90,6 +97,41 @@ class SuperTestDataStore(object):
                             chunk.index[-1] <= 
                             chunk.timeframe.end)        
 
+    def test_look_ahead(self):
+        self.datastore.window.clear()
+        timeframes = [TimeFrame('2012-01-01 00:00:00', '2012-01-01 00:01:00'),
+                      TimeFrame('2012-01-01 00:10:00', '2012-01-01 00:11:00')]
+        one_sec = timedelta(seconds=1)
+        chunks = self.datastore.load(key=self.keys[0], sections=timeframes,
+                                     cols=[('power', 'active')],
+                                     chunksize=25, n_look_ahead_rows=30)
+        for chunk in chunks:
+            look_ahead = chunk.look_ahead
+            self.assertEqual(len(look_ahead), 30)
+            self.assertEqual(list(look_ahead.columns), list(chunk.columns))
+            self.assertEqual(look_ahead.index[0], chunk.index[-1] + one_sec)
+            self.assertTrue((look_ahead.index[1:] - look_ahead.index[:-1] ==
+                             one_sec).all())
+
+    def test_load_prefetch(self):
+        self.datastore.window.clear()
+        timeframes = [TimeFrame('2012-01-01 00:00:00', '2012-01-01 00:01:00'),
+                      TimeFrame('2012-01-01 00:10:00', '2012-01-01 00:11:00')]
+        kwargs = dict(key=self.keys[0], sections=timeframes, chunksize=20,
+                      n_look_ahead_rows=2)
+        expected = list(self.datastore.load(**kwargs))
+        chunks = list(self.datastore.load(prefetch=2, **kwargs))
+        self.assertEqual(len(chunks), len(expected))
+        for chunk, expected_chunk in zip(chunks, expected):
+            self.assertTrue(chunk.equals(expected_chunk))
+            self.assertEqual(chunk.timeframe, expected_chunk.timeframe)
+            self.assertTrue(chunk.look_ahead.equals(expected_chunk.look_ahead))
+
+        # Stopping early must not leave the reader blocked
+        chunks = self.datastore.load(prefetch=1, **kwargs)
+        next(chunks)
+        chunks.close()
+
     #--------- helper functions ---------------------#
 
     def _apply_mask(self):
@@ -122,6 +164,22 @@ class TestHDFDataStore(unittest.TestCase, SuperTestDataStore):
             self.datastore.window.enabled = False
             self.assertEqual(self.datastore._nrows(key), self.NROWS)
 
+    def test_row_range(self):
+        timeframe = TimeFrame('2012-01-01 00:10:00', '2012-01-01 00:20:00')
+        for key in self.keys:
+            coords = self.datastore.store.select_as_coordinates(
+                key, timeframe.query_terms('timeframe'))
+            self.assertEqual(self.datastore._row_range(key, timeframe),
+                             (coords[0], coords[-1] + 1))
+
+    def test_load_single_row(self):
+        key = self.keys[0]
+        index = self.datastore.store.select(key, start=0, stop=2).index
+        for section in [TimeFrame(index[0], index[1]),
+                        TimeFrame(start=self.datastore.get_timeframe(key).end)]:
+            chunks = list(self.datastore.load(key, sections=[section]))
+            self.assertEqual([len(chunk) for chunk in chunks], [1])
+
     def test_estimate_memory_requirement(self):
         self._apply_mask()
         for key in self.keys:
@@ -132,6 +190,99 @@ class TestHDFDataStore(unittest.TestCase, SuperTestDataStore):
             mem = self.datastore._estimate_memory_requirement(key, self.datastore._nrows(key))
             self.assertEqual(mem, 200000)
 
+    def test_plan_chunksize(self):
+        # 3 float32 columns + 8 byte index = 20 bytes per row
+        key = self.keys[0]
+        self.assertEqual(self.datastore._plan_chunksize(key, max_bytes=2000),
+                         100)
+        self.assertEqual(self.datastore._plan_chunksize(
+            key, cols=[('power', 'active')], max_bytes=2000), 166)
+        set_memory_ceiling(2000)
+        try:
+            self.assertEqual(self.datastore._plan_chunksize(key), 100)
+            for chunk in self.datastore.load(key):
+                self.assertLessEqual(len(chunk), 101)
+        finally:
+            set_memory_ceiling()
+
+    def test_write_session(self):
+        dirname = mkdtemp()
+        datastore = HDFDataStore(join(dirname, 'session.h5'), mode='w')
+        key = '/building1/elec/meter1'
+        df = create_random_df()
+        try:
+            with datastore.write_session(max_bytes=10000):
+                for i in range(0, len(df), 100):
+                    datastore.append(key, df.iloc[i:i+100])
+                datastore.save_metadata(key, {'instance': 1})
+            self.assertTrue(datastore.store[key].equals(df))
+            self.assertEqual(datastore.load_metadata(key), {'instance': 1})
+            table = datastore.store.get_storer(key).table
+            self.assertTrue(table.colindexes['index'].is_csi)
+        finally:
+            datastore.close()
+            rmtree(dirname)
+
+    def test_summary(self):
+        dirname = mkdtemp()
+        filename = join(dirname, 'summary.h5')
+        datastore = HDFDataStore(filename, mode='w')
+        key = '/building1/elec/meter1'
+        df = create_random_df()
+        try:
+            datastore.append(key, df.iloc[:100])
+            datastore.append(key, df.iloc[100:])
+            datastore.close()
+
+            # The summary is read from a single node, not from the table.
+            datastore = HDFDataStore(filename, mode='r')
+            summary = datastore._load_summaries()[key]
+            self.assertEqual(summary['nrows'], len(df))
+            self.assertEqual(summary['columns'], list(df.columns))
+            self.assertEqual(datastore.get_timeframe(key), self.TIMEFRAME)
+            self.assertEqual(datastore._nrows(key), len(df))
+            self.assertEqual(datastore.elements_below_key(), ['building1'])
+        finally:
+            datastore.close()
+            rmtree(dirname)
+
+    def test_stale_summary(self):
+        dirname = mkdtemp()
+        filename = join(dirname, 'stale.h5')
+        key = '/building1/elec/meter1'
+        df = create_random_df()
+        try:
+            datastore = HDFDataStore(filename, mode='w')
+            datastore.put(key, df.iloc[:10])
+            datastore.close()
+            with pd.HDFStore(filename) as store:
+                store.append(key, df.iloc[10:20])
+            datastore = HDFDataStore(filename, mode='r')
+            self.assertEqual(datastore._nrows(key), 20)
+            self.assertEqual(datastore.get_timeframe(key),
+                             TimeFrame(df.index[0], df.index[19]))
+        finally:
+            datastore.close()
+            rmtree(dirname)
+
+    def test_read_does_not_write(self):
+        dirname = mkdtemp()
+        filename = join(dirname, 'plain.h5')
+        key = '/building1/elec/meter1'
+        df = create_random_df()
+        df.to_hdf(filename, key, format='table')
+        datastore = HDFDataStore(filename, mode='a')
+        try:
+            self.assertEqual(len(pd.concat(datastore.load(key))), len(df))
+            self.assertEqual(datastore.get_timeframe(key), self.TIMEFRAME)
+            datastore._row_range(key, self.TIMEFRAME)
+        finally:
+            datastore.close()
+            with pd.HDFStore(filename, mode='r') as store:
+                self.assertEqual(store.root._v_children.keys(),
+                                 {'building1'})
+            rmtree(dirname)
+
 class TestCSVDataStore(unittest.TestCase, SuperTestDataStore):
 
     @classmethod
@@ -143,6 +294,281 @@ class TestCSVDataStore(unittest.TestCase, SuperTestDataStore):
     @classmethod
     def tearDownClass(cls):
         cls.datastore.close()
-    
+        rmtree(join(cls.datastore.filename, 'metadata', 'row_index'),
+               ignore_errors=True)
+
+    def test_row_index(self):
+        dirname = mkdtemp()
+        try:
+            datastore = CSVDataStore(dirname)
+            key = '/building1/elec/meter1'
+            df = create_random_df()
+            datastore.append(key, df.iloc[:5000])
+            datastore.append(key, df.iloc[5000:])
+            row_index = datastore._row_index(key)
+            self.assertEqual(row_index.nrows, len(df))
+            self.assertEqual(datastore.get_timeframe(key),
+                             TimeFrame(df.index[0], df.index[-1]))
+
+            # Use a small block size so sections start mid-file
+            row_index = _CSVRowIndex.build(
+                datastore._key_to_abs_path(key), block_size=100)
+            datastore._row_indexes[key] = row_index
+            timeframe = TimeFrame('2012-01-01 00:50:05', '2012-01-01 01:00:00')
+            offset, nrows = row_index.seek_range(timeframe)
+            self.assertEqual(offset, row_index.offsets[30])
+            self.assertEqual(nrows, 36 * 100 - 30 * 100)
+            chunks = list(datastore.load(key, sections=[timeframe],
+                                         n_look_ahead_rows=5))
+            self.assertEqual(len(chunks), 1)
+            expected = df[timeframe.start:timeframe.end].iloc[:-1]
+            self.assertTrue((chunks[0].values == expected.values).all())
+            self.assertEqual(len(chunks[0].look_ahead), 5)
+
+            # The index is rebuilt when the file changes
+            datastore.put(key, df.iloc[:100])
+            self.assertEqual(datastore._row_index(key).nrows, 100)
+        finally:
+            rmtree(dirname)
+
+
+class TestMemmapDataStore(unittest.TestCase, SuperTestDataStore):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.dirname = mkdtemp()
+        cls.datastore = MemmapDataStore(cls.dirname)
+        cls.keys = ['/building1/elec/meter{:d}'.format(i) for i in range(1, 6)]
+        for key in cls.keys:
+            cls.datastore.put(key, create_random_df())
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.datastore.close()
+        rmtree(cls.dirname)
+
+    def test_column_names(self):
+        for key in self.keys:
+            self.assertEqual(self.datastore._column_names(key),
+                             [('power', 'active'), ('energy', 'reactive'),
+                              ('voltage', '')])
+
+    def test_n_rows(self):
+        self._apply_mask()
+        for key in self.keys:
+            self.datastore.window.enabled = True
+            self.assertEqual(self.datastore._nrows(key), 10*60)
+            self.datastore.window.enabled = False
+            self.assertEqual(self.datastore._nrows(key), self.NROWS)
+
+    def test_append(self):
+        key = '/building2/elec/meter1'
+        df = create_random_df()
+        self.datastore.put(key, df.iloc[:100])
+        self.datastore.append(key, df.iloc[100:])
+        self.assertTrue(self.datastore[key].equals(df))
+        # New rows must come after the rows on disk.
+        with self.assertRaises(ValueError):
+            self.datastore.append(key, df.iloc[-10:])
+        with self.assertRaises(ValueError):
+            self.datastore.append(key, df.iloc[:10])
+        self.assertEqual(self.datastore._nrows(key), len(df))
+        self.datastore.remove('/building2')
+
+
+@unittest.skipIf(parquetdatastore.pq is None, "pyarrow is not installed")
+class TestParquetDataStore(unittest.TestCase, SuperTestDataStore):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.dirname = mkdtemp()
+        cls.datastore = ParquetDataStore(cls.dirname, row_group_size=1000)
+        cls.keys = ['/building1/elec/meter{:d}'.format(i) for i in range(1, 6)]
+        for key in cls.keys:
+            cls.datastore.put(key, create_random_df())
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.datastore.close()
+        rmtree(cls.dirname)
+
+    def test_column_names(self):
+        for key in self.keys:
+            self.assertEqual(self.datastore._column_names(key),
+                             [('power', 'active'), ('energy', 'reactive'),
+                              ('voltage', '')])
+
+    def test_n_rows(self):
+        self._apply_mask()
+        for key in self.keys:
+            self.datastore.window.enabled = True
+            self.assertEqual(self.datastore._nrows(key), 10*60)
+            self.datastore.window.enabled = False
+            self.assertEqual(self.datastore._nrows(key), self.NROWS)
+
+    def test_append(self):
+        key = '/building2/elec/meter1'
+        df = create_random_df()
+        self.datastore.put(key, df.iloc[:100])
+        self.datastore.append(key, df.iloc[100:])
+        self.assertTrue(self.datastore[key].equals(df))
+        # New rows must come after the rows on disk.
+        with self.assertRaises(ValueError):
+            self.datastore.append(key, df.iloc[-10:])
+        with self.assertRaises(ValueError):
+            self.datastore.append(key, df.iloc[:10])
+        self.assertEqual(self.datastore._nrows(key), len(df))
+        self.datastore.remove('/building2')
+
+    def test_row_group_pushdown(self):
+        self.datastore.window.clear()
+        table = self.datastore._get_table(self.keys[0])
+        self.assertEqual(len(table.row_groups), 10)
+        timeframe = TimeFrame('2012-01-01 00:20:00', '2012-01-01 00:30:00')
+        self.assertEqual(table.row_range(timeframe), (1200, 1800))
+
+        # Only the row groups which overlap the section should be read.
+        read = []
+        read_row_group = table._read_row_group
+
+        def spy(rg, fields):
+            read.append(rg)
+            return read_row_group(rg, fields)
+
+        table._read_row_group = spy
+        try:
+            chunks = list(self.datastore.load(self.keys[0],
+                                              cols=[('power', 'active')],
+                                              sections=[timeframe]))
+        finally:
+            del table._read_row_group
+        self.assertEqual(set(read), {1})
+        self.assertEqual(len(chunks[0]), 600)
+        self.assertEqual(list(chunks[0].columns), [('power', 'active')])
+
+
+class TestPartitionedDataStore(unittest.TestCase, SuperTestDataStore):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.dirname = mkdtemp()
+        # One partition per hour gives three partitions per meter.
+        cls.datastore = PartitionedDataStore(cls.dirname, freq='H',
+                                             n_workers=1)
+        cls.keys = ['/building1/elec/meter{:d}'.format(i) for i in range(1, 6)]
+        for key in cls.keys:
+            cls.datastore.put(key, create_random_df())
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.datastore.close()
+        rmtree(cls.dirname)
+
+    def test_column_names(self):
+        for key in self.keys:
+            self.assertEqual(self.datastore._column_names(key),
+                             [('power', 'active'), ('energy', 'reactive'),
+                              ('voltage', '')])
+
+    def test_n_rows(self):
+        self._apply_mask()
+        for key in self.keys:
+            self.datastore.window.enabled = True
+            self.assertEqual(self.datastore._nrows(key), 10*60)
+            self.datastore.window.enabled = False
+            self.assertEqual(self.datastore._nrows(key), self.NROWS)
+
+    def test_append(self):
+        key = '/building2/elec/meter1'
+        df = create_random_df()
+        self.datastore.put(key, df.iloc[:100])
+        self.datastore.append(key, df.iloc[100:5000])
+        self.datastore.append(key, df.iloc[5000:])
+        self.assertTrue(self.datastore[key].equals(df))
+        partitions = self.datastore._get_manifest(key).partitions
+        self.assertEqual([partition['nrows'] for partition in partitions],
+                         [3600, 3600, 2800])
+        # Older partitions are immutable.
+        with self.assertRaises(ValueError):
+            self.datastore.append(key, df.iloc[:10])
+        self.datastore.remove('/building2')
+
+    def test_parallel_load(self):
+        self.datastore.window.clear()
+        timeframe = TimeFrame('2012-01-01 00:30:00', '2012-01-01 02:30:00')
+        kwargs = dict(key=self.keys[0], sections=[timeframe],
+                      n_look_ahead_rows=10, chunksize=1000)
+        serial = list(self.datastore.load(**kwargs))
+        datastore = PartitionedDataStore(self.dirname, n_workers=2)
+        try:
+            parallel = list(datastore.load(**kwargs))
+        finally:
+            datastore.close()
+        self.assertEqual(len(parallel), 8)
+        for serial_chunk, parallel_chunk in zip(serial, parallel):
+            self.assertTrue(serial_chunk.equals(parallel_chunk))
+            self.assertTrue(
+                serial_chunk.look_ahead.equals(parallel_chunk.look_ahead))
+            self.assertEqual(serial_chunk.timeframe, parallel_chunk.timeframe)
+
+    def test_row_position_cache(self):
+        self.datastore.window.clear()
+        size = partitioneddatastore.ROW_POSITION_CACHE_SIZE
+        partitioneddatastore.ROW_POSITION_CACHE_SIZE = 4
+        try:
+            for minute in range(0, 50, 5):
+                start = self.START_DATE + timedelta(minutes=minute)
+                section = TimeFrame(start, start + timedelta(minutes=1))
+                list(self.datastore.load(self.keys[0], sections=[section]))
+            self.assertEqual(len(self.datastore._row_position_cache), 4)
+        finally:
+            partitioneddatastore.ROW_POSITION_CACHE_SIZE = size
+
+
+class TestReaderPoolDataStore(unittest.TestCase, SuperTestDataStore):
+
+    @classmethod
+    def setUpClass(cls):
+        filename = join(data_dir(), 'random.h5')
+        cls.datastore = ReaderPoolDataStore(filename, n_workers=2)
+        cls.keys = ['/building1/elec/meter{:d}'.format(i) for i in range(1, 6)]
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.datastore.close()
+
+    def test_load_matches_hdf(self):
+        self.datastore.window.clear()
+        hdf = HDFDataStore(join(data_dir(), 'random.h5'), 'r')
+        try:
+            for key in self.keys[:2]:
+                kwargs = dict(chunksize=3000, n_look_ahead_rows=5)
+                expected = list(hdf.load(key, **kwargs))
+                chunks = list(self.datastore.load(key, **kwargs))
+                self.assertEqual(len(chunks), len(expected))
+                for chunk, expected_chunk in zip(chunks, expected):
+                    self.assertTrue(chunk.equals(expected_chunk))
+                    self.assertTrue(
+                        chunk.look_ahead.equals(expected_chunk.look_ahead))
+                    self.assertEqual(chunk.timeframe, expected_chunk.timeframe)
+        finally:
+            hdf.close()
+
+    def test_concurrent_generators(self):
+        self.datastore.window.clear()
+        # More open generators than workers: the third reads in-process.
+        generators = [self.datastore.load(key, chunksize=100)
+                      for key in self.keys[:3]]
+        for generator in generators:
+            self.assertEqual(len(next(generator)), 101)
+        for generator in generators:
+            generator.close()
+        # Closing early returns the workers to the pool.
+        self.assertEqual(len(self.datastore._idle_workers), 2)
+
+    def test_read_only(self):
+        with self.assertRaises(NotImplementedError):
+            self.datastore.put('/building2/elec/meter1', create_random_df())
+
 if __name__ == '__main__':
     unittest.main()
@@ -1,18 +1,73 @@
-from nilmtk.datastore import HDFDataStore, CSVDataStore 
-from nilmtk.datastore.datastore import convert_datastore
-import os
+from __future__ import print_function, division
+import unittest
 import shutil
+from os.path import join, isfile
+from tempfile import mkdtemp
+import yaml
+from nilmtk.datastore import HDFDataStore, CSVDataStore
+from nilmtk.datastore.datastore import convert_datastore, write_yaml_to_file
+from nilmtk.datastore.converter import JOURNAL_SUFFIX, _meter_keys
+from .testingtools import data_dir
 
-input_filepath = 'data/random.h5'
-output_filepath = 'data/random_csv'
 
-if os.path.isdir(output_filepath):
-    shutil.rmtree(output_filepath)
+class TestConvertDatastore(unittest.TestCase):
 
-input_store=HDFDataStore(input_filepath)
-output_store=CSVDataStore(output_filepath)
+    def setUp(self):
+        self.input_store = HDFDataStore(join(data_dir(), 'random.h5'), 'r')
+        self.output_dir = mkdtemp()
 
-convert_datastore(input_store, output_store)
+    def tearDown(self):
+        self.input_store.close()
+        shutil.rmtree(self.output_dir)
 
-input_store.close()
-output_store.close()
\ No newline at end of file
+    def test_convert(self):
+        output_filename = join(self.output_dir, 'random_csv')
+        output_store = CSVDataStore(output_filename)
+        convert_datastore(self.input_store, output_store)
+        output_store.close()
+        self.assertTrue(isfile(output_filename + JOURNAL_SUFFIX))
+
+    def test_parallel(self):
+        output_store = CSVDataStore(join(self.output_dir, 'csv'))
+        summaries = convert_datastore(self.input_store, output_store,
+                                      n_workers=2, chunksize=1000)
+        self.assertEqual(sorted(summaries),
+                         sorted(_meter_keys(self.input_store)))
+        for key, summary in summaries.items():
+            self.assertEqual(summary['nrows'], self.input_store._nrows(key))
+            self.assertEqual(output_store.get_timeframe(key),
+                             self.input_store.get_timeframe(key))
+            # No row is copied twice at the boundaries between chunks
+            output = next(output_store.load(key))
+            self.assertFalse(output.index.duplicated().any())
+        self.assertEqual(output_store.load_metadata('/'),
+                         self.input_store.load_metadata('/'))
+
+    def test_resume(self):
+        output_filename = join(self.output_dir, 'out.h5')
+        output_store = HDFDataStore(output_filename, 'w')
+        summaries = convert_datastore(self.input_store, output_store)
+        journal_filename = output_filename + JOURNAL_SUFFIX
+        self.assertTrue(isfile(journal_filename))
+        self.assertEqual(output_store.load_metadata('/building1'),
+                         self.input_store.load_metadata('/building1'))
+
+        # Pretend the last key was interrupted half way through.
+        key = sorted(summaries)[-1]
+        with open(journal_filename) as fh:
+            journal = yaml.safe_load(fh)
+        del journal['keys'][key]
+        write_yaml_to_file(journal_filename, journal)
+        output_store.remove(key)
+        output_store.append(key, next(self.input_store.load(key, chunksize=10)))
+
+        resumed = convert_datastore(self.input_store, output_store,
+                                    resume=True)
+        self.assertEqual(resumed, summaries)
+        self.assertEqual(output_store._nrows(key), summaries[key]['nrows'])
+        self.assertEqual(output_store._nrows(key), self.input_store._nrows(key))
+        output_store.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
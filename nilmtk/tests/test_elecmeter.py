@@ -1,12 +1,19 @@
 #!/usr/bin/python
 from __future__ import print_function, division
 import unittest
+import shutil
+import tempfile
 from os.path import join
+import numpy as np
 import pandas as pd
 from datetime import timedelta
 from .testingtools import data_dir, WarningTestMixin
 from ..datastore import HDFDataStore
 from ..elecmeter import ElecMeter, ElecMeterID
+from ..timeframe import TimeFrame
+from ..preprocessing import Apply, Clip
+from ..pyramid import pyramid_key
+from ..stats.energyindex import energy_index_key
 from ..stats.tests.test_totalenergy import check_energy_numbers
 
 METER_ID = ElecMeterID(instance=1, building=1, dataset='REDD')
@@ -52,6 +59,146 @@ class TestElecMeter(WarningTestMixin, unittest.TestCase):
                                        periods=5, freq='D')
         meter.total_energy(sections=period_index, full_results=True)
         
+    def test_compute_stats(self):
+        meter = ElecMeter(store=self.datastore, metadata=self.meter_meta, 
+                          meter_id=METER_ID)
+        meter.clear_cache()
+        stats = meter.compute_stats(
+            ['good_sections', 'total_energy', 'dropout_rate'])
+        check_energy_numbers(self, stats['total_energy'])
+
+        # Results must match computing each stat separately
+        meter.clear_cache()
+        self.assertEqual(stats['good_sections'], meter.good_sections())
+        self.assertAlmostEqual(stats['dropout_rate'], meter.dropout_rate())
+
+        # ...and the single pass fills the cache for each stat
+        meter.clear_cache()
+        meter.compute_stats(['good_sections', 'total_energy', 'dropout_rate'])
+        for stat in ['good_sections', 'total_energy', 'dropout_rate']:
+            cached = meter.get_cached_stat(meter.key_for_cached_stat(stat))
+            self.assertFalse(cached.empty)
+        self.assertAlmostEqual(meter.dropout_rate(), stats['dropout_rate'])
+        meter.clear_cache()
+
+        with self.assertRaises(ValueError):
+            meter.compute_stats(['activity_histogram'])
+
+    def test_stats_with_preprocessing(self):
+        meter = ElecMeter(store=self.datastore, metadata=self.meter_meta,
+                          meter_id=METER_ID)
+        meter.clear_cache()
+        energy = meter.total_energy(preprocessing=[Clip()])
+        check_energy_numbers(self, energy)
+        key = meter.key_for_cached_stat('total_energy',
+                                        {'preprocessing': [Clip()]})
+        self.assertNotEqual(key, meter.key_for_cached_stat('total_energy'))
+        self.assertFalse(meter.get_cached_stat(key).empty)
+        self.assertTrue(meter.get_cached_stat(
+            meter.key_for_cached_stat('total_energy')).empty)
+        check_energy_numbers(self, meter.total_energy(preprocessing=[Clip()]))
+
+        # Functions without a key are never cached
+        preprocessing = [Apply(func=lambda chunk: chunk)]
+        check_energy_numbers(
+            self, meter.total_energy(preprocessing=preprocessing))
+        with self.assertRaises(ValueError):
+            meter.key_for_cached_stat('total_energy',
+                                      {'preprocessing': preprocessing})
+        meter.clear_cache()
+
+    def test_pyramid(self):
+        directory = tempfile.mkdtemp()
+        filename = join(directory, 'energy.h5')
+        shutil.copyfile(join(data_dir(), 'energy.h5'), filename)
+        datastore = HDFDataStore(filename)
+        try:
+            meter = ElecMeter(store=datastore, metadata=self.meter_meta,
+                              meter_id=METER_ID)
+            self.assertEqual(meter.pyramid_levels(), [])
+            # The last minute is incomplete so isn't stored
+            self.assertEqual(meter.build_pyramid(levels=[60]), {60: 2})
+            self.assertEqual(meter.pyramid_levels(), [60])
+            self.assertEqual(meter.build_pyramid(levels=[60]), {60: 0})
+
+            raw = datastore[meter.key].iloc[:12]
+            mean = datastore[pyramid_key(meter.key, 60, 'mean')]
+            expected = raw.groupby(raw.index.minute).mean()
+            np.testing.assert_allclose(mean.values,
+                                       expected[mean.columns].values,
+                                       rtol=1E-6)
+            count = datastore[pyramid_key(meter.key, 60, 'count')]
+            self.assertEqual(list(count[('power', 'active')]), [6, 6])
+
+            # The level is read up to its last bin, then the raw data
+            chunks = list(meter.load(sample_period=60))
+            self.assertEqual(len(chunks), 2)
+            np.testing.assert_allclose(
+                chunks[0].loc[mean.index, mean.columns].values,
+                mean.values, rtol=1E-6)
+            chunks = list(meter.load(sample_period=60, use_pyramid=False))
+            self.assertEqual(len(chunks), 1)
+
+            # Chunks overlap by one row, which is only counted once
+            datastore.remove(pyramid_key(meter.key))
+            self.assertEqual(meter.build_pyramid(levels=[60], chunksize=7),
+                             {60: 2})
+            for aggregate in ['mean', 'count']:
+                expected = getattr(raw.groupby(raw.index.minute), aggregate)()
+                actual = datastore[pyramid_key(meter.key, 60, aggregate)]
+                np.testing.assert_allclose(actual.values,
+                                           expected[actual.columns].values,
+                                           rtol=1E-6)
+        finally:
+            datastore.close()
+            shutil.rmtree(directory)
+
+    def test_energy_index(self):
+        directory = tempfile.mkdtemp()
+        filename = join(directory, 'energy.h5')
+        shutil.copyfile(join(data_dir(), 'energy.h5'), filename)
+        datastore = HDFDataStore(filename)
+        try:
+            meter = ElecMeter(store=datastore, metadata=self.meter_meta,
+                              meter_id=METER_ID)
+            start = meter.get_timeframe().start
+            sections = [TimeFrame(start, start + timedelta(seconds=45)),
+                        TimeFrame(start + timedelta(seconds=45),
+                                  start + timedelta(seconds=125)),
+                        TimeFrame(start + timedelta(seconds=200),
+                                  start + timedelta(seconds=300))]
+            expected = meter.total_energy(ac_type='active', sections=sections,
+                                          full_results=True)
+            meter.clear_cache()
+
+            self.assertEqual(meter.build_energy_index(),
+                             {'active': 14, 'reactive': 14, 'apparent': 14})
+            self.assertEqual(meter.build_energy_index(),
+                             {'active': 0, 'reactive': 0, 'apparent': 0})
+            energy = meter.total_energy(ac_type='active', sections=sections,
+                                        full_results=True)
+            np.testing.assert_allclose(energy._data['active'].values,
+                                       expected._data['active'].values)
+            self.assertAlmostEqual(meter.total_energy(ac_type='active')['active'],
+                                   0.0163888888889)
+            # Nothing was computed, so nothing was cached
+            self.assertTrue(meter.get_cached_stat(
+                meter.key_for_cached_stat('total_energy')).empty)
+
+            # A stale index is not used, and not extended by reading
+            data = datastore.store[meter.key]
+            last_row = data.iloc[-1:].copy()
+            last_row.index += timedelta(seconds=10)
+            datastore.put(meter.key, pd.concat([data, last_row]))
+            meter.total_energy(ac_type='active')
+            self.assertFalse(meter.get_cached_stat(
+                meter.key_for_cached_stat('total_energy')).empty)
+            self.assertEqual(datastore._nrows(
+                energy_index_key(meter.key, 'active')), 14)
+        finally:
+            datastore.close()
+            shutil.rmtree(directory)
+
     def test_upstream_meter(self):
         meter1 = ElecMeter(metadata={'site_meter': True}, meter_id=METER_ID)
         self.assertIsNone(meter1.upstream_meter())
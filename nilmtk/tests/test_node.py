@@ -1,7 +1,65 @@
 #!/usr/bin/python
 from __future__ import print_function, division
 import unittest
-from ..node import find_unsatisfied_requirements
+import pandas as pd
+from ..node import (Node, Inlet, Pipeline, run_branches, pipeline_fingerprint,
+                    find_unsatisfied_requirements, UnsatisfiedRequirementsError)
+from ..preprocessing import Apply, Clip
+from ..datastore.chunkcache import writeable_chunk
+
+
+class CountChunks(Node):
+
+    def reset(self):
+        self.n_chunks = 0
+
+    def process(self):
+        for chunk in self.upstream.process():
+            self.n_chunks += 1
+            yield chunk
+
+
+class SkipChunks(Node):
+
+    def process(self):
+        for chunk in self.upstream.process():
+            pass
+        return
+        yield
+
+class Double(Node):
+
+    def process(self):
+        for chunk in self.upstream.process():
+            chunk = writeable_chunk(chunk)
+            chunk *= 2
+            yield chunk
+
+
+class Sum(Node):
+
+    requirements = {'device': {'sample_period': 'ANY VALUE'}}
+
+    def reset(self):
+        self.total = 0
+
+    def process(self):
+        self.check_requirements()
+        for chunk in self.upstream.process():
+            self.total += chunk['a'].sum()
+            yield chunk
+
+
+class Meter(object):
+
+    def __init__(self, metadata):
+        self.metadata = metadata
+        self.n_dry_runs = 0
+
+    def dry_run_metadata(self):
+        self.n_dry_runs += 1
+        return self.metadata
+
 
 class TestNode(unittest.TestCase):
 
@@ -65,5 +123,86 @@ class TestNode(unittest.TestCase):
         unsatisfied = find_unsatisfied_requirements(state, requirements)
         self.assertEqual(len(unsatisfied), 0)
 
+    def test_run_branches(self):
+        pulled = []
+
+        def chunks():
+            for chunk in range(3):
+                pulled.append(chunk)
+                yield chunk
+
+        source = Node(generator=chunks())
+        branch1 = CountChunks(Inlet(source))
+        branch2 = CountChunks(CountChunks(Inlet(source)))
+        run_branches(source, [branch1, branch2])
+        self.assertEqual(pulled, [0, 1, 2])
+        self.assertEqual(branch1.n_chunks, 3)
+        self.assertEqual(branch2.n_chunks, 3)
+        self.assertEqual(branch2.upstream.n_chunks, 3)
+
+        source = Node(generator=chunks())
+        with self.assertRaises(RuntimeError):
+            run_branches(source, [SkipChunks(Inlet(source))])
+
+        with self.assertRaises(ValueError):
+            run_branches(source, [CountChunks(source)])
+
+    def test_pipeline(self):
+        pulled = []
+
+        def chunks():
+            for i in range(3):
+                pulled.append(i)
+                yield pd.DataFrame({'a': [i, i]})
+
+        meter = Meter({'device': {'sample_period': 6}})
+        source = Node(meter, generator=chunks())
+        raw = Sum(source)
+        double = Double(source)
+        doubled = Sum(double)
+        quadrupled = Sum(Double(double))
+        pipeline = Pipeline(source, [raw, doubled, quadrupled])
+        self.assertEqual(len(pipeline.nodes), 5)
+        pipeline.run()
+        self.assertEqual(pulled, [0, 1, 2])
+        self.assertEqual(meter.n_dry_runs, 1)
+        # Chunks shared by several nodes are copied before modification
+        self.assertEqual(raw.total, 6)
+        self.assertEqual(doubled.total, 12)
+        self.assertEqual(quadrupled.total, 24)
+        self.assertIs(raw.upstream, source)
+
+        # Requirements are checked before any data is pulled
+        pulled = []
+        source = Node(Meter({'device': {}}), generator=chunks())
+        pipeline = Pipeline(source, [Sum(source), Sum(Double(source))])
+        with self.assertRaises(UnsatisfiedRequirementsError):
+            pipeline.run()
+        self.assertEqual(pulled, [])
+
+        with self.assertRaises(ValueError):
+            Pipeline(source, [Sum(Node())])
+
+    def test_fingerprint(self):
+        self.assertIsNone(Node().fingerprint())
+        self.assertIsNone(Apply(func=abs).fingerprint())
+        self.assertEqual(Apply(func=abs, func_key='abs').fingerprint(),
+                         Apply(func=abs, func_key='abs').fingerprint())
+        self.assertNotEqual(Apply(func=abs, func_key='abs').fingerprint(),
+                            Apply(func=abs, func_key='neg').fingerprint())
+
+        clip1, clip2 = Clip(), Clip()
+        self.assertEqual(clip1.fingerprint(), clip2.fingerprint())
+        clip2.upper = 100
+        self.assertNotEqual(clip1.fingerprint(), clip2.fingerprint())
+
+        apply = Apply(func=abs, func_key='abs')
+        self.assertEqual(pipeline_fingerprint([clip1, apply]),
+                         pipeline_fingerprint([Clip(), apply]))
+        self.assertNotEqual(pipeline_fingerprint([clip1, apply]),
+                            pipeline_fingerprint([apply, clip1]))
+        self.assertIsNone(pipeline_fingerprint([clip1, Apply(func=abs)]))
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,114 @@
+#!/usr/bin/python
+from __future__ import print_function, division
+import unittest
+import pickle
+import shutil
+import tempfile
+import time
+from os.path import join
+import pandas as pd
+from .testingtools import data_dir
+from ..node import Node
+from ..datastore import HDFDataStore
+from ..profiling import (Profiler, COLUMNS, enable_profiling,
+                         disable_profiling, get_profiler)
+
+KEY = '/building1/elec/meter1'
+
+
+class Slow(Node):
+
+    def process(self):
+        for chunk in self.upstream.process():
+            time.sleep(0.01)
+            yield chunk
+
+
+class Slower(Slow):
+
+    def process(self):
+        for chunk in self.upstream.process():
+            time.sleep(0.02)
+            yield chunk
+
+
+def chunks(n_chunks, n_rows=10):
+    for i in range(n_chunks):
+        yield pd.DataFrame({'a': range(n_rows)}, dtype=float)
+
+
+class TestProfiling(unittest.TestCase):
+
+    def tearDown(self):
+        disable_profiling()
+
+    def test_profile(self):
+        profiler = Profiler()
+        calls = []
+        profiler.add_callback(lambda stage, stats: calls.append(stage))
+        profiled = list(profiler.profile('source', chunks(3)))
+        self.assertEqual(len(profiled), 3)
+        for chunk, expected in zip(profiled, chunks(3)):
+            self.assertTrue(chunk.equals(expected))
+        list(profiler.profile('source', chunks(2)))
+        report = profiler.report()
+        self.assertEqual(list(report.columns), COLUMNS)
+        self.assertEqual(report.loc['source', 'calls'], 2)
+        self.assertEqual(report.loc['source', 'chunks'], 5)
+        self.assertEqual(report.loc['source', 'rows'], 50)
+        self.assertEqual(report.loc['source', 'bytes'],
+                         5 * next(chunks(1)).memory_usage().sum())
+        self.assertEqual(calls, ['source'] * 5)
+        profiler.reset()
+        self.assertEqual(profiler.to_dict(), {})
+
+    def test_nodes(self):
+        self.assertIsNone(get_profiler())
+        unprofiled = Slow(Node(generator=chunks(2)))
+        self.assertNotIn('process', unprofiled.__dict__)
+
+        profiler = enable_profiling()
+        self.assertIs(get_profiler(), profiler)
+        source = Node(generator=profiler.profile('source', chunks(2)))
+        slower = Slower(Slow(source))
+        slower.run()
+        stats = profiler.to_dict()
+        self.assertEqual(sorted(stats), ['Slow', 'Slower', 'source'])
+        for stage in stats:
+            self.assertEqual(stats[stage]['chunks'], 2)
+            self.assertEqual(stats[stage]['rows'], 20)
+
+        # Time spent upstream is excluded from self time
+        self.assertGreaterEqual(stats['Slow']['self_wall_time'], 0.02)
+        self.assertGreaterEqual(stats['Slower']['self_wall_time'], 0.04)
+        self.assertLess(stats['Slow']['self_wall_time'],
+                        stats['Slower']['self_wall_time'])
+        self.assertGreaterEqual(stats['Slower']['wall_time'],
+                                stats['Slower']['self_wall_time'] +
+                                stats['Slow']['self_wall_time'])
+
+        # Profiled nodes can still be pickled
+        copied = pickle.loads(pickle.dumps(Slow()))
+        self.assertNotIn('process', copied.__dict__)
+
+    def test_load(self):
+        directory = tempfile.mkdtemp()
+        filename = join(directory, 'energy.h5')
+        shutil.copyfile(join(data_dir(), 'energy.h5'), filename)
+        datastore = HDFDataStore(filename, 'r')
+        try:
+            profiler = enable_profiling()
+            n_rows = sum(len(chunk) for chunk in datastore.load(KEY))
+            disable_profiling()
+            list(datastore.load(KEY))
+        finally:
+            datastore.close()
+            shutil.rmtree(directory)
+        stats = profiler.to_dict()['HDFDataStore.load']
+        self.assertEqual(stats['calls'], 1)
+        self.assertEqual(stats['rows'], n_rows)
+        self.assertGreater(stats['bytes'], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,38 @@
+#!/usr/bin/python
+from __future__ import print_function, division
+import unittest
+import numpy as np
+from ..scratch import ScratchPool, get_scratch_pool
+
+
+class TestScratchPool(unittest.TestCase):
+
+    def test_array(self):
+        pool = ScratchPool(max_bytes=100)
+        a = pool.array('a', 10, np.float64)
+        self.assertEqual(a.shape, (10,))
+        self.assertEqual(a.dtype, np.float64)
+        self.assertEqual(pool.n_bytes, 80)
+
+        # The same buffer is reused, whatever the dtype
+        b = pool.array('a', 4, np.int32)
+        self.assertTrue(np.shares_memory(a, b))
+        self.assertEqual(pool.n_bytes, 80)
+
+        # Arrays which don't fit in the pool are allocated as usual
+        c = pool.array('c', 10, np.float64)
+        self.assertEqual(len(c), 10)
+        self.assertFalse(np.shares_memory(a, c))
+        self.assertEqual(pool.n_bytes, 80)
+
+        pool.clear()
+        self.assertEqual(pool.n_bytes, 0)
+        pool.array('c', 10, np.float64)
+        self.assertEqual(pool.n_bytes, 80)
+
+    def test_get_scratch_pool(self):
+        self.assertIs(get_scratch_pool(), get_scratch_pool())
+
+
+if __name__ == '__main__':
+    unittest.main()
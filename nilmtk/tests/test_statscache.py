@@ -0,0 +1,97 @@
+#!/usr/bin/python
+from __future__ import print_function, division
+import unittest
+import shutil
+import tempfile
+from os import listdir, utime
+from os.path import join
+import pandas as pd
+from .testingtools import data_dir
+from nilmtk.datastore import (HDFDataStore, StatsCache, enable_stats_cache,
+                              disable_stats_cache, get_stats_cache)
+from nilmtk.elecmeter import ElecMeter, ElecMeterID
+from nilmtk.stats.tests.test_totalenergy import check_energy_numbers
+
+METER_ID = ElecMeterID(instance=1, building=1, dataset='REDD')
+KEY = '/building1/elec/meter1'
+
+
+class TestStatsCache(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        # A private copy, so other tests can't hold the file open.
+        cls.data_directory = tempfile.mkdtemp()
+        filename = join(cls.data_directory, 'energy.h5')
+        shutil.copyfile(join(data_dir(), 'energy.h5'), filename)
+        cls.datastore = HDFDataStore(filename, 'r')
+        ElecMeter.load_meter_devices(cls.datastore)
+        cls.meter_meta = cls.datastore.load_metadata(
+            'building1')['elec_meters'][METER_ID.instance]
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.datastore.close()
+        shutil.rmtree(cls.data_directory)
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        disable_stats_cache()
+        shutil.rmtree(self.directory)
+
+    def test_meter_stats(self):
+        self.assertIsNone(get_stats_cache())
+        cache = enable_stats_cache(self.directory)
+        self.assertIs(get_stats_cache(), cache)
+
+        # The datastore is read-only so stats can only be cached outside it
+        meter = ElecMeter(store=self.datastore, metadata=self.meter_meta,
+                          meter_id=METER_ID)
+        energy = meter.total_energy()
+        check_energy_numbers(self, energy)
+        self.assertEqual(len(listdir(self.directory)), 1)
+        key = meter.key_for_cached_stat('total_energy')
+        self.assertFalse(meter.get_cached_stat(key).empty)
+        check_energy_numbers(self, meter.total_energy())
+
+        # Different load parameters are cached separately
+        cols = [('energy', 'active')]
+        self.assertNotEqual(
+            meter.key_for_cached_stat('total_energy', {'cols': cols}), key)
+        good_sections = meter.good_sections()
+        self.assertEqual(len(listdir(self.directory)), 2)
+        self.assertEqual(meter.good_sections(), good_sections)
+
+        meter.clear_cache()
+        self.assertEqual(listdir(self.directory), [])
+
+    def test_append_and_evict(self):
+        cache = StatsCache(self.directory)
+        stat = pd.DataFrame({'end': [1, 2], 'active': [3., 4.]},
+                            index=[0, 1])
+        key = cache.key(self.datastore, KEY, 'total_energy')
+        cache.append(key, stat.iloc[:1])
+        cache.append(key, stat.iloc[1:])
+        self.assertTrue(cache[key].equals(stat))
+        with self.assertRaises(ValueError):
+            cache.append(key, stat[['end']])
+
+        other_key = cache.key(self.datastore, KEY, 'good_sections')
+        cache.put(other_key, stat)
+        # `other_key` was used least recently
+        utime(join(self.directory, other_key + '.h5'), (0, 0))
+        cache.max_bytes = cache.n_bytes() - 1
+        cache.evict()
+        with self.assertRaises(KeyError):
+            cache[other_key]
+        self.assertTrue(cache[key].equals(stat))
+
+        cache.remove(cache.meter_prefix(self.datastore, KEY))
+        with self.assertRaises(KeyError):
+            cache.remove(key)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -2,7 +2,10 @@
 from __future__ import print_function, division
 import unittest
 import pandas as pd
-from nilmtk.timeframe import TimeFrame, merge_timeframes
+from nilmtk.timeframe import TimeFrame, merge_timeframes, split_timeframes
+from nilmtk.timeframegroup import TimeFrameGroup
+from nilmtk.results import Results
+from nilmtk.consts import SECS_PER_DAY
 
 
 class TestTimeFrame(unittest.TestCase):
@@ -137,6 +140,67 @@ class TestTimeFrame(unittest.TestCase):
                           TimeFrame("2012-01-01", "2013-01-01")]
         self.assertEqual(merged, correct_answer)
 
+        merged = merge_timeframes(tfs, gap=SECS_PER_DAY * 365)
+        self.assertEqual(merged, [TimeFrame("2010-01-01", "2013-01-01")])
+
+    def test_split_timeframes(self):
+        tf = TimeFrame("2010-01-01 00:00", "2010-01-01 00:25")
+        split = list(split_timeframes([tf], duration_threshold=600))
+        correct_answer = [TimeFrame("2010-01-01 00:00", "2010-01-01 00:10"),
+                          TimeFrame("2010-01-01 00:10", "2010-01-01 00:20"),
+                          TimeFrame("2010-01-01 00:20", "2010-01-01 00:25")]
+        self.assertEqual(split, correct_answer)
+        with self.assertRaises(ValueError):
+            list(split_timeframes([TimeFrame(start="2010-01-01")], 600))
+
+
+class TestTimeFrameGroup(unittest.TestCase):
+    def setUp(self):
+        self.tfg1 = TimeFrameGroup([TimeFrame("2010-01-01", "2010-01-07"),
+                                    TimeFrame("2010-01-11", "2010-01-16")])
+        self.tfg2 = TimeFrameGroup([TimeFrame("2010-01-04", "2010-01-06"),
+                                    TimeFrame("2010-01-09", "2010-01-13"),
+                                    TimeFrame("2010-01-16", "2010-01-18")])
+
+    def test_intersection(self):
+        intersection = self.tfg1.intersection(self.tfg2)
+        correct_answer = [TimeFrame("2010-01-04", "2010-01-06"),
+                          TimeFrame("2010-01-11", "2010-01-13")]
+        self.assertEqual(list(intersection), correct_answer)
+
+        # `other` is not sorted
+        intersection = self.tfg1.intersection(list(reversed(self.tfg2)))
+        self.assertEqual(sorted(intersection, key=lambda tf: tf.start),
+                         correct_answer)
+
+    def test_union(self):
+        union = self.tfg1.union(self.tfg2)
+        correct_answer = [TimeFrame("2010-01-01", "2010-01-07"),
+                          TimeFrame("2010-01-09", "2010-01-18")]
+        self.assertEqual(list(union), correct_answer)
+
+
+class TestResults(unittest.TestCase):
+    def test_append_and_update(self):
+        results = Results()
+        results.append(TimeFrame("2010-01-03", "2010-01-04"), {'n': 1})
+        results.append(TimeFrame("2010-01-01", "2010-01-02"), {'n': 2})
+        results.append(TimeFrame("2010-01-02", "2010-01-03"), {'n': 3})
+        with self.assertRaises(ValueError):
+            results.append(TimeFrame("2010-01-01 12:00", "2010-01-02 12:00"),
+                           {'n': 4})
+        self.assertEqual(list(results._data['n']), [2, 3, 1])
+
+        other = Results()
+        other.append(TimeFrame("2010-01-05", "2010-01-06"), {'n': 5})
+        results.update(other)
+        self.assertEqual(len(results._data), 4)
+
+        other = Results()
+        other.append(TimeFrame("2010-01-03 12:00", "2010-01-05"), {'n': 6})
+        with self.assertRaises(ValueError):
+            results.update(other)
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -1,4 +1,5 @@
 from __future__ import print_function, division
+import numpy as np
 import pandas as pd
 import pytz
 from datetime import timedelta
@@ -296,10 +297,31 @@ class TimeFrame(object):
 
 
 def split_timeframes(timeframes, duration_threshold):
+    """Splits each TimeFrame into adjacent TimeFrames no longer
+    than `duration_threshold` seconds.  See `TimeFrame.split`.
+
+    Returns
+    -------
+    generator of TimeFrame objects
+    """
     # TODO: put this into TimeFrameGroup. #316
-    for timeframe in timeframes:
-        for split in timeframe.split(duration_threshold):
-            yield split
+    timeframes = list(timeframes)
+    if any(tf.start is None or tf.end is None for tf in timeframes):
+        raise ValueError("Cannot split a TimeFrame if `start` or `end`"
+                         " is None")
+    starts, ends = timeframes_to_i8(timeframes)
+    threshold = int(duration_threshold * 1E9)
+    n_splits = np.ceil((ends - starts) / threshold).astype(np.int64)
+    for timeframe, start, n_split in zip(timeframes, starts, n_splits):
+        if n_split <= 1:
+            yield timeframe
+            continue
+        tz = timeframe.start.tz
+        split_starts = start + np.arange(n_split, dtype=np.int64) * threshold
+        for split_start, split_end in zip(split_starts[:-1], split_starts[1:]):
+            yield TimeFrame(i8_to_timestamp(split_start, tz),
+                            i8_to_timestamp(split_end, tz))
+        yield TimeFrame(i8_to_timestamp(split_starts[-1], tz), timeframe.end)
 
 
 def merge_timeframes(timeframes, gap=0):
@@ -322,16 +344,79 @@ def merge_timeframes(timeframes, gap=0):
     elif n_timeframes == 1:
         return timeframes
 
+    starts, ends = timeframes_to_i8(timeframes)
+    gaps = starts[1:] - ends[:-1]
+    open_ended = (starts == OPEN_START) | (ends == OPEN_END)
+    if open_ended.any() or (gaps < 0).any():
+        # Overlapping or open-ended timeframes need the general case.
+        return _merge_timeframes_sequentially(timeframes, gap)
+
+    # Each timeframe starts a new group unless it is within
+    # `gap` seconds of the end of the previous timeframe.
+    group_starts = np.concatenate(
+        [[0], np.flatnonzero(gaps > gap * 1E9) + 1])
+    group_ends = np.concatenate([group_starts[1:] - 1, [n_timeframes - 1]])
+    merged = []
+    for first, last in zip(group_starts, group_ends):
+        if first == last:
+            merged.append(timeframes[first])
+        else:
+            merged.append(TimeFrame(timeframes[first].start,
+                                    timeframes[last].end))
+    return merged
+
+
+def _merge_timeframes_sequentially(timeframes, gap):
     merged = [timeframes[0]]
     for timeframe in timeframes[1:]:
         if timeframe.adjacent(merged[-1], gap):
             merged[-1] = timeframe.union(merged[-1])
         else:
             merged.append(timeframe)
-
     return merged
 
 
+# Open starts and ends of TimeFrames are represented by these
+# values in int64 arrays of nanoseconds since the epoch (UTC).
+OPEN_START = np.iinfo(np.int64).min
+OPEN_END = np.iinfo(np.int64).max
+
+
+def timestamp_to_i8(timestamp, open_value):
+    """Returns nanoseconds since the epoch (UTC) or `open_value` if
+    `timestamp` is None or NaT."""
+    if timestamp is None or timestamp is pd.NaT:
+        return open_value
+    return pd.Timestamp(timestamp).value
+
+
+def i8_to_timestamp(value, tz=None):
+    """Inverse of `timestamp_to_i8`.  Returns None for open values."""
+    if value == OPEN_START or value == OPEN_END:
+        return None
+    if tz is None:
+        return pd.Timestamp(value)
+    return pd.Timestamp(value, tz='UTC').tz_convert(tz)
+
+
+def timeframes_to_i8(timeframes):
+    """
+    Parameters
+    ----------
+    timeframes : list of TimeFrame objects
+
+    Returns
+    -------
+    starts, ends : int64 arrays of nanoseconds since the epoch (UTC)
+        Open starts are OPEN_START and open ends are OPEN_END.
+    """
+    starts = np.array([timestamp_to_i8(tf.start, OPEN_START)
+                       for tf in timeframes], dtype=np.int64)
+    ends = np.array([timestamp_to_i8(tf.end, OPEN_END)
+                     for tf in timeframes], dtype=np.int64)
+    return starts, ends
+
+
 def list_of_timeframe_dicts(timeframes):
     """
     Parameters
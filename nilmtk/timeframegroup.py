@@ -1,11 +1,12 @@
 from __future__ import print_function, division
 import matplotlib.pyplot as plt
+import numpy as np
 import pandas as pd
 from datetime import timedelta
 
 # NILMTK imports
 from nilmtk.consts import SECS_PER_DAY
-from nilmtk.timeframe import TimeFrame
+from nilmtk.timeframe import TimeFrame, timeframes_to_i8, i8_to_timestamp
 
 
 class TimeFrameGroup(list):
@@ -44,6 +45,44 @@ class TimeFrameGroup(list):
                intersection():  |---##-----##-----------###|
         """
         assert isinstance(other, (TimeFrameGroup, list))
+        self_timeframes = [tf for tf in self if not tf.empty]
+        other_timeframes = [tf for tf in other if not tf.empty]
+        if not self_timeframes or not other_timeframes:
+            return TimeFrameGroup()
+        self_starts, self_ends = timeframes_to_i8(self_timeframes)
+        other_starts, other_ends = timeframes_to_i8(other_timeframes)
+        if not _sorted_and_disjoint(other_starts, other_ends):
+            return self._intersection_pairwise(other)
+
+        # For each of self's timeframes, the timeframes in `other`
+        # which end after it starts and start before it ends.
+        first = np.searchsorted(other_ends, self_starts, side='right')
+        last = np.searchsorted(other_starts, self_ends, side='left')
+        n_overlaps = np.maximum(last - first, 0)
+        self_i = np.repeat(np.arange(len(self_timeframes)), n_overlaps)
+        other_i = (np.arange(n_overlaps.sum()) -
+                   np.repeat(np.cumsum(n_overlaps) - n_overlaps, n_overlaps) +
+                   np.repeat(first, n_overlaps))
+
+        starts = np.maximum(self_starts[self_i], other_starts[other_i])
+        ends = np.minimum(self_ends[self_i], other_ends[other_i])
+        non_empty = starts < ends
+        new_tfg = TimeFrameGroup()
+        for i, j, start, end in zip(self_i[non_empty], other_i[non_empty],
+                                    starts[non_empty], ends[non_empty]):
+            self_timeframe = self_timeframes[i]
+            other_timeframe = other_timeframes[j]
+            tz = _tz(self_timeframe, other_timeframe)
+            intersect = TimeFrame(i8_to_timestamp(start, tz),
+                                  i8_to_timestamp(end, tz))
+            if end == other_ends[j]:
+                intersect.include_end = other_timeframe.include_end
+            elif end == self_ends[i]:
+                intersect.include_end = self_timeframe.include_end
+            new_tfg.append(intersect)
+        return new_tfg
+
+    def _intersection_pairwise(self, other):
         new_tfg = TimeFrameGroup()
         for self_timeframe in self:
             for other_timeframe in other:
@@ -52,6 +91,37 @@ class TimeFrameGroup(list):
                     new_tfg.append(intersect)
         return new_tfg
 
+    def union(self, other):
+        """Returns a new, sorted TimeFrameGroup covering every moment
+        covered by self or other.  Overlapping and touching timeframes
+        are merged.
+
+        Illustrated example:
+
+         self.good_sections():  |######----#####-----######|
+        other.good_sections():  |---##---####----##-----###|
+                      union():  |######--#######-##--######|
+        """
+        assert isinstance(other, (TimeFrameGroup, list))
+        timeframes = [tf for tf in list(self) + list(other) if not tf.empty]
+        if not timeframes:
+            return TimeFrameGroup()
+        starts, ends = timeframes_to_i8(timeframes)
+        order = np.argsort(starts, kind='mergesort')
+        starts = starts[order]
+        ends = ends[order]
+
+        # A new timeframe starts wherever a start is after the
+        # end of every timeframe before it.
+        max_ends = np.maximum.accumulate(ends)
+        new_group = np.concatenate([[True], starts[1:] > max_ends[:-1]])
+        group_starts = starts[new_group]
+        group_ends = np.maximum.reduceat(ends, np.flatnonzero(new_group))
+        tz = _tz(*timeframes)
+        return TimeFrameGroup([
+            TimeFrame(i8_to_timestamp(start, tz), i8_to_timestamp(end, tz))
+            for start, end in zip(group_starts, group_ends)])
+
     def uptime(self):
         """Returns total timedelta of all timeframes joined together."""
         uptime = timedelta(0)
@@ -67,3 +137,16 @@ class TimeFrameGroup(list):
                 new_tfg.append(timeframe)
 
         return new_tfg
+
+
+def _sorted_and_disjoint(starts, ends):
+    return bool(np.all(starts[1:] >= ends[:-1]) and np.all(starts < ends))
+
+
+def _tz(*timeframes):
+    """Returns the timezone of the first timestamp in `timeframes`."""
+    for timeframe in timeframes:
+        for timestamp in (timeframe.start, timeframe.end):
+            if timestamp is not None:
+                return timestamp.tz
+    return None
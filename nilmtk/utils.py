@@ -10,7 +10,8 @@ from IPython.core.display import HTML, display
 from collections import OrderedDict
 import datetime
 import pytz
-from nilmtk.datastore import HDFDataStore, CSVDataStore
+from nilmtk.datastore import (HDFDataStore, CSVDataStore, MemmapDataStore,
+                              ParquetDataStore, PartitionedDataStore)
 import warnings
 
 # Python 2/3 compatibility
@@ -304,13 +305,14 @@ def timestamp_is_naive(timestamp):
         return False
 
 
-def get_datastore(filename, format, mode='a'):
+def get_datastore(filename, format, mode='a', **kwargs):
     """
     Parameters
     ----------
     filename : string
-    format : 'CSV' or 'HDF'
+    format : 'CSV' or 'HDF' or 'MEMMAP' or 'PARQUET' or 'PARTITIONED'
     mode : 'a' (append) or 'w' (write), optional
+    **kwargs : passed to HDFDataStore, e.g. `compression` and `purpose`
 
     Returns
     -------
@@ -318,9 +320,15 @@ def get_datastore(filename, format, mode='a'):
     """
     if filename is not None:
         if format == 'HDF':
-            return HDFDataStore(filename, mode)
+            return HDFDataStore(filename, mode, **kwargs)
         elif format == 'CSV':
             return CSVDataStore(filename)
+        elif format == 'MEMMAP':
+            return MemmapDataStore(filename)
+        elif format == 'PARQUET':
+            return ParquetDataStore(filename)
+        elif format == 'PARTITIONED':
+            return PartitionedDataStore(filename)
         else:
             raise ValueError('format not recognised')
     else: